@@ -12,3 +12,23 @@ def version():
     """Return the Deuce Client Version"""
     return '{0:}.{1:}'.format(__DEUCECLIENT_VERSION__['major'],
                               __DEUCECLIENT_VERSION__['minor'])
+
+
+def open(client, vault, file_id, read_ahead=None, cached_blocks=None):
+    """Open a file for reading
+
+    :param client: instance of deuceclient.client.deuce.DeuceClient
+    :param vault: instance of deuceclient.api.Vault holding the file
+    :param file_id: File ID in the Vault
+    :param read_ahead: number of blocks fetched ahead of sequential reads
+    :param cached_blocks: number of blocks kept in memory
+    :returns: read-only, seekable io.RawIOBase over the file
+    """
+    from deuceclient.client import reader
+
+    return reader.DeuceFile(
+        reader.FileReader(client, vault, file_id),
+        read_ahead=reader.DEFAULT_READ_AHEAD if read_ahead is None
+        else read_ahead,
+        cached_blocks=reader.DEFAULT_CACHED_BLOCKS if cached_blocks is None
+        else cached_blocks)
@@ -7,4 +7,5 @@ from deuceclient.api.blocks import Blocks
 from deuceclient.api.storageblocks import StorageBlocks
 from deuceclient.api.files import Files
 from deuceclient.api.project import Project
+from deuceclient.api.snapshot import VaultSnapshot
 from deuceclient.api.vault import Vault
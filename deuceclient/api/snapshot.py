@@ -0,0 +1,463 @@
+"""
+Deuce Client - Vault Snapshot API
+
+A Vault Snapshot is a binary, memory-mappable image of the metadata held
+by a deuceclient.api.Vault: its metadata blocks, storage blocks and the
+offset maps of its files.
+
+All identifiers are stored in their packed binary form in fixed-width
+columns sorted by identifier so that lookups are done with a binary search
+directly against the mapped file instead of loading the Vault into Python
+objects.
+
+Layout (all integers little-endian):
+
+    header          - magic, version, name length, entry counts
+    names           - project_id and vault_id (utf-8, NUL separated)
+    metadata blocks - block_id[20], storage_id[36], size, ref_count,
+                      ref_modified
+    storage blocks  - storage_id[36], block_id[20], size, ref_count,
+                      ref_modified, orphaned
+    files           - file_id[16], index into the offset table (count + 1)
+    offsets         - offset, block_id[20]
+
+Every column is its own contiguous array and every section starts on an
+8-byte boundary. Unknown integer values are stored as -1, unknown
+identifiers as all-zero bytes.
+"""
+import binascii
+import bisect
+import mmap
+import struct
+import uuid
+
+from stoplight import validate
+
+from deuceclient.api.block import Block
+from deuceclient.common.validation import *
+
+SNAPSHOT_MAGIC = b'DEUCEVS\x00'
+SNAPSHOT_VERSION = 1
+
+_HEADER = struct.Struct('<8sIIQQQQ')
+_INT64 = struct.Struct('<q')
+_UINT64 = struct.Struct('<Q')
+
+_BLOCK_ID_WIDTH = 20
+_FILE_ID_WIDTH = 16
+_STORAGE_ID_WIDTH = _BLOCK_ID_WIDTH + _FILE_ID_WIDTH
+
+_NO_BLOCK_ID = bytes(_BLOCK_ID_WIDTH)
+_NO_STORAGE_ID = bytes(_STORAGE_ID_WIDTH)
+
+_ORPHANED_VALUES = {
+    False: 0,
+    True: 1,
+    'indeterminate': 2
+}
+_ORPHANED_STATES = {v: k for k, v in _ORPHANED_VALUES.items()}
+
+
+def _align(value, alignment=8):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def _pack_block_id(block_id):
+    if block_id is None:
+        return _NO_BLOCK_ID
+    return binascii.unhexlify(block_id)
+
+
+def _unpack_block_id(data):
+    if data == _NO_BLOCK_ID:
+        return None
+    return binascii.hexlify(data).decode()
+
+
+def _pack_file_id(file_id):
+    return uuid.UUID(file_id).bytes
+
+
+def _unpack_file_id(data):
+    return str(uuid.UUID(bytes=data))
+
+
+def _pack_storage_id(storage_id):
+    if storage_id is None:
+        return _NO_STORAGE_ID
+    block_id, _, storage_uuid = storage_id.partition('_')
+    return _pack_block_id(block_id) + _pack_file_id(storage_uuid)
+
+
+def _unpack_storage_id(data):
+    if data == _NO_STORAGE_ID:
+        return None
+    return '{0}_{1}'.format(_unpack_block_id(data[:_BLOCK_ID_WIDTH]),
+                            _unpack_file_id(data[_BLOCK_ID_WIDTH:]))
+
+
+def _optional_int(value):
+    return -1 if value is None else value
+
+
+def _block_size(block):
+    if block.data is not None:
+        return len(block.data)
+    return _optional_int(block.serialize()['block_size'])
+
+
+class _Column(object):
+    """Read-only sequence view of a fixed-width column in the snapshot
+    """
+
+    def __init__(self, buf, offset, width, count):
+        self._buf = buf
+        self._offset = offset
+        self._width = width
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        start = self._offset + index * self._width
+        return self._buf[start:start + self._width]
+
+    def int_at(self, index):
+        return _INT64.unpack_from(self._buf,
+                                  self._offset + index * self._width)[0]
+
+    def find(self, key, lo=0, hi=None):
+        """Binary search for key returning its index or None
+        """
+        hi = self._count if hi is None else hi
+        index = bisect.bisect_left(self, key, lo, hi)
+        if index < hi and self[index] == key:
+            return index
+        return None
+
+
+class _Layout(object):
+    """Computes the offsets of each column from the header counts
+    """
+
+    def __init__(self, names_length, block_count, storage_count,
+                 file_count, offset_count):
+        position = _align(_HEADER.size + names_length)
+        self.columns = {}
+
+        def add_column(name, width, count):
+            nonlocal position
+            self.columns[name] = (position, width, count)
+            position = _align(position + width * count)
+
+        add_column('block_ids', _BLOCK_ID_WIDTH, block_count)
+        add_column('block_storage_ids', _STORAGE_ID_WIDTH, block_count)
+        add_column('block_sizes', _INT64.size, block_count)
+        add_column('block_ref_counts', _INT64.size, block_count)
+        add_column('block_ref_modified', _INT64.size, block_count)
+
+        add_column('storage_ids', _STORAGE_ID_WIDTH, storage_count)
+        add_column('storage_block_ids', _BLOCK_ID_WIDTH, storage_count)
+        add_column('storage_sizes', _INT64.size, storage_count)
+        add_column('storage_ref_counts', _INT64.size, storage_count)
+        add_column('storage_ref_modified', _INT64.size, storage_count)
+        add_column('storage_orphaned', 1, storage_count)
+
+        add_column('file_ids', _FILE_ID_WIDTH, file_count)
+        add_column('file_offset_index', _UINT64.size, file_count + 1)
+
+        add_column('offsets', _INT64.size, offset_count)
+        add_column('offset_block_ids', _BLOCK_ID_WIDTH, offset_count)
+
+        self.size = position
+
+
+class VaultSnapshot(object):
+    """Read-only, memory-mapped view of a Vault Snapshot file
+    """
+
+    def __init__(self, filename):
+        """Open a snapshot previously written by VaultSnapshot.create()
+
+        :param filename: snapshot file to open
+        :raises: ValueError if the file is not a Vault Snapshot
+        """
+        self.__file = open(filename, 'rb')
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except ValueError:
+            self.__file.close()
+            raise ValueError('{0} is not a Vault Snapshot'.format(filename))
+
+        if len(self.__map) < _HEADER.size:
+            self.close()
+            raise ValueError('{0} is not a Vault Snapshot'.format(filename))
+
+        (magic, version, names_length, block_count, storage_count,
+         file_count, offset_count) = _HEADER.unpack_from(self.__map, 0)
+
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError('{0} is not a supported Vault Snapshot'
+                             .format(filename))
+
+        layout = _Layout(names_length, block_count, storage_count,
+                         file_count, offset_count)
+        if len(self.__map) < layout.size:
+            self.close()
+            raise ValueError('{0} is truncated'.format(filename))
+
+        names = self.__map[_HEADER.size:_HEADER.size + names_length]
+        project_id, vault_id = names.decode('utf-8').split('\x00')
+        self.__properties = {
+            'project_id': project_id,
+            'vault_id': vault_id
+        }
+        self.__columns = {
+            name: _Column(self.__map, *position)
+            for name, position in layout.columns.items()
+        }
+
+    @staticmethod
+    def create(vault, filename):
+        """Write a snapshot of a Vault
+
+        :param vault: deuceclient.api.Vault to take the snapshot of
+        :param filename: file to write the snapshot to
+        :returns: the number of bytes written
+        """
+        block_ids = sorted(vault.blocks.keys())
+        storage_ids = sorted(vault.storageblocks.keys())
+        file_ids = sorted(vault.files.keys(), key=_pack_file_id)
+
+        file_offsets = []
+        for file_id in file_ids:
+            file_offsets.append(sorted(
+                (int(offset), block_id)
+                for offset, block_id in vault.files[file_id].offsets.items()))
+
+        names = '{0}\x00{1}'.format(vault.project_id,
+                                    vault.vault_id).encode('utf-8')
+        offset_count = sum(len(offsets) for offsets in file_offsets)
+        layout = _Layout(len(names), len(block_ids), len(storage_ids),
+                         len(file_ids), offset_count)
+
+        blocks = [vault.blocks[block_id] for block_id in block_ids]
+        storage_blocks = [vault.storageblocks[storage_id]
+                          for storage_id in storage_ids]
+
+        offset_index = [0]
+        for offsets in file_offsets:
+            offset_index.append(offset_index[-1] + len(offsets))
+
+        columns = {
+            'block_ids': [_pack_block_id(block_id)
+                          for block_id in block_ids],
+            'block_storage_ids': [_pack_storage_id(block.storage_id)
+                                  for block in blocks],
+            'block_sizes': [_INT64.pack(_block_size(block))
+                            for block in blocks],
+            'block_ref_counts': [_INT64.pack(_optional_int(block.ref_count))
+                                 for block in blocks],
+            'block_ref_modified': [
+                _INT64.pack(_optional_int(block.ref_modified))
+                for block in blocks],
+            'storage_ids': [_pack_storage_id(storage_id)
+                            for storage_id in storage_ids],
+            'storage_block_ids': [_pack_block_id(block.block_id)
+                                  for block in storage_blocks],
+            'storage_sizes': [_INT64.pack(_block_size(block))
+                              for block in storage_blocks],
+            'storage_ref_counts': [
+                _INT64.pack(_optional_int(block.ref_count))
+                for block in storage_blocks],
+            'storage_ref_modified': [
+                _INT64.pack(_optional_int(block.ref_modified))
+                for block in storage_blocks],
+            'storage_orphaned': [
+                bytes([_ORPHANED_VALUES[block.block_orphaned]])
+                for block in storage_blocks],
+            'file_ids': [_pack_file_id(file_id) for file_id in file_ids],
+            'file_offset_index': [_UINT64.pack(index)
+                                  for index in offset_index],
+            'offsets': [_INT64.pack(offset)
+                        for offsets in file_offsets
+                        for offset, _ in offsets],
+            'offset_block_ids': [_pack_block_id(block_id)
+                                 for offsets in file_offsets
+                                 for _, block_id in offsets]
+        }
+
+        with open(filename, 'wb') as output:
+            output.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                      len(names), len(block_ids),
+                                      len(storage_ids), len(file_ids),
+                                      offset_count))
+            output.write(names)
+            for name, (position, _, _) in sorted(layout.columns.items(),
+                                                 key=lambda c: c[1][0]):
+                output.write(bytes(position - output.tell()))
+                output.write(b''.join(columns[name]))
+            output.write(bytes(layout.size - output.tell()))
+            return output.tell()
+
+    def close(self):
+        if not self.__map.closed:
+            self.__map.close()
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def project_id(self):
+        return self.__properties['project_id']
+
+    @property
+    def vault_id(self):
+        return self.__properties['vault_id']
+
+    @property
+    def block_count(self):
+        return len(self.__columns['block_ids'])
+
+    @property
+    def storage_block_count(self):
+        return len(self.__columns['storage_ids'])
+
+    @property
+    def file_count(self):
+        return len(self.__columns['file_ids'])
+
+    def _find_block(self, block_id):
+        return self.__columns['block_ids'].find(_pack_block_id(block_id))
+
+    def _find_storage_block(self, storage_id):
+        return self.__columns['storage_ids'].find(
+            _pack_storage_id(storage_id))
+
+    def _find_file(self, file_id):
+        index = self.__columns['file_ids'].find(_pack_file_id(file_id))
+        if index is None:
+            raise KeyError(file_id)
+        return index
+
+    def _int_or_none(self, column, index):
+        value = self.__columns[column].int_at(index)
+        return None if value < 0 else value
+
+    @validate(block_id=MetadataBlockIdRule)
+    def has_block(self, block_id):
+        return self._find_block(block_id) is not None
+
+    @validate(storage_id=StorageBlockIdRule)
+    def has_storage_block(self, storage_id):
+        return self._find_storage_block(storage_id) is not None
+
+    @validate(file_id=FileIdRule)
+    def has_file(self, file_id):
+        return self.__columns['file_ids'].find(
+            _pack_file_id(file_id)) is not None
+
+    @validate(block_id=MetadataBlockIdRule)
+    def get_block(self, block_id):
+        """Build a metadata Block from the snapshot
+
+        :raises: KeyError if the block is not in the snapshot
+        """
+        index = self._find_block(block_id)
+        if index is None:
+            raise KeyError(block_id)
+
+        return Block(self.project_id, self.vault_id,
+                     block_id=block_id,
+                     storage_id=_unpack_storage_id(
+                         self.__columns['block_storage_ids'][index]),
+                     ref_count=self._int_or_none('block_ref_counts', index),
+                     ref_modified=self._int_or_none('block_ref_modified',
+                                                    index),
+                     block_size=self._int_or_none('block_sizes', index))
+
+    @validate(storage_id=StorageBlockIdRule)
+    def get_storage_block(self, storage_id):
+        """Build a storage Block from the snapshot
+
+        :raises: KeyError if the storage block is not in the snapshot
+        """
+        index = self._find_storage_block(storage_id)
+        if index is None:
+            raise KeyError(storage_id)
+
+        orphaned = self.__columns['storage_orphaned'][index][0]
+        return Block(self.project_id, self.vault_id,
+                     block_id=_unpack_block_id(
+                         self.__columns['storage_block_ids'][index]),
+                     storage_id=storage_id,
+                     ref_count=self._int_or_none('storage_ref_counts', index),
+                     ref_modified=self._int_or_none('storage_ref_modified',
+                                                    index),
+                     block_size=self._int_or_none('storage_sizes', index),
+                     block_orphaned=_ORPHANED_STATES[orphaned],
+                     block_type='storage')
+
+    def _file_offset_range(self, file_id):
+        index = self._find_file(file_id)
+        offset_index = self.__columns['file_offset_index']
+        return (_UINT64.unpack(offset_index[index])[0],
+                _UINT64.unpack(offset_index[index + 1])[0])
+
+    @validate(file_id=FileIdRule)
+    def get_file_offsets(self, file_id):
+        """Retrieve the offset map of a file
+
+        :returns: generator of (offset, block_id) in offset order
+        :raises: KeyError if the file is not in the snapshot
+        """
+        start, end = self._file_offset_range(file_id)
+        offsets = self.__columns['offsets']
+        block_ids = self.__columns['offset_block_ids']
+        return ((offsets.int_at(index), _unpack_block_id(block_ids[index]))
+                for index in range(start, end))
+
+    @validate(file_id=FileIdRule, offset=OffsetNumericRule)
+    def get_block_at_offset(self, file_id, offset):
+        """Find the block that holds the given byte of a file
+
+        :param file_id: file to look in
+        :param offset: byte offset within the file
+        :returns: tuple of (block_id, block_offset) for the block starting
+                  at or before offset, or None if there is no such block or
+                  the block is known to end before offset
+        :raises: KeyError if the file is not in the snapshot
+        """
+        start, end = self._file_offset_range(file_id)
+        offsets = self.__columns['offsets']
+
+        lo, hi = start, end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if offsets.int_at(mid) <= offset:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo == start:
+            return None
+
+        block_offset = offsets.int_at(lo - 1)
+        block_id = _unpack_block_id(self.__columns['offset_block_ids'][lo - 1])
+
+        block_index = self._find_block(block_id)
+        if block_index is not None:
+            size = self.__columns['block_sizes'].int_at(block_index)
+            if 0 <= size and block_offset + size <= offset:
+                return None
+
+        return (block_id, block_offset)
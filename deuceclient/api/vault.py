@@ -113,6 +113,16 @@ class Vault(object):
     def files(self):
         return self.__properties['files']
 
+    def empty_copy(self):
+        """Vault object for the same vault without its blocks and files
+
+        Used to hold the data of a single file or batch of blocks so that
+        it is released once done with them.
+        """
+        vault = Vault(project_id=self.project_id, vault_id=self.vault_id)
+        vault.status = self.status
+        return vault
+
     @validate(file_id=FileIdRule)
     def add_file(self, file_id, file_url=None):
         self.files[file_id] = File(self.project_id,
@@ -2,11 +2,8 @@
 Deuce Authentication API
 """
 import abc
-import json
-import requests
 import logging
 import datetime
-import time
 
 
 # TODO: Add a base Auth class
@@ -32,7 +29,7 @@ class AuthenticationBase(object):
 
     def __init__(self, userid=None, usertype=None,
                  credentials=None, auth_method=None,
-                 datacenter=None, auth_url=None):
+                 datacenter=None, auth_url=None, token_cache=None):
         """
         :param userid:  string - User Identifier, e.g username, userid, etc.)
         :param usertype: string - Type of User Identifier
@@ -45,6 +42,8 @@ class AuthenticationBase(object):
         :param auth_url: string - Authentication Service URL to use
         :param datacenter: string - Datacenter to autheniticate in
                                     e.g. identity.rackspace.com
+        :param token_cache: deuceclient.auth.tokencache.TokenCache - cache
+                            to share tokens through, None to not cache
         """
         if userid is None:
             raise AuthenticationError(
@@ -69,6 +68,7 @@ class AuthenticationBase(object):
         self.__catalog['auth_method'] = auth_method
         self.__catalog['datacenter'] = datacenter
         self.__catalog['auth_url'] = auth_url
+        self.__token_cache = token_cache
 
     @property
     def userid(self):
@@ -106,6 +106,12 @@ class AuthenticationBase(object):
         """
         return self.__catalog['auth_url']
 
+    @property
+    def token_cache(self):
+        """Return the cache the tokens are shared through, if any
+        """
+        return self.__token_cache
+
     @abc.abstractmethod
     def GetToken(self, retry=5):
         """Retrieve an Authentication Token
@@ -115,6 +121,14 @@ class AuthenticationBase(object):
         """
         raise NotImplementedError()
 
+    def ResetToken(self):
+        """Retrieve a new Authentication Token, e.g. after the current one
+        was rejected
+
+        :returns: string - authentication token
+        """
+        return self.GetToken()
+
     @abc.abstractmethod
     def IsExpired(self, fuzz=0):
         """Has the token expired
@@ -137,6 +151,41 @@ class AuthenticationBase(object):
     def _AuthToken(self):
         raise NotImplementedError()
 
+    @property
+    def AuthTokenAndExpiration(self):
+        """Access the current AuthToken along with the time it expires at,
+        retrieving it if necessary
+
+        :returns: tuple of the authentication token and the
+                  datetime.datetime it expires at
+        """
+        return self._AuthTokenAndExpiration()
+
+    def _AuthTokenAndExpiration(self):
+        # Authenticators renewing the token in the background must read
+        # both from the same token instead
+        return (self.AuthToken, self.AuthExpirationTime)
+
+    @property
+    def CurrentToken(self):
+        """Return the token currently held without checking whether it
+        expired or retrieving one, so that users can cheaply notice that
+        the token was renewed
+
+        :returns: string - authentication token or None if not known
+        """
+        return self._CurrentToken()
+
+    def _CurrentToken(self):
+        return None
+
+    @property
+    def refresh_margin(self):
+        """Return the number of seconds before the token expires that it
+        is renewed in the background, 0 if it is not
+        """
+        return 0
+
     @property
     def AuthTenantId(self):
         """Return the Tenant Id
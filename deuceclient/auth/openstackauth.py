@@ -3,14 +3,99 @@ Deuce OpenStack Authentication API
 """
 import datetime
 import logging
+import random
+import threading
 import time
 
+import keystoneclient.exceptions
 # What we want to do:
 # import keystoneclient.client
 # What we have to do:
 import keystoneclient.v2_0.client as client_v2
 
 import deuceclient.auth
+from deuceclient.auth.tokencache import TokenCache
+
+# Number of seconds before the token expires that it is renewed in the
+# background
+DEFAULT_REFRESH_MARGIN = 300
+
+# Retrieving a token is retried with an exponential backoff starting at
+# RETRY_BASE_DELAY seconds, up to RETRY_MAX_DELAY seconds between attempts
+# and RETRY_DEADLINE seconds in total
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8
+RETRY_DEADLINE = 30
+
+# Errors from Keystone that are not worth retrying
+CREDENTIAL_ERRORS = (keystoneclient.exceptions.Unauthorized,
+                     keystoneclient.exceptions.Forbidden)
+
+# Errors that are worth retrying, along with the HTTP errors of status
+# 5xx or in RETRY_HTTP_STATUSES; anything else is raised straight away
+TRANSIENT_ERRORS = (keystoneclient.exceptions.ConnectionError,
+                    keystoneclient.exceptions.RequestTimeout,
+                    keystoneclient.exceptions.HttpServerError,
+                    ConnectionError,
+                    TimeoutError)
+RETRY_HTTP_STATUSES = (429,)
+
+
+def _is_transient(ex):
+    """Whether an error retrieving a token is worth retrying
+
+    The Keystone client wraps the errors of the identity service in an
+    AuthorizationFailure, so the errors it was raised from are checked
+    as well.
+    """
+    while ex is not None:
+        if isinstance(ex, TRANSIENT_ERRORS):
+            return True
+
+        status = getattr(ex, 'http_status', None)
+        if isinstance(status, int) and (status >= 500 or
+                                        status in RETRY_HTTP_STATUSES):
+            return True
+
+        ex = ex.__cause__ or ex.__context__
+    return False
+
+
+class _CachedAccess(object):
+    """Stands in for the Keystone access information of a cached token
+    """
+
+    def __init__(self, entry):
+        self.__entry = entry
+
+    @property
+    def auth_token(self):
+        return self.__entry['token']
+
+    @property
+    def expires(self):
+        return self.__entry['expires']
+
+    @property
+    def tenant_id(self):
+        return self.__entry['tenant_id']
+
+    @property
+    def tenant_name(self):
+        return self.__entry['tenant_name']
+
+    @property
+    def user_id(self):
+        return self.__entry['user_id']
+
+    @property
+    def username(self):
+        return self.__entry['username']
+
+    def will_expire_soon(self, stale_duration=None):
+        check_time = datetime.datetime.utcnow() + \
+            datetime.timedelta(seconds=stale_duration or 0)
+        return self.__entry['expires'] <= check_time
 
 
 class OpenStackAuthentication(deuceclient.auth.AuthenticationBase):
@@ -21,17 +106,29 @@ class OpenStackAuthentication(deuceclient.auth.AuthenticationBase):
 
     def __init__(self, userid=None, usertype=None,
                  credentials=None, auth_method=None,
-                 datacenter=None, auth_url=None):
+                 datacenter=None, auth_url=None, token_cache=None,
+                 refresh_margin=DEFAULT_REFRESH_MARGIN):
+        """
+        :param refresh_margin: integer - number of seconds before the token
+                               expires that it is renewed in the background
+        """
         if auth_url is None:
             raise deuceclient.auth.AuthenticationError(
                 'Required Parameter, auth_url, not specified.')
 
         super().__init__(userid=userid, usertype=usertype,
                          credentials=credentials, auth_method=auth_method,
-                         datacenter=datacenter, auth_url=auth_url)
+                         datacenter=datacenter, auth_url=auth_url,
+                         token_cache=token_cache)
 
         self.__client = None
         self.__access = None
+        self.__refresh_margin = refresh_margin
+        # held while a token is being retrieved
+        self.__refresh_lock = threading.Lock()
+        # whether a background refresh is in flight, guarded by its lock
+        self.__refreshing = False
+        self.__refreshing_lock = threading.Lock()
 
     def get_client(self):
         """Retrieve the OpenStack Keystone Client
@@ -74,7 +171,58 @@ class OpenStackAuthentication(deuceclient.auth.AuthenticationBase):
         # What we have to do:
         return client_v2.Client(**auth_args)
 
-    def GetToken(self, retry=5):
+    @property
+    def token_cache_key(self):
+        """Key of the tokens of this user in the token cache
+        """
+        user = '{0}:{1}'.format(self.usertype, self.userid)
+        if self.usertype in ('tenant_name', 'tenant_id'):
+            return TokenCache.make_key(self.authurl, None, user)
+        else:
+            return TokenCache.make_key(self.authurl, user, None)
+
+    def GetToken(self, retry=5, margin=None):
+        """Retrieve a token from the token cache or OpenStack Keystone
+
+        :param margin: number of seconds before its expiration that a token
+                       of the token cache is no longer used but replaced
+                       by a new one
+        """
+        if self.token_cache is None:
+            return self.__get_token(retry)
+
+        entry = self.token_cache.fetch(self.token_cache_key,
+                                       lambda: self.__get_token_entry(retry),
+                                       margin=margin)
+        self.__access = _CachedAccess(entry)
+        return self.__access.auth_token
+
+    def ResetToken(self):
+        """Retrieve a new token after the current one was rejected
+
+        The rejected token is also dropped from the token cache so that it
+        is not handed out again.
+        """
+        with self.__refresh_lock:
+            if self.token_cache is not None and self.__access is not None:
+                self.token_cache.remove(self.token_cache_key,
+                                        token=self.__access.auth_token)
+            return self.GetToken()
+
+    def __get_token_entry(self, retry):
+        """Retrieve a token from OpenStack Keystone for the token cache
+        """
+        entry = {
+            'token': self.__get_token(retry),
+            'expires': self._AuthExpirationTime(),
+            'tenant_id': self._AuthTenantId(),
+            'tenant_name': self.AuthTenantName,
+            'user_id': self.AuthUserId,
+            'username': self.AuthUserName
+        }
+        return entry
+
+    def __get_token(self, retry=5):
         """Retrieve a token from OpenStack Keystone
         """
         if self.__client is None:
@@ -84,27 +232,54 @@ class OpenStackAuthentication(deuceclient.auth.AuthenticationBase):
                 raise deuceclient.auth.AuthenticationError(
                     'Unable to retrieve the Authentication Client')
 
-        try:
-            if self.authmethod in ('apikey', 'password'):
-                self.__access = \
-                    self.__client.get_raw_token_from_identity_service(
-                        auth_url=self.authurl, username=self.userid,
-                        password=self.credentials)
-            else:
-                self.__access = \
-                    self.__client.get_raw_token_from_identity_service(
-                        auth_url=self.authurl, project_id=self.userid,
-                        token=self.credentials)
-
-            return self.__access.auth_token
-
-        except Exception as ex:
-            if retry is 0:
-                self.__access = None
-                raise deuceclient.auth.AuthenticationError(
-                    'Unable to retrieve the Auth Token: {0}'.format(ex))
-            else:
-                return self.GetToken(retry=retry - 1)
+        deadline = time.monotonic() + RETRY_DEADLINE
+        attempt = 0
+        while True:
+            # The current token stays in use until a new one is retrieved,
+            # e.g. when a background refresh fails
+            try:
+                if self.authmethod in ('apikey', 'password'):
+                    access = \
+                        self.__client.get_raw_token_from_identity_service(
+                            auth_url=self.authurl, username=self.userid,
+                            password=self.credentials)
+                else:
+                    access = \
+                        self.__client.get_raw_token_from_identity_service(
+                            auth_url=self.authurl, project_id=self.userid,
+                            token=self.credentials)
+
+                token = access.auth_token
+                self.__access = access
+                return token
+
+            except CREDENTIAL_ERRORS as ex:
+                # Retrying will not make the credentials valid
+                raise deuceclient.auth.AuthCredentialsErrors(
+                    'Invalid Credentials: {0}'.format(ex))
+
+            except Exception as ex:
+                if not _is_transient(ex):
+                    if not isinstance(
+                            ex, keystoneclient.exceptions.ClientException):
+                        # e.g. programming errors
+                        raise
+                    raise deuceclient.auth.AuthenticationError(
+                        'Unable to retrieve the Auth Token: {0}'.format(ex))
+
+                # Exponential backoff with full jitter so that clients
+                # failing at the same time do not retry at the same time
+                delay = random.uniform(0, min(RETRY_MAX_DELAY,
+                                              RETRY_BASE_DELAY * 2 ** attempt))
+                if attempt >= retry or time.monotonic() + delay > deadline:
+                    raise deuceclient.auth.AuthenticationError(
+                        'Unable to retrieve the Auth Token: {0}'.format(ex))
+
+                log = logging.getLogger(__name__)
+                log.debug('Failed to retrieve the Auth Token, retrying in '
+                          '{0:.2f} seconds: {1}'.format(delay, ex))
+                time.sleep(delay)
+                attempt = attempt + 1
 
     def IsExpired(self, fuzz=0):
         if self.__access is None:
@@ -113,20 +288,79 @@ class OpenStackAuthentication(deuceclient.auth.AuthenticationBase):
         else:
             return self.__access.will_expire_soon(stale_duration=fuzz)
 
+    @property
+    def refresh_margin(self):
+        return self.__refresh_margin
+
     def _AuthToken(self):
-        if self.IsExpired():
-            return self.GetToken()
+        return self._AuthTokenAndExpiration()[0]
+
+    def _AuthTokenAndExpiration(self):
+        if not self.IsExpired():
+            if self.IsExpired(fuzz=self.refresh_margin):
+                # The current token is still usable while a new one is
+                # retrieved
+                self.__start_refresh()
+
+            # Both are read from the same token so that a background
+            # refresh cannot pair the current token with the expiration of
+            # the next
+            access = self.__access
+            if access is not None:
+                return (access.auth_token, self.__expiration(access))
+
+        # Only one thread retrieves the token, the others wait for it
+        with self.__refresh_lock:
+            access = self.__access
+            if access is None or self.IsExpired():
+                token = self.GetToken()
+                return (token, self._AuthExpirationTime())
+            return (access.auth_token, self.__expiration(access))
+
+    def _CurrentToken(self):
+        access = self.__access
+        if access is None:
+            return None
+        return access.auth_token
 
-        elif self.IsExpired(fuzz=2):
-            time.sleep(3)
-            return self.GetToken()
+    def __start_refresh(self):
+        """Renew the token in the background unless already renewing it
+        """
+        with self.__refreshing_lock:
+            if self.__refreshing:
+                return
+            self.__refreshing = True
 
-        else:
-            return self.__access.auth_token
+        def refresh():
+            try:
+                with self.__refresh_lock:
+                    # Another thread may have renewed it in the meantime
+                    if self.IsExpired(fuzz=self.refresh_margin):
+                        # A cached token about to expire is replaced too
+                        self.GetToken(margin=self.refresh_margin)
+
+            except Exception as ex:
+                # The next request will try again
+                log = logging.getLogger(__name__)
+                log.warning('Failed to refresh the Auth Token: {0}'
+                            .format(ex))
+
+            finally:
+                with self.__refreshing_lock:
+                    self.__refreshing = False
+
+        refresher = threading.Thread(target=refresh,
+                                     name='deuceclient-token-refresh')
+        refresher.daemon = True
+        refresher.start()
 
     def _AuthExpirationTime(self):
+        return self.__expiration(self.__access)
+
+    @staticmethod
+    def __expiration(access):
         try:
-            return self.__access.expires
+            return access.expires
 
         except Exception as ex:
             print('Error: {0}'.format(ex))
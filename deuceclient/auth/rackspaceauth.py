@@ -4,7 +4,7 @@ Deuce Rackspace Authentication API
 import logging
 
 import deuceclient.auth
-import deuceclient.auth.openstackauth
+import deuceclient.auth.openstackauth as openstackauth
 
 
 def get_identity_apihost(datacenter):
@@ -18,8 +18,7 @@ def get_identity_apihost(datacenter):
             'Unknown Data Center: {0:}'.format(datacenter))
 
 
-class RackspaceAuthentication(
-        deuceclient.auth.openstackauth.OpenStackAuthentication):
+class RackspaceAuthentication(openstackauth.OpenStackAuthentication):
     """Rackspace Identity Authentication Support
 
     Only difference between this and OpenStackAuthentication is that this
@@ -28,7 +27,8 @@ class RackspaceAuthentication(
 
     def __init__(self, userid=None, usertype=None,
                  credentials=None, auth_method=None,
-                 datacenter=None, auth_url=None):
+                 datacenter=None, auth_url=None, token_cache=None,
+                 refresh_margin=openstackauth.DEFAULT_REFRESH_MARGIN):
 
         # If an authentication url is not provided then create one using
         # Rackspace's Identity Service for the specified datacenter
@@ -41,12 +41,15 @@ class RackspaceAuthentication(
             log = logging.getLogger(__name__)
             log.debug('No AuthURL specified. Using {0:}'.format(auth_url))
 
-        super(RackspaceAuthentication, self).__init__(userid=userid,
-                                                      usertype=usertype,
-                                                      credentials=credentials,
-                                                      auth_method=auth_method,
-                                                      datacenter=datacenter,
-                                                      auth_url=auth_url)
+        super(RackspaceAuthentication, self).__init__(
+            userid=userid,
+            usertype=usertype,
+            credentials=credentials,
+            auth_method=auth_method,
+            datacenter=datacenter,
+            auth_url=auth_url,
+            token_cache=token_cache,
+            refresh_margin=refresh_margin)
 
     @staticmethod
     def _management_url(*args, **kwargs):
@@ -0,0 +1,209 @@
+"""
+Deuce Authentication Token Cache
+
+- Shares authentication tokens between processes on the same host so that
+short lived processes do not each have to go to the identity service
+"""
+import contextlib
+import datetime
+import fcntl
+import json
+import os
+
+# Tokens expiring within this many seconds are not handed out
+DEFAULT_EXPIRATION_MARGIN = 60
+
+EXPIRATION_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def default_cache_path():
+    """Location of the token cache shared by the user's processes
+    """
+    cache_dir = os.environ.get('XDG_CACHE_HOME',
+                               os.path.join(os.path.expanduser('~'),
+                                            '.cache'))
+    return os.path.join(cache_dir, 'deuceclient', 'tokens.json')
+
+
+def utc_naive(expires):
+    """Convert a datetime to a naive UTC datetime
+
+    Identity services may return timezone aware expiration times while the
+    authentication plugins use naive UTC times.
+    """
+    if expires.tzinfo is not None:
+        expires = expires.astimezone(datetime.timezone.utc).replace(
+            tzinfo=None)
+    return expires
+
+
+class TokenCache(object):
+    """On-disk cache of authentication tokens
+
+    The cache is a JSON document mapping a key made of the authentication
+    url, user and tenant to the token data. Access is serialized between
+    processes by an flock() on a companion lock file and the cache is
+    replaced atomically on update. Both files are only accessible by
+    the owner since they contain credentials.
+    """
+
+    def __init__(self, path=None, margin=DEFAULT_EXPIRATION_MARGIN):
+        """
+        :param path: path of the cache file, defaults to a file in the
+                     user's cache directory
+        :param margin: number of seconds before its expiration that a
+                       token is no longer handed out
+        """
+        self._path = path if path is not None else default_cache_path()
+        self._margin = margin
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def margin(self):
+        return self._margin
+
+    @staticmethod
+    def make_key(auth_url, user, tenant):
+        """Create the key identifying a token in the cache
+
+        :param auth_url: string - Authentication Service URL
+        :param user: string - user identifier or None
+        :param tenant: string - tenant identifier or None
+        """
+        return json.dumps([auth_url, user, tenant])
+
+    @contextlib.contextmanager
+    def locked(self, exclusive=True):
+        """Hold the cache lock
+
+        :param exclusive: whether or not to exclude all other processes,
+                          otherwise other readers are allowed
+        """
+        cache_dir = os.path.dirname(self._path)
+        if cache_dir:
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+        lock_fd = os.open('{0}.lock'.format(self._path),
+                          os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+    def _read(self):
+        try:
+            with open(self._path, 'r') as cache:
+                entries = json.load(cache)
+        except (OSError, ValueError):
+            # A missing or corrupted cache is treated as empty
+            return {}
+
+        if not isinstance(entries, dict):
+            return {}
+        return entries
+
+    def _write(self, entries):
+        temp_file = '{0}.{1}.tmp'.format(self._path, os.getpid())
+        fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     0o600)
+        with os.fdopen(fd, 'w') as cache:
+            json.dump(entries, cache)
+        os.replace(temp_file, self._path)
+
+    def _is_valid(self, entry, margin=None):
+        try:
+            expires = datetime.datetime.strptime(entry['expires'],
+                                                 EXPIRATION_FORMAT)
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        margin = max(self._margin, margin or 0)
+        return expires > (datetime.datetime.utcnow() +
+                          datetime.timedelta(seconds=margin))
+
+    def _lookup(self, key, margin=None):
+        entry = self._read().get(key)
+        if entry is not None and self._is_valid(entry, margin):
+            return self._decode(entry)
+        return None
+
+    def _store(self, key, entry):
+        entries = {k: v for k, v in self._read().items()
+                   if k != key and self._is_valid(v)}
+        entries[key] = self._encode(entry)
+        self._write(entries)
+
+    @staticmethod
+    def _encode(entry):
+        encoded = dict(entry)
+        encoded['expires'] = utc_naive(entry['expires']).strftime(
+            EXPIRATION_FORMAT)
+        return encoded
+
+    @staticmethod
+    def _decode(entry):
+        decoded = dict(entry)
+        decoded['expires'] = datetime.datetime.strptime(entry['expires'],
+                                                        EXPIRATION_FORMAT)
+        return decoded
+
+    def get(self, key):
+        """Retrieve a token that is not about to expire
+
+        :param key: key made by make_key()
+        :returns: dict of the token data, with 'token' and 'expires' (naive
+                  UTC datetime) entries, or None if there is no such token
+        """
+        with self.locked(exclusive=False):
+            return self._lookup(key)
+
+    def put(self, key, entry):
+        """Store a token; expired tokens are pruned at the same time
+
+        :param key: key made by make_key()
+        :param entry: dict of JSON serializable token data that must at
+                      least contain 'token' and 'expires' (datetime)
+        """
+        with self.locked():
+            self._store(key, entry)
+
+    def remove(self, key, token=None):
+        """Forget a token, e.g. one the service rejected
+
+        :param key: key made by make_key()
+        :param token: only forget the entry if it holds this token, so
+                      that a new token stored by another process is kept
+        """
+        with self.locked():
+            entries = self._read()
+            entry = entries.get(key)
+            if entry is not None and token in (None, entry.get('token')):
+                del entries[key]
+                self._write(entries)
+
+    def fetch(self, key, get_entry, margin=None):
+        """Retrieve a token, requesting a new one if needed
+
+        The lock is held while requesting a new token so that concurrent
+        processes wait for and share the same new token instead of each
+        going to the identity service.
+
+        :param key: key made by make_key()
+        :param get_entry: function returning a new entry as for put()
+        :param margin: number of seconds before its expiration that a
+                       cached token is replaced, when more than the margin
+                       of the cache, e.g. to renew a token ahead of time
+        :returns: dict of the token data as for get()
+        """
+        with self.locked():
+            entry = self._lookup(key, margin)
+            if entry is None:
+                entry = get_entry()
+                self._store(key, entry)
+                entry = self._decode(self._encode(entry))
+            return entry
@@ -0,0 +1,362 @@
+"""
+Deuce Client - Vault Archives
+
+An archive holds the files of a vault with the data of their blocks, so
+that a vault can be seeded or migrated offline. It is written and read in a
+single pass, as a stream:
+
+    header   - magic, version
+    manifest - length, then JSON with the project_id, vault_id, the number
+               of blocks and the offset map of each file as a list of
+               [block_id, offset]
+    blocks   - each block used by the files, once: binary Block ID, length,
+               data
+    trailer  - a Block ID of all zeros
+
+Lengths are unsigned 64-bit little-endian integers.
+"""
+import binascii
+import json
+import logging
+import struct
+
+import deuceclient.api.block as api_block
+from deuceclient.client.deuce import DEFAULT_CONCURRENCY
+from deuceclient.client.tree import DEFAULT_BLOCKS_PER_ASSIGNMENT
+from deuceclient.utils import parallel
+
+ARCHIVE_MAGIC = b'DEUCEVX\x00'
+ARCHIVE_VERSION = 1
+
+# Number of bytes of blocks uploaded per request on import
+DEFAULT_UPLOAD_BATCH_SIZE = 4 * 1024 * 1024
+
+_HEADER = struct.Struct('<8sI')
+_LENGTH = struct.Struct('<Q')
+_BLOCK_ID_SIZE = 20
+_TRAILER = b'\x00' * _BLOCK_ID_SIZE
+
+
+def _read_exactly(archive, size):
+    data = archive.read(size)
+    if len(data) != size:
+        raise ValueError('Truncated archive')
+    return data
+
+
+def read_manifest(archive):
+    """Read the header and the manifest of an archive
+
+    :param archive: file-like object positioned at the start of the archive
+    :returns: dict of the manifest
+    :raises: ValueError if the archive is not a valid vault archive
+    """
+    magic, version = _HEADER.unpack(_read_exactly(archive, _HEADER.size))
+    if magic != ARCHIVE_MAGIC:
+        raise ValueError('Not a vault archive')
+    if version != ARCHIVE_VERSION:
+        raise ValueError('Unsupported vault archive version {0:}'.format(
+            version))
+
+    length, = _LENGTH.unpack(_read_exactly(archive, _LENGTH.size))
+    try:
+        manifest = json.loads(_read_exactly(archive, length).decode('utf-8'))
+        for file_id, blocks in manifest['files'].items():
+            for block_id, offset in blocks:
+                int(offset)
+        int(manifest['blocks'])
+    except (UnicodeDecodeError, TypeError, KeyError, AttributeError) as ex:
+        raise ValueError('Invalid vault archive manifest: {0:}'.format(ex))
+    return manifest
+
+
+def read_blocks(archive):
+    """Read the blocks of an archive
+
+    :param archive: file-like object positioned after the manifest
+    :returns: generator of the (Block ID, data) of each block
+    :raises: ValueError if the archive is truncated or a block does not
+             match its Block ID
+    """
+    while True:
+        binary_id = _read_exactly(archive, _BLOCK_ID_SIZE)
+        if binary_id == _TRAILER:
+            return
+
+        block_id = binascii.hexlify(binary_id).decode('ascii')
+        length, = _LENGTH.unpack(_read_exactly(archive, _LENGTH.size))
+        data = _read_exactly(archive, length)
+        if api_block.Block.make_id(data) != block_id:
+            raise ValueError('Block {0:} of the archive does not match its '
+                             'data'.format(block_id))
+        yield block_id, data
+
+
+class VaultExporter(object):
+    """Exports the files of a vault and their blocks to an archive
+
+    The block lists of the files and then the blocks are downloaded
+    concurrently. Each block is written once however many files use it, as
+    soon as it arrives, so only the blocks in flight are held in memory.
+    """
+
+    def __init__(self, client, vault, concurrency=DEFAULT_CONCURRENCY):
+        """
+        :param client: instance of deuceclient.client.deuce.DeuceClient
+        :param vault: instance of deuceclient.api.Vault to export
+        :param concurrency: number of requests made at the same time
+        """
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+
+        self.log = logging.getLogger(__name__)
+        self._client = client
+        self._vault = vault
+        self._concurrency = concurrency
+
+        self.files_exported = 0
+        self.blocks_exported = 0
+        self.bytes_exported = 0
+
+    def _block_list(self, file_id):
+        vault = self._vault.empty_copy()
+        vault.add_file(file_id)
+        blocks = sorted((int(offset), block_id) for block_id, offset in
+                        self._client.IterFileBlockList(vault, file_id))
+        return file_id, [[block_id, offset] for offset, block_id in blocks]
+
+    def _download(self, block_id):
+        block = api_block.Block(project_id=self._vault.project_id,
+                                vault_id=self._vault.vault_id,
+                                block_id=block_id)
+        self._client.DownloadBlock(self._vault, block)
+        return block_id, block.data
+
+    def export(self, output):
+        """Write the archive of the vault
+
+        :param output: object with a write method receiving the archive
+        :returns: number of files exported
+        """
+        files = dict(parallel.imap_unordered(
+            self._block_list, self._client.IterFiles(self._vault),
+            self._concurrency))
+        block_ids = sorted({block_id for blocks in files.values()
+                            for block_id, offset in blocks})
+
+        manifest = json.dumps({
+            'project_id': self._vault.project_id,
+            'vault_id': self._vault.vault_id,
+            'blocks': len(block_ids),
+            'files': files
+        }, sort_keys=True).encode('utf-8')
+        output.write(_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION))
+        output.write(_LENGTH.pack(len(manifest)))
+        output.write(manifest)
+
+        for block_id, data in parallel.imap_unordered(
+                self._download, block_ids, self._concurrency):
+            output.write(binascii.unhexlify(block_id))
+            output.write(_LENGTH.pack(len(data)))
+            output.write(data)
+            self.blocks_exported = self.blocks_exported + 1
+            self.bytes_exported = self.bytes_exported + len(data)
+        output.write(_TRAILER)
+
+        self.files_exported = self.files_exported + len(files)
+        self.log.info('Exported {0:} files with {1:} blocks, {2:} bytes, '
+                      'from {3:}'.format(len(files), len(block_ids),
+                                         self.bytes_exported,
+                                         self._vault.vault_id))
+        return len(files)
+
+
+class VaultImporter(object):
+    """Imports the files of an archive into a vault
+
+    The files are created and their blocks assigned concurrently, which
+    tells which blocks the vault is missing. The blocks of the archive are
+    then read in a single pass, the missing ones uploaded concurrently in
+    batches and the others skipped. The files are finalized last, once all
+    their blocks are stored.
+    """
+
+    def __init__(self, client, vault, concurrency=DEFAULT_CONCURRENCY,
+                 upload_batch_size=DEFAULT_UPLOAD_BATCH_SIZE,
+                 blocks_per_assignment=DEFAULT_BLOCKS_PER_ASSIGNMENT):
+        """
+        :param client: instance of deuceclient.client.deuce.DeuceClient
+        :param vault: instance of deuceclient.api.Vault to import into
+        :param concurrency: number of requests made at the same time
+        :param upload_batch_size: number of bytes of blocks uploaded per
+                                  request
+        :param blocks_per_assignment: number of blocks assigned to a file
+                                      per request
+        """
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        if upload_batch_size < 1:
+            raise ValueError('upload_batch_size must be at least 1')
+        if blocks_per_assignment < 1:
+            raise ValueError('blocks_per_assignment must be at least 1')
+
+        self.log = logging.getLogger(__name__)
+        self._client = client
+        self._vault = vault
+        self._concurrency = concurrency
+        self._upload_batch_size = upload_batch_size
+        self._blocks_per_assignment = blocks_per_assignment
+
+        self.files_imported = 0
+        self.blocks_uploaded = 0
+        self.blocks_skipped = 0
+        self.bytes_uploaded = 0
+
+    def _create(self, entry, created_files):
+        """Create a file and assign its blocks
+
+        :param created_files: list the Vault object holding the new file
+                              and its File ID are added to as soon as it
+                              is created
+        :returns: the File ID in the archive, the Vault object holding the
+                  new file, its File ID and the set of the missing blocks
+        """
+        archived_file_id, blocks = entry
+        vault = self._vault.empty_copy()
+        file_id = self._client.CreateFile(vault)
+        created_files.append((vault, file_id))
+        for block_id, offset in blocks:
+            vault.files[file_id].assign_block(block_id, offset)
+
+        missing = set()
+        for index in range(0, len(blocks), self._blocks_per_assignment):
+            missing.update(self._client.AssignBlocksToFile(
+                vault, file_id,
+                [(block_id, offset) for block_id, offset in
+                 blocks[index:index + self._blocks_per_assignment]]))
+        return archived_file_id, (vault, file_id, missing)
+
+    def _batches(self, archive, missing, sizes):
+        """Read the blocks of the archive, batching those to upload
+        """
+        batch = []
+        batch_size = 0
+        for block_id, data in read_blocks(archive):
+            sizes[block_id] = len(data)
+            if block_id not in missing:
+                self.blocks_skipped = self.blocks_skipped + 1
+                continue
+
+            missing.discard(block_id)
+            batch.append((block_id, data))
+            batch_size = batch_size + len(data)
+            if batch_size >= self._upload_batch_size:
+                yield batch
+                batch = []
+                batch_size = 0
+
+        if batch:
+            yield batch
+
+    def _upload(self, batch):
+        vault = self._vault.empty_copy()
+        for block_id, data in batch:
+            vault.blocks[block_id] = api_block.Block(
+                project_id=vault.project_id, vault_id=vault.vault_id,
+                block_id=block_id, data=data)
+        self._client.UploadBlocks(vault, [block_id for block_id, data in
+                                          batch])
+        return len(batch), sum(len(data) for block_id, data in batch)
+
+    def _finalize(self, entry):
+        vault, file_id, blocks, sizes = entry
+        if blocks:
+            block_id, offset = blocks[-1]
+            vault.files[file_id].add_block(api_block.Block(
+                project_id=vault.project_id, vault_id=vault.vault_id,
+                block_id=block_id, block_size=sizes[block_id]))
+        self._client.FinalizeFile(vault, file_id)
+        return file_id
+
+    def import_archive(self, archive):
+        """Import the files of an archive
+
+        :param archive: file-like object positioned at the start of the
+                        archive
+        :returns: dict of the File ID in the vault of each File ID in the
+                  archive
+        :raises: ValueError if the archive is not a valid vault archive or
+                 lacks blocks of its files
+        :raises: RuntimeError if blocks the vault is missing are not in the
+                 archive
+        :raises: the first error of the import, once the files it created
+                 are deleted
+        """
+        manifest = read_manifest(archive)
+        files = {archived_file_id: sorted(blocks, key=lambda block:
+                                          int(block[1]))
+                 for archived_file_id, blocks in manifest['files'].items()}
+
+        created_files = []
+        try:
+            return self._import_files(archive, files, created_files)
+
+        except Exception:
+            for vault, file_id in created_files:
+                try:
+                    self._client.DeleteFile(vault, file_id)
+                except Exception as ex:
+                    self.log.error('Failed to delete the partially imported '
+                                   'file {0:}: {1:}'.format(file_id, ex))
+            raise
+
+    def _import_files(self, archive, files, created_files):
+        """Import the files of an archive positioned after its manifest
+
+        :param files: dict of the sorted offset map of each File ID in the
+                      archive
+        :param created_files: list the new files are added to, as for
+                              _create()
+        :returns: dict of the File ID in the vault of each File ID in the
+                  archive
+        """
+        created = dict(parallel.imap_unordered(
+            lambda entry: self._create(entry, created_files), files.items(),
+            self._concurrency))
+        missing = set()
+        for vault, file_id, file_missing in created.values():
+            missing.update(file_missing)
+
+        sizes = {}
+        for count, size in parallel.imap_unordered(
+                self._upload, self._batches(archive, missing, sizes),
+                self._concurrency):
+            self.blocks_uploaded = self.blocks_uploaded + count
+            self.bytes_uploaded = self.bytes_uploaded + size
+
+        if missing:
+            raise RuntimeError('Failed to import the archive. {0:} blocks '
+                               'missing from the vault are not in the '
+                               'archive: {1:}'.format(len(missing),
+                                                      sorted(missing)))
+        absent = {block_id for blocks in files.values()
+                  for block_id, offset in blocks}.difference(sizes)
+        if absent:
+            raise ValueError('Blocks of the files of the archive are not in '
+                             'the archive: {0:}'.format(sorted(absent)))
+
+        for file_id in parallel.imap_unordered(
+                self._finalize,
+                [(vault, file_id, files[archived_file_id], sizes)
+                 for archived_file_id, (vault, file_id, file_missing)
+                 in created.items()],
+                self._concurrency):
+            self.files_imported = self.files_imported + 1
+
+        self.log.info('Imported {0:} files into {1:}: {2:} blocks, {3:} '
+                      'bytes, uploaded and {4:} already stored'.format(
+                          self.files_imported, self._vault.vault_id,
+                          self.blocks_uploaded, self.bytes_uploaded,
+                          self.blocks_skipped))
+        return {archived_file_id: file_id for archived_file_id,
+                (vault, file_id, file_missing) in created.items()}
@@ -0,0 +1,233 @@
+"""
+Deuce Block Cache
+
+- Keeps the blocks downloaded from Deuce on local disk so that blocks used
+by several files, or downloaded again later on, are read locally instead of
+over the network
+"""
+import logging
+import os
+import threading
+
+import deuceclient.api.block as api_block
+
+# Default cap of the size of the cache, in bytes
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+# Once over its cap, the cache is trimmed down to this ratio of its cap so
+# that it is not scanned again on every addition
+EVICTION_RATIO = 0.9
+
+
+def default_cache_path():
+    """Location of the block cache shared by the user's processes
+    """
+    cache_dir = os.environ.get('XDG_CACHE_HOME',
+                               os.path.join(os.path.expanduser('~'),
+                                            '.cache'))
+    return os.path.join(cache_dir, 'deuceclient', 'blocks')
+
+
+class BlockCache(object):
+    """Content-addressed on-disk cache of blocks
+
+    Blocks are stored in a file named after their Block ID, the SHA-1 of
+    their data, in directories sharded by the first characters of the id.
+    The data is checked against the Block ID whenever it is read so that a
+    corrupted entry is dropped instead of returned. The least recently
+    used blocks, by modification time which is refreshed on each use, are
+    evicted when the cache grows over its cap.
+
+    Entries are written to a temporary file and renamed into place so that
+    several processes may share the cache.
+    """
+
+    def __init__(self, path=None, max_size=DEFAULT_MAX_SIZE):
+        """
+        :param path: path of the cache directory, defaults to a directory
+                     in the user's cache directory
+        :param max_size: maximum number of bytes of blocks kept
+        """
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+
+        self.log = logging.getLogger(__name__)
+        self._path = path if path is not None else default_cache_path()
+        self._max_size = max_size
+        self.__lock = threading.Lock()
+        self.__size = None
+
+        self.hits = 0
+        self.misses = 0
+        self.corrupted = 0
+        self.evicted = 0
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def size(self):
+        """Number of bytes of blocks in the cache
+        """
+        with self.__lock:
+            return self.__current_size()
+
+    def __current_size(self):
+        # Must be called with the lock held
+        if self.__size is None:
+            self.__size = sum(size for modified, size, path
+                              in self.__scan())
+        return self.__size
+
+    def block_path(self, block_id):
+        """Path of the cache entry of a block
+        """
+        return os.path.join(self._path, block_id[0:2], block_id[2:4],
+                            block_id)
+
+    def __scan(self):
+        """List the entries of the cache
+
+        :returns: generator of (modification time, size, path)
+        """
+        for directory, subdirectories, file_names in os.walk(self._path):
+            for file_name in file_names:
+                # Skip the entries being written
+                if file_name.startswith('.'):
+                    continue
+
+                path = os.path.join(directory, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Evicted by another process
+                    continue
+                yield (stat.st_mtime, stat.st_size, path)
+
+    def __count(self, counter):
+        with self.__lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def __discard(self, path, size):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+
+        with self.__lock:
+            if self.__size is not None:
+                self.__size = max(self.__size - size, 0)
+
+    def get(self, block_id):
+        """Read a block from the cache
+
+        :param block_id: the Block ID
+        :returns: the block data, or None if the block is not in the cache
+        """
+        path = self.block_path(block_id)
+        try:
+            with open(path, 'rb') as entry:
+                data = entry.read()
+        except OSError:
+            self.__count('misses')
+            return None
+
+        if api_block.Block.make_id(data) != block_id:
+            self.log.warning('Dropping the corrupted cache entry of block '
+                             '{0:}'.format(block_id))
+            self.__discard(path, len(data))
+            self.__count('corrupted')
+            self.__count('misses')
+            return None
+
+        try:
+            # Mark the block as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        self.__count('hits')
+        return data
+
+    def put(self, block_id, data):
+        """Add a block to the cache
+
+        :param block_id: the Block ID
+        :param data: the block data
+        :returns: True if the block was added, False if the data does not
+                  match the Block ID or is larger than the cache
+        """
+        if len(data) > self._max_size:
+            return False
+
+        if api_block.Block.make_id(data) != block_id:
+            self.log.warning('Not caching block {0:}: its data does not '
+                             'match its id'.format(block_id))
+            return False
+
+        path = self.block_path(block_id)
+        if os.path.exists(path):
+            return True
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        temp_file = os.path.join(directory, '.{0}.{1}.{2}.tmp'.format(
+            block_id, os.getpid(), threading.get_ident()))
+        fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     0o600)
+        with os.fdopen(fd, 'wb') as entry:
+            entry.write(data)
+
+        with self.__lock:
+            # Account for the existing entries before adding this one
+            size = self.__current_size()
+            if os.path.exists(path):
+                # Added by another thread meanwhile
+                os.unlink(temp_file)
+                return True
+
+            os.replace(temp_file, path)
+            self.__size = size + len(data)
+            over_cap = self.__size > self._max_size
+
+        if over_cap:
+            self.evict()
+        return True
+
+    def evict(self, target_size=None):
+        """Remove the least recently used blocks
+
+        :param target_size: number of bytes to trim the cache down to,
+                            defaults to a fraction of the cap
+        """
+        if target_size is None:
+            target_size = int(self._max_size * EVICTION_RATIO)
+
+        with self.__lock:
+            # Scan again as other processes share the cache
+            entries = sorted(self.__scan())
+            size = sum(entry_size for modified, entry_size, path
+                       in entries)
+
+            for modified, entry_size, path in entries:
+                if size <= target_size:
+                    break
+
+                try:
+                    os.unlink(path)
+                    self.evicted = self.evicted + 1
+                except FileNotFoundError:
+                    pass
+                size = size - entry_size
+
+            self.__size = size
+
+    def clear(self):
+        """Remove all the blocks
+        """
+        self.evict(target_size=0)
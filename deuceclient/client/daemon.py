@@ -0,0 +1,259 @@
+"""
+Deuce Client Daemon
+
+- Serves the commands of the shell batch mode over a local Unix socket so
+that short lived processes share an authenticated client, its connections
+and its caches instead of each setting up their own
+"""
+import io
+import json
+import logging
+import os
+import shlex
+import socket
+import socketserver
+import threading
+
+
+def default_socket_path():
+    """Location of the socket of the user's daemon
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR',
+                                 os.path.join(os.path.expanduser('~'),
+                                              '.cache'))
+    return os.path.join(runtime_dir, 'deuceclient', 'daemon.sock')
+
+
+class _DaemonRequestHandler(socketserver.StreamRequestHandler):
+    """Runs the commands received on a connection
+
+    Each line received is a command, answered by a line of JSON
+    """
+
+    def handle(self):
+        commands = io.TextIOWrapper(self.rfile, encoding='utf-8')
+        output = io.TextIOWrapper(self.wfile, encoding='utf-8',
+                                  write_through=True)
+        try:
+            self.server.run_commands(commands, output)
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.log.debug('Connection closed by the client')
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server running the commands of its clients
+
+    Each connection is served by its own thread. The socket is only
+    accessible by its owner since the commands run with the owner's
+    credentials.
+    """
+    daemon_threads = True
+
+    def __init__(self, run_commands, path=None):
+        """
+        :param run_commands: function running the commands read from its
+                             first argument, an iterable of lines, and
+                             writing the results to its second argument,
+                             a file-like object
+        :param path: path of the socket, defaults to a file in the user's
+                     runtime directory
+        """
+        self.log = logging.getLogger(__name__)
+        self.run_commands = run_commands
+        self.path = path if path is not None else default_socket_path()
+
+        socket_dir = os.path.dirname(self.path)
+        if socket_dir:
+            os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+        self.__remove_stale_socket()
+
+        umask = os.umask(0o177)
+        try:
+            super(DaemonServer, self).__init__(self.path,
+                                               _DaemonRequestHandler)
+        finally:
+            os.umask(umask)
+
+    def __remove_stale_socket(self):
+        if not os.path.exists(self.path):
+            return
+
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # Left behind by a daemon that did not shut down cleanly
+            os.unlink(self.path)
+        else:
+            raise RuntimeError('A daemon is already listening on {0:}'
+                               .format(self.path))
+        finally:
+            probe.close()
+
+    def server_close(self):
+        super(DaemonServer, self).server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class DaemonClient(object):
+    """Thin client of the Deuce Client daemon
+
+    The connection is opened on first use and kept for the following
+    commands. Paths are sent as absolute paths since the daemon does not
+    share the current directory of the caller.
+    """
+
+    def __init__(self, path=None, timeout=None):
+        """
+        :param path: path of the daemon socket, defaults to the socket in
+                     the user's runtime directory
+        :param timeout: number of seconds to wait for the daemon
+        """
+        self.path = path if path is not None else default_socket_path()
+        self.timeout = timeout
+        self.__socket = None
+        self.__results = None
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the connection to the daemon
+        """
+        if self.__socket is not None:
+            self.__results.close()
+            self.__socket.close()
+            self.__socket = None
+            self.__results = None
+
+    def __connect(self):
+        if self.__socket is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            try:
+                connection.connect(self.path)
+            except OSError as ex:
+                connection.close()
+                raise RuntimeError('Failed to connect to the daemon at {0:}.'
+                                   ' Error: {1:}'.format(self.path, ex))
+            self.__socket = connection
+            self.__results = connection.makefile('r', encoding='utf-8')
+
+    def send(self, command):
+        """Run a command, as for the shell batch mode
+
+        :param command: list of the command arguments
+        :returns: dict of the result as produced by the daemon
+        :raises: RuntimeError if the daemon could not be reached
+        """
+        if not command:
+            raise ValueError('command must not be empty')
+
+        line = ' '.join(shlex.quote(str(argument)) for argument in command)
+
+        with self.__lock:
+            self.__connect()
+            try:
+                self.__socket.sendall((line + '\n').encode('utf-8'))
+                result = self.__results.readline()
+            except OSError as ex:
+                self.close()
+                raise RuntimeError('Failed to run the command on the daemon.'
+                                   ' Error: {0:}'.format(ex))
+
+            if not result:
+                self.close()
+                raise RuntimeError('Failed to run the command on the daemon.'
+                                   ' Error: connection closed')
+
+        return json.loads(result)
+
+    def execute(self, command):
+        """Run a command
+
+        :param command: list of the command arguments
+        :returns: the result of the command
+        :raises: RuntimeError if the command failed
+        """
+        result = self.send(command)
+        if result['status'] != 'ok':
+            raise RuntimeError('Failed to {0:}. Error: {1:}'.format(
+                result['command'], result['error']))
+        return result['result']
+
+    def ListVaults(self):
+        """List the vaults
+
+        :returns: list of the vault names
+        """
+        return self.execute(['vault', 'list'])['vaults']
+
+    def ListBlocks(self, vault_name, marker=None, limit=None):
+        """List the blocks of a vault
+
+        :param vault_name: name of the vault
+        :param marker: block id to start the listing at
+        :param limit: maximum number of block ids to return
+        :returns: list of the block ids
+        """
+        command = ['blocks', '--vault-name', vault_name, 'list']
+        if marker is not None:
+            command.extend(['--marker', marker])
+        if limit is not None:
+            command.extend(['--limit', limit])
+        return self.execute(command)['blocks']
+
+    def UploadBlock(self, vault_name, path):
+        """Upload the content of a file as a block
+
+        :param vault_name: name of the vault
+        :param path: path of the file holding the block
+        :returns: the block id
+        """
+        return self.execute(['blocks', '--vault-name', vault_name,
+                             'upload', '--block-content',
+                             os.path.abspath(path)])['block_id']
+
+    def ListFiles(self, vault_name, limit=None):
+        """List the files of a vault
+
+        :param vault_name: name of the vault
+        :param limit: maximum number of file ids to return
+        :returns: list of the file ids
+        """
+        command = ['files', '--vault-name', vault_name, 'list']
+        if limit is not None:
+            command.extend(['--limit', limit])
+        return self.execute(command)['files']
+
+    def UploadFile(self, vault_name, path, file_id=None):
+        """Upload a file
+
+        :param vault_name: name of the vault
+        :param path: path of the file to upload
+        :param file_id: File ID in the Vault, one is created if None
+        :returns: the File ID
+        """
+        command = ['files', '--vault-name', vault_name, 'upload',
+                   '--content', os.path.abspath(path)]
+        if file_id is not None:
+            command.extend(['--file-id', file_id])
+        return self.execute(command)['file_id']
+
+    def DownloadFile(self, vault_name, file_id, path):
+        """Download a file
+
+        :param vault_name: name of the vault
+        :param file_id: File ID in the Vault
+        :param path: path to store the file at
+        """
+        self.execute(['files', '--vault-name', vault_name, 'download',
+                      '--file-id', file_id,
+                      '--file-name', os.path.abspath(path)])
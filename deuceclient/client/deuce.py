@@ -5,9 +5,10 @@ import datetime
 import json
 import requests
 import logging
+import threading
 from urllib.parse import urlparse, parse_qs
+import uuid
 
-import msgpack
 from stoplight import validate
 
 import deuceclient.api.afile as api_file
@@ -16,17 +17,50 @@ import deuceclient.api.blocks as api_blocks
 import deuceclient.api.storageblocks as api_storageblocks
 import deuceclient.api.vault as api_vault
 import deuceclient.api.v1 as api_v1
+import deuceclient.client.verify as verify
+from deuceclient.auth.tokencache import utc_naive
 from deuceclient.common.command import Command
 from deuceclient.common import errors as errors
 from deuceclient.common.validation import *
 from deuceclient.common.validation_instance import *
+from deuceclient.utils import download
 from deuceclient.utils.misc import set_qs_on_url
+from deuceclient.utils.paginator import Paginator
+from deuceclient.utils import parallel
 
 
 # So that we can simply capture the Security warnings
 # generated by requests.urllib3....
 logging.captureWarnings(True)
 
+# Block IDs are SHA-1 hex digests
+BLOCK_ID_KEYSPACE_BITS = 160
+
+DEFAULT_CONCURRENCY = parallel.DEFAULT_CONCURRENCY
+
+# Size of the chunks block downloads are verified in
+VERIFY_CHUNK_SIZE = 64 * 1024
+
+# Number of blocks assigned per request when cloning a file
+CLONE_BLOCKS_PER_ASSIGNMENT = 1000
+
+# Number of seconds before the token expires that the authentication
+# headers are resolved again
+AUTH_HEADERS_EXPIRATION_MARGIN = 60
+
+
+def _keyspace_boundaries(partitions):
+    """Split the block id keyspace into evenly sized ranges
+
+    :param partitions: number of ranges
+    :returns: list of the first block id of each range
+    """
+    if partitions < 1:
+        raise ValueError('partitions must be at least 1')
+
+    return ['{0:040x}'.format((index << BLOCK_ID_KEYSPACE_BITS) // partitions)
+            for index in range(partitions)]
+
 
 class DeuceClient(Command):
 
@@ -34,13 +68,26 @@ class DeuceClient(Command):
     Object defining HTTP REST API calls for interacting with Deuce.
     """
 
-    def __init__(self, authenticator, apihost, sslenabled=False):
+    def __init__(self, authenticator, apihost, sslenabled=False,
+                 session=None, block_cache=None, verify_downloads=False,
+                 verify_retries=verify.DEFAULT_RETRIES):
         """Initialize the Deuce Client access
 
         :param authenticator: instance of deuceclient.auth.Authentication
                               to use for retrieving auth tokens
         :param apihost: server to use for API calls
         :param sslenabled: True if using HTTPS; otherwise false
+        :param session: requests.Session to send the requests through so
+                        that connections are kept alive and reused;
+                        otherwise each request uses its own connection
+        :param block_cache: deuceclient.client.blockcache.BlockCache
+                            serving the block downloads from local disk
+                            when it has the blocks
+        :param verify_downloads: True to check the downloaded data against
+                                 the Block IDs as it arrives
+        :param verify_retries: number of times a block failing
+                               verification is downloaded again before
+                               giving up; 0 to fail straight away
         """
         super(DeuceClient, self).__init__(apihost,
                                           '/',
@@ -48,12 +95,95 @@ class DeuceClient(Command):
         self.log = logging.getLogger(__name__)
         self.sslenabled = sslenabled
         self.authenticator = authenticator
+        self.__http = session if session is not None else requests
+        self.block_cache = block_cache
+        self.verify_downloads = verify_downloads
+        self.verify_retries = verify_retries
+        self.verification = verify.VerificationStats()
+        # tuple of the token, the tenant id and when to resolve them again
+        self.__auth = None
+        self.__auth_lock = threading.Lock()
+
+    def __resolve_auth(self):
+        """Read the authentication headers from the authenticator
+
+        Must be called with the auth lock held.
+        """
+        token, expires = self.authenticator.AuthTokenAndExpiration
+        tenant_id = self.authenticator.AuthTenantId
+        # Resolved again once the authenticator renews the token
+        margin = max(AUTH_HEADERS_EXPIRATION_MARGIN,
+                     self.authenticator.refresh_margin)
+        expires = utc_naive(expires) - datetime.timedelta(seconds=margin)
+
+        self.__auth = (token, tenant_id, expires)
+        return self.__auth
+
+    def __is_stale(self, auth):
+        """Whether the resolved headers must be resolved again
+        """
+        if auth is None or datetime.datetime.utcnow() >= auth[2]:
+            return True
+
+        current_token = self.authenticator.CurrentToken
+        return current_token is not None and current_token != auth[0]
+
+    def __auth_headers(self):
+        """Retrieve the token and tenant id, resolving them only when the
+        token is about to expire or the authenticator changed it
+
+        :returns: tuple of the token and the tenant id
+        """
+        auth = self.__auth
+        if self.__is_stale(auth):
+            with self.__auth_lock:
+                auth = self.__auth
+                if self.__is_stale(auth):
+                    auth = self.__resolve_auth()
+        return auth[:2]
+
+    def __reauthenticate(self, rejected_token):
+        """Retrieve a new token after the service rejected one
+
+        Only the first of the requests rejected with the same token gets
+        a new token; the others reuse it.
+
+        :returns: tuple of the token and the tenant id
+        """
+        with self.__auth_lock:
+            auth = self.__auth
+            if auth is None or auth[0] == rejected_token:
+                self.authenticator.ResetToken()
+                auth = self.__resolve_auth()
+            return auth[:2]
 
     def __update_headers(self):
         """Update common headers
         """
-        self.headers['X-Auth-Token'] = self.authenticator.AuthToken
-        self.headers['X-Project-ID'] = self.project_id
+        token, tenant_id = self.__auth_headers()
+        self.headers['X-Auth-Token'] = token
+        self.headers['X-Project-ID'] = tenant_id
+
+    def __send(self, method, url, headers=None, **kwargs):
+        """Send a request, replaying it once with a new token if the
+        token was rejected
+
+        :param method: name of the HTTP method, e.g. 'get'
+        :param url: url of the request
+        :param headers: headers of the request
+        :returns: requests.Response
+        """
+        method = getattr(self.__http, method)
+        res = method(url, headers=headers, **kwargs)
+        if res.status_code == 401:
+            self.log.debug('Token rejected, re-authenticating')
+            token, tenant_id = self.__reauthenticate(
+                headers.get('X-Auth-Token'))
+            headers = dict(headers)
+            headers['X-Auth-Token'] = token
+            headers['X-Project-ID'] = tenant_id
+            res = method(url, headers=headers, **kwargs)
+        return res
 
     def __log_request_data(self, fn=None, headers=None):
         """Log the information about the request
@@ -95,65 +225,136 @@ class DeuceClient(Command):
     def project_id(self):
         """Return the project id to use
         """
-        return self.authenticator.AuthTenantId
+        return self.__auth_headers()[1]
 
-    @validate(project=ProjectInstanceRule, marker=VaultIdRuleNoneOkay)
-    def ListVaults(self, project, marker=None, limit=None):
-        """List vaults for the user
-        :param marker: vaultid within the list to start at
-        :param limit: the maximum number of entries to retrieve
-        :returns: deuceclient.api.Projects instance containing the vaults
-        :raises: RuntimeError on failure
-        """
-        url = api_v1.get_vault_base_path()
+    def __list_page(self, url, marker=None, limit=None, fn=None):
+        """Retrieve a single page of a paginated listing
 
+        :param url: path of the listing
+        :param marker: marker denoting the start of the page
+        :param limit: maximum number of entries in the page
+        :returns: the requests response object
+        """
         query_args = {}
-
-        if marker and limit:
-            query_args = {
-                'marker': marker,
-                'limit': limit,
-            }
-
-        elif marker:
-            query_args = {
-                'marker': marker
-            }
-        elif limit:
-            query_args = {
-                'limit': limit
-            }
-        else:
-            pass
+        if marker:
+            query_args['marker'] = marker
+        if limit:
+            query_args['limit'] = limit
 
         ret_url = set_qs_on_url(url, query_args)
         self.ReInit(self.sslenabled, ret_url)
         self.__update_headers()
-        self.__log_request_data(fn='List Vaults')
-        res = requests.get(self.Uri, headers=self.Headers)
-        self.__log_response_data(res, jsondata=True, fn='List Vaults')
+        self.__log_request_data(fn=fn)
+        res = self.__send('get', self.Uri, headers=self.Headers)
+        self.__log_response_data(res, jsondata=True, fn=fn)
+        return res
+
+    def __iter_partitioned(self, get_page, markers, boundaries):
+        """Iterate over a listing with one cursor per keyspace range
+
+        :param get_page: function taking a marker and returning a tuple of
+                         (entries, next_marker)
+        :param markers: marker to start each range's cursor at
+        :param boundaries: first entry of each range; a cursor stops at the
+                           next range's boundary
+        :returns: generator of the entries of all ranges as they arrive
+        """
+        def partition(marker, end):
+            for entries in Paginator(get_page, marker=marker):
+                if end is None:
+                    yield entries
+                    continue
+
+                in_range = [entry for entry in entries if entry < end]
+                if in_range:
+                    yield in_range
+                if len(in_range) < len(entries):
+                    break
+
+        ends = boundaries[1:] + [None]
+        for entries in parallel.merge([partition(marker, end)
+                                       for marker, end in zip(markers,
+                                                              ends)]):
+            for entry in entries:
+                yield entry
+
+    @staticmethod
+    def __next_batch_marker(res):
+        """Extract the marker of the next page from the x-next-batch header
+
+        :returns: the marker or None if this was the last page
+        """
+        if 'x-next-batch' in res.headers:
+            parsed_url = urlparse(res.headers['x-next-batch'])
 
-        if res.status_code == 200:
-            for vault_name, vault_data in res.json().items():
-                if vault_name not in project:
-                    project[vault_name] = api_vault.Vault(
-                        project_id=project.project_id,
-                        vault_id=vault_name)
-                    project[vault_name].status = 'valid'
-            if 'x-next-batch' in res.headers:
-                parsed_url = urlparse(res.headers['x-next-batch'])
-
-                qs = parse_qs(parsed_url[4])
-                project.marker = qs['marker'][0]
-            else:
-                project.marker = None
+            qs = parse_qs(parsed_url[4])
+            return qs['marker'][0]
+        else:
+            return None
 
-            return True
+    def __vault_list_page(self, marker=None, limit=None):
+        """Retrieve a page of vault names
+
+        :returns: tuple of the vault names and the marker for the next page
+        :raises: RuntimeError on failure
+        """
+        res = self.__list_page(api_v1.get_vault_base_path(), marker, limit,
+                               fn='List Vaults')
+
+        if res.status_code == 200:
+            return (list(res.json().keys()), self.__next_batch_marker(res))
         else:
             raise RuntimeError(
                 'Failed to List Vaults. '
                 'Error ({0:}): {1:}'.format(res.status_code, res.text))
 
+    @staticmethod
+    def __add_vault_to_project(project, vault_name):
+        if vault_name not in project:
+            project[vault_name] = api_vault.Vault(
+                project_id=project.project_id,
+                vault_id=vault_name)
+            project[vault_name].status = 'valid'
+
+    @validate(project=ProjectInstanceRule, marker=VaultIdRuleNoneOkay)
+    def ListVaults(self, project, marker=None, limit=None):
+        """List vaults for the user
+        :param marker: vaultid within the list to start at
+        :param limit: the maximum number of entries to retrieve
+        :returns: deuceclient.api.Projects instance containing the vaults
+        :raises: RuntimeError on failure
+        """
+        vault_names, project.marker = self.__vault_list_page(marker, limit)
+        for vault_name in vault_names:
+            self.__add_vault_to_project(project, vault_name)
+        return True
+
+    @validate(project=ProjectInstanceRule, marker=VaultIdRuleNoneOkay,
+              limit=LimitRuleNoneOkay)
+    def IterVaults(self, project, marker=None, limit=None, store=False,
+                   prefetch=0):
+        """Iterate over all the vaults for the user
+
+        Pages are retrieved as the generator is consumed, following the
+        x-next-batch header until the listing is exhausted.
+
+        :param project: deuceclient.api.Project the vaults belong to
+        :param marker: vaultid within the list to start at
+        :param limit: the maximum number of entries to retrieve per page
+        :param store: whether or not to also add the vaults to the project
+        :param prefetch: number of pages to request ahead in the background
+        :returns: generator of vault names
+        :raises: RuntimeError on failure
+        """
+        pages = Paginator(lambda page_marker:
+                          self.__vault_list_page(page_marker, limit),
+                          marker=marker, prefetch=prefetch)
+        for vault_names in pages:
+            for vault_name in vault_names:
+                if store:
+                    self.__add_vault_to_project(project, vault_name)
+                yield vault_name
+
     @validate(vault_name=VaultIdRule)
     def CreateVault(self, vault_name):
         """Create a vault
@@ -169,7 +370,7 @@ class DeuceClient(Command):
 
         self.__update_headers()
         self.__log_request_data(fn='Create Vault')
-        res = requests.put(self.Uri, headers=self.Headers)
+        res = self.__send('put', self.Uri, headers=self.Headers)
         self.__log_response_data(res, jsondata=False, fn='Create Vault')
 
         if res.status_code == 201:
@@ -215,7 +416,7 @@ class DeuceClient(Command):
         self.ReInit(self.sslenabled, path)
         self.__update_headers()
         self.__log_request_data(fn='Delete Vault')
-        res = requests.delete(self.Uri, headers=self.Headers)
+        res = self.__send('delete', self.Uri, headers=self.Headers)
         self.__log_response_data(res, jsondata=False, fn='Delete Vault')
 
         if res.status_code == 204:
@@ -245,7 +446,7 @@ class DeuceClient(Command):
         self.ReInit(self.sslenabled, path)
         self.__update_headers()
         self.__log_request_data(fn='Vault Exists')
-        res = requests.head(self.Uri, headers=self.Headers)
+        res = self.__send('head', self.Uri, headers=self.Headers)
         self.__log_response_data(res, jsondata=False, fn='Vault Exists')
 
         if res.status_code == 204:
@@ -281,7 +482,7 @@ class DeuceClient(Command):
         self.ReInit(self.sslenabled, path)
         self.__update_headers()
         self.__log_request_data(fn='Get Vault Statistics')
-        res = requests.get(self.Uri, headers=self.Headers)
+        res = self.__send('get', self.Uri, headers=self.Headers)
         self.__log_response_data(res, jsondata=True, fn='Get Vault Statistics')
 
         if res.status_code == 200:
@@ -307,7 +508,7 @@ class DeuceClient(Command):
         self.ReInit(self.sslenabled, url)
         self.__update_headers()
         self.__log_request_data(fn='VaultBlockStatusReset')
-        res = requests.patch(self.Uri, headers=self.Headers)
+        res = self.__send('patch', self.Uri, headers=self.Headers)
         self.__log_response_data(res, jsondata=False,
                                  fn='Vault Block Status Reset')
 
@@ -318,6 +519,28 @@ class DeuceClient(Command):
                 "Failed to Reset Vault's Block Statuses"
                 "Error ({0:}): {1:}".format(res.status_code, res.text))
 
+    def __block_list_page(self, vault, marker=None, limit=None):
+        """Retrieve a page of block ids in the vault
+
+        :returns: tuple of the block ids and the marker for the next page
+        :raises: RunTimeError on failure
+        """
+        res = self.__list_page(api_v1.get_blocks_path(vault.vault_id),
+                               marker, limit, fn='Get Block List')
+
+        if res.status_code == 200:
+            return (res.json(), self.__next_batch_marker(res))
+        else:
+            raise RuntimeError(
+                'Failed to get Block list for Vault . '
+                'Error ({0:}): {1:}'.format(res.status_code, res.text))
+
+    @staticmethod
+    def __add_block_to_vault(vault, block_id):
+        vault.blocks[block_id] = api_block.Block(vault.project_id,
+                                                 vault.vault_id,
+                                                 block_id)
+
     @validate(vault=VaultInstanceRule,
               marker=MetadataBlockIdRuleNoneOkay,
               limit=LimitRuleNoneOkay)
@@ -333,54 +556,73 @@ class DeuceClient(Command):
         :raises: TypeError if vault is not a Vault object
         :raises: RunTimeError on failure
         """
-        url = api_v1.get_blocks_path(vault.vault_id)
-        query_args = {}
+        block_ids, next_marker = self.__block_list_page(vault, marker, limit)
+        for block_id in block_ids:
+            self.__add_block_to_vault(vault, block_id)
 
-        if marker and limit:
-            query_args = {
-                'marker': marker,
-                'limit': limit,
-            }
+        vault.blocks.marker = next_marker
+        return block_ids
 
-        elif marker:
-            query_args = {
-                'marker': marker
-            }
-        elif limit:
-            query_args = {
-                'limit': limit
-            }
-        else:
-            pass
+    @validate(vault=VaultInstanceRule,
+              marker=MetadataBlockIdRuleNoneOkay,
+              limit=LimitRuleNoneOkay)
+    def IterBlockList(self, vault, marker=None, limit=None, store=False,
+                      prefetch=0):
+        """Iterate over all the blocks in the vault
 
-        ret_url = set_qs_on_url(url, query_args)
-        self.ReInit(self.sslenabled, ret_url)
-        self.__update_headers()
-        self.__log_request_data(fn='Get Block List')
-        res = requests.get(self.Uri, headers=self.Headers)
-        self.__log_response_data(res, jsondata=True, fn='Get Block List')
+        Pages are retrieved as the generator is consumed, following the
+        x-next-batch header until the listing is exhausted.
 
-        if res.status_code == 200:
-            block_ids = []
-            for block_entry in res.json():
-                vault.blocks[block_entry] = api_block.Block(vault.project_id,
-                                                            vault.vault_id,
-                                                            block_entry)
-                block_ids.append(block_entry)
-
-            if 'x-next-batch' in res.headers:
-                parsed_url = urlparse(res.headers['x-next-batch'])
-
-                qs = parse_qs(parsed_url[4])
-                vault.blocks.marker = qs['marker'][0]
-            else:
-                vault.blocks.marker = None
+        :param vault: vault to get the block list for
+        :param marker: marker denoting the start of the list
+        :param limit: integer denoting the maximum entries to retrieve
+                      per page
+        :param store: whether or not to also keep the blocks in the blocks
+                      property of the Vault
+        :param prefetch: number of pages to request ahead in the background
+        :returns: generator of block ids
+        :raises: TypeError if vault is not a Vault object
+        :raises: RunTimeError on failure
+        """
+        pages = Paginator(lambda page_marker:
+                          self.__block_list_page(vault, page_marker, limit),
+                          marker=marker, prefetch=prefetch)
+        for block_ids in pages:
+            for block_id in block_ids:
+                if store:
+                    self.__add_block_to_vault(vault, block_id)
+                yield block_id
 
-            return block_ids
-        else:
-            raise RuntimeError(
-                'Failed to get Block list for Vault . '
-                'Error ({0:}): {1:}'.format(res.status_code, res.text))
+    @validate(vault=VaultInstanceRule,
+              limit=LimitRuleNoneOkay)
+    def IterBlockListPartitioned(self, vault, partitions=4, limit=None,
+                                 store=False):
+        """Iterate over all the blocks in the vault using parallel cursors
+
+        Block IDs are uniformly distributed over the SHA-1 keyspace; so the
+        keyspace is split into the given number of ranges that are each
+        listed by their own cursor concurrently.
+
+        :param vault: vault to get the block list for
+        :param partitions: number of keyspace ranges to list in parallel
+        :param limit: integer denoting the maximum entries to retrieve
+                      per page
+        :param store: whether or not to also keep the blocks in the blocks
+                      property of the Vault
+        :returns: generator of block ids, in no particular order
+        :raises: TypeError if vault is not a Vault object
+        :raises: ValueError if partitions is less than 1
+        :raises: RunTimeError on failure
+        """
+        boundaries = _keyspace_boundaries(partitions)
+        markers = [None] + boundaries[1:]
+
+        for block_id in self.__iter_partitioned(
+                lambda marker: self.__block_list_page(vault, marker, limit),
+                markers, boundaries):
+            if store:
+                self.__add_block_to_vault(vault, block_id)
+            yield block_id
 
     @validate(vault=VaultInstanceRule,
               block=BlockInstanceRule)
@@ -400,7 +642,7 @@ class DeuceClient(Command):
         headers.update(self.Headers)
         headers['content-type'] = 'application/octet-stream'
         self.__log_request_data(headers=headers, fn='Head Block')
-        res = requests.head(self.Uri, headers=headers)
+        res = self.__send('head', self.Uri, headers=headers)
         self.__log_response_data(res, jsondata=False, fn='Head Block')
         if res.status_code == 204:
             block.ref_modified = int(res.headers['X-Ref-Modified'])\
@@ -429,6 +671,63 @@ class DeuceClient(Command):
                 'Error ({2:}): {3:}'.format(block.block_id, vault.vault_id,
                                             res.status_code, res.text))
 
+    def __head_blocks(self, head, vault, blocks, concurrency, missing):
+        """Head blocks concurrently
+
+        :param head: function heading a single block
+        :param vault: vault the blocks are in
+        :param blocks: iterable of the blocks to head
+        :param concurrency: number of blocks to head at the same time
+        :param missing: list to append the missing blocks to, None to
+                        raise MissingBlockError instead
+        :returns: generator of the updated blocks
+        :raises: ValueError if concurrency is less than 1
+        """
+        # Checked before returning the generator so that it is raised by
+        # the call rather than once the blocks are iterated
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+
+        return self.__iter_head_blocks(head, vault, blocks, concurrency,
+                                       missing)
+
+    def __iter_head_blocks(self, head, vault, blocks, concurrency, missing):
+        def head_block(block):
+            try:
+                return head(vault, block)
+            except errors.MissingBlockError:
+                if missing is None:
+                    raise
+                missing.append(block)
+                return None
+
+        for block in parallel.imap_unordered(head_block, blocks,
+                                             concurrency):
+            if block is not None:
+                yield block
+
+    @validate(vault=VaultInstanceRule)
+    def HeadBlocks(self, vault, blocks, concurrency=DEFAULT_CONCURRENCY,
+                   missing=None):
+        """Head many blocks concurrently and get their information
+
+        The blocks are consumed lazily so very large scans only hold
+        `concurrency` blocks in flight at any time.
+
+        :param vault: vault the blocks are in
+        :param blocks: iterable of deuceclient.api.Block instances
+        :param concurrency: number of blocks to head at the same time
+        :param missing: list to append the blocks whose data is missing
+                        from storage to, None to raise MissingBlockError
+                        instead
+        :returns: generator of the updated blocks in completion order
+        :raises: ValueError if concurrency is less than 1
+        :raises: MissingBlockError if a block is missing and missing is None
+        :raises: RunTimeError on failure
+        """
+        return self.__head_blocks(self.HeadBlock, vault, blocks,
+                                  concurrency, missing)
+
     @validate(vault=VaultInstanceRule,
               block=BlockInstanceRule)
     def UploadBlock(self, vault, block):
@@ -448,7 +747,8 @@ class DeuceClient(Command):
         headers['content-type'] = 'application/octet-stream'
         headers['content-length'] = len(block)
         self.__log_request_data(headers=headers, fn='Upload Block')
-        res = requests.put(self.Uri, headers=headers, data=block.data)
+        res = self.__send('put', self.Uri, headers=headers,
+                          data=block.data)
         self.__log_response_data(res, jsondata=False, fn='Upload Block')
         if res.status_code == 201:
             return True
@@ -490,9 +790,11 @@ class DeuceClient(Command):
             block_data.append((block_id, block.data))
 
         contents = dict(block_data)
+        # msgpack is only needed for bulk uploads, import it on first use
+        import msgpack
         body = msgpack.packb(contents)
         self.__log_request_data(fn='Upload Multiple Blocks - msgpack')
-        res = requests.post(self.Uri, headers=headers, data=body)
+        res = self.__send('post', self.Uri, headers=headers, data=body)
         self.__log_response_data(res,
                                  jsondata=False,
                                  fn='Upload Multiple Blocks - msgpack')
@@ -528,7 +830,7 @@ class DeuceClient(Command):
         self.ReInit(self.sslenabled, url)
         self.__update_headers()
         self.__log_request_data(fn='Delete Block')
-        res = requests.delete(self.Uri, headers=self.Headers)
+        res = self.__send('delete', self.Uri, headers=self.Headers)
         self.__log_response_data(res, jsondata=False, fn='Delete Block')
         if res.status_code == 204:
             return True
@@ -569,26 +871,105 @@ class DeuceClient(Command):
         :stores: The block Data in the the data property of the block
         :returns: True on success
         """
-        url = api_v1.get_block_path(vault.vault_id, block.block_id)
-        self.ReInit(self.sslenabled, url)
-        self.__update_headers()
-        self.__log_request_data(fn='Download Block')
-        res = requests.get(self.Uri, headers=self.Headers)
-        self.__log_response_data(res, jsondata=False, fn='Download Block')
+        if self.block_cache is not None:
+            data = self.block_cache.get(block.block_id)
+            if data is not None:
+                block.data = data
+                return True
+
+        block.data = self.__download_block_data(vault, block.block_id)
+        if self.block_cache is not None:
+            self.block_cache.put(block.block_id, block.data)
+        return True
+
+    def __download_block_data(self, vault, block_id):
+        """Download the data of a block, verifying it if enabled
+
+        :returns: the block data
+        :raises: BlockIntegrityError if the data still does not match the
+                 Block ID once the retries are exhausted
+        """
+        attempts = self.verify_retries + 1 if self.verify_downloads else 1
+        for attempt in range(attempts):
+            if attempt:
+                self.log.warning('Block {0:} does not match its data, '
+                                 'downloading it again'.format(block_id))
+                self.verification.add(retries=1)
+
+            url = api_v1.get_block_path(vault.vault_id, block_id)
+            self.ReInit(self.sslenabled, url)
+            self.__update_headers()
+            self.__log_request_data(fn='Download Block')
+            res = self.__send('get', self.Uri, headers=self.Headers,
+                              stream=self.verify_downloads)
+
+            if res.status_code == 200:
+                if not self.verify_downloads:
+                    self.__log_response_data(res, jsondata=False,
+                                             fn='Download Block')
+                    return res.content
+
+                # Hashed while the rest of the block is received
+                verifier = verify.StreamVerifier([(0, block_id)],
+                                                 self.verification)
+                chunks = []
+                try:
+                    for chunk in res.iter_content(
+                            chunk_size=VERIFY_CHUNK_SIZE):
+                        chunks.append(chunk)
+                        verifier.feed(chunk)
+                finally:
+                    mismatches = verifier.finish()
+                if not mismatches:
+                    return b''.join(chunks)
+
+            elif res.status_code == 410:
+                self.__log_response_data(res, jsondata=False,
+                                         fn='Download Block')
+                raise errors.MissingBlockError(
+                    'The Storage Block associated with Metadata Block {0:} '
+                    'is missing from storage. Re-uploading the associated '
+                    'data will restore access to any files using the block.')
+            else:
+                self.__log_response_data(res, jsondata=False,
+                                         fn='Download Block')
+                raise RuntimeError(
+                    'Failed to get Block Content for Block Id . '
+                    'Error ({0:}): {1:}'.format(res.status_code, res.text))
+
+        raise errors.BlockIntegrityError(
+            'Block {0:} of Vault {1:} does not match its data after {2:} '
+            'attempts'.format(block_id, vault.vault_id, attempts))
+
+    def __file_list_page(self, vault, marker=None, limit=None):
+        """Retrieve a page of file ids in the vault
+
+        :returns: tuple of the file ids and the marker for the next page
+        :raises: RunTimeError on failure
+        """
+        res = self.__list_page(api_v1.get_files_path(vault.vault_id),
+                               marker, limit, fn='List Files')
 
         if res.status_code == 200:
-            block.data = res.content
-            return True
-        elif res.status_code == 410:
-            raise errors.MissingBlockError(
-                'The Storage Block associated with Metadata Block {0:} '
-                'is missing from storage. Re-uploading the associated '
-                'data will restore access to any files using the block.')
+            return (res.json(), self.__next_batch_marker(res))
         else:
             raise RuntimeError(
-                'Failed to get Block Content for Block Id . '
+                'Failed to List Files in the Vault. '
                 'Error ({0:}): {1:}'.format(res.status_code, res.text))
 
+    def __add_file_to_vault(self, vault, file_id):
+        url = api_v1.get_files_path(vault.vault_id)
+        self.ReInit(self.sslenabled, url)
+        file_url = self.Uri
+
+        kw = {
+            'project_id': self.project_id,
+            'vault_id': vault.vault_id,
+            'file_id': file_id,
+            'url': file_url
+        }
+        vault.files[file_id] = api_file.File(**kw)
+
     @validate(vault=VaultInstanceRule, marker=FileIdRuleNoneOkay)
     def ListFiles(self, vault, marker=None, limit=None):
         """List files in the Vault
@@ -598,65 +979,39 @@ class DeuceClient(Command):
         :param limit: the maximum number of entries to retrieve
         :returns: a list of file ids in the vault
         """
-        url = api_v1.get_files_path(vault.vault_id)
-
-        query_args = {}
+        file_ids, vault.files.marker = self.__file_list_page(vault,
+                                                             marker,
+                                                             limit)
+        for file_id in file_ids:
+            self.__add_file_to_vault(vault, file_id)
 
-        if marker and limit:
-            query_args = {
-                'marker': marker,
-                'limit': limit,
-            }
+        return file_ids
 
-        elif marker:
-            query_args = {
-                'marker': marker
-            }
-        elif limit:
-            query_args = {
-                'limit': limit
-            }
-        else:
-            pass
-
-        ret_url = set_qs_on_url(url, query_args)
-        self.ReInit(self.sslenabled, ret_url)
-        self.__update_headers()
-        self.__log_request_data(fn='List Files')
-        res = requests.get(self.Uri, headers=self.Headers)
-        self.__log_response_data(res, jsondata=True, fn='List Files')
-
-        if res.status_code == 200:
-            if 'x-next-batch' in res.headers:
-                parsed_url = urlparse(res.headers['x-next-batch'])
-
-                qs = parse_qs(parsed_url[4])
-                vault.files.marker = qs['marker'][0]
-            else:
-                vault.files.marker = None
-
-            return_list = []
-            for file_id in res.json():
-                return_list.append(file_id)
-
-                file_uri = api_v1.get_file_path(vault.vault_id, file_id)
-                self.ReInit(self.sslenabled, url)
-                file_url = self.Uri
-
-                kw = {
-                    'project_id': self.project_id,
-                    'vault_id': vault.vault_id,
-                    'file_id': file_id,
-                    'url': file_url
-                }
-                vault.files[file_id] = api_file.File(**kw)
+    @validate(vault=VaultInstanceRule, marker=FileIdRuleNoneOkay,
+              limit=LimitRuleNoneOkay)
+    def IterFiles(self, vault, marker=None, limit=None, store=False,
+                  prefetch=0):
+        """Iterate over all the files in the Vault
 
-            return return_list
+        Pages are retrieved as the generator is consumed, following the
+        x-next-batch header until the listing is exhausted.
 
-        else:
-            raise RuntimeError(
-                'Failed to List Files in the Vault. '
-                'Error ({0:}): {1:}'.format(res.status_code, res.text))
+        :param vault: vault to list the files from
+        :param marker: fileid within the list to start at
+        :param limit: the maximum number of entries to retrieve per page
+        :param store: whether or not to also keep the files in the files
+                      property of the Vault
+        :param prefetch: number of pages to request ahead in the background
+        :returns: generator of file ids in the vault
+        """
+        pages = Paginator(lambda page_marker:
+                          self.__file_list_page(vault, page_marker, limit),
+                          marker=marker, prefetch=prefetch)
+        for file_ids in pages:
+            for file_id in file_ids:
+                if store:
+                    self.__add_file_to_vault(vault, file_id)
+                yield file_id
 
     @validate(vault=VaultInstanceRule)
     def CreateFile(self, vault):
@@ -670,7 +1025,7 @@ class DeuceClient(Command):
         self.ReInit(self.sslenabled, url)
         self.__update_headers()
         self.__log_request_data(fn='Create File')
-        res = requests.post(self.Uri, headers=self.Headers)
+        res = self.__send('post', self.Uri, headers=self.Headers)
         self.__log_response_data(res, jsondata=False, fn='Create File')
         if res.status_code == 201:
             new_file = api_file.File(project_id=self.project_id,
@@ -696,7 +1051,7 @@ class DeuceClient(Command):
         self.ReInit(self.sslenabled, url)
         self.__update_headers()
         self.__log_request_data(fn='Delete File')
-        res = requests.delete(self.Uri, headers=self.Headers)
+        res = self.__send('delete', self.Uri, headers=self.Headers)
         self.__log_response_data(res, jsondata=False, fn='Delete File')
         if res.status_code == 204:
             return True
@@ -710,26 +1065,46 @@ class DeuceClient(Command):
     def DownloadFile(self, vault, file_id, output_file, chunk_size=512 * 1024):
         """Download a file
 
+        The data is read straight into the output file, preallocated to
+        the size of the file. The size of the reads starts at chunk_size
+        and adapts to the throughput.
+
+        When verifying the downloads, the data is checked against the
+        blocks of the file as it arrives. The blocks that do not match are
+        downloaded again and written in place, unless retries are disabled.
+
         :param vault: vault to download the file from
         :param file_id: file id within the vault to download
         :param output_file: local fully qualified (absolute) file name to
                             store the file in
+        :param chunk_size: size of the first read
         :returns: True on success
+        :raises: BlockIntegrityError if the data could not be verified
         """
+        verifier = None
+        if self.verify_downloads:
+            blocks = self.__file_blocks(vault, file_id)
+            verifier = verify.StreamVerifier(blocks, self.verification)
+
         url = api_v1.get_file_path(vault.vault_id, file_id)
         self.ReInit(self.sslenabled, url)
         self.__update_headers()
         self.__log_request_data(fn='Download File')
-        res = requests.get(self.Uri, headers=self.Headers, stream=True)
+        res = self.__send('get', self.Uri, headers=self.Headers,
+                          stream=True)
         if res.status_code == 200:
             try:
-                downloaded_bytes = 0
+                on_chunk = None
+                if verifier is not None:
+                    # The chunks are hashed after their buffer is reused
+                    def on_chunk(chunk):
+                        verifier.feed(bytes(chunk))
+
                 download_start_time = datetime.datetime.utcnow()
-                with open(output_file, 'wb') as output:
-                    for chunk in res.iter_content(chunk_size=chunk_size):
-                        output.write(chunk)
-                        downloaded_bytes = downloaded_bytes + len(chunk)
-                        res.raise_for_status()
+                downloaded_bytes = download.receive_into_file(
+                    res.raw, output_file,
+                    expected_size=self.__content_length(res),
+                    chunk_size=chunk_size, on_chunk=on_chunk)
                 download_end_time = datetime.datetime.utcnow()
 
                 download_time = download_end_time - download_start_time
@@ -744,18 +1119,94 @@ class DeuceClient(Command):
                                  download_rate / 1024,
                                  download_rate / 1024 / 1024))
 
+                if verifier is not None:
+                    self.__repair_file(vault, file_id, output_file, blocks,
+                                       verifier.finish())
+                    log.info(self.verification.report())
+
                 # succeeded in downloading the file
                 return True
 
+            except errors.BlockIntegrityError:
+                raise
+
             except Exception as ex:
                 raise RuntimeError(
                     'Failed while Downloading File. '
                     'Error: {0:} '.format(ex))
+
+            finally:
+                if verifier is not None:
+                    verifier.finish()
         else:
+            if verifier is not None:
+                verifier.finish()
             raise RuntimeError(
                 'Failed to Download File. '
                 'Error ({0:}): {1:}'.format(res.status_code, res.text))
 
+    @staticmethod
+    def __content_length(res):
+        """Size of the body of a response, None if not known
+
+        The length of an encoded body is not the length of the data.
+        """
+        res.raw.decode_content = True
+        if res.headers.get('Content-Encoding', 'identity') != 'identity':
+            return None
+        try:
+            return int(res.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return None
+
+    def __file_blocks(self, vault, file_id):
+        """Retrieve the blocks of a file
+
+        :returns: list of the (offset, Block ID) of the blocks, in order
+        """
+        listing = api_vault.Vault(project_id=vault.project_id,
+                                  vault_id=vault.vault_id)
+        listing.add_file(file_id)
+        return sorted((int(offset), block_id) for block_id, offset
+                      in self.IterFileBlockList(listing, file_id))
+
+    def __repair_file(self, vault, file_id, output_file, blocks,
+                      mismatches):
+        """Replace the blocks of a downloaded file that failed verification
+
+        :param blocks: list of the (offset, Block ID) of the blocks of the
+                       file, in order
+        :param mismatches: list of the (offset, Block ID) of the blocks
+                           that failed verification
+        :raises: BlockIntegrityError if retries are disabled or the data
+                 is not made of the blocks of the file
+        """
+        if not mismatches:
+            return
+
+        if not self.verify_retries or \
+                any(block_id is None for offset, block_id in mismatches):
+            raise errors.BlockIntegrityError(
+                '{0:} blocks of File {1:} in Vault {2:} do not match their '
+                'data'.format(len(mismatches), file_id, vault.vault_id))
+
+        self.log.warning('{0:} blocks of File {1:} do not match their data, '
+                         'downloading them again'
+                         .format(len(mismatches), file_id))
+        self.verification.add(retries=len(mismatches))
+        with open(output_file, 'r+b') as output:
+            for offset, block_id in mismatches:
+                block = api_block.Block(project_id=vault.project_id,
+                                        vault_id=vault.vault_id,
+                                        block_id=block_id)
+                self.DownloadBlock(vault, block)
+                output.seek(offset)
+                output.write(block.data)
+
+                # The file ends with its last block
+                if offset == blocks[-1][0]:
+                    output.truncate(offset + len(block.data))
+
     @validate(vault=VaultInstanceRule,
               file_id=FileIdRule)
     def FinalizeFile(self, vault, file_id):
@@ -774,9 +1225,9 @@ class DeuceClient(Command):
         self.__update_headers()
         headers = {}
         headers.update(self.Headers)
-        headers['X-File-Length'] = len(vault.files[file_id])
+        headers['X-File-Length'] = str(len(vault.files[file_id]))
         self.__log_request_data(fn='Finalize File')
-        res = requests.post(self.Uri, headers=headers)
+        res = self.__send('post', self.Uri, headers=headers)
         self.__log_response_data(res, jsondata=True, fn='Finalize File')
         if res.status_code in (200, 204):
             return True
@@ -820,6 +1271,22 @@ class DeuceClient(Command):
             if len(vault.files[file_id].offsets) == 0:
                 raise ValueError('File must have offsets specified')
 
+        if block_ids is not None:
+            block_assignment_data = [(block_id, offset)
+                                     for block_id, offset in block_ids]
+        else:
+            block_assignment_data = [(block_id, offset)
+                                     for offset, block_id in
+                                     vault.files[file_id].offsets.items()]
+
+        return self.__assign_blocks(vault, file_id, block_assignment_data)
+
+    def __assign_blocks(self, vault, file_id, block_assignment_data):
+        """Assign blocks to a file
+
+        :param block_assignment_data: list of (block_id, offset)
+        :returns: set of the block ids missing from the vault
+        """
         url = api_v1.get_fileblocks_path(vault.vault_id, file_id)
         self.ReInit(self.sslenabled, url)
         self.__update_headers()
@@ -832,24 +1299,14 @@ class DeuceClient(Command):
                     ...
                 ]
         """
-        block_assignment_data = []
-
-        if block_ids is not None:
-            block_assignment_data = [(block_id, offset)
-                                     for block_id, offset in block_ids]
-        else:
-            block_assignment_data = [(block_id, offset)
-                                     for offset, block_id in
-                                     vault.files[file_id].offsets.items()]
-
         self.log.debug('Assigning blocks to offset:')
         for block_id, offset in block_assignment_data:
             self.log.debug('Offset, Block -> {0:}, {1:}'.format(offset,
                                                                 block_id))
 
-        res = requests.post(self.Uri,
-                            data=json.dumps(block_assignment_data),
-                            headers=self.Headers)
+        res = self.__send('post', self.Uri,
+                          data=json.dumps(block_assignment_data),
+                          headers=self.Headers)
         self.__log_response_data(res, jsondata=True,
                                  fn='Assign Blocks To File')
         if res.status_code == 200:
@@ -861,6 +1318,153 @@ class DeuceClient(Command):
                 'Failed to Assign Blocks to the File. '
                 'Error ({0:}): {1:}'.format(res.status_code, res.text))
 
+    @validate(vault=VaultInstanceRule,
+              file_id=FileIdRule)
+    def CloneFile(self, vault, file_id,
+                  blocks_per_assignment=CLONE_BLOCKS_PER_ASSIGNMENT,
+                  concurrency=DEFAULT_CONCURRENCY):
+        """Copy a file within the vault without transferring its data
+
+        The new file is assigned the blocks of the file, which are already
+        stored in the vault, and finalized. The block list of the file is
+        assigned in chunks, concurrently, as it is read; only the last block
+        is kept, to get the length of the file.
+
+        :param vault: vault containing the file
+        :param file_id: file id of the file to copy
+        :param blocks_per_assignment: number of blocks assigned per request
+        :param concurrency: number of assignment requests made at the same
+                            time
+        :returns: file id of the new file, which is added to the vault
+        :raises: RuntimeError if blocks of the file are missing from the
+                 vault, once the new file is deleted
+        """
+        if blocks_per_assignment < 1:
+            raise ValueError('blocks_per_assignment must be at least 1')
+
+        clone_file_id = self.CreateFile(vault)
+        last_block = []
+
+        try:
+            missing = set()
+            for chunk_missing in parallel.imap_unordered(
+                    lambda chunk: self.__assign_blocks(vault, clone_file_id,
+                                                       chunk),
+                    self.IterFileBlockChunks(vault, file_id,
+                                             blocks_per_assignment,
+                                             last_block),
+                    concurrency):
+                missing.update(chunk_missing)
+            if missing:
+                raise RuntimeError(
+                    'Failed to Clone File {0:}. {1:} of its blocks are '
+                    'missing from Vault {2:}'.format(file_id, len(missing),
+                                                     vault.vault_id))
+
+            self.FinalizeFileAfterLastBlock(vault, clone_file_id, last_block)
+
+        except Exception:
+            del vault.files[clone_file_id]
+            try:
+                self.DeleteFile(vault, clone_file_id)
+            except Exception as ex:
+                self.log.error('Failed to delete the partial clone {0:} of '
+                               '{1:}: {2:}'.format(clone_file_id, file_id,
+                                                   ex))
+            raise
+
+        self.log.info('Cloned File {0:} as {1:}'.format(file_id,
+                                                        clone_file_id))
+        return clone_file_id
+
+    @validate(vault=VaultInstanceRule,
+              file_id=FileIdRule)
+    def IterFileBlockChunks(self, vault, file_id, chunk_size, last_block):
+        """Iterate over the blocks assigned to the file in chunks
+
+        Only the last block of the file is kept as the block list is read,
+        to get the length of the file with FinalizeFileAfterLastBlock.
+
+        :param vault: vault the file belongs to
+        :param file_id: file id of the file to list the blocks of
+        :param chunk_size: number of blocks per chunk
+        :param last_block: list set to the offset and block id of the last
+                           block of the file
+        :returns: generator of lists of (block_id, offset)
+        """
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+
+        # The file data is only needed for the listing, so it is kept out
+        # of the vault
+        listing = vault.empty_copy()
+        listing.add_file(file_id)
+        return self.__file_block_chunks(listing, file_id, chunk_size,
+                                        last_block)
+
+    def __file_block_chunks(self, vault, file_id, chunk_size, last_block):
+        chunk = []
+        for block_id, offset in self.IterFileBlockList(vault, file_id,
+                                                       prefetch=1):
+            if not last_block or int(offset) > last_block[0]:
+                last_block[:] = [int(offset), block_id]
+            chunk.append((block_id, offset))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @validate(vault=VaultInstanceRule,
+              file_id=FileIdRule)
+    def FinalizeFileAfterLastBlock(self, vault, file_id, last_block):
+        """Finalize a file whose blocks were assigned without their sizes
+
+        The size of the last block, retrieved from the vault, gives the
+        length of the file.
+
+        :param vault: vault containing the file
+        :param file_id: file id of the file to finalize
+        :param last_block: offset and block id of the last block of the
+                           file, as set by IterFileBlockChunks; empty for
+                           an empty file
+        :returns: True on success
+        :raises: RuntimeError on failure
+        """
+        if last_block:
+            offset, block_id = last_block
+            block = api_block.Block(project_id=vault.project_id,
+                                    vault_id=vault.vault_id,
+                                    block_id=block_id)
+            self.HeadBlock(vault, block)
+            vault.files[file_id].assign_block(block_id, offset)
+            vault.files[file_id].add_block(block)
+        return self.FinalizeFile(vault, file_id)
+
+    def __file_block_list_page(self, vault, file_id, marker=None,
+                               limit=None):
+        """Retrieve a page of the blocks assigned to the file
+
+        :returns: tuple of the list of (block_id, offset) and the marker for
+                  the next page
+        :raises: RunTimeError on failure
+        """
+        if file_id not in vault.files:
+            raise KeyError(
+                'file_id must specify a file in the provided Vault.')
+
+        res = self.__list_page(api_v1.get_fileblocks_path(vault.vault_id,
+                                                          file_id),
+                               marker, limit, fn='Get File Block List')
+
+        if res.status_code == 200:
+            return ([(block_id, offset) for block_id, offset in res.json()],
+                    self.__next_batch_marker(res))
+        else:
+            raise RuntimeError(
+                'Failed to get Block list for File . '
+                'Error ({0:}): {1:}'.format(res.status_code, res.text))
+
     @validate(vault=VaultInstanceRule,
               file_id=FileIdRule,
               marker=MetadataBlockIdRuleNoneOkay,
@@ -876,56 +1480,46 @@ class DeuceClient(Command):
         :stores: The resulting block list in the file data for the vault.
         :returns: True on success
         """
-        if file_id not in vault.files:
-            raise KeyError(
-                'file_id must specify a file in the provided Vault.')
-
-        url = api_v1.get_fileblocks_path(vault.vault_id, file_id)
-
-        query_args = {}
-
-        if marker and limit:
-            query_args = {
-                'marker': marker,
-                'limit': limit,
-            }
-
-        elif marker:
-            query_args = {
-                'marker': marker
-            }
-        elif limit:
-            query_args = {
-                'limit': limit
-            }
-        else:
-            pass
-
-        ret_url = set_qs_on_url(url, query_args)
-        self.ReInit(self.sslenabled, ret_url)
-        self.__update_headers()
-        self.__log_request_data(fn='Get File Block List')
-        res = requests.get(self.Uri, headers=self.Headers)
-        self.__log_response_data(res, jsondata=True, fn='Get File Block List')
+        block_list, next_marker = self.__file_block_list_page(vault,
+                                                              file_id,
+                                                              marker,
+                                                              limit)
+        block_ids = []
+        for block_id, offset in block_list:
+            vault.files[file_id].offsets[offset] = block_id
+            block_ids.append(block_id)
 
-        if res.status_code == 200:
-            block_ids = []
-            for block_id, offset in res.json():
-                vault.files[file_id].offsets[offset] = block_id
-                block_ids.append(block_id)
+        return (block_ids, next_marker)
 
-            next_marker = None
-            if 'x-next-batch' in res.headers:
-                parsed_url = urlparse(res.headers['x-next-batch'])
+    @validate(vault=VaultInstanceRule,
+              file_id=FileIdRule,
+              marker=MetadataBlockIdRuleNoneOkay,
+              limit=LimitRuleNoneOkay)
+    def IterFileBlockList(self, vault, file_id, marker=None, limit=None,
+                          store=False, prefetch=0):
+        """Iterate over all the blocks assigned to the file
 
-                qs = parse_qs(parsed_url[4])
-                next_marker = qs['marker'][0]
+        Pages are retrieved as the generator is consumed, following the
+        x-next-batch header until the listing is exhausted.
 
-            return (block_ids, next_marker)
-        else:
-            raise RuntimeError(
-                'Failed to get Block list for File . '
-                'Error ({0:}): {1:}'.format(res.status_code, res.text))
+        :param vault: vault to the file belongs to
+        :param fileid: fileid of the file in the Vault to list the blocks for
+        :param marker: blockid within the list to start at
+        :param limit: the maximum number of entries to retrieve per page
+        :param store: whether or not to also keep the offsets in the file
+                      data for the vault
+        :param prefetch: number of pages to request ahead in the background
+        :returns: generator of (block_id, offset)
+        """
+        pages = Paginator(lambda page_marker:
+                          self.__file_block_list_page(vault, file_id,
+                                                      page_marker, limit),
+                          marker=marker, prefetch=prefetch)
+        for block_list in pages:
+            for block_id, offset in block_list:
+                if store:
+                    vault.files[file_id].offsets[offset] = block_id
+                yield (block_id, offset)
 
     @validate(vault=VaultInstanceRule, block=BlockInstanceRule)
     def DownloadBlockStorageData(self, vault, block):
@@ -936,13 +1530,25 @@ class DeuceClient(Command):
         :return: instance of deuce.api.block.Block if expected
                  status code is returned, Runtime Error raised
                  if that's not the case.
+
+        When served from the block cache, the reference count and
+        modification time of the block are not retrieved.
         """
+        if self.block_cache is not None:
+            # Storage Block IDs are the Block ID followed by a unique id
+            block_id = block.storage_id.split('_')[0]
+            data = self.block_cache.get(block_id)
+            if data is not None:
+                block.data = data
+                block.block_id = block_id
+                return block
+
         url = api_v1.get_storage_block_path(vault.vault_id,
                                             block.storage_id)
         self.ReInit(self.sslenabled, url)
         self.__update_headers()
         self.__log_request_data(fn='Download Block Storage Data')
-        res = requests.get(self.Uri, headers=self.Headers)
+        res = self.__send('get', self.Uri, headers=self.Headers)
         self.__log_response_data(res,
                                  jsondata=False,
                                  fn='Download Block Storage Data')
@@ -956,6 +1562,8 @@ class DeuceClient(Command):
                 if res.headers['X-Block-Reference-Count'] else 0
 
             block.block_id = res.headers['X-Block-ID']
+            if self.block_cache is not None:
+                self.block_cache.put(block.block_id, block.data)
             return block
         else:
             raise RuntimeError(
@@ -978,7 +1586,7 @@ class DeuceClient(Command):
         self.ReInit(self.sslenabled, url)
         self.__update_headers()
         self.__log_request_data(fn='Delete Block Storage')
-        res = requests.delete(self.Uri, headers=self.Headers)
+        res = self.__send('delete', self.Uri, headers=self.Headers)
         self.__log_response_data(res,
                                  jsondata=False,
                                  fn='Delete Block Storage')
@@ -991,6 +1599,30 @@ class DeuceClient(Command):
                                             res.status_code,
                                             res.text))
 
+    def __storage_block_list_page(self, vault, marker=None, limit=None):
+        """Retrieve a page of storage block ids in the vault
+
+        :returns: tuple of the storage block ids and the marker for the
+                  next page
+        :raises: RunTimeError on failure
+        """
+        res = self.__list_page(api_v1.get_storage_blocks_path(vault.vault_id),
+                               marker, limit, fn='Get Block Storage List')
+
+        if res.status_code == 200:
+            return (res.json(), self.__next_batch_marker(res))
+        else:
+            raise RuntimeError(
+                'Failed to get Block Storage list for Vault . '
+                'Error ({0:}): {1:}'.format(res.status_code, res.text))
+
+    def __add_storage_block_to_vault(self, vault, storage_block_id):
+        vault.storageblocks[storage_block_id] = api_block.Block(
+            project_id=self.project_id,
+            vault_id=vault.vault_id,
+            storage_id=storage_block_id,
+            block_type='storage')
+
     @validate(vault=VaultInstanceRule, marker=StorageBlockIdRuleNoneOkay,
               limit=LimitRuleNoneOkay)
     def GetBlockStorageList(self, vault, marker=None, limit=None):
@@ -1002,61 +1634,69 @@ class DeuceClient(Command):
         :return: True if expected status code is returned,
                  Runtime Error raised if that's not the case.
         """
-        url = api_v1.get_storage_blocks_path(vault.vault_id)
-        query_args = {}
+        storage_block_ids, next_marker = \
+            self.__storage_block_list_page(vault, marker, limit)
+        for storage_block_id in storage_block_ids:
+            self.__add_storage_block_to_vault(vault, storage_block_id)
 
-        if marker and limit:
-            query_args = {
-                'marker': marker,
-                'limit': limit,
-            }
+        vault.storageblocks.marker = next_marker
+        return storage_block_ids
 
-        elif marker:
-            query_args = {
-                'marker': marker
-            }
-        elif limit:
-            query_args = {
-                'limit': limit
-            }
-        else:
-            pass
+    @validate(vault=VaultInstanceRule, marker=StorageBlockIdRuleNoneOkay,
+              limit=LimitRuleNoneOkay)
+    def IterBlockStorageList(self, vault, marker=None, limit=None,
+                             store=False, prefetch=0):
+        """Iterate over all the blocks directly from block storage
 
-        ret_url = set_qs_on_url(url, query_args)
-        self.ReInit(self.sslenabled, ret_url)
-        self.__update_headers()
-        self.__log_request_data(fn='Get Block Storage List')
-        res = requests.get(self.Uri, headers=self.Headers)
-        self.__log_response_data(res,
-                                 jsondata=True,
-                                 fn='Get Block Storage List')
+        Pages are retrieved as the generator is consumed, following the
+        x-next-batch header until the listing is exhausted.
 
-        if res.status_code == 200:
-            block_list = api_storageblocks.StorageBlocks(
-                project_id=self.project_id,
-                vault_id=vault.vault_id)
-            blocks = {
-                storageblockid: api_block.Block(project_id=self.project_id,
-                                                vault_id=vault.vault_id,
-                                                storage_id=storageblockid,
-                                                block_type='storage')
-                for storageblockid in res.json()}
-            block_list.update(blocks)
-            vault.storageblocks.update(block_list)
-
-            if 'x-next-batch' in res.headers:
-                parsed_url = urlparse(res.headers['x-next-batch'])
-
-                qs = parse_qs(parsed_url[4])
-                vault.storageblocks.marker = qs['marker'][0]
-            else:
-                vault.storageblocks.marker = None
+        :param vault: instance of deuce.api.vault.Vault
+        :param marker: storage block id within the list to start at
+        :param limit: the maximum number of entries to retrieve per page
+        :param store: whether or not to also keep the blocks in the
+                      storageblocks property of the Vault
+        :param prefetch: number of pages to request ahead in the background
+        :return: generator of storage block ids
+        """
+        pages = Paginator(lambda page_marker:
+                          self.__storage_block_list_page(vault, page_marker,
+                                                         limit),
+                          marker=marker, prefetch=prefetch)
+        for storage_block_ids in pages:
+            for storage_block_id in storage_block_ids:
+                if store:
+                    self.__add_storage_block_to_vault(vault, storage_block_id)
+                yield storage_block_id
+
+    @validate(vault=VaultInstanceRule, limit=LimitRuleNoneOkay)
+    def IterBlockStorageListPartitioned(self, vault, partitions=4,
+                                        limit=None, store=False):
+        """Iterate over all the blocks in block storage using parallel cursors
+
+        Storage Block IDs start with the SHA-1 of the block; so the keyspace
+        is split into the given number of ranges that are each listed by
+        their own cursor concurrently.
 
-            return [storageblockid for storageblockid in res.json()]
-        else:
-            raise RuntimeError(
-                'Failed to get Block Storage list for Vault . '
-                'Error ({0:}): {1:}'.format(res.status_code, res.text))
+        :param vault: instance of deuce.api.vault.Vault
+        :param partitions: number of keyspace ranges to list in parallel
+        :param limit: the maximum number of entries to retrieve per page
+        :param store: whether or not to also keep the blocks in the
+                      storageblocks property of the Vault
+        :return: generator of storage block ids, in no particular order
+        :raises: ValueError if partitions is less than 1
+        """
+        boundaries = ['{0}_{1}'.format(boundary, uuid.UUID(int=0))
+                      for boundary in _keyspace_boundaries(partitions)]
+        markers = [None] + boundaries[1:]
+
+        for storage_block_id in self.__iter_partitioned(
+                lambda marker: self.__storage_block_list_page(vault, marker,
+                                                              limit),
+                markers, boundaries):
+            if store:
+                self.__add_storage_block_to_vault(vault, storage_block_id)
+            yield storage_block_id
 
     @validate(vault=VaultInstanceRule, block=BlockInstanceRule)
     def HeadBlockStorage(self, vault, block):
@@ -1068,13 +1708,22 @@ class DeuceClient(Command):
                  status code is returned, Runtime Error raised
                  if that's not the case.
         """
+        return self.__head_block_storage(vault, block)
 
+    @validate(vault=VaultInstanceRule, block=BlockInstanceRule)
+    def __head_block_storage(self, vault, block, missing_error=False):
+        """Head a block directly from block storage
+
+        :param missing_error: whether to raise MissingBlockError rather
+                              than RuntimeError if the block is not in
+                              block storage
+        """
         url = api_v1.get_storage_block_path(vault.vault_id,
                                             block.storage_id)
         self.ReInit(self.sslenabled, url)
         self.__update_headers()
         self.__log_request_data(fn='Head Block in Storage')
-        res = requests.head(self.Uri, headers=self.Headers)
+        res = self.__send('head', self.Uri, headers=self.Headers)
         self.__log_response_data(res,
                                  jsondata=True,
                                  fn='Head Block in Storage')
@@ -1094,9 +1743,33 @@ class DeuceClient(Command):
             block.block_orphaned = \
                 json.loads(res.headers['X-Block-Orphaned'].lower())
             return block
+        elif missing_error and res.status_code in (404, 410):
+            raise errors.MissingBlockError(
+                'Block {0:} is missing from BlockStorage, Vault {1:}'.format(
+                    block.storage_id, vault.vault_id))
         else:
             raise RuntimeError(
                 'Failed to head Block {0:} from BlockStorage, Vault {1:}'
                 'Error ({2:}): {3:}'.format(block.storage_id, vault.vault_id,
                                             res.status_code,
                                             res.text))
+
+    @validate(vault=VaultInstanceRule)
+    def HeadBlocksStorage(self, vault, blocks,
+                          concurrency=DEFAULT_CONCURRENCY, missing=None):
+        """Head many blocks directly from block storage concurrently
+
+        :param vault: instance of deuce.api.vault.Vault
+        :param blocks: iterable of deuce.api.block.Block instances
+        :param concurrency: number of blocks to head at the same time
+        :param missing: list to append the missing blocks to, None to
+                        raise MissingBlockError instead
+        :return: generator of the updated blocks in completion order
+        :raises: ValueError if concurrency is less than 1
+        :raises: MissingBlockError if a block is missing and missing is None
+        :raises: RunTimeError on failure
+        """
+        return self.__head_blocks(
+            lambda vault, block: self.__head_block_storage(
+                vault, block, missing_error=True),
+            vault, blocks, concurrency, missing)
@@ -0,0 +1,147 @@
+"""
+Deuce Client - Differential Restore
+"""
+import hashlib
+import logging
+import os
+
+import deuceclient.api.block as api_block
+import deuceclient.api.vault as api_vault
+from deuceclient.client.deuce import DEFAULT_CONCURRENCY
+from deuceclient.utils import parallel
+
+# Number of bytes of the local file read at once when hashing a range
+HASH_READ_SIZE = 1024 * 1024
+
+
+class DifferentialRestore(object):
+    """Restores a file over a local copy, transferring only what differs
+
+    The ranges of the local file at the offsets of the blocks of the file
+    are hashed and compared with the Block IDs. Only the blocks whose data
+    differs are downloaded and written in place; the local file is then
+    cut to the length of the restored file. A local file that is mostly up
+    to date costs the changed blocks rather than the whole file.
+    """
+
+    def __init__(self, client, vault, concurrency=DEFAULT_CONCURRENCY):
+        """
+        :param client: instance of deuceclient.client.deuce.DeuceClient
+        :param vault: instance of deuceclient.api.Vault holding the file
+        :param concurrency: number of blocks hashed or downloaded at the
+                            same time
+        """
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+
+        self.log = logging.getLogger(__name__)
+        self._client = client
+        self._vault = vault
+        self._concurrency = concurrency
+
+        self.blocks_matched = 0
+        self.blocks_downloaded = 0
+        self.bytes_matched = 0
+        self.bytes_downloaded = 0
+
+    def _block_list(self, file_id):
+        vault = api_vault.Vault(project_id=self._vault.project_id,
+                                vault_id=self._vault.vault_id)
+        vault.add_file(file_id)
+        return sorted(((block_id, int(offset)) for block_id, offset in
+                       self._client.IterFileBlockList(vault, file_id)),
+                      key=lambda block: block[1])
+
+    @staticmethod
+    def _ranges(block_list, local_size):
+        """Compute the range of the local file matching each block
+
+        The size of a block is given by the offset of the next one; the
+        last block is compared with the rest of the local file.
+
+        :returns: list of (block_id, offset, size)
+        """
+        ranges = []
+        for index, (block_id, offset) in enumerate(block_list):
+            if index + 1 < len(block_list):
+                end = block_list[index + 1][1]
+            else:
+                end = max(local_size, offset)
+            ranges.append((block_id, offset, end - offset))
+        return ranges
+
+    def _matches(self, fd, block_range):
+        """Compare a range of the local file with its block
+
+        The range is hashed a piece at a time, as the last one runs to the
+        end of the local file however much longer it is than the block.
+        """
+        block_id, offset, size = block_range
+        sha1 = hashlib.sha1()
+        end = offset + size
+        while offset < end:
+            data = os.pread(fd, min(HASH_READ_SIZE, end - offset), offset)
+            if not data:
+                return (block_range, False)
+            sha1.update(data)
+            offset = offset + len(data)
+        return (block_range, sha1.hexdigest().lower() == block_id)
+
+    def _download(self, block_id):
+        block = api_block.Block(project_id=self._vault.project_id,
+                                vault_id=self._vault.vault_id,
+                                block_id=block_id)
+        self._client.DownloadBlock(self._vault, block)
+        return block
+
+    def restore(self, file_id, path):
+        """Restore a file over a local file
+
+        :param file_id: File ID in the Vault
+        :param path: path of the local file, created if it does not exist
+        :returns: True on success
+        :raises: RuntimeError on failure
+        """
+        block_list = self._block_list(file_id)
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            local_size = os.fstat(fd).st_size
+
+            differing = {}
+            for block_range, matches in parallel.imap_unordered(
+                    lambda block_range: self._matches(fd, block_range),
+                    self._ranges(block_list, local_size),
+                    self._concurrency):
+                block_id, offset, size = block_range
+                if matches:
+                    self.blocks_matched = self.blocks_matched + 1
+                    self.bytes_matched = self.bytes_matched + size
+                else:
+                    differing.setdefault(block_id, []).append(offset)
+
+            self.log.info('{0:} of {1:} blocks of {2:} differ from {3:}'
+                          .format(sum(len(offsets) for offsets
+                                      in differing.values()),
+                                  len(block_list), file_id, path))
+
+            # Each unique block is downloaded once however often it is used
+            file_size = local_size
+            for block in parallel.imap_unordered(self._download,
+                                                 list(differing),
+                                                 self._concurrency):
+                self.blocks_downloaded = self.blocks_downloaded + 1
+                self.bytes_downloaded = self.bytes_downloaded + \
+                    len(block.data)
+                for offset in differing[block.block_id]:
+                    os.pwrite(fd, block.data, offset)
+                    if offset == block_list[-1][1]:
+                        file_size = offset + len(block.data)
+
+            if not block_list:
+                file_size = 0
+            os.ftruncate(fd, file_size)
+        finally:
+            os.close(fd)
+
+        return True
@@ -0,0 +1,213 @@
+"""
+Deuce Client - Orphaned Storage Block Garbage Collection
+"""
+import json
+import logging
+import os
+import time
+
+import deuceclient.api.block as api_block
+from deuceclient.client.deuce import DEFAULT_CONCURRENCY
+from deuceclient.utils import parallel
+
+# Orphans younger than this (in seconds) may still be in the middle of an
+# upload that has not yet assigned them to a file
+DEFAULT_MIN_AGE = 24 * 60 * 60
+
+# Number of storage blocks inspected between checkpoints
+DEFAULT_BATCH_SIZE = 1000
+
+
+class OrphanCollector(object):
+    """Finds and deletes the orphaned blocks in block storage
+
+    The storage block listing is streamed and inspected in batches; the
+    blocks of each batch are headed concurrently and the confirmed orphans
+    that are older than the minimum age are deleted concurrently. Orphans
+    whose age is not known are kept, as are the blocks that vanished
+    between the listing and the head. After
+    each batch the last storage block id is recorded in the checkpoint file
+    (if any) so that an interrupted sweep resumes after it.
+    """
+
+    def __init__(self, client, vault, min_age=DEFAULT_MIN_AGE,
+                 concurrency=DEFAULT_CONCURRENCY,
+                 batch_size=DEFAULT_BATCH_SIZE,
+                 checkpoint_file=None, dry_run=False):
+        """
+        :param client: instance of deuceclient.client.deuce.DeuceClient
+        :param vault: instance of deuceclient.api.Vault to sweep
+        :param min_age: minimum number of seconds since the block was last
+                        referenced for it to be deleted
+        :param concurrency: number of requests in flight
+        :param batch_size: number of storage blocks per checkpoint
+        :param checkpoint_file: path of the file to resume from and record
+                                the progress in, None to not checkpoint
+        :param dry_run: whether or not to only report the orphans that
+                        would be deleted
+        """
+        if min_age < 0:
+            raise ValueError('min_age must not be negative')
+        if batch_size < 1:
+            raise ValueError('batch_size must be at least 1')
+
+        self.log = logging.getLogger(__name__)
+        self._client = client
+        self._vault = vault
+        self._min_age = min_age
+        self._concurrency = concurrency
+        self._batch_size = batch_size
+        self._checkpoint_file = checkpoint_file
+        self._dry_run = dry_run
+
+        self.scanned = 0
+        self.orphaned = 0
+        self.recent = 0
+        # orphans kept as their last reference time is not known
+        self.unknown_age = 0
+        # blocks no longer in storage by the time they were headed
+        self.vanished = 0
+        self.deleted = 0
+        self.failed = 0
+
+    @property
+    def checkpoint_file(self):
+        return self._checkpoint_file
+
+    def load_checkpoint(self):
+        """Read the storage block id the last sweep stopped after
+
+        :returns: storage block id or None to start from the beginning
+        :raises: ValueError if the checkpoint belongs to a different vault
+        """
+        if self._checkpoint_file is None or \
+                not os.path.exists(self._checkpoint_file):
+            return None
+
+        with open(self._checkpoint_file, 'r') as checkpoint:
+            data = json.load(checkpoint)
+
+        if data['project_id'] != self._vault.project_id or \
+                data['vault_id'] != self._vault.vault_id:
+            raise ValueError('Checkpoint {0} is for Vault {1} in Project {2}'
+                             .format(self._checkpoint_file,
+                                     data['vault_id'],
+                                     data['project_id']))
+        return data['marker']
+
+    def save_checkpoint(self, marker):
+        """Record the last storage block id that has been fully processed
+
+        The checkpoint is replaced atomically so that it is never left
+        half written.
+        """
+        if self._checkpoint_file is None:
+            return
+
+        temp_file = '{0}.tmp'.format(self._checkpoint_file)
+        with open(temp_file, 'w') as checkpoint:
+            json.dump({'project_id': self._vault.project_id,
+                       'vault_id': self._vault.vault_id,
+                       'marker': marker}, checkpoint)
+        os.replace(temp_file, self._checkpoint_file)
+
+    def clear_checkpoint(self):
+        if self._checkpoint_file is not None and \
+                os.path.exists(self._checkpoint_file):
+            os.remove(self._checkpoint_file)
+
+    def is_collectable(self, block, now):
+        """Whether or not the headed storage block should be deleted
+
+        :param block: storage block updated by HeadBlockStorage
+        :param now: current time in seconds since the epoch
+        """
+        if block.block_orphaned is not True:
+            return False
+
+        self.orphaned = self.orphaned + 1
+        if not block.ref_modified:
+            # A missing X-Ref-Modified must not pass for the epoch; the
+            # orphan may be an upload not yet assigned to its file
+            self.unknown_age = self.unknown_age + 1
+            return False
+
+        if now - block.ref_modified < self._min_age:
+            self.recent = self.recent + 1
+            return False
+
+        return True
+
+    def _delete(self, block):
+        if self._dry_run:
+            return (block.storage_id, False)
+
+        try:
+            return (block.storage_id,
+                    self._client.DeleteBlockStorage(self._vault, block))
+        except Exception as ex:
+            self.log.debug('Orphan Collector: Failed to delete storage block '
+                           '({0}) - Exception {1}'.format(block.storage_id,
+                                                          str(ex)))
+            return (block.storage_id, False)
+
+    def _sweep_batch(self, storage_ids):
+        self.scanned = self.scanned + len(storage_ids)
+        blocks = (api_block.Block(project_id=self._vault.project_id,
+                                  vault_id=self._vault.vault_id,
+                                  storage_id=storage_id,
+                                  block_type='storage')
+                  for storage_id in storage_ids)
+        now = time.time()
+        missing = []
+        candidates = [block for block in
+                      self._client.HeadBlocksStorage(
+                          self._vault, blocks,
+                          concurrency=self._concurrency,
+                          missing=missing)
+                      if self.is_collectable(block, now)]
+        self.vanished = self.vanished + len(missing)
+
+        for storage_id, deleted in parallel.imap_unordered(
+                self._delete, candidates, self._concurrency):
+            if deleted:
+                self.deleted = self.deleted + 1
+            elif not self._dry_run:
+                self.failed = self.failed + 1
+            yield (storage_id, deleted)
+
+        self.save_checkpoint(storage_ids[-1])
+
+    def sweep(self):
+        """Sweep the vault for orphaned storage blocks
+
+        :returns: generator of tuples of the storage block id of each orphan
+                  old enough to be collected and a boolean denoting whether
+                  or not it was deleted (always False for a dry run)
+        :raises: RunTimeError if the listing or a head fails
+        """
+        marker = self.load_checkpoint()
+        if marker is not None:
+            self.log.info('Orphan Collector: resuming after {0}'
+                          .format(marker))
+
+        # the listing includes the marker itself
+        storage_ids = (storage_id for storage_id in
+                       self._client.IterBlockStorageList(self._vault,
+                                                         marker=marker,
+                                                         prefetch=1)
+                       if marker is None or storage_id > marker)
+
+        batch = []
+        for storage_id in storage_ids:
+            batch.append(storage_id)
+            if len(batch) == self._batch_size:
+                for result in self._sweep_batch(batch):
+                    yield result
+                batch = []
+
+        if batch:
+            for result in self._sweep_batch(batch):
+                yield result
+
+        self.clear_checkpoint()
@@ -0,0 +1,420 @@
+"""
+Deuce Client - Random Access to Files
+"""
+import bisect
+import collections
+import io
+import queue
+import threading
+
+import deuceclient.api.block as api_block
+from deuceclient.client.deuce import DEFAULT_CONCURRENCY
+from deuceclient.utils import parallel
+
+# Number of blocks fetched ahead of sequential reads
+DEFAULT_READ_AHEAD = 4
+
+# Number of blocks kept in memory by a file object
+DEFAULT_CACHED_BLOCKS = 8
+
+
+class FileReader(object):
+    """Reads ranges of the data of a file
+
+    The offsets of the blocks of the file are retrieved once, on first
+    use, and reused for every read. Only the blocks covering the range
+    read are downloaded. Reading the header of a large file costs one
+    block rather than the whole file.
+    """
+
+    def __init__(self, client, vault, file_id,
+                 concurrency=DEFAULT_CONCURRENCY):
+        """
+        :param client: instance of deuceclient.client.deuce.DeuceClient
+        :param vault: instance of deuceclient.api.Vault holding the file
+        :param file_id: File ID in the Vault
+        :param concurrency: number of blocks downloaded at the same time
+        """
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+
+        self._client = client
+        self._vault = vault
+        self._file_id = file_id
+        self._concurrency = concurrency
+        self.__lock = threading.Lock()
+        self.__offsets = None
+        self.__block_ids = None
+
+    @property
+    def file_id(self):
+        return self._file_id
+
+    def __load_block_map(self):
+        with self.__lock:
+            if self.__offsets is not None:
+                return
+
+            if self._file_id not in self._vault.files:
+                self._vault.add_file(self._file_id)
+
+            # The offsets known for the file in the vault may only be part
+            # of them, e.g. a single page of its block list, so the whole
+            # list is always retrieved
+            block_map = sorted((int(offset), block_id)
+                               for block_id, offset in
+                               self._client.IterFileBlockList(
+                                   self._vault, self._file_id))
+            self.__block_ids = [block_id for offset, block_id in block_map]
+            self.__offsets = [offset for offset, block_id in block_map]
+
+    @property
+    def block_map(self):
+        """List of the (offset, Block ID) of the blocks of the file
+        """
+        self.__load_block_map()
+        return list(zip(self.__offsets, self.__block_ids))
+
+    def blocks_for_range(self, start, length):
+        """Find the blocks covering a range of the file
+
+        :param start: offset of the first byte of the range
+        :param length: number of bytes of the range
+        :returns: list of the (offset, Block ID) of the blocks, in order
+        """
+        if start < 0:
+            raise ValueError('start must not be negative')
+        if length < 0:
+            raise ValueError('length must not be negative')
+
+        self.__load_block_map()
+        if not length or not self.__offsets:
+            return []
+
+        first = max(bisect.bisect_right(self.__offsets, start) - 1, 0)
+        last = bisect.bisect_left(self.__offsets, start + length)
+        return list(zip(self.__offsets[first:last],
+                        self.__block_ids[first:last]))
+
+    def download_block(self, block_id):
+        """Download the data of a block of the file
+
+        :param block_id: the Block ID
+        :returns: the block data
+        """
+        block = api_block.Block(project_id=self._vault.project_id,
+                                vault_id=self._vault.vault_id,
+                                block_id=block_id)
+        self._client.DownloadBlock(self._vault, block)
+        return block.data
+
+    def iter_range(self, start, length):
+        """Stream a range of the file
+
+        The blocks are downloaded concurrently, a window of blocks at a
+        time, and the data is produced in order.
+
+        :param start: offset of the first byte of the range
+        :param length: number of bytes of the range
+        :returns: generator of the data of the range in chunks; the range
+                  is cut short at the end of the file
+        """
+        blocks = self.blocks_for_range(start, length)
+        end = start + length
+
+        for window_start in range(0, len(blocks), self._concurrency):
+            window = blocks[window_start:window_start + self._concurrency]
+            data = dict(parallel.imap_unordered(
+                lambda block: (block[0], self.download_block(block[1])),
+                window, self._concurrency))
+
+            for offset, block_id in window:
+                chunk = data[offset][max(start - offset, 0):end - offset]
+                if chunk:
+                    yield chunk
+
+    def read_range(self, start, length):
+        """Read a range of the file
+
+        :param start: offset of the first byte of the range
+        :param length: number of bytes of the range
+        :returns: the data of the range, shorter than length if the file
+                  ends before the end of the range
+        """
+        return b''.join(self.iter_range(start, length))
+
+
+class _BlockFetch(object):
+    """Download of a block in the background
+    """
+
+    def __init__(self, reader, block_id):
+        self.done = threading.Event()
+        self.data = None
+        self.error = None
+        self.cancelled = False
+        self.__reader = reader
+        self.__block_id = block_id
+
+    def cancel(self):
+        """Skip the download unless it already started
+        """
+        self.cancelled = True
+
+    def run(self):
+        try:
+            if not self.cancelled:
+                self.data = self.__reader.download_block(self.__block_id)
+        except Exception as ex:
+            self.error = ex
+        finally:
+            self.done.set()
+
+    def result(self):
+        """Wait for the download
+
+        :returns: the block data, None if the download was skipped
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.data
+
+
+class _FetchPool(object):
+    """Bounded number of threads running the block fetches
+    """
+
+    def __init__(self, workers):
+        """
+        :param workers: maximum number of threads
+        """
+        self.__fetches = queue.Queue()
+        self.__workers = workers
+        self.__threads = []
+
+    def submit(self, fetch):
+        """Queue a fetch, starting a thread unless all of them run already
+
+        :param fetch: instance of _BlockFetch
+        """
+        if len(self.__threads) < self.__workers:
+            thread = threading.Thread(target=self.__work,
+                                      name='deuceclient-read-ahead')
+            thread.daemon = True
+            thread.start()
+            self.__threads.append(thread)
+        self.__fetches.put(fetch)
+
+    def __work(self):
+        while True:
+            fetch = self.__fetches.get()
+            if fetch is None:
+                return
+            fetch.run()
+
+    def shutdown(self):
+        """Stop the threads once the queued fetches are done
+        """
+        for _ in self.__threads:
+            self.__fetches.put(None)
+        self.__threads = []
+
+
+class DeuceFile(io.RawIOBase):
+    """Read-only, seekable file object over a file
+
+    Blocks are downloaded as they are read and the most recently used are
+    kept in memory. During sequential reads the following blocks are
+    fetched in the background, by up to read_ahead threads, so that the
+    data is ready when the reader gets to it. The fetches left behind by a
+    seek are dropped. Wrap it in an io.BufferedReader for small reads.
+    """
+
+    def __init__(self, reader, read_ahead=DEFAULT_READ_AHEAD,
+                 cached_blocks=DEFAULT_CACHED_BLOCKS):
+        """
+        :param reader: FileReader of the file
+        :param read_ahead: number of blocks fetched ahead of sequential
+                           reads, 0 to disable
+        :param cached_blocks: number of blocks kept in memory, including
+                              those being fetched ahead, at least one more
+                              than read_ahead
+        """
+        super(DeuceFile, self).__init__()
+        if read_ahead < 0:
+            raise ValueError('read_ahead must not be negative')
+        if cached_blocks < 1:
+            raise ValueError('cached_blocks must be at least 1')
+
+        self._reader = reader
+        self._read_ahead = read_ahead
+        self._cached_blocks = max(cached_blocks, read_ahead + 1)
+        self.__lock = threading.Lock()
+        self.__blocks = collections.OrderedDict()
+        self.__fetches = {}
+        self.__pool = _FetchPool(read_ahead)
+        self.__offsets = None
+        self.__block_ids = None
+        self.__position = 0
+        self.__next_read = 0
+
+    @property
+    def name(self):
+        return self._reader.file_id
+
+    @property
+    def mode(self):
+        return 'rb'
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def __load_block_map(self):
+        if self.__offsets is None:
+            block_map = self._reader.block_map
+            self.__block_ids = [block_id for offset, block_id in block_map]
+            self.__offsets = [offset for offset, block_id in block_map]
+
+    def __index(self, position):
+        """Index of the block covering a position, None past the blocks
+        """
+        self.__load_block_map()
+        index = bisect.bisect_right(self.__offsets, position) - 1
+        return index if index >= 0 else None
+
+    def __block(self, index):
+        with self.__lock:
+            data = self.__blocks.get(index)
+            if data is not None:
+                self.__blocks.move_to_end(index)
+                return data
+            fetch = self.__fetches.pop(index, None)
+
+        data = None
+        if fetch is not None:
+            try:
+                data = fetch.result()
+            except Exception:
+                # Downloaded again below rather than keeping the error of
+                # the fetch for every later read
+                data = None
+        if data is None:
+            # Not fetched ahead, or the fetch was dropped or failed
+            data = self._reader.download_block(self.__block_ids[index])
+
+        with self.__lock:
+            self.__blocks[index] = data
+            self.__evict()
+        return data
+
+    def __evict(self):
+        """Drop the least recently used blocks over the number of blocks
+        kept in memory, counting the fetches
+
+        Must be called with the lock held.
+        """
+        while self.__blocks and \
+                len(self.__blocks) + len(self.__fetches) > \
+                self._cached_blocks:
+            self.__blocks.popitem(last=False)
+
+    def __drop_fetches(self, first, last):
+        """Cancel the fetches of the blocks outside of a window
+
+        Must be called with the lock held.
+
+        :param first: index of the first block of the window
+        :param last: index of the last block of the window
+        """
+        for index in [index for index in self.__fetches
+                      if not first <= index <= last]:
+            self.__fetches.pop(index).cancel()
+
+    def __fetch_ahead(self, index):
+        last = min(index + self._read_ahead, len(self.__offsets) - 1)
+        with self.__lock:
+            self.__drop_fetches(index, last)
+            for ahead in range(index + 1, last + 1):
+                if ahead not in self.__blocks and \
+                        ahead not in self.__fetches:
+                    fetch = _BlockFetch(self._reader, self.__block_ids[ahead])
+                    self.__fetches[ahead] = fetch
+                    self.__pool.submit(fetch)
+            self.__evict()
+
+    @property
+    def size(self):
+        """Length of the file
+        """
+        self.__load_block_map()
+        if not self.__offsets:
+            return 0
+        last = len(self.__offsets) - 1
+        return self.__offsets[last] + len(self.__block(last))
+
+    def tell(self):
+        self._checkClosed()
+        return self.__position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.__position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError('Invalid whence ({0:})'.format(whence))
+
+        if position < 0:
+            raise ValueError('Negative seek position {0:}'.format(position))
+
+        if self.__fetches and position != self.__position:
+            # Only the fetches a sequential read from there would use are
+            # kept, the others would hold their data forever
+            index = self.__index(position) or 0
+            with self.__lock:
+                self.__drop_fetches(index, index + self._read_ahead)
+
+        self.__position = position
+        return position
+
+    def readinto(self, buffer):
+        self._checkClosed()
+        view = memoryview(buffer).cast('B')
+        sequential = self.__position == self.__next_read
+
+        filled = 0
+        while filled < len(view):
+            index = self.__index(self.__position)
+            if index is None:
+                break
+
+            data = self.__block(index)
+            start = self.__position - self.__offsets[index]
+            chunk = data[start:start + len(view) - filled]
+            if not chunk:
+                break
+
+            view[filled:filled + len(chunk)] = chunk
+            filled = filled + len(chunk)
+            self.__position = self.__position + len(chunk)
+            if sequential and self._read_ahead:
+                self.__fetch_ahead(index)
+
+        self.__next_read = self.__position
+        return filled
+
+    def close(self):
+        with self.__lock:
+            self.__blocks.clear()
+            for fetch in self.__fetches.values():
+                fetch.cancel()
+            self.__fetches.clear()
+        self.__pool.shutdown()
+        super(DeuceFile, self).close()
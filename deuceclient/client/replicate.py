@@ -0,0 +1,178 @@
+"""
+Deuce Client - File Replication
+"""
+import logging
+
+import deuceclient.api.block as api_block
+from deuceclient.client.archive import DEFAULT_UPLOAD_BATCH_SIZE
+from deuceclient.client.deuce import CLONE_BLOCKS_PER_ASSIGNMENT, \
+    DEFAULT_CONCURRENCY
+from deuceclient.utils import parallel
+
+
+class FileReplicator(object):
+    """Replicates files to another vault, which may be on another endpoint
+
+    The block list of a file is assigned to a new file of the destination
+    in chunks, and only the blocks the destination reports missing are
+    transferred. The assignments, the downloads from the source and the
+    uploads to the destination run concurrently as a pipeline, each stage
+    consuming the output of the previous one as it arrives. The blocks
+    pass through memory only, a few at a time, and never touch the disk.
+
+    Blocks already stored in the destination, such as those of an earlier
+    replication of a similar file, are not transferred again.
+    """
+
+    def __init__(self, source_client, source_vault, destination_client,
+                 destination_vault, concurrency=DEFAULT_CONCURRENCY,
+                 blocks_per_assignment=CLONE_BLOCKS_PER_ASSIGNMENT,
+                 upload_batch_size=DEFAULT_UPLOAD_BATCH_SIZE):
+        """
+        :param source_client: DeuceClient of the endpoint of the files
+        :param source_vault: instance of deuceclient.api.Vault holding the
+                             files
+        :param destination_client: DeuceClient of the endpoint to replicate
+                                   to, which may be the source client
+        :param destination_vault: instance of deuceclient.api.Vault to
+                                  replicate to
+        :param concurrency: number of requests of each stage made at the
+                            same time
+        :param blocks_per_assignment: number of blocks assigned per request
+        :param upload_batch_size: number of bytes of blocks uploaded per
+                                  request
+        """
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        if blocks_per_assignment < 1:
+            raise ValueError('blocks_per_assignment must be at least 1')
+        if upload_batch_size < 1:
+            raise ValueError('upload_batch_size must be at least 1')
+
+        self.log = logging.getLogger(__name__)
+        self._source = source_client
+        self._source_vault = source_vault
+        self._destination = destination_client
+        self._destination_vault = destination_vault
+        self._concurrency = concurrency
+        self._blocks_per_assignment = blocks_per_assignment
+        self._upload_batch_size = upload_batch_size
+
+        self.files_replicated = 0
+        self.blocks_assigned = 0
+        self.blocks_transferred = 0
+        self.bytes_transferred = 0
+
+    def _assign(self, file_id, chunk):
+        """Assign a chunk of blocks to the file of the destination
+
+        :returns: set of the Block IDs missing from the destination
+        """
+        vault = self._destination_vault.empty_copy()
+        vault.add_file(file_id)
+        for block_id, offset in chunk:
+            vault.files[file_id].assign_block(block_id, offset)
+        missing = self._destination.AssignBlocksToFile(vault, file_id, chunk)
+        return len(chunk), missing
+
+    def _new_blocks(self, assignments):
+        """The missing blocks of the assignments, each only once
+        """
+        requested = set()
+        for count, missing in assignments:
+            self.blocks_assigned = self.blocks_assigned + count
+            for block_id in missing.difference(requested):
+                requested.add(block_id)
+                yield block_id
+
+    def _download(self, block_id):
+        block = api_block.Block(project_id=self._source_vault.project_id,
+                                vault_id=self._source_vault.vault_id,
+                                block_id=block_id)
+        self._source.DownloadBlock(self._source_vault, block)
+        return block_id, block.data
+
+    def _batches(self, downloads):
+        batch = []
+        batch_size = 0
+        for block_id, data in downloads:
+            batch.append((block_id, data))
+            batch_size = batch_size + len(data)
+            if batch_size >= self._upload_batch_size:
+                yield batch
+                batch = []
+                batch_size = 0
+
+        if batch:
+            yield batch
+
+    def _upload(self, batch):
+        vault = self._destination_vault.empty_copy()
+        for block_id, data in batch:
+            vault.blocks[block_id] = api_block.Block(
+                project_id=vault.project_id, vault_id=vault.vault_id,
+                block_id=block_id, data=data)
+        self._destination.UploadBlocks(vault, [block_id for block_id, data
+                                               in batch])
+        return len(batch), sum(len(data) for block_id, data in batch)
+
+    def replicate(self, file_id):
+        """Replicate a file
+
+        :param file_id: File ID of the file in the source vault
+        :returns: File ID of the new file in the destination vault
+        :raises: the first error of the replication, once the partial file
+                 of the destination is deleted
+        """
+        destination_file_id = self._destination.CreateFile(
+            self._destination_vault)
+        last_block = []
+        transferred = 0
+        transferred_bytes = 0
+
+        assignments = parallel.imap_unordered(
+            lambda chunk: self._assign(destination_file_id, chunk),
+            self._source.IterFileBlockChunks(self._source_vault, file_id,
+                                             self._blocks_per_assignment,
+                                             last_block),
+            self._concurrency)
+        downloads = parallel.imap_unordered(
+            self._download, self._new_blocks(assignments), self._concurrency)
+        uploads = parallel.imap_unordered(
+            self._upload, self._batches(downloads), self._concurrency)
+        try:
+            try:
+                for count, size in uploads:
+                    transferred = transferred + count
+                    transferred_bytes = transferred_bytes + size
+            finally:
+                # Stop the earlier stages when a later one failed
+                uploads.close()
+                downloads.close()
+                assignments.close()
+                self.blocks_transferred = self.blocks_transferred + \
+                    transferred
+                self.bytes_transferred = self.bytes_transferred + \
+                    transferred_bytes
+
+            self._destination.FinalizeFileAfterLastBlock(
+                self._destination_vault, destination_file_id, last_block)
+
+        except Exception:
+            self._destination_vault.files.pop(destination_file_id, None)
+            try:
+                self._destination.DeleteFile(self._destination_vault,
+                                             destination_file_id)
+            except Exception as ex:
+                self.log.error('Failed to delete the partial replica {0:} '
+                               'of {1:}: {2:}'.format(destination_file_id,
+                                                      file_id, ex))
+            raise
+
+        self.files_replicated = self.files_replicated + 1
+        self.log.info('Replicated {0:} to {1:} in {2:}, transferring {3:} '
+                      'blocks, {4:} bytes'.format(
+                          file_id, destination_file_id,
+                          self._destination_vault.vault_id, transferred,
+                          transferred_bytes))
+        return destination_file_id
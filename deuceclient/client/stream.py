@@ -0,0 +1,179 @@
+"""
+Deuce Client - Ordered Streaming Restore
+"""
+import logging
+import threading
+
+import deuceclient.api.block as api_block
+import deuceclient.api.vault as api_vault
+from deuceclient.client.deuce import DEFAULT_CONCURRENCY
+from deuceclient.utils import parallel
+
+# Number of bytes of downloaded blocks held waiting for their turn
+DEFAULT_BUFFER_SIZE = 64 * 1024 * 1024
+
+
+class _ReorderBuffer(object):
+    """Room for the blocks downloaded ahead of the one to write next
+
+    Room is granted in the order of the blocks, so the block to write next
+    always has its room before the ones after it. The blocks ahead can
+    then never take up the whole buffer while it is missing.
+    """
+
+    def __init__(self, size):
+        self.__condition = threading.Condition()
+        self.__size = size
+        self.__used = 0
+        self.__turn = 0
+        self.__closed = False
+        self.peak = 0
+
+    def reserve(self, index, size):
+        """Wait for the turn of a block and for room for its data
+
+        A block larger than the whole buffer is let in when the buffer is
+        empty.
+
+        :raises: RuntimeError if the buffer was closed
+        """
+        with self.__condition:
+            while not self.__closed and \
+                    (index != self.__turn or
+                     (self.__used and self.__used + size > self.__size)):
+                self.__condition.wait()
+
+            if self.__closed:
+                raise RuntimeError('The reorder buffer was closed')
+            self.__used = self.__used + size
+            self.peak = max(self.peak, self.__used)
+            self.__turn = self.__turn + 1
+            self.__condition.notify_all()
+
+    def release(self, size):
+        with self.__condition:
+            self.__used = self.__used - size
+            self.__condition.notify_all()
+
+    def close(self):
+        """Wake up and fail the downloads waiting for room
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+
+
+class StreamRestore(object):
+    """Restores a file to a stream, such as a pipe, in order
+
+    The blocks are downloaded concurrently and written in order of their
+    offsets, so the output needs neither seeking nor positional writes.
+    Blocks that arrive before their turn wait in a reorder buffer. Downloads
+    wait when the buffer is full, which caps memory at about the buffer
+    size whatever the size of the file.
+    """
+
+    def __init__(self, client, vault, concurrency=DEFAULT_CONCURRENCY,
+                 buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        :param client: instance of deuceclient.client.deuce.DeuceClient
+        :param vault: instance of deuceclient.api.Vault holding the file
+        :param concurrency: number of blocks downloaded at the same time
+        :param buffer_size: number of bytes of downloaded blocks that may
+                            wait to be written
+        """
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        if buffer_size < 1:
+            raise ValueError('buffer_size must be at least 1')
+
+        self.log = logging.getLogger(__name__)
+        self._client = client
+        self._vault = vault
+        self._concurrency = concurrency
+        self._buffer_size = buffer_size
+
+        self.blocks_downloaded = 0
+        self.bytes_written = 0
+        self.peak_buffered = 0
+
+    def _block_list(self, file_id):
+        vault = api_vault.Vault(project_id=self._vault.project_id,
+                                vault_id=self._vault.vault_id)
+        vault.add_file(file_id)
+        return sorted((int(offset), block_id) for block_id, offset in
+                      self._client.IterFileBlockList(vault, file_id))
+
+    @staticmethod
+    def _sizes(block_list):
+        """Compute the room needed by each block
+
+        The size of a block is given by the offset of the next one; that
+        of the last block is taken to be the largest of the others.
+        """
+        sizes = [block_list[index + 1][0] - offset
+                 for index, (offset, block_id) in enumerate(block_list[:-1])]
+        sizes.append(max(sizes) if sizes else 0)
+        return sizes
+
+    def _download(self, block_id):
+        block = api_block.Block(project_id=self._vault.project_id,
+                                vault_id=self._vault.vault_id,
+                                block_id=block_id)
+        self._client.DownloadBlock(self._vault, block)
+        return block.data
+
+    def restore(self, file_id, output):
+        """Write the data of a file to an output, in order
+
+        :param file_id: File ID in the Vault
+        :param output: object with a write method receiving the data
+        :returns: number of bytes written
+        :raises: the first error downloading the blocks or writing them
+        """
+        block_list = self._block_list(file_id)
+        sizes = self._sizes(block_list)
+        reorder_buffer = _ReorderBuffer(self._buffer_size)
+        failures = []
+
+        def fetch(index):
+            try:
+                reorder_buffer.reserve(index, sizes[index])
+                return index, self._download(block_list[index][1])
+            except Exception as ex:
+                # Recorded before the waiting downloads are failed
+                failures.append(ex)
+                reorder_buffer.close()
+                raise
+
+        results = parallel.imap_unordered(fetch, range(len(block_list)),
+                                          self._concurrency)
+        arrived = {}
+        next_index = 0
+        written = 0
+        try:
+            for index, data in results:
+                self.blocks_downloaded = self.blocks_downloaded + 1
+                arrived[index] = data
+                while next_index in arrived:
+                    data = arrived.pop(next_index)
+                    output.write(data)
+                    written = written + len(data)
+                    reorder_buffer.release(sizes[next_index])
+                    next_index = next_index + 1
+
+        except Exception:
+            if failures:
+                raise failures[0]
+            raise
+
+        finally:
+            reorder_buffer.close()
+            results.close()
+            self.bytes_written = self.bytes_written + written
+            self.peak_buffered = max(self.peak_buffered, reorder_buffer.peak)
+
+        self.log.info('Streamed {0:} bytes of {1:} with at most {2:} bytes '
+                      'buffered'.format(written, file_id,
+                                        reorder_buffer.peak))
+        return written
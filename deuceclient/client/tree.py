@@ -0,0 +1,485 @@
+"""
+Deuce Client - Directory Tree Transfers
+"""
+import json
+import logging
+import os
+import threading
+
+import deuceclient.api.block as api_block
+from deuceclient.client.deuce import DEFAULT_CONCURRENCY
+from deuceclient.utils import parallel
+from deuceclient.utils.filesplitter import UniformSplitter
+
+# Number of blocks assigned to a file per request
+DEFAULT_BLOCKS_PER_ASSIGNMENT = 10
+
+# Size of the blocks the files are split into
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# Number of bytes of downloaded blocks that may wait to be written
+DEFAULT_SPOOL_SIZE = 64 * 1024 * 1024
+
+
+def read_manifest(lines):
+    """Read the File IDs of the files of a tree
+
+    :param lines: iterable of JSON lines as written by files upload-tree,
+                  each with the path and the File ID of a file
+    :returns: generator of the (path, File ID) of the files that were
+              uploaded
+    :raises: ValueError if a line is not a valid entry
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+
+        try:
+            entry = json.loads(line)
+            path, file_id = entry['path'], entry['file_id']
+        except (ValueError, TypeError, KeyError):
+            raise ValueError('Invalid manifest entry: {0:}'.format(
+                line.strip()))
+
+        if file_id is not None:
+            yield (path, file_id)
+
+
+class _BlockUpload(object):
+    """Upload of a block by one of the files using it
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.uploaded = False
+
+
+class UploadedBlocks(object):
+    """Blocks uploaded during a session, shared by the uploads of many files
+
+    The first file needing a block claims it and uploads it; the other
+    files needing it at the same time wait for that upload instead of
+    uploading the block again.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__uploads = {}
+        self.uploaded = 0
+        self.deduplicated = 0
+
+    def __contains__(self, block_id):
+        upload = self.__uploads.get(block_id)
+        return upload is not None and upload.uploaded
+
+    def __len__(self):
+        with self.__lock:
+            return len([upload for upload in self.__uploads.values()
+                        if upload.uploaded])
+
+    def claim(self, block_ids):
+        """Claim the blocks to upload
+
+        :param block_ids: iterable of the ids of the blocks the service
+                          does not have yet
+        :returns: tuple of the set of the block ids that were claimed and
+                  must be uploaded by the caller, and the list of the
+                  uploads of the other blocks by other files
+        """
+        claimed = set()
+        others = []
+        with self.__lock:
+            for block_id in block_ids:
+                upload = self.__uploads.get(block_id)
+                if upload is None:
+                    self.__uploads[block_id] = _BlockUpload()
+                    claimed.add(block_id)
+                elif block_id not in claimed:
+                    others.append(upload)
+                    self.deduplicated = self.deduplicated + 1
+        return (claimed, others)
+
+    def complete(self, block_ids, uploaded=True):
+        """Record the outcome of the upload of claimed blocks
+
+        :param block_ids: the ids of the blocks claimed by the caller
+        :param uploaded: whether or not the blocks were uploaded; blocks
+                         that failed to upload can be claimed again
+        """
+        with self.__lock:
+            for block_id in block_ids:
+                upload = self.__uploads[block_id]
+                if uploaded:
+                    upload.uploaded = True
+                    self.uploaded = self.uploaded + 1
+                else:
+                    del self.__uploads[block_id]
+                upload.done.set()
+
+    @staticmethod
+    def wait(uploads):
+        """Wait for the uploads of blocks claimed by other files
+
+        :param uploads: list of the uploads returned by claim()
+        :returns: True if all the blocks were uploaded
+        """
+        for upload in uploads:
+            upload.done.wait()
+        return all(upload.uploaded for upload in uploads)
+
+
+class TreeUploader(object):
+    """Uploads the files of a directory tree
+
+    The files are uploaded concurrently through a single client. Each file
+    is created, split into blocks that are assigned to it a few at a time,
+    the blocks the service does not have yet are uploaded, and the file is
+    finalized. Blocks shared by several files are only uploaded once.
+    """
+
+    def __init__(self, client, vault, concurrency=DEFAULT_CONCURRENCY,
+                 uploaded_blocks=None, block_size=DEFAULT_BLOCK_SIZE,
+                 blocks_per_assignment=DEFAULT_BLOCKS_PER_ASSIGNMENT):
+        """
+        :param client: instance of deuceclient.client.deuce.DeuceClient
+        :param vault: instance of deuceclient.api.Vault to upload to
+        :param concurrency: number of files uploaded at the same time
+        :param uploaded_blocks: UploadedBlocks shared with other uploads
+        :param block_size: size of the blocks the files are split into
+        :param blocks_per_assignment: number of blocks assigned to a file
+                                      per request
+        """
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        if blocks_per_assignment < 1:
+            raise ValueError('blocks_per_assignment must be at least 1')
+
+        self.log = logging.getLogger(__name__)
+        self._client = client
+        self._vault = vault
+        self._concurrency = concurrency
+        self._block_size = block_size
+        self._blocks_per_assignment = blocks_per_assignment
+        self.uploaded_blocks = uploaded_blocks \
+            if uploaded_blocks is not None else UploadedBlocks()
+
+        self.uploaded = 0
+        self.failed = 0
+        self.errors = {}
+
+    @staticmethod
+    def iter_paths(root):
+        """List the regular files of a directory tree
+
+        :param root: path of the directory
+        :returns: generator of the paths of the files relative to the root,
+                  in sorted order
+        """
+        for directory, subdirectories, file_names in os.walk(root):
+            subdirectories.sort()
+            for file_name in sorted(file_names):
+                path = os.path.join(directory, file_name)
+                if os.path.isfile(path):
+                    yield os.path.relpath(path, root)
+
+    def upload_file(self, path):
+        """Upload a file
+
+        :param path: path of the file
+        :returns: the File ID
+        :raises: RuntimeError on failure
+        """
+        vault = self._vault.empty_copy()
+        file_id = self._client.CreateFile(vault)
+        the_file = vault.files[file_id]
+        others = []
+
+        with open(path, 'rb') as content:
+            splitter = UniformSplitter(vault.project_id, vault.vault_id,
+                                       content, chunk_size=self._block_size)
+            while True:
+                block_list = the_file.assign_from_data_source(
+                    splitter, append=True, count=self._blocks_per_assignment)
+                if not block_list:
+                    break
+
+                missing = self._client.AssignBlocksToFile(
+                    vault, file_id,
+                    [(block.block_id, offset)
+                     for block, offset in block_list])
+
+                claimed, uploads = self.uploaded_blocks.claim(missing)
+                others.extend(uploads)
+                if claimed:
+                    self.__upload_blocks(vault, block_list, claimed)
+
+                # Only the last block is needed to continue the file
+                last_block_id = block_list[-1][0].block_id
+                for block, offset in block_list:
+                    if block.block_id != last_block_id:
+                        the_file.blocks.pop(block.block_id, None)
+
+        if not self.uploaded_blocks.wait(others):
+            raise RuntimeError('Failed to upload the file {0:}: blocks '
+                               'shared with another file failed to upload'
+                               .format(path))
+
+        self._client.FinalizeFile(vault, file_id)
+        return file_id
+
+    def __upload_blocks(self, vault, block_list, claimed):
+        for block, offset in block_list:
+            if block.block_id in claimed:
+                vault.blocks[block.block_id] = block
+        try:
+            self._client.UploadBlocks(vault, claimed)
+        except Exception:
+            self.uploaded_blocks.complete(claimed, uploaded=False)
+            raise
+        finally:
+            for block_id in claimed:
+                vault.blocks.pop(block_id, None)
+        self.uploaded_blocks.complete(claimed)
+
+    def _upload(self, root, path):
+        try:
+            return (path, self.upload_file(os.path.join(root, path)), None)
+        except Exception as ex:
+            self.log.error('Failed to upload {0}: {1}'.format(path, ex))
+            return (path, None, str(ex) or type(ex).__name__)
+
+    def upload(self, root):
+        """Upload the files of a directory tree
+
+        :param root: path of the directory
+        :returns: generator of the (path relative to the root, File ID) of
+                  the files as they complete; the File ID is None if the
+                  upload of the file failed, the error is then in errors
+        """
+        for path, file_id, error in parallel.imap_unordered(
+                lambda path: self._upload(root, path),
+                self.iter_paths(root), self._concurrency):
+            if file_id is None:
+                self.failed = self.failed + 1
+                self.errors[path] = error
+            else:
+                self.uploaded = self.uploaded + 1
+            yield (path, file_id)
+
+
+class _Spool(object):
+    """Downloaded block data waiting to be written
+
+    The downloads wait for room in the spool so that the data held in
+    memory stays bounded when writing falls behind.
+    """
+
+    def __init__(self, size):
+        self.__condition = threading.Condition()
+        self.__size = size
+        self.__used = 0
+        self.__closed = False
+
+    def reserve(self, size):
+        """Wait for room for the data of a block
+
+        A block larger than the whole spool is let in when the spool is
+        empty.
+
+        :raises: RuntimeError if the spool was closed
+        """
+        with self.__condition:
+            while (self.__used and self.__used + size > self.__size and
+                   not self.__closed):
+                self.__condition.wait()
+
+            if self.__closed:
+                raise RuntimeError('The spool was closed')
+            self.__used = self.__used + size
+
+    def release(self, size):
+        with self.__condition:
+            self.__used = self.__used - size
+            self.__condition.notify_all()
+
+    def close(self):
+        """Wake up and fail the downloads waiting for room
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+
+
+class TreeRestorer(object):
+    """Restores files into a directory tree
+
+    The block lists of all the files are retrieved first so that each block
+    is only downloaded once however many times, and in however many files,
+    it is used. Each block is then written at every offset using it.
+    Restoring many near identical files costs the unique data, not the
+    total size of the files.
+    """
+
+    def __init__(self, client, vault, concurrency=DEFAULT_CONCURRENCY,
+                 spool_size=DEFAULT_SPOOL_SIZE):
+        """
+        :param client: instance of deuceclient.client.deuce.DeuceClient
+        :param vault: instance of deuceclient.api.Vault to restore from
+        :param concurrency: number of requests made at the same time
+        :param spool_size: number of bytes of downloaded blocks that may
+                           wait to be written
+        """
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        if spool_size < 1:
+            raise ValueError('spool_size must be at least 1')
+
+        self.log = logging.getLogger(__name__)
+        self._client = client
+        self._vault = vault
+        self._concurrency = concurrency
+        self._spool_size = spool_size
+
+        self.restored = 0
+        self.failed = 0
+        self.errors = {}
+        self.blocks_downloaded = 0
+        self.bytes_downloaded = 0
+        self.bytes_written = 0
+
+    def _block_list(self, entry):
+        path, file_id = entry
+        try:
+            vault = self._vault.empty_copy()
+            vault.add_file(file_id)
+            block_list = sorted(self._client.IterFileBlockList(vault,
+                                                               file_id),
+                                key=lambda block: int(block[1]))
+            return (path, file_id, block_list, None)
+        except Exception as ex:
+            return (path, file_id, None, str(ex) or type(ex).__name__)
+
+    def _download(self, spool, block_id):
+        try:
+            block = api_block.Block(project_id=self._vault.project_id,
+                                    vault_id=self._vault.vault_id,
+                                    block_id=block_id)
+            self._client.DownloadBlock(self._vault, block)
+        except Exception as ex:
+            return (block_id, None, str(ex) or type(ex).__name__)
+
+        spool.reserve(len(block.data))
+        return (block_id, block.data, None)
+
+    def _fail(self, path, error):
+        self.log.error('Failed to restore {0}: {1}'.format(path, error))
+        self.failed = self.failed + 1
+        self.errors[path] = error
+
+    def restore(self, files, root):
+        """Restore files into a directory tree
+
+        :param files: iterable of the (path relative to the root, File ID)
+                      of the files to restore
+        :param root: path of the directory to restore the files into
+        :returns: generator of the (path relative to the root, File ID) of
+                  the files as they complete; the path is in errors if the
+                  restoration of the file failed
+        """
+        root = os.path.abspath(root)
+        file_ids = {}
+        for path, file_id in files:
+            file_ids.setdefault(path, []).append(file_id)
+
+        entries = []
+        for path, path_file_ids in sorted(file_ids.items()):
+            target = os.path.abspath(os.path.join(root, path))
+            if len(path_file_ids) > 1:
+                self._fail(path, 'The path is listed more than once')
+            elif target == root or \
+                    os.path.commonpath([root, target]) != root:
+                self._fail(path, 'The path is outside of the directory')
+            else:
+                entries.append((path, path_file_ids[0]))
+                continue
+            yield (path, path_file_ids[0])
+
+        # Where each block goes, and how many blocks each file still needs
+        uses = {}
+        pending = {}
+        for path, file_id, block_list, error in parallel.imap_unordered(
+                self._block_list, entries, self._concurrency):
+            if error is None:
+                try:
+                    target = os.path.join(root, path)
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    open(target, 'wb').close()
+                except OSError as ex:
+                    error = str(ex)
+
+            if error is not None:
+                self._fail(path, error)
+                yield (path, file_id)
+            elif not block_list:
+                self.restored = self.restored + 1
+                yield (path, file_id)
+            else:
+                pending[path] = len(block_list)
+                for block_id, offset in block_list:
+                    uses.setdefault(block_id, []).append((path,
+                                                          int(offset)))
+
+        spool = _Spool(self._spool_size)
+        downloads = parallel.imap_unordered(
+            lambda block_id: self._download(spool, block_id),
+            list(uses), self._concurrency, buffer_size=max(len(uses), 1))
+        try:
+            for block_id, data, error in downloads:
+                if data is not None:
+                    self.blocks_downloaded = self.blocks_downloaded + 1
+                    self.bytes_downloaded = self.bytes_downloaded + len(data)
+
+                for path in self.__write_block(root, uses.pop(block_id),
+                                               data, error, pending):
+                    yield (path, file_ids[path][0])
+
+                if data is not None:
+                    spool.release(len(data))
+        finally:
+            spool.close()
+            downloads.close()
+
+    def __write_block(self, root, block_uses, data, error, pending):
+        # Lists the files that completed or failed
+        offsets = {}
+        for path, offset in block_uses:
+            offsets.setdefault(path, []).append(offset)
+
+        for path, file_offsets in offsets.items():
+            if path not in pending:
+                # The file already failed
+                continue
+
+            write_error = error
+            if write_error is None:
+                try:
+                    with open(os.path.join(root, path), 'r+b') as target:
+                        for offset in file_offsets:
+                            target.seek(offset)
+                            target.write(data)
+                            self.bytes_written = self.bytes_written + \
+                                len(data)
+                except OSError as ex:
+                    write_error = str(ex)
+
+            if write_error is not None:
+                del pending[path]
+                self._fail(path, write_error)
+                yield path
+                continue
+
+            pending[path] = pending[path] - len(file_offsets)
+            if not pending[path]:
+                del pending[path]
+                self.restored = self.restored + 1
+                yield path
@@ -0,0 +1,169 @@
+"""
+Deuce Download Verification
+
+- Checks the data downloaded from Deuce against the Block IDs, the SHA-1 of
+the block data, as it arrives. The hashing is done by a separate thread so
+that it overlaps the transfer instead of adding to it.
+"""
+import hashlib
+import queue
+import threading
+import time
+
+# Number of times a block failing verification is downloaded again
+DEFAULT_RETRIES = 2
+
+# Number of chunks waiting to be verified before the download waits
+QUEUE_SIZE = 16
+
+
+class VerificationStats(object):
+    """Counters of the verification of the downloads of a client
+
+    Shared by the concurrent downloads of the client.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.blocks_verified = 0
+        self.bytes_verified = 0
+        self.mismatches = 0
+        self.retries = 0
+        # time spent hashing
+        self.hash_seconds = 0.0
+        # time spent receiving the verified data
+        self.transfer_seconds = 0.0
+        # time the downloads waited for the verification once received
+        self.wait_seconds = 0.0
+
+    def add(self, **counters):
+        """Add to the counters
+
+        :param counters: amount to add to each counter, by name
+        """
+        with self.__lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def throughput(self):
+        """Number of bytes verified per second of hashing
+        """
+        if not self.hash_seconds:
+            return 0.0
+        return self.bytes_verified / self.hash_seconds
+
+    @property
+    def overhead(self):
+        """Time added to the downloads by the verification, as a ratio of
+        the time spent receiving the data
+        """
+        if not self.transfer_seconds:
+            return 0.0
+        return self.wait_seconds / self.transfer_seconds
+
+    def report(self):
+        return ('Verified {0:} blocks, {1:} bytes, at {2:.1f} MB/s; '
+                '{3:} mismatches, {4:} retries; '
+                'added {5:.3f} seconds ({6:.1%}) to the downloads'
+                .format(self.blocks_verified, self.bytes_verified,
+                        self.throughput / 1024 / 1024,
+                        self.mismatches, self.retries,
+                        self.wait_seconds, self.overhead))
+
+
+class StreamVerifier(object):
+    """Verifies the data of consecutive blocks as it is received
+
+    The chunks fed in are hashed by a separate thread, split at the
+    offsets of the blocks. The size of a block is given by the offset of
+    the next one; the last block runs to the end of the data.
+    """
+
+    def __init__(self, blocks, stats):
+        """
+        :param blocks: list of the (offset, Block ID) of the blocks of the
+                       data, in order, the first at offset 0
+        :param stats: VerificationStats to record the verification in
+        """
+        self._blocks = blocks
+        self._stats = stats
+        self.__queue = queue.Queue(QUEUE_SIZE)
+        self.__mismatches = []
+        self.__finished = False
+        self.__started = time.perf_counter()
+        self.__thread = threading.Thread(target=self.__verify,
+                                         name='deuceclient-verify')
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def __check(self, index, digest, size):
+        offset, block_id = self._blocks[index]
+        if digest.hexdigest() != block_id:
+            self.__mismatches.append((offset, block_id))
+        self._stats.add(blocks_verified=1, bytes_verified=size)
+
+    def __verify(self):
+        index = 0
+        digest = hashlib.sha1()
+        position = 0
+        hash_seconds = 0.0
+
+        chunk = self.__queue.get()
+        while chunk is not None:
+            chunk = memoryview(chunk)
+            while len(chunk):
+                if index >= len(self._blocks):
+                    # Data past the blocks of the file
+                    self.__mismatches.append((position, None))
+                    break
+
+                if index + 1 < len(self._blocks):
+                    end = self._blocks[index + 1][0]
+                else:
+                    end = position + len(chunk)
+                used = min(len(chunk), end - position)
+
+                start = time.perf_counter()
+                digest.update(chunk[:used])
+                hash_seconds = hash_seconds + time.perf_counter() - start
+
+                position = position + used
+                chunk = chunk[used:]
+                if position == end and index + 1 < len(self._blocks):
+                    self.__check(index, digest,
+                                 end - self._blocks[index][0])
+                    index = index + 1
+                    digest = hashlib.sha1()
+
+            chunk = self.__queue.get()
+
+        # The last block, or the blocks the data stopped short of
+        if index < len(self._blocks):
+            self.__check(index, digest, position - self._blocks[index][0])
+            self.__mismatches.extend(self._blocks[index + 1:])
+        self._stats.add(hash_seconds=hash_seconds)
+
+    def feed(self, chunk):
+        """Verify the next chunk of data
+
+        Waits if the verification falls too far behind.
+        """
+        self.__queue.put(chunk)
+
+    def finish(self):
+        """Wait for the data fed in to be verified
+
+        :returns: list of the (offset, Block ID) of the blocks that did
+                  not match their data; a Block ID of None marks data past
+                  the end of the blocks
+        """
+        if not self.__finished:
+            self.__finished = True
+            received = time.perf_counter()
+            self.__queue.put(None)
+            self.__thread.join()
+            self._stats.add(mismatches=len(self.__mismatches),
+                            transfer_seconds=received - self.__started,
+                            wait_seconds=time.perf_counter() - received)
+        return list(self.__mismatches)
@@ -1,10 +1,23 @@
 """
 Basic HTTP Command Interface
 """
+import threading
 
 import deuceclient
 
 
+class _RequestState(threading.local):
+    """
+    Per-thread HTTP request data so that a single Command object
+    can be used by several threads at the same time
+    """
+
+    def __init__(self):
+        self.body = None
+        self.headers = {}
+        self.uri = ''
+
+
 class Command(object):
     """
     Base class for defining HTTP REST API calls
@@ -17,12 +30,37 @@ class Command(object):
           uripath - HTTP(S) Path for the REST API being defined
           sslenabled - True if using HTTPS; otherwise False
         """
+        self.__request_state = _RequestState()
         self.body = None
         self.headers = {}
         self.uri = ''
         self.apihost = apihost
         self.__ReInit(sslenabled, uripath)
 
+    @property
+    def body(self):
+        return self.__request_state.body
+
+    @body.setter
+    def body(self, value):
+        self.__request_state.body = value
+
+    @property
+    def headers(self):
+        return self.__request_state.headers
+
+    @headers.setter
+    def headers(self, value):
+        self.__request_state.headers = value
+
+    @property
+    def uri(self):
+        return self.__request_state.uri
+
+    @uri.setter
+    def uri(self, value):
+        self.__request_state.uri = value
+
     @property
     def ApiHost(self):
         """API Host"""
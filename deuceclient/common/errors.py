@@ -45,6 +45,12 @@ class MissingBlockError(InvalidBlocks):
     pass
 
 
+class BlockIntegrityError(InvalidBlocks):
+    """Deuce Client detected block data not matching its Block ID
+    """
+    pass
+
+
 class ParameterConstraintError(DeuceClientExceptions):
     """Parameter Constraint Error
     """
@@ -6,24 +6,47 @@ from __future__ import print_function
 import argparse
 import json
 import logging
+import os
 import pprint
+import shlex
 import sys
+import time
 
 import deuceclient.api as api
-import deuceclient.auth.nonauth as noauth
-import deuceclient.auth.openstackauth as openstackauth
-import deuceclient.auth.rackspaceauth as rackspaceauth
-import deuceclient.client.deuce as client
+from deuceclient.auth.tokencache import TokenCache
+from deuceclient.client.blockcache import BlockCache, DEFAULT_MAX_SIZE
+from deuceclient.client.verify import DEFAULT_RETRIES
 import deuceclient.utils as utils
+from deuceclient.utils.parallel import DEFAULT_CONCURRENCY
+
+# Megabytes of blocks held by files stream waiting for their turn
+DEFAULT_STREAM_BUFFER_SIZE = 64
 
 
 class ProgramArgumentError(ValueError):
     pass
 
 
-def __api_operation_prep(log, arguments):
+class BatchArgumentParser(argparse.ArgumentParser):
+    """Argument Parser for the batch commands
+
+    Errors are raised instead of exiting the program so that a bad command
+    only fails itself.
+    """
+
+    def error(self, message):
+        raise ProgramArgumentError(message)
+
+    def print_help(self, file=None):
+        # Keep the output to the results of the commands
+        raise ProgramArgumentError(self.format_help())
+
+
+def __api_operation_prep(log, arguments, session=None):
     """
     API Operation Common Functionality
+
+    :param session: requests.Session shared by the requests of the client
     """
     # Parse the user data
     example_user_config_json = """
@@ -92,6 +115,12 @@ def __api_operation_prep(log, arguments):
 
         return False
 
+    if arguments.user_config is None:
+        sys.stderr.write('The user configuration (--user-config) is '
+                         'required.\n Example Config: {0:}'.format(
+                             example_user_config_json))
+        sys.exit(-1)
+
     user_data = json.load(arguments.user_config)
     if not find_user(user_data):
         sys.stderr.write('Unknown User Type.\n Example Config: {0:}'.format(
@@ -106,14 +135,19 @@ def __api_operation_prep(log, arguments):
     # Setup the Authentication
     datacenter = arguments.datacenter
 
+    # Only the selected provider is imported as the OpenStack based
+    # providers pull in keystoneclient which is slow to import
     asp = None
     if auth_provider == 'openstack':
+        import deuceclient.auth.openstackauth as openstackauth
         asp = openstackauth.OpenStackAuthentication
 
     elif auth_provider == 'rackspace':
+        import deuceclient.auth.rackspaceauth as rackspaceauth
         asp = rackspaceauth.RackspaceAuthentication
 
     elif auth_provider == 'none':
+        import deuceclient.auth.nonauth as noauth
         asp = noauth.NonAuthAuthentication
 
     else:
@@ -121,22 +155,61 @@ def __api_operation_prep(log, arguments):
                          ': {0:}'.format(auth_provider))
         sys.exit(-4)
 
+    token_cache = None
+    if arguments.token_cache is not None:
+        token_cache = TokenCache(arguments.token_cache or None)
+
     auth_engine = asp(userid=auth_data['user']['value'],
                       usertype=auth_data['user']['type'],
                       credentials=auth_data['credentials']['value'],
                       auth_method=auth_data['credentials']['type'],
                       datacenter=datacenter,
-                      auth_url=auth_url)
+                      auth_url=auth_url,
+                      token_cache=token_cache)
 
     # Deuce URL
     uri = arguments.url
 
+    block_cache = None
+    if arguments.block_cache is not None:
+        block_cache = BlockCache(arguments.block_cache or None,
+                                 max_size=arguments.block_cache_size *
+                                 1024 * 1024)
+
     # Setup Agent Access
-    deuce = client.DeuceClient(auth_engine, uri)
+    import deuceclient.client.deuce as client
+    deuce = client.DeuceClient(auth_engine, uri, session=session,
+                               block_cache=block_cache,
+                               verify_downloads=arguments.verify_downloads,
+                               verify_retries=arguments.verify_retries)
 
     return (auth_engine, deuce, uri)
 
 
+def __pooled_session(concurrency):
+    """
+    Create a requests.Session pooling enough connections for the requests
+    made at the same time
+
+    :param concurrency: number of requests made at the same time
+    """
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_maxsize=max(concurrency, requests.adapters.DEFAULT_POOLSIZE))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def __print_error(ex):
+    """
+    Report the error of a command on stderr, leaving stdout to its results
+    """
+    print('Error: {0:}'.format(ex), file=sys.stderr)
+
+
 def vault_list(log, arguments):
     """
     Create a vault with the given name
@@ -149,16 +222,14 @@ def vault_list(log, arguments):
     try:
         project = api.Project(auth_engine.AuthTenantId)
 
-        vault_marker = None
-        while deuceclient.ListVaults(project, vault_marker):
-            vault_marker = project.marker
-            if vault_marker is None:
-                break
+        vault_count = 0
+        for vault_id in deuceclient.IterVaults(project):
+            if not vault_count:
+                print('Vaults:')
+            print('\t{0:}'.format(vault_id))
+            vault_count = vault_count + 1
 
-        if len(project):
-            print('Vaults:')
-            for vault_id in project:
-                print('\t{0:}'.format(vault_id))
+        if vault_count:
             sys.exit(0)
         else:
             print('No Vaults available for the User')
@@ -239,6 +310,70 @@ def vault_delete(log, arguments):
         sys.exit(1)
 
 
+def vault_export(log, arguments):
+    """
+    Export the files of a vault and their blocks to an archive
+    """
+    from deuceclient.client.archive import VaultExporter
+
+    with __pooled_session(arguments.concurrency) as session:
+        auth_engine, deuceclient, api_url = __api_operation_prep(
+            log, arguments, session=session)
+
+        try:
+            vault = deuceclient.GetVault(arguments.vault_name)
+
+            exporter = VaultExporter(deuceclient, vault,
+                                     concurrency=arguments.concurrency)
+            if arguments.archive is None:
+                output = sys.stdout.buffer
+            else:
+                output = open(arguments.archive, 'wb')
+            with output:
+                exporter.export(output)
+
+        except Exception as ex:
+            __print_error(ex)
+            sys.exit(1)
+
+    log.info('Exported {0:} files with {1:} blocks, {2:} bytes'.format(
+        exporter.files_exported, exporter.blocks_exported,
+        exporter.bytes_exported))
+    sys.exit(0)
+
+
+def vault_import(log, arguments):
+    """
+    Import the files of an archive into a vault, writing their new File IDs
+    """
+    from deuceclient.client.archive import VaultImporter
+
+    with __pooled_session(arguments.concurrency) as session:
+        auth_engine, deuceclient, api_url = __api_operation_prep(
+            log, arguments, session=session)
+
+        try:
+            vault = deuceclient.GetVault(arguments.vault_name)
+
+            importer = VaultImporter(deuceclient, vault,
+                                     concurrency=arguments.concurrency)
+            if arguments.archive is None:
+                archive = sys.stdin.buffer
+            else:
+                archive = open(arguments.archive, 'rb')
+            with archive:
+                files = importer.import_archive(archive)
+            print(json.dumps({'files': files,
+                              'blocks_uploaded': importer.blocks_uploaded,
+                              'blocks_skipped': importer.blocks_skipped}))
+
+        except Exception as ex:
+            __print_error(ex)
+            sys.exit(1)
+
+    sys.exit(0)
+
+
 def block_list(log, arguments):
     """
     List the blocks in a vault
@@ -248,18 +383,16 @@ def block_list(log, arguments):
     try:
         vault = deuceclient.GetVault(arguments.vault_name)
 
-        block_marker = arguments.marker
-        while deuceclient.GetBlockList(vault,
-                                       marker=block_marker,
-                                       limit=arguments.limit):
-            block_marker = vault.blocks.marker
-            if block_marker is None:
-                break
-
-        if len(vault.blocks):
-            print('Block List:')
-            for key, block in vault.blocks.items():
-                print('\t{0}'.format(block.block_id))
+        block_count = 0
+        for block_id in deuceclient.IterBlockList(vault,
+                                                  marker=arguments.marker,
+                                                  limit=arguments.limit):
+            if not block_count:
+                print('Block List:')
+            print('\t{0}'.format(block_id))
+            block_count = block_count + 1
+
+        if block_count:
             sys.exit(0)
 
         else:
@@ -350,6 +483,74 @@ def file_create(log, arguments):
         sys.exit(1)
 
 
+def file_clone(log, arguments):
+    """
+    Copy a file within its vault, reusing its blocks
+    """
+    with __pooled_session(arguments.concurrency) as session:
+        auth_engine, deuceclient, api_url = __api_operation_prep(
+            log, arguments, session=session)
+
+        try:
+            vault = deuceclient.GetVault(arguments.vault_name)
+
+            clone_file_id = deuceclient.CloneFile(
+                vault, arguments.file_id, concurrency=arguments.concurrency)
+
+            print('Cloned File {0}'.format(arguments.file_id))
+            print('\tFile ID: {0}'.format(clone_file_id))
+            print('\tURL: {0}'.format(vault.files[clone_file_id].url))
+
+        except Exception as ex:
+            __print_error(ex)
+            sys.exit(1)
+
+    sys.exit(0)
+
+
+def file_replicate(log, arguments):
+    """
+    Replicate a file to another vault, transferring only the missing blocks
+    """
+    import deuceclient.client.deuce as client
+    from deuceclient.client.replicate import FileReplicator
+
+    with __pooled_session(3 * arguments.concurrency) as session:
+        auth_engine, deuceclient, api_url = __api_operation_prep(
+            log, arguments, session=session)
+
+        try:
+            vault = deuceclient.GetVault(arguments.vault_name)
+
+            destination = deuceclient
+            if arguments.destination_url is not None:
+                destination = client.DeuceClient(
+                    auth_engine, arguments.destination_url, session=session,
+                    verify_downloads=arguments.verify_downloads,
+                    verify_retries=arguments.verify_retries)
+            destination_vault = destination.GetVault(
+                arguments.destination_vault)
+
+            replicator = FileReplicator(deuceclient, vault, destination,
+                                        destination_vault,
+                                        concurrency=arguments.concurrency)
+            file_id = replicator.replicate(arguments.file_id)
+
+            print('Replicated File {0}'.format(arguments.file_id))
+            print('\tFile ID: {0}'.format(file_id))
+            print('\tURL: {0}'.format(destination_vault.files[file_id].url))
+            print('\tBlocks Transferred: {0}'.format(
+                replicator.blocks_transferred))
+            print('\tBytes Transferred: {0}'.format(
+                replicator.bytes_transferred))
+
+        except Exception as ex:
+            __print_error(ex)
+            sys.exit(1)
+
+    sys.exit(0)
+
+
 def file_list(log, arguments):
     """
     List files in the vault
@@ -359,18 +560,14 @@ def file_list(log, arguments):
     try:
         vault = deuceclient.GetVault(arguments.vault_name)
 
-        file_marker = None
-        while deuceclient.ListFiles(vault,
-                                    file_marker,
-                                    limit=arguments.limit):
-            file_marker = vault.files.marker
-            if file_marker is None:
-                break
-
-        if len(vault.files):
-            print('Files:')
-            for file_id in vault.files:
-                print('\t{0:}'.format(file_id))
+        file_count = 0
+        for file_id in deuceclient.IterFiles(vault, limit=arguments.limit):
+            if not file_count:
+                print('Files:')
+            print('\t{0:}'.format(file_id))
+            file_count = file_count + 1
+
+        if file_count:
             sys.exit(0)
 
         else:
@@ -403,52 +600,65 @@ def file_delete(log, arguments):
         sys.exit(1)
 
 
-def file_upload(log, arguments):
-    """
-    Upload a file
+def __upload_file(deuceclient, vault, file_id, content):
+    """Upload the content of a file
+
+    :param deuceclient: the DeuceClient to upload with
+    :param vault: the Vault to upload to
+    :param file_id: File ID in the Vault, None to create a new file
+    :param content: file-like object to upload
+    :returns: the File ID
     """
-    auth_engine, deuceclient, api_url = __api_operation_prep(log, arguments)
+    if file_id is None:
+        file_id = deuceclient.CreateFile(vault)
+    else:
+        vault.add_file(file_id)
 
-    try:
-        vault = deuceclient.GetVault(arguments.vault_name)
+    file_splitter = utils.UniformSplitter(vault.project_id,
+                                          vault.vault_id,
+                                          content)
 
-        file_id = arguments.file_id
-        if file_id is None:
-            file_id = deuceclient.CreateFile(vault)
-        else:
-            vault.add_file(file_id)
+    while True:
 
-        file_splitter = utils.UniformSplitter(vault.project_id,
-                                              vault.vault_id,
-                                              arguments.content)
+        block_list = vault.files[file_id].assign_from_data_source(
+            file_splitter, append=True, count=10)
 
-        while True:
+        if len(block_list):
+            assignment_list = []
 
-            block_list = vault.files[file_id].assign_from_data_source(
-                file_splitter, append=True, count=10)
+            for block, block_offset in block_list:
+                assignment_list.append((block.block_id, block_offset))
 
-            if len(block_list):
-                assignment_list = []
+            blocks_to_upload = \
+                deuceclient.AssignBlocksToFile(vault,
+                                               file_id,
+                                               assignment_list)
 
-                for block, block_offset in block_list:
-                    assignment_list.append((block.block_id, block_offset))
+            if len(blocks_to_upload):
+                for block, offset in block_list:
+                    if block.block_id in blocks_to_upload:
+                        vault.blocks[block.block_id] = block
 
-                blocks_to_upload = \
-                    deuceclient.AssignBlocksToFile(vault,
-                                                   file_id,
-                                                   assignment_list)
+                deuceclient.UploadBlocks(vault, blocks_to_upload)
 
-                if len(blocks_to_upload):
-                    for block, offset in block_list:
-                        if block.block_id in blocks_to_upload:
-                            vault.blocks[block.block_id] = block
+        else:
+            break
 
-                    deuceclient.UploadBlocks(vault, blocks_to_upload)
+    deuceclient.FinalizeFile(vault, file_id)
+    return file_id
 
-            else:
-                break
 
-        deuceclient.FinalizeFile(vault, file_id)
+def file_upload(log, arguments):
+    """
+    Upload a file
+    """
+    auth_engine, deuceclient, api_url = __api_operation_prep(log, arguments)
+
+    try:
+        vault = deuceclient.GetVault(arguments.vault_name)
+
+        file_id = __upload_file(deuceclient, vault, arguments.file_id,
+                                arguments.content)
 
         file_url = vault.files[file_id].url
 
@@ -462,6 +672,19 @@ def file_upload(log, arguments):
         sys.exit(1)
 
 
+def __download_file(deuceclient, vault, file_id, file_name, differential):
+    """
+    Download a file, only transferring the blocks that differ from the
+    existing local file if differential
+    """
+    if differential:
+        from deuceclient.client.differential import DifferentialRestore
+
+        DifferentialRestore(deuceclient, vault).restore(file_id, file_name)
+    else:
+        deuceclient.DownloadFile(vault, file_id, file_name)
+
+
 def file_download(log, arguments):
     """
     Download a file
@@ -474,7 +697,8 @@ def file_download(log, arguments):
         file_id = arguments.file_id
         filename = arguments.file_name
 
-        deuceclient.DownloadFile(vault, file_id, filename)
+        __download_file(deuceclient, vault, file_id, filename,
+                        arguments.differential)
         sys.exit(0)
 
     except Exception as ex:
@@ -482,73 +706,701 @@ def file_download(log, arguments):
         sys.exit(1)
 
 
-def main():
+def file_read_range(log, arguments):
+    """
+    Read a range of a file, only downloading the blocks covering it
+    """
+    from deuceclient.client.reader import FileReader
+
+    auth_engine, deuceclient, api_url = __api_operation_prep(log, arguments)
+
+    try:
+        vault = deuceclient.GetVault(arguments.vault_name)
+
+        reader = FileReader(deuceclient, vault, arguments.file_id)
+        if arguments.file_name is None:
+            output = sys.stdout.buffer
+        else:
+            output = open(arguments.file_name, 'wb')
+        with output:
+            for chunk in reader.iter_range(arguments.start,
+                                           arguments.length):
+                output.write(chunk)
+        sys.exit(0)
+
+    except Exception as ex:
+        __print_error(ex)
+        sys.exit(1)
+
+
+def file_upload_tree(log, arguments):
+    """
+    Upload the files of a directory tree, writing the File ID of each file
+    """
+    from deuceclient.client.tree import TreeUploader
+
+    with __pooled_session(arguments.concurrency) as session:
+        auth_engine, deuceclient, api_url = __api_operation_prep(
+            log, arguments, session=session)
+
+        try:
+            vault = deuceclient.GetVault(arguments.vault_name)
+
+            uploader = TreeUploader(deuceclient, vault,
+                                    concurrency=arguments.concurrency)
+            for path, file_id in uploader.upload(arguments.source):
+                mapping = {'path': path, 'file_id': file_id}
+                if file_id is None:
+                    mapping['error'] = uploader.errors[path]
+                print(json.dumps(mapping))
+                sys.stdout.flush()
+
+        except Exception as ex:
+            __print_error(ex)
+            sys.exit(1)
+
+    sys.exit(1 if uploader.failed else 0)
+
+
+def file_restore_tree(log, arguments):
+    """
+    Restore the files listed by upload-tree into a directory tree
+    """
+    from deuceclient.client.tree import TreeRestorer, read_manifest
+
+    with __pooled_session(arguments.concurrency) as session:
+        auth_engine, deuceclient, api_url = __api_operation_prep(
+            log, arguments, session=session)
+
+        try:
+            vault = deuceclient.GetVault(arguments.vault_name)
+
+            with arguments.manifest as manifest:
+                files = list(read_manifest(manifest))
+
+            restorer = TreeRestorer(deuceclient, vault,
+                                    concurrency=arguments.concurrency)
+            for path, file_id in restorer.restore(files,
+                                                  arguments.destination):
+                mapping = {'path': path, 'file_id': file_id}
+                if path in restorer.errors:
+                    mapping['error'] = restorer.errors[path]
+                print(json.dumps(mapping))
+                sys.stdout.flush()
+
+        except Exception as ex:
+            __print_error(ex)
+            sys.exit(1)
+
+    log.info('Restored {0:} files from {1:} blocks, {2:} bytes downloaded '
+             'for {3:} bytes written'.format(restorer.restored,
+                                             restorer.blocks_downloaded,
+                                             restorer.bytes_downloaded,
+                                             restorer.bytes_written))
+    sys.exit(1 if restorer.failed else 0)
+
+
+def file_stream(log, arguments):
+    """
+    Write a file in order, downloading its blocks concurrently
+    """
+    from deuceclient.client.stream import StreamRestore
+
+    with __pooled_session(arguments.concurrency) as session:
+        auth_engine, deuceclient, api_url = __api_operation_prep(
+            log, arguments, session=session)
+
+        try:
+            vault = deuceclient.GetVault(arguments.vault_name)
+
+            restore = StreamRestore(deuceclient, vault,
+                                    concurrency=arguments.concurrency,
+                                    buffer_size=arguments.buffer_size *
+                                    1024 * 1024)
+            if arguments.file_name is None:
+                output = sys.stdout.buffer
+            else:
+                output = open(arguments.file_name, 'wb')
+            with output:
+                restore.restore(arguments.file_id, output)
+            sys.exit(0)
+
+        except Exception as ex:
+            __print_error(ex)
+            sys.exit(1)
+
+
+class BatchSession(object):
+    """State shared by the commands of a batch
+
+    The vaults known to exist are remembered so that the commands do not
+    each have to check for them, as are the blocks known to be stored so
+    that they are not uploaded again. A new Vault object is handed out to
+    each command so that the blocks and files of a command are not kept
+    around.
+    """
+
+    def __init__(self, deuceclient):
+        """
+        :param deuceclient: the DeuceClient shared by the commands
+        """
+        self.deuceclient = deuceclient
+        self.vaults = set()
+        self.blocks = {}
+
+    def known_blocks(self, vault_name):
+        """The ids of the blocks known to be stored in a vault
+
+        :param vault_name: name of the vault
+        :returns: set of the block ids
+        """
+        return self.blocks.setdefault(vault_name, set())
+
+    def forget_vault(self, vault_name):
+        """Forget about a vault that no longer exists
+
+        :param vault_name: name of the vault
+        """
+        self.vaults.discard(vault_name)
+        self.blocks.pop(vault_name, None)
+
+    def get_vault(self, vault_name):
+        """Retrieve a Vault
+
+        :param vault_name: name of the vault
+        :returns: deuceclient.api.Vault instance of the existing Vault
+        :raises: RuntimeError if the vault does not exist
+        """
+        if vault_name not in self.vaults:
+            vault = self.deuceclient.GetVault(vault_name)
+            self.vaults.add(vault_name)
+            return vault
+
+        vault = api.Vault(project_id=self.deuceclient.project_id,
+                          vault_id=vault_name)
+        vault.status = 'valid'
+        return vault
+
+
+def __batch_vault_create(batch, arguments):
+    batch.deuceclient.CreateVault(arguments.vault_name)
+    batch.vaults.add(arguments.vault_name)
+    return {'vault': arguments.vault_name}
+
+
+def __batch_vault_exists(batch, arguments):
+    exists = batch.deuceclient.VaultExists(arguments.vault_name)
+    if exists:
+        batch.vaults.add(arguments.vault_name)
+    else:
+        batch.forget_vault(arguments.vault_name)
+    return {'vault': arguments.vault_name, 'exists': exists}
+
+
+def __batch_vault_stats(batch, arguments):
+    vault = batch.get_vault(arguments.vault_name)
+    batch.deuceclient.GetVaultStatistics(vault)
+    return {'vault': arguments.vault_name, 'statistics': vault.statistics}
+
+
+def __batch_vault_delete(batch, arguments):
+    vault = batch.get_vault(arguments.vault_name)
+    batch.forget_vault(arguments.vault_name)
+    batch.deuceclient.DeleteVault(vault)
+    return {'vault': arguments.vault_name, 'deleted': True}
+
+
+def __batch_vault_list(batch, arguments):
+    project = api.Project(batch.deuceclient.project_id)
+    return {'vaults': list(batch.deuceclient.IterVaults(project))}
+
+
+def __batch_vault_export(batch, arguments):
+    from deuceclient.client.archive import VaultExporter
+
+    if arguments.archive is None:
+        raise ProgramArgumentError('--archive is required in batches')
+
+    vault = batch.get_vault(arguments.vault_name)
+    exporter = VaultExporter(batch.deuceclient, vault,
+                             concurrency=arguments.concurrency)
+    with open(arguments.archive, 'wb') as output:
+        exporter.export(output)
+
+    return {'vault': arguments.vault_name, 'archive': arguments.archive,
+            'files': exporter.files_exported,
+            'blocks': exporter.blocks_exported,
+            'bytes': exporter.bytes_exported}
+
+
+def __batch_vault_import(batch, arguments):
+    from deuceclient.client.archive import VaultImporter
+
+    if arguments.archive is None:
+        raise ProgramArgumentError('--archive is required in batches')
+
+    vault = batch.get_vault(arguments.vault_name)
+    importer = VaultImporter(batch.deuceclient, vault,
+                             concurrency=arguments.concurrency)
+    with open(arguments.archive, 'rb') as archive:
+        files = importer.import_archive(archive)
+
+    return {'vault': arguments.vault_name, 'archive': arguments.archive,
+            'files': files,
+            'blocks_uploaded': importer.blocks_uploaded,
+            'blocks_skipped': importer.blocks_skipped}
+
+
+def __batch_block_list(batch, arguments):
+    vault = batch.get_vault(arguments.vault_name)
+    block_ids = list(batch.deuceclient.IterBlockList(vault,
+                                                     marker=arguments.marker,
+                                                     limit=arguments.limit))
+    batch.known_blocks(arguments.vault_name).update(block_ids)
+    return {'vault': arguments.vault_name, 'blocks': block_ids}
+
+
+def __batch_block_upload(batch, arguments):
+    vault = batch.get_vault(arguments.vault_name)
+    with arguments.block_content as block_content:
+        data = block_content.read()
+
+    block = api.Block(project_id=vault.project_id,
+                      vault_id=vault.vault_id,
+                      block_id=api.Block.make_id(data.encode()),
+                      data=data)
+
+    known_blocks = batch.known_blocks(arguments.vault_name)
+    uploaded = block.block_id not in known_blocks
+    if uploaded:
+        batch.deuceclient.UploadBlock(vault, block)
+        known_blocks.add(block.block_id)
+    return {'vault': arguments.vault_name, 'block_id': block.block_id,
+            'uploaded': uploaded}
+
+
+def __batch_block_delete(batch, arguments):
+    vault = batch.get_vault(arguments.vault_name)
+    block = api.Block(project_id=vault.project_id,
+                      vault_id=vault.vault_id,
+                      block_id=arguments.block_id)
+    batch.deuceclient.DeleteBlock(vault, block)
+    batch.known_blocks(arguments.vault_name).discard(arguments.block_id)
+    return {'vault': arguments.vault_name, 'block_id': arguments.block_id,
+            'deleted': True}
+
+
+def __batch_file_create(batch, arguments):
+    vault = batch.get_vault(arguments.vault_name)
+    file_id = batch.deuceclient.CreateFile(vault)
+    return {'vault': arguments.vault_name, 'file_id': file_id,
+            'url': vault.files[file_id].url}
+
+
+def __batch_file_clone(batch, arguments):
+    vault = batch.get_vault(arguments.vault_name)
+    clone_file_id = batch.deuceclient.CloneFile(
+        vault, arguments.file_id, concurrency=arguments.concurrency)
+    return {'vault': arguments.vault_name, 'file_id': arguments.file_id,
+            'clone_file_id': clone_file_id,
+            'url': vault.files[clone_file_id].url}
+
+
+def __batch_file_replicate(batch, arguments):
+    from deuceclient.client.replicate import FileReplicator
+
+    if arguments.destination_url is not None:
+        raise ProgramArgumentError('--destination-url is not supported in '
+                                   'batches')
+
+    vault = batch.get_vault(arguments.vault_name)
+    destination_vault = batch.get_vault(arguments.destination_vault)
+    replicator = FileReplicator(batch.deuceclient, vault, batch.deuceclient,
+                                destination_vault,
+                                concurrency=arguments.concurrency)
+    file_id = replicator.replicate(arguments.file_id)
+
+    return {'vault': arguments.vault_name, 'file_id': arguments.file_id,
+            'destination_vault': arguments.destination_vault,
+            'destination_file_id': file_id,
+            'blocks_transferred': replicator.blocks_transferred,
+            'bytes_transferred': replicator.bytes_transferred}
+
+
+def __batch_file_list(batch, arguments):
+    vault = batch.get_vault(arguments.vault_name)
+    file_ids = batch.deuceclient.IterFiles(vault, limit=arguments.limit)
+    return {'vault': arguments.vault_name, 'files': list(file_ids)}
+
+
+def __batch_file_upload(batch, arguments):
+    vault = batch.get_vault(arguments.vault_name)
+    with arguments.content as content:
+        file_id = __upload_file(batch.deuceclient, vault, arguments.file_id,
+                                content)
+    return {'vault': arguments.vault_name, 'file_id': file_id,
+            'url': vault.files[file_id].url}
+
+
+def __batch_file_download(batch, arguments):
+    vault = batch.get_vault(arguments.vault_name)
+    __download_file(batch.deuceclient, vault, arguments.file_id,
+                    arguments.file_name, arguments.differential)
+    return {'vault': arguments.vault_name, 'file_id': arguments.file_id,
+            'file_name': arguments.file_name}
+
+
+def __batch_file_read_range(batch, arguments):
+    from deuceclient.client.reader import FileReader
+
+    if arguments.file_name is None:
+        raise ProgramArgumentError('--file-name is required in batches')
+
+    vault = batch.get_vault(arguments.vault_name)
+    reader = FileReader(batch.deuceclient, vault, arguments.file_id)
+    length = 0
+    with open(arguments.file_name, 'wb') as output:
+        for chunk in reader.iter_range(arguments.start, arguments.length):
+            output.write(chunk)
+            length = length + len(chunk)
+
+    return {'vault': arguments.vault_name, 'file_id': arguments.file_id,
+            'start': arguments.start, 'length': length,
+            'file_name': arguments.file_name}
+
+
+def __batch_file_stream(batch, arguments):
+    from deuceclient.client.stream import StreamRestore
+
+    if arguments.file_name is None:
+        raise ProgramArgumentError('--file-name is required in batches')
+
+    vault = batch.get_vault(arguments.vault_name)
+    restore = StreamRestore(batch.deuceclient, vault,
+                            concurrency=arguments.concurrency,
+                            buffer_size=arguments.buffer_size * 1024 * 1024)
+    with open(arguments.file_name, 'wb') as output:
+        length = restore.restore(arguments.file_id, output)
+
+    return {'vault': arguments.vault_name, 'file_id': arguments.file_id,
+            'length': length, 'file_name': arguments.file_name}
+
+
+def __batch_file_upload_tree(batch, arguments):
+    from deuceclient.client.tree import TreeUploader
+
+    vault = batch.get_vault(arguments.vault_name)
+    uploader = TreeUploader(batch.deuceclient, vault,
+                            concurrency=arguments.concurrency)
+    files = dict(uploader.upload(arguments.source))
+    if uploader.failed:
+        raise RuntimeError('Failed to upload {0:} of {1:} files: {2:}'.format(
+            uploader.failed, len(files), json.dumps(uploader.errors)))
+
+    return {'vault': arguments.vault_name, 'files': files,
+            'blocks_uploaded': uploader.uploaded_blocks.uploaded,
+            'blocks_deduplicated': uploader.uploaded_blocks.deduplicated}
+
+
+def __batch_file_restore_tree(batch, arguments):
+    from deuceclient.client.tree import TreeRestorer, read_manifest
+
+    vault = batch.get_vault(arguments.vault_name)
+    with arguments.manifest as manifest:
+        files = list(read_manifest(manifest))
+
+    restorer = TreeRestorer(batch.deuceclient, vault,
+                            concurrency=arguments.concurrency)
+    restored = dict(restorer.restore(files, arguments.destination))
+    if restorer.failed:
+        raise RuntimeError('Failed to restore {0:} of {1:} files: '
+                           '{2:}'.format(restorer.failed, len(restored),
+                                         json.dumps(restorer.errors)))
+
+    return {'vault': arguments.vault_name, 'files': restored,
+            'blocks_downloaded': restorer.blocks_downloaded,
+            'bytes_downloaded': restorer.bytes_downloaded,
+            'bytes_written': restorer.bytes_written}
+
+
+def __batch_file_delete(batch, arguments):
+    vault = batch.get_vault(arguments.vault_name)
+    batch.deuceclient.DeleteFile(vault, arguments.file_id)
+    return {'vault': arguments.vault_name, 'file_id': arguments.file_id,
+            'deleted': True}
+
+
+def batch_parser():
+    """Create the parser for the commands of a batch
+
+    The commands use the same syntax as the vault, blocks and files
+    subcommands of the program.
+    """
+    parser = BatchArgumentParser(prog='batch', add_help=False)
+    __add_operation_parsers(parser.add_subparsers(title='subcommands'), {
+        'vault_create': __batch_vault_create,
+        'vault_exists': __batch_vault_exists,
+        'vault_stats': __batch_vault_stats,
+        'vault_delete': __batch_vault_delete,
+        'vault_list': __batch_vault_list,
+        'vault_export': __batch_vault_export,
+        'vault_import': __batch_vault_import,
+        'block_list': __batch_block_list,
+        'block_upload': __batch_block_upload,
+        'block_delete': __batch_block_delete,
+        'file_create': __batch_file_create,
+        'file_clone': __batch_file_clone,
+        'file_replicate': __batch_file_replicate,
+        'file_list': __batch_file_list,
+        'file_upload': __batch_file_upload,
+        'file_download': __batch_file_download,
+        'file_read_range': __batch_file_read_range,
+        'file_stream': __batch_file_stream,
+        'file_upload_tree': __batch_file_upload_tree,
+        'file_restore_tree': __batch_file_restore_tree,
+        'file_delete': __batch_file_delete,
+    })
+    return parser
+
+
+def run_batch(batch, commands, output, stop_on_error=False):
+    """Run the commands of a batch
+
+    Blank lines and comments (#) are skipped. The result of each command is
+    written to the output as a line of JSON as soon as it completes.
+
+    :param batch: BatchSession to run the commands in
+    :param commands: iterable of the command lines
+    :param output: file-like object to write the results to
+    :param stop_on_error: whether or not to stop at the first failed command
+    :returns: number of failed commands
+    """
+    parser = batch_parser()
+    failures = 0
+
+    for line_number, line in enumerate(commands, 1):
+        command = line.strip()
+        result = {
+            'line': line_number,
+            'command': command
+        }
+        start = time.time()
+        try:
+            argv = shlex.split(command, comments=True)
+            if not argv:
+                continue
+
+            arguments = parser.parse_args(argv)
+            if not hasattr(arguments, 'func'):
+                raise ProgramArgumentError('no operation specified')
+
+            result['result'] = arguments.func(batch, arguments)
+            result['status'] = 'ok'
+
+        except Exception as ex:
+            result['status'] = 'error'
+            # Some errors, e.g. the validation errors, have no message
+            result['error'] = str(ex) or type(ex).__name__
+            failures = failures + 1
+
+        result['elapsed'] = round(time.time() - start, 6)
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+
+        if failures and stop_on_error:
+            break
+
+    return failures
+
+
+def batch(log, arguments):
+    """
+    Run the commands read from a file, one per line, with a single client
+    """
+    import requests
+
+    with requests.Session() as session:
+        auth_engine, deuceclient, api_url = __api_operation_prep(
+            log, arguments, session=session)
+
+        failures = run_batch(BatchSession(deuceclient),
+                             arguments.commands,
+                             sys.stdout,
+                             stop_on_error=arguments.stop_on_error)
+
+    sys.exit(1 if failures else 0)
+
+
+def daemon(log, arguments):
+    """
+    Serve the batch commands to other processes over a Unix socket
+    """
+    import functools
+    import signal
+
+    import requests
+
+    from deuceclient.client.daemon import DaemonServer
+
+    with requests.Session() as session:
+        auth_engine, deuceclient, api_url = __api_operation_prep(
+            log, arguments, session=session)
+
+        try:
+            server = DaemonServer(functools.partial(run_batch,
+                                                    BatchSession(deuceclient)),
+                                  path=arguments.socket)
+        except Exception as ex:
+            __print_error(ex)
+            sys.exit(1)
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        log.info('Serving on {0:}'.format(server.path))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    sys.exit(0)
+
+
+def daemon_command(operation, arguments):
+    """Rebuild the command of an operation to send it to the daemon
+
+    :param operation: name of the operation, e.g. 'file_upload'
+    :param arguments: the parsed arguments of the operation
+    :returns: list of the command arguments
+    :raises: ProgramArgumentError if the command can not be run remotely
+    """
+    group, action = operation.split('_', 1)
+    action = action.replace('_', '-')
+    if group == 'vault':
+        command = ['vault', action]
+        if action != 'list':
+            command.extend(['--vault-name', arguments.vault_name])
+    else:
+        command = [group + 's', '--vault-name', arguments.vault_name,
+                   action]
+
+    for option in ('marker', 'limit', 'block_id', 'file_id', 'concurrency',
+                   'start', 'length', 'buffer_size', 'destination_vault',
+                   'destination_url'):
+        value = getattr(arguments, option, None)
+        if value is not None:
+            command.extend(['--' + option.replace('_', '-'), str(value)])
+
+    # The daemon opens the files itself and does not share our directory
+    for option in ('block_content', 'content', 'file_name', 'source',
+                   'manifest', 'destination', 'archive'):
+        value = getattr(arguments, option, None)
+        if value is None:
+            continue
+
+        if hasattr(value, 'name'):
+            if value in (sys.stdin, sys.stdin.buffer):
+                raise ProgramArgumentError('Reading from stdin is not '
+                                           'supported through the daemon')
+            value.close()
+            value = value.name
+        command.extend(['--' + option.replace('_', '-'),
+                        os.path.abspath(value)])
+
+    for option in ('differential',):
+        if getattr(arguments, option, False):
+            command.append('--' + option.replace('_', '-'))
+
+    return command
+
+
+def __via_daemon(log, arguments, operation):
+    """
+    Run an operation through the daemon, writing its result as JSON
+    """
+    from deuceclient.client.daemon import DaemonClient
+
+    try:
+        with DaemonClient(arguments.via_daemon or None) as daemon_client:
+            result = daemon_client.send(daemon_command(operation, arguments))
+    except Exception as ex:
+        __print_error(ex)
+        sys.exit(1)
+
+    print(json.dumps(result))
+    sys.exit(0 if result['status'] == 'ok' else 1)
+
+
+def __add_operation_parsers(sub_argument_parser, operations):
+    """Add the parsers of the vault, blocks and files subcommands
+
+    :param sub_argument_parser: the subparsers action to add them to
+    :param operations: dict of the operation names to the functions
+                       implementing them
+    """
     def parameter_add_vault_name(the_parser):
         the_parser.add_argument('--vault-name',
                                 default=None,
                                 required=True,
                                 help="Vault Name")
 
-    arg_parser = argparse.ArgumentParser(
-        description="Cloud Backup Agent Status")
-    arg_parser.add_argument('--user-config',
-                            default=None,
-                            type=argparse.FileType('r'),
-                            required=True,
-                            help='JSON file containing username and API Key')
-    arg_parser.add_argument('--url',
-                            default='127.0.0.1:8080',
-                            type=str,
-                            required=False,
-                            help="Network Address for the Deuce Server."
-                                 " Default: 127.0.0.1:8080")
-    arg_parser.add_argument('-lg', '--log-config',
-                            default=None,
-                            type=str,
-                            dest='logconfig',
-                            help='log configuration file')
-    arg_parser.add_argument('-dc', '--datacenter',
-                            default='ord',
-                            type=str,
-                            dest='datacenter',
-                            required=True,
-                            help='Datacenter the system is in',
-                            choices=['lon', 'syd', 'hkg', 'ord', 'iad', 'dfw'])
-    arg_parser.add_argument('--auth-service',
-                            default='rackspace',
-                            type=str,
-                            required=False,
-                            help='Authentication Service Provider',
-                            choices=['openstack', 'rackspace', 'none'])
-    arg_parser.add_argument('--auth-service-url',
-                            default=None,
-                            type=str,
-                            required=False,
-                            help='Authentication Service Provider URL')
-    sub_argument_parser = arg_parser.add_subparsers(title='subcommands')
-
     vault_parser = sub_argument_parser.add_parser('vault')
     vault_subparsers = vault_parser.add_subparsers(title='operations',
                                                    help='Vault Operations')
 
     vault_create_parser = vault_subparsers.add_parser('create')
     parameter_add_vault_name(vault_create_parser)
-    vault_create_parser.set_defaults(func=vault_create)
+    vault_create_parser.set_defaults(func=operations['vault_create'])
 
     vault_exists_parser = vault_subparsers.add_parser('exists')
     parameter_add_vault_name(vault_exists_parser)
-    vault_exists_parser.set_defaults(func=vault_exists)
+    vault_exists_parser.set_defaults(func=operations['vault_exists'])
 
     vault_stats_parser = vault_subparsers.add_parser('stats')
     parameter_add_vault_name(vault_stats_parser)
-    vault_stats_parser.set_defaults(func=vault_stats)
+    vault_stats_parser.set_defaults(func=operations['vault_stats'])
 
     vault_delete_parser = vault_subparsers.add_parser('delete')
     parameter_add_vault_name(vault_delete_parser)
-    vault_delete_parser.set_defaults(func=vault_delete)
+    vault_delete_parser.set_defaults(func=operations['vault_delete'])
 
     vault_list_parser = vault_subparsers.add_parser('list')
-    vault_list_parser.set_defaults(func=vault_list)
+    vault_list_parser.set_defaults(func=operations['vault_list'])
+
+    vault_export_parser = vault_subparsers.add_parser('export')
+    parameter_add_vault_name(vault_export_parser)
+    vault_export_parser.add_argument('--archive',
+                                     default=None,
+                                     required=False,
+                                     type=str,
+                                     help='File name to write the archive '
+                                          'to. Default: standard output')
+    vault_export_parser.add_argument('--concurrency',
+                                     default=DEFAULT_CONCURRENCY,
+                                     required=False,
+                                     type=int,
+                                     help='Number of requests made at the '
+                                          'same time. Default: {0}'.format(
+                                              DEFAULT_CONCURRENCY))
+    vault_export_parser.set_defaults(func=operations['vault_export'])
+
+    vault_import_parser = vault_subparsers.add_parser('import')
+    parameter_add_vault_name(vault_import_parser)
+    vault_import_parser.add_argument('--archive',
+                                     default=None,
+                                     required=False,
+                                     type=str,
+                                     help='File name of the archive written '
+                                          'by vault export. Default: '
+                                          'standard input')
+    vault_import_parser.add_argument('--concurrency',
+                                     default=DEFAULT_CONCURRENCY,
+                                     required=False,
+                                     type=int,
+                                     help='Number of requests made at the '
+                                          'same time. Default: {0}'.format(
+                                              DEFAULT_CONCURRENCY))
+    vault_import_parser.set_defaults(func=operations['vault_import'])
 
     block_parser = sub_argument_parser.add_parser('blocks')
     parameter_add_vault_name(block_parser)
@@ -568,7 +1420,7 @@ def main():
                                    required=False,
                                    type=int,
                                    help="Number of entries to return at most")
-    block_list_parser.set_defaults(func=block_list)
+    block_list_parser.set_defaults(func=operations['block_list'])
 
     block_upload_parser = block_subparsers.add_parser('upload')
     block_upload_parser.add_argument('--block-content',
@@ -576,7 +1428,7 @@ def main():
                                      required=True,
                                      type=argparse.FileType('r'),
                                      help="The block to be uploaded")
-    block_upload_parser.set_defaults(func=block_upload)
+    block_upload_parser.set_defaults(func=operations['block_upload'])
 
     block_delete_parser = block_subparsers.add_parser('delete')
     block_delete_parser.add_argument('--block-id',
@@ -585,7 +1437,7 @@ def main():
                                      type=str,
                                      help="Block ID of the block to be "
                                      "deleted")
-    block_delete_parser.set_defaults(func=block_delete)
+    block_delete_parser.set_defaults(func=operations['block_delete'])
 
     file_parser = sub_argument_parser.add_parser('files')
     parameter_add_vault_name(file_parser)
@@ -593,7 +1445,7 @@ def main():
                                                  help='File Operations')
 
     file_create_parser = file_subparsers.add_parser('create')
-    file_create_parser.set_defaults(func=file_create)
+    file_create_parser.set_defaults(func=operations['file_create'])
 
     file_list_parser = file_subparsers.add_parser('list')
     file_list_parser.add_argument('--limit',
@@ -601,7 +1453,7 @@ def main():
                                   required=False,
                                   type=int,
                                   help="Number of entries to return at most")
-    file_list_parser.set_defaults(func=file_list)
+    file_list_parser.set_defaults(func=operations['file_list'])
 
     file_upload_parser = file_subparsers.add_parser('upload')
     file_upload_parser.add_argument('--file-id',
@@ -616,7 +1468,7 @@ def main():
                                     required=True,
                                     type=argparse.FileType('rb'),
                                     help='File to upload')
-    file_upload_parser.set_defaults(func=file_upload)
+    file_upload_parser.set_defaults(func=operations['file_upload'])
 
     file_download_parser = file_subparsers.add_parser('download')
     file_download_parser.add_argument('--file-id',
@@ -630,7 +1482,58 @@ def main():
                                       required=True,
                                       type=str,
                                       help='File name to store the file in')
-    file_download_parser.set_defaults(func=file_download)
+    file_download_parser.add_argument('--differential',
+                                      default=False,
+                                      action='store_true',
+                                      help='Only download the blocks that '
+                                           'differ from the existing file')
+    file_download_parser.set_defaults(func=operations['file_download'])
+
+    file_clone_parser = file_subparsers.add_parser('clone')
+    file_clone_parser.add_argument('--file-id',
+                                   default=None,
+                                   required=True,
+                                   type=str,
+                                   help='File ID in the Vault of the file to '
+                                        'copy')
+    file_clone_parser.add_argument('--concurrency',
+                                   default=DEFAULT_CONCURRENCY,
+                                   required=False,
+                                   type=int,
+                                   help='Number of block assignment requests '
+                                        'made at the same time. Default: '
+                                        '{0}'.format(DEFAULT_CONCURRENCY))
+    file_clone_parser.set_defaults(func=operations['file_clone'])
+
+    file_replicate_parser = file_subparsers.add_parser('replicate')
+    file_replicate_parser.add_argument('--file-id',
+                                       default=None,
+                                       required=True,
+                                       type=str,
+                                       help='File ID in the Vault of the file '
+                                            'to replicate')
+    file_replicate_parser.add_argument('--destination-vault',
+                                       default=None,
+                                       required=True,
+                                       type=str,
+                                       help='Vault Name to replicate the file '
+                                            'to')
+    file_replicate_parser.add_argument('--destination-url',
+                                       default=None,
+                                       required=False,
+                                       type=str,
+                                       help='Deuce Server of the destination '
+                                            'vault, accessed with the same '
+                                            'credentials. Default: --url')
+    file_replicate_parser.add_argument('--concurrency',
+                                       default=DEFAULT_CONCURRENCY,
+                                       required=False,
+                                       type=int,
+                                       help='Number of requests of each stage '
+                                            'of the replication made at the '
+                                            'same time. Default: {0}'.format(
+                                                DEFAULT_CONCURRENCY))
+    file_replicate_parser.set_defaults(func=operations['file_replicate'])
 
     file_delete_parser = file_subparsers.add_parser('delete')
     file_delete_parser.add_argument('--file-id',
@@ -638,7 +1541,255 @@ def main():
                                     required=False,
                                     type=str,
                                     help='File ID in the Vault to be deleted')
-    file_delete_parser.set_defaults(func=file_delete)
+    file_delete_parser.set_defaults(func=operations['file_delete'])
+
+    file_read_range_parser = file_subparsers.add_parser('read-range')
+    file_read_range_parser.add_argument('--file-id',
+                                        default=None,
+                                        required=True,
+                                        type=str,
+                                        help='File ID in the Vault for the '
+                                             'file.')
+    file_read_range_parser.add_argument('--start',
+                                        default=0,
+                                        required=False,
+                                        type=int,
+                                        help='Offset of the first byte to '
+                                             'read. Default: 0')
+    file_read_range_parser.add_argument('--length',
+                                        default=None,
+                                        required=True,
+                                        type=int,
+                                        help='Number of bytes to read')
+    file_read_range_parser.add_argument('--file-name',
+                                        default=None,
+                                        required=False,
+                                        type=str,
+                                        help='File name to store the data '
+                                             'in. Default: standard output')
+    file_read_range_parser.set_defaults(func=operations['file_read_range'])
+
+    file_stream_parser = file_subparsers.add_parser('stream')
+    file_stream_parser.add_argument('--file-id',
+                                    default=None,
+                                    required=True,
+                                    type=str,
+                                    help='File ID in the Vault for the file.')
+    file_stream_parser.add_argument('--concurrency',
+                                    default=DEFAULT_CONCURRENCY,
+                                    required=False,
+                                    type=int,
+                                    help='Number of blocks downloaded at the '
+                                         'same time. Default: {0}'.format(
+                                             DEFAULT_CONCURRENCY))
+    file_stream_parser.add_argument('--buffer-size',
+                                    default=DEFAULT_STREAM_BUFFER_SIZE,
+                                    required=False,
+                                    type=int,
+                                    metavar='MB',
+                                    help='Megabytes of blocks held waiting '
+                                         'for their turn. Default: '
+                                         '{0}'.format(
+                                             DEFAULT_STREAM_BUFFER_SIZE))
+    file_stream_parser.add_argument('--file-name',
+                                    default=None,
+                                    required=False,
+                                    type=str,
+                                    help='File name to store the data in. '
+                                         'Default: standard output')
+    file_stream_parser.set_defaults(func=operations['file_stream'])
+
+    file_upload_tree_parser = file_subparsers.add_parser('upload-tree')
+    file_upload_tree_parser.add_argument('--source',
+                                         default=None,
+                                         required=True,
+                                         type=str,
+                                         help='Directory to upload')
+    file_upload_tree_parser.add_argument('--concurrency',
+                                         default=DEFAULT_CONCURRENCY,
+                                         required=False,
+                                         type=int,
+                                         help='Number of files uploaded at '
+                                              'the same time. Default: '
+                                              '{0}'.format(
+                                                  DEFAULT_CONCURRENCY))
+    file_upload_tree_parser.set_defaults(
+        func=operations['file_upload_tree'])
+
+    file_restore_tree_parser = file_subparsers.add_parser('restore-tree')
+    file_restore_tree_parser.add_argument('--manifest',
+                                          default=None,
+                                          required=True,
+                                          type=argparse.FileType('r'),
+                                          help='File listing the path and '
+                                               'File ID of the files, as '
+                                               'written by upload-tree')
+    file_restore_tree_parser.add_argument('--destination',
+                                          default=None,
+                                          required=True,
+                                          type=str,
+                                          help='Directory to restore the '
+                                               'files into')
+    file_restore_tree_parser.add_argument('--concurrency',
+                                          default=DEFAULT_CONCURRENCY,
+                                          required=False,
+                                          type=int,
+                                          help='Number of blocks downloaded '
+                                               'at the same time. Default: '
+                                               '{0}'.format(
+                                                   DEFAULT_CONCURRENCY))
+    file_restore_tree_parser.set_defaults(
+        func=operations['file_restore_tree'])
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Cloud Backup Agent Status")
+    arg_parser.add_argument('--user-config',
+                            default=None,
+                            type=argparse.FileType('r'),
+                            required=False,
+                            help='JSON file containing username and API Key.'
+                                 ' Required unless --via-daemon is used')
+    arg_parser.add_argument('--url',
+                            default='127.0.0.1:8080',
+                            type=str,
+                            required=False,
+                            help="Network Address for the Deuce Server."
+                                 " Default: 127.0.0.1:8080")
+    arg_parser.add_argument('-lg', '--log-config',
+                            default=None,
+                            type=str,
+                            dest='logconfig',
+                            help='log configuration file')
+    arg_parser.add_argument('-dc', '--datacenter',
+                            default='ord',
+                            type=str,
+                            dest='datacenter',
+                            required=True,
+                            help='Datacenter the system is in',
+                            choices=['lon', 'syd', 'hkg', 'ord', 'iad', 'dfw'])
+    arg_parser.add_argument('--auth-service',
+                            default='rackspace',
+                            type=str,
+                            required=False,
+                            help='Authentication Service Provider',
+                            choices=['openstack', 'rackspace', 'none'])
+    arg_parser.add_argument('--auth-service-url',
+                            default=None,
+                            type=str,
+                            required=False,
+                            help='Authentication Service Provider URL')
+    arg_parser.add_argument('--token-cache',
+                            default=None,
+                            nargs='?',
+                            const='',
+                            type=str,
+                            required=False,
+                            metavar='PATH',
+                            help='Share authentication tokens with other'
+                                 ' invocations through an on-disk cache.'
+                                 ' Default: ~/.cache/deuceclient/tokens.json')
+    arg_parser.add_argument('--block-cache',
+                            default=None,
+                            nargs='?',
+                            const='',
+                            type=str,
+                            required=False,
+                            metavar='DIR',
+                            help='Keep the downloaded blocks in an on-disk'
+                                 ' cache shared with other invocations.'
+                                 ' Default: ~/.cache/deuceclient/blocks')
+    arg_parser.add_argument('--block-cache-size',
+                            default=DEFAULT_MAX_SIZE // (1024 * 1024),
+                            type=int,
+                            required=False,
+                            metavar='MB',
+                            help='Maximum size of the block cache in'
+                                 ' megabytes. Default: {0}'.format(
+                                     DEFAULT_MAX_SIZE // (1024 * 1024)))
+    arg_parser.add_argument('--verify-downloads',
+                            default=False,
+                            action='store_true',
+                            required=False,
+                            help='Check the downloaded data against the'
+                                 ' Block IDs as it arrives')
+    arg_parser.add_argument('--verify-retries',
+                            default=DEFAULT_RETRIES,
+                            type=int,
+                            required=False,
+                            metavar='COUNT',
+                            help='Number of times a block failing'
+                                 ' verification is downloaded again, 0 to'
+                                 ' fail straight away. Default: {0}'.format(
+                                     DEFAULT_RETRIES))
+    arg_parser.add_argument('--via-daemon',
+                            default=None,
+                            nargs='?',
+                            const='',
+                            type=str,
+                            required=False,
+                            metavar='SOCKET',
+                            help='Run the vault, blocks and files operations'
+                                 ' through a running daemon and output their'
+                                 ' result as JSON.'
+                                 ' Default: the socket of the user\'s daemon')
+    sub_argument_parser = arg_parser.add_subparsers(title='subcommands')
+
+    operations = {
+        'vault_create': vault_create,
+        'vault_exists': vault_exists,
+        'vault_stats': vault_stats,
+        'vault_delete': vault_delete,
+        'vault_list': vault_list,
+        'vault_export': vault_export,
+        'vault_import': vault_import,
+        'block_list': block_list,
+        'block_upload': block_upload,
+        'block_delete': block_delete,
+        'file_create': file_create,
+        'file_clone': file_clone,
+        'file_replicate': file_replicate,
+        'file_list': file_list,
+        'file_upload': file_upload,
+        'file_download': file_download,
+        'file_read_range': file_read_range,
+        'file_stream': file_stream,
+        'file_upload_tree': file_upload_tree,
+        'file_restore_tree': file_restore_tree,
+        'file_delete': file_delete,
+    }
+    __add_operation_parsers(sub_argument_parser, operations)
+
+    batch_command_parser = sub_argument_parser.add_parser(
+        'batch',
+        help='Run vault, blocks and files commands read one per line, '
+             'reusing the authentication, connections and vaults between '
+             'them. Results are written as JSON lines.')
+    batch_command_parser.add_argument('--commands',
+                                      default='-',
+                                      required=False,
+                                      type=argparse.FileType('r'),
+                                      help='File to read the commands from. '
+                                           'Default: stdin')
+    batch_command_parser.add_argument('--stop-on-error',
+                                      default=False,
+                                      action='store_true',
+                                      help='Stop at the first failed command')
+    batch_command_parser.set_defaults(func=batch)
+
+    daemon_parser = sub_argument_parser.add_parser(
+        'daemon',
+        help='Serve the batch commands to the other processes of the user '
+             'over a Unix socket, sharing the authentication, connections '
+             'and caches between them.')
+    daemon_parser.add_argument('--socket',
+                               default=None,
+                               required=False,
+                               type=str,
+                               help='Path of the socket. Default: '
+                                    '$XDG_RUNTIME_DIR/deuceclient/daemon.sock')
+    daemon_parser.set_defaults(func=daemon)
 
     arguments = arg_parser.parse_args()
 
@@ -658,6 +1809,13 @@ def main():
     # Build the logger
     log = logging.getLogger()
 
+    if arguments.via_daemon is not None:
+        operation_names = {func: name for name, func in operations.items()}
+        if arguments.func not in operation_names:
+            arg_parser.error('--via-daemon only applies to the vault, '
+                             'blocks and files subcommands')
+        __via_daemon(log, arguments, operation_names[arguments.func])
+
     arguments.func(log, arguments)
 
 
@@ -4,12 +4,14 @@ Tests - Deuce Client - Testing Support
 import datetime
 import hashlib
 import io
+import json
 import os
 import random
 import time
 import tempfile
 from time import sleep as slowsleep
 from unittest import TestCase
+import urllib.parse
 import uuid
 
 import deuceclient
@@ -191,6 +193,49 @@ def make_reader(data_size, use_temp_file=False, null_data=False):
         return io.BytesIO(data)
 
 
+def make_paged_listing(entries, page_size, key=None, as_dict=False):
+    """Make an httpretty callback that serves a paginated listing
+
+    :param entries: sorted list of the entries to serve
+    :param page_size: default number of entries per page, overridden by
+                      the limit in the request
+    :param key: function extracting the marker from an entry
+    :param as_dict: whether or not the listing is a JSON object (vaults)
+                    instead of a JSON array
+    :returns: callback to use as the body of httpretty.register_uri
+    """
+    if key is None:
+        def key(entry):
+            return entry
+
+    def callback(request, uri, response_headers):
+        marker = request.querystring.get('marker', [None])[0]
+        limit = int(request.querystring.get('limit', [page_size])[0])
+
+        start = 0
+        if marker is not None:
+            markers = [str(key(entry)) for entry in entries]
+            start = markers.index(marker) if marker in markers else \
+                len([m for m in markers if m < marker])
+
+        page = entries[start:start + limit]
+        if start + limit < len(entries):
+            next_batch = '{0}?{1}'.format(
+                uri.split('?')[0],
+                urllib.parse.urlencode({
+                    'marker': key(entries[start + limit]),
+                    'limit': limit}))
+            response_headers['x-next-batch'] = next_batch
+
+        if as_dict:
+            body = json.dumps({entry: {} for entry in page})
+        else:
+            body = json.dumps(page)
+        return (200, response_headers, body)
+
+    return callback
+
+
 class FakeAuthenticator(deuceclient.auth.base.AuthenticationBase):
 
     def __init__(self, *args, **kwargs):
@@ -223,11 +268,11 @@ class FakeAuthenticator(deuceclient.auth.base.AuthenticationBase):
             return token
 
     def IsExpired(self, fuzz=0):
-        test_time = (self.AuthExpirationTime() +
+        test_time = (self.AuthExpirationTime +
                     datetime.timedelta(seconds=fuzz))
         return (test_time >= datetime.datetime.utcnow())
 
-    def AuthExpirationTime(self):
+    def _AuthExpirationTime(self):
         return self.__token_data['expires']
 
     def _AuthToken(self):
@@ -241,6 +286,9 @@ class FakeAuthenticator(deuceclient.auth.base.AuthenticationBase):
         else:
             return self.__token_data['token']
 
+    def _CurrentToken(self):
+        return self.__token_data['token']
+
     def _AuthTenantId(self):
         return self.__tenantid
 
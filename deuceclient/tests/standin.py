@@ -0,0 +1,195 @@
+"""
+Tests - Deuce Client - Stand-in Deuce Service
+
+- Serves the part of the Deuce API used by the tests that need a real HTTP
+server, such as those sharing a client between threads
+"""
+import http.server
+import json
+import socketserver
+import threading
+import uuid
+
+import msgpack
+
+
+class StandInDeuceHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the requests from the state of the stand-in service
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        data = b'' if body is None else body
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def reply_json(self, data):
+        self.reply(200, json.dumps(data).encode(),
+                   {'Content-Type': 'application/json'})
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def route(self):
+        with self.server.lock:
+            self.server.state['requests'].append((self.command, self.path))
+
+        parts = self.path.split('?')[0].strip('/').split('/')[1:]
+        if parts == ['vaults']:
+            return self.command, None, None, None, None
+        vault_id = parts[1]
+        resource = parts[2] if len(parts) > 2 else None
+        resource_id = parts[3] if len(parts) > 3 else None
+        sub_resource = parts[4] if len(parts) > 4 else None
+        return self.command, vault_id, resource, resource_id, sub_resource
+
+    def do_request(self):
+        state = self.server.state
+        method, vault_id, resource, resource_id, sub_resource = self.route()
+
+        if vault_id is None:
+            return self.reply_json({name: {} for name in state['vaults']})
+
+        if method == 'PUT' and resource is None:
+            self.server.add_vault(vault_id)
+            return self.reply(201)
+
+        vault = state['vaults'].get(vault_id)
+        if vault is None:
+            return self.reply(404, b'no such vault')
+
+        if resource is None:
+            return self.reply(204)
+
+        if resource == 'blocks':
+            return self.blocks_request(vault, method, resource_id)
+
+        return self.files_request(vault, method, resource_id, sub_resource)
+
+    def blocks_request(self, vault, method, block_id):
+        if method == 'POST':
+            blocks = msgpack.unpackb(self.read_body(), raw=False)
+            if self.server.failing_blocks.intersection(blocks):
+                return self.reply(500, b'mock failure')
+            with self.server.lock:
+                for block_id, data in blocks.items():
+                    self.server.uploads[block_id] = \
+                        self.server.uploads.get(block_id, 0) + 1
+                    vault['blocks'][block_id] = data
+            return self.reply(201)
+
+        if block_id is None:
+            return self.reply_json(sorted(vault['blocks']))
+
+        if block_id not in vault['blocks']:
+            return self.reply(404, b'no such block')
+
+        if method == 'HEAD':
+            with self.server.lock:
+                references = sum(1 for file_blocks in vault['files'].values()
+                                 for assigned, offset in file_blocks
+                                 if assigned == block_id)
+            return self.reply(204, headers={
+                'X-Block-Size': str(len(vault['blocks'][block_id])),
+                'X-Block-Reference-Count': str(references),
+                'X-Ref-Modified': '0',
+                'X-Storage-ID': '{0}_{1}'.format(
+                    block_id, uuid.uuid5(uuid.NAMESPACE_OID, block_id))})
+
+        return self.reply(200, vault['blocks'][block_id])
+
+    def files_request(self, vault, method, file_id, sub_resource):
+        if method == 'POST' and file_id is None:
+            file_id = str(uuid.uuid4())
+            with self.server.lock:
+                vault['files'][file_id] = []
+            return self.reply(201, headers={
+                'location': 'http://{0}{1}/{2}'.format(
+                    self.server.apihost, self.path.split('?')[0], file_id),
+                'x-file-id': file_id})
+
+        if file_id is None:
+            return self.reply_json(sorted(vault['files']))
+
+        if file_id not in vault['files']:
+            return self.reply(404, b'no such file')
+        file_blocks = vault['files'][file_id]
+
+        if method == 'DELETE':
+            with self.server.lock:
+                del vault['files'][file_id]
+            return self.reply(204)
+
+        if method == 'POST' and sub_resource is None:
+            with self.server.lock:
+                vault['finalized'][file_id] = \
+                    int(self.headers['X-File-Length'])
+            return self.reply(204)
+
+        if method == 'POST':
+            assignment = json.loads(self.read_body().decode())
+            with self.server.lock:
+                file_blocks.extend((block_id, int(offset))
+                                   for block_id, offset in assignment)
+                missing = sorted({block_id for block_id, offset in assignment
+                                  if block_id not in vault['blocks']})
+            return self.reply_json(missing)
+
+        if sub_resource == 'blocks':
+            return self.reply_json(file_blocks)
+
+        return self.reply(200, b''.join(vault['blocks'][block_id]
+                                        for block_id, offset in
+                                        sorted(file_blocks,
+                                               key=lambda block: block[1])))
+
+    do_GET = do_HEAD = do_PUT = do_POST = do_DELETE = do_request
+
+
+class StandInDeuce(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Stand-in Deuce service running in a thread
+
+    The state holds the vaults, each with its blocks as a dict of the block
+    data by block id and its files as a dict of the list of the
+    (block id, offset) assigned to the file by file id, and the length of
+    the finalized files by file id.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        http.server.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                        StandInDeuceHandler)
+        self.lock = threading.Lock()
+        self.state = {'vaults': {}, 'requests': []}
+        self.uploads = {}
+        self.failing_blocks = set()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+
+    @property
+    def apihost(self):
+        return '{0}:{1}'.format(*self.server_address)
+
+    def add_vault(self, vault_id):
+        with self.lock:
+            return self.state['vaults'].setdefault(vault_id,
+                                                   {'blocks': {},
+                                                    'files': {},
+                                                    'finalized': {}})
+
+    def requests_made(self, method):
+        return [path for request_method, path in self.state['requests']
+                if request_method == method]
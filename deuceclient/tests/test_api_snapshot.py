@@ -0,0 +1,237 @@
+"""
+Tests - Deuce Client - API - Vault Snapshot
+"""
+import os
+import shutil
+import tempfile
+
+import deuceclient.api as api
+import deuceclient.api.snapshot as snapshot
+import deuceclient.common.errors as errors
+from deuceclient.tests import *
+
+
+class VaultSnapshotTest(VaultTestBase):
+
+    def setUp(self):
+        super(VaultSnapshotTest, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.snapshot_file = os.path.join(self.temp_dir, 'vault.snapshot')
+
+        self.vault = api.Vault(self.project_id, self.vault_id)
+        self.block_info = create_blocks(block_count=20)
+        for block_id, block_data, block_size in self.block_info:
+            self.vault.blocks[block_id] = api.Block(
+                self.project_id, self.vault_id,
+                block_id=block_id,
+                storage_id=create_storage_block(block_id),
+                block_size=block_size,
+                ref_count=1,
+                ref_modified=12345)
+
+        self.storage_ids = []
+        for block_id, block_data, block_size in self.block_info[:5]:
+            storage_id = create_storage_block(block_id)
+            self.storage_ids.append(storage_id)
+            self.vault.storageblocks[storage_id] = api.Block(
+                self.project_id, self.vault_id,
+                block_id=block_id,
+                storage_id=storage_id,
+                block_type='storage',
+                block_size=block_size,
+                block_orphaned=True)
+
+        orphan_id = create_storage_block()
+        self.storage_ids.append(orphan_id)
+        self.vault.storageblocks[orphan_id] = api.Block(
+            self.project_id, self.vault_id,
+            storage_id=orphan_id,
+            block_type='storage')
+
+        self.file_id = create_file()
+        self.vault.add_file(self.file_id)
+        self.file_offsets = []
+        offset = 0
+        for block_id, block_data, block_size in self.block_info:
+            self.vault.files[self.file_id].assign_block(block_id, offset)
+            self.file_offsets.append((offset, block_id))
+            offset = offset + block_size
+        self.file_length = offset
+
+        self.empty_file_id = create_file()
+        self.vault.add_file(self.empty_file_id)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        super(VaultSnapshotTest, self).tearDown()
+
+    def test_create_and_open(self):
+        size = api.VaultSnapshot.create(self.vault, self.snapshot_file)
+        self.assertEqual(size, os.path.getsize(self.snapshot_file))
+        self.assertEqual(size % 8, 0)
+
+        with api.VaultSnapshot(self.snapshot_file) as vault_snapshot:
+            self.assertEqual(vault_snapshot.project_id, self.project_id)
+            self.assertEqual(vault_snapshot.vault_id, self.vault_id)
+            self.assertEqual(vault_snapshot.block_count, 20)
+            self.assertEqual(vault_snapshot.storage_block_count, 6)
+            self.assertEqual(vault_snapshot.file_count, 2)
+
+    def test_empty_vault(self):
+        vault = api.Vault(self.project_id, self.vault_id)
+        api.VaultSnapshot.create(vault, self.snapshot_file)
+
+        with api.VaultSnapshot(self.snapshot_file) as vault_snapshot:
+            self.assertEqual(vault_snapshot.block_count, 0)
+            self.assertEqual(vault_snapshot.storage_block_count, 0)
+            self.assertEqual(vault_snapshot.file_count, 0)
+            self.assertFalse(vault_snapshot.has_block(self.block_info[0][0]))
+            self.assertFalse(vault_snapshot.has_file(self.file_id))
+
+    def test_blocks(self):
+        api.VaultSnapshot.create(self.vault, self.snapshot_file)
+
+        with api.VaultSnapshot(self.snapshot_file) as vault_snapshot:
+            for block_id, block_data, block_size in self.block_info:
+                self.assertTrue(vault_snapshot.has_block(block_id))
+                self.check_block_instance(
+                    self.vault.blocks[block_id],
+                    vault_snapshot.get_block(block_id))
+
+            missing_block_id = create_block()[0]
+            self.assertFalse(vault_snapshot.has_block(missing_block_id))
+            with self.assertRaises(KeyError):
+                vault_snapshot.get_block(missing_block_id)
+
+            with self.assertRaises(errors.InvalidBlocks):
+                vault_snapshot.has_block('invalid')
+
+    def test_blocks_unknown_values(self):
+        vault = api.Vault(self.project_id, self.vault_id)
+        block_id, block_data, block_size = create_block()
+        vault.blocks[block_id] = api.Block(self.project_id,
+                                           self.vault_id,
+                                           block_id=block_id)
+        api.VaultSnapshot.create(vault, self.snapshot_file)
+
+        with api.VaultSnapshot(self.snapshot_file) as vault_snapshot:
+            block = vault_snapshot.get_block(block_id)
+            self.assertIsNone(block.storage_id)
+            self.assertIsNone(block.ref_count)
+            self.assertIsNone(block.ref_modified)
+            self.assertEqual(len(block), 0)
+
+    def test_blocks_with_data(self):
+        vault = api.Vault(self.project_id, self.vault_id)
+        block_id, block_data, block_size = create_block()
+        vault.blocks[block_id] = api.Block(self.project_id,
+                                           self.vault_id,
+                                           block_id=block_id,
+                                           data=block_data)
+        api.VaultSnapshot.create(vault, self.snapshot_file)
+
+        with api.VaultSnapshot(self.snapshot_file) as vault_snapshot:
+            block = vault_snapshot.get_block(block_id)
+            self.assertIsNone(block.data)
+            self.assertEqual(len(block), block_size)
+
+    def test_storage_blocks(self):
+        api.VaultSnapshot.create(self.vault, self.snapshot_file)
+
+        with api.VaultSnapshot(self.snapshot_file) as vault_snapshot:
+            for storage_id in self.storage_ids:
+                self.assertTrue(vault_snapshot.has_storage_block(storage_id))
+                self.check_block_instance(
+                    self.vault.storageblocks[storage_id],
+                    vault_snapshot.get_storage_block(storage_id))
+
+            missing_storage_id = create_storage_block()
+            self.assertFalse(
+                vault_snapshot.has_storage_block(missing_storage_id))
+            with self.assertRaises(KeyError):
+                vault_snapshot.get_storage_block(missing_storage_id)
+
+    def test_file_offsets(self):
+        api.VaultSnapshot.create(self.vault, self.snapshot_file)
+
+        with api.VaultSnapshot(self.snapshot_file) as vault_snapshot:
+            self.assertTrue(vault_snapshot.has_file(self.file_id))
+            self.assertFalse(vault_snapshot.has_file(create_file()))
+
+            self.assertEqual(
+                list(vault_snapshot.get_file_offsets(self.file_id)),
+                self.file_offsets)
+            self.assertEqual(
+                list(vault_snapshot.get_file_offsets(self.empty_file_id)),
+                [])
+
+            with self.assertRaises(KeyError):
+                vault_snapshot.get_file_offsets(create_file())
+
+    def test_block_at_offset(self):
+        api.VaultSnapshot.create(self.vault, self.snapshot_file)
+
+        with api.VaultSnapshot(self.snapshot_file) as vault_snapshot:
+            for offset, block_id in self.file_offsets:
+                block_size = len(self.vault.blocks[block_id])
+                self.assertEqual(
+                    vault_snapshot.get_block_at_offset(self.file_id, offset),
+                    (block_id, offset))
+                self.assertEqual(
+                    vault_snapshot.get_block_at_offset(
+                        self.file_id, offset + block_size - 1),
+                    (block_id, offset))
+
+            self.assertIsNone(vault_snapshot.get_block_at_offset(
+                self.file_id, self.file_length))
+            self.assertIsNone(vault_snapshot.get_block_at_offset(
+                self.empty_file_id, 0))
+
+            with self.assertRaises(KeyError):
+                vault_snapshot.get_block_at_offset(create_file(), 0)
+
+    def test_block_at_offset_unknown_block(self):
+        vault = api.Vault(self.project_id, self.vault_id)
+        file_id = create_file()
+        vault.add_file(file_id)
+        block_id = create_block()[0]
+        vault.files[file_id].assign_block(block_id, 100)
+        api.VaultSnapshot.create(vault, self.snapshot_file)
+
+        with api.VaultSnapshot(self.snapshot_file) as vault_snapshot:
+            self.assertIsNone(vault_snapshot.get_block_at_offset(file_id, 99))
+            self.assertEqual(
+                vault_snapshot.get_block_at_offset(file_id, 1000000),
+                (block_id, 100))
+
+    def test_open_invalid(self):
+        with open(self.snapshot_file, 'wb') as output:
+            pass
+        with self.assertRaises(ValueError):
+            api.VaultSnapshot(self.snapshot_file)
+
+        with open(self.snapshot_file, 'wb') as output:
+            output.write(b'DEUCE')
+        with self.assertRaises(ValueError):
+            api.VaultSnapshot(self.snapshot_file)
+
+        with open(self.snapshot_file, 'wb') as output:
+            output.write(bytes(snapshot._HEADER.size))
+        with self.assertRaises(ValueError):
+            api.VaultSnapshot(self.snapshot_file)
+
+    def test_open_truncated(self):
+        size = api.VaultSnapshot.create(self.vault, self.snapshot_file)
+        with open(self.snapshot_file, 'r+b') as output:
+            output.truncate(size - 8)
+
+        with self.assertRaises(ValueError):
+            api.VaultSnapshot(self.snapshot_file)
+
+    def test_column_index(self):
+        column = snapshot._Column(b'abcdef', 0, 2, 3)
+        self.assertEqual(column[2], b'ef')
+        with self.assertRaises(IndexError):
+            column[3]
+        self.assertEqual(column.find(b'cd'), 1)
+        self.assertIsNone(column.find(b'zz'))
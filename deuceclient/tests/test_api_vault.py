@@ -99,3 +99,16 @@ class VaultTest(TestCase):
 
         with self.assertRaises(errors.InvalidFiles):
             vault.add_file(file_id)
+
+    def test_empty_copy(self):
+        vault = api.Vault(self.project_id, self.vault_id)
+        vault.status = 'valid'
+        vault.add_file(create_file())
+
+        vault_copy = vault.empty_copy()
+        self.assertIsNot(vault_copy, vault)
+        self.assertEqual(vault_copy.project_id, self.project_id)
+        self.assertEqual(vault_copy.vault_id, self.vault_id)
+        self.assertEqual(vault_copy.status, 'valid')
+        self.assertEqual(len(vault_copy.files), 0)
+        self.assertEqual(len(vault.files), 1)
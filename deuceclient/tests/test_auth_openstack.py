@@ -2,6 +2,11 @@
 Tests - Deuce Client - Auth - OpenStack Authentication
 """
 import datetime
+import os
+import queue
+import shutil
+import tempfile
+import threading
 import time
 import uuid
 from unittest import TestCase
@@ -12,6 +17,7 @@ import mock
 
 import deuceclient.auth
 import deuceclient.auth.openstackauth as openstackauth
+from deuceclient.auth.tokencache import TokenCache
 import deuceclient.tests.test_auth
 from deuceclient.tests import fastsleep
 
@@ -87,7 +93,9 @@ class FakeAccess(object):
                 self.__class__.raise_counter = self.__class__.raise_counter + 1
 
         if self.__class__.raise_error is True:
-            raise keystoneclient.exceptions.AuthorizationFailure('mocking')
+            # As the Keystone client wraps the errors of the service
+            raise keystoneclient.exceptions.AuthorizationFailure('mocking') \
+                from keystoneclient.exceptions.ServiceUnavailable('mocking')
         else:
             return 'token_{0:}'.format(str(uuid.uuid4()))
 
@@ -176,13 +184,14 @@ class OpenStackAuthTest(TestCase,
 
     def create_authengine(self, userid=None, usertype=None,
                           credentials=None, auth_method=None,
-                          datacenter=None, auth_url=None):
+                          datacenter=None, auth_url=None, token_cache=None):
         return openstackauth.OpenStackAuthentication(userid=userid,
                                                      usertype=usertype,
                                                      credentials=credentials,
                                                      auth_method=auth_method,
                                                      datacenter=datacenter,
-                                                     auth_url=auth_url)
+                                                     auth_url=auth_url,
+                                                     token_cache=token_cache)
 
     def test_parameter_no_authurl(self):
         userid = self.create_userid()
@@ -732,36 +741,268 @@ class OpenStackAuthTest(TestCase,
 
             self.assertEqual(token, authengine.AuthToken)
 
+    def create_authengine_with_token(self):
+        authengine = self.create_authengine(userid=self.create_username(),
+                                            usertype='user_name',
+                                            credentials=self.create_apikey(),
+                                            auth_method='apikey',
+                                            datacenter='test',
+                                            auth_url='http://identity')
+
+        FakeAccess.raise_reset()
+        with mock.patch(
+            'deuceclient.auth.openstackauth.OpenStackAuthentication.get_client'
+        ) as mok_get_client:
+            mok_get_client.return_value = FakeClient()
+            authengine.GetToken()
+
+        return authengine
+
     def test_auth_token_will_expire(self):
-        usertype = 'user_name'
-        username = self.create_username()
+        authengine = self.create_authengine_with_token()
+        self.assertEqual(authengine.refresh_margin,
+                         openstackauth.DEFAULT_REFRESH_MARGIN)
 
-        apikey = self.create_apikey()
-        auth_method = 'apikey'
+        mok_isexpired = 'deuceclient.auth.openstackauth' \
+            '.OpenStackAuthentication.IsExpired'
+        mok_gettoken = 'deuceclient.auth.openstackauth' \
+            '.OpenStackAuthentication.GetToken'
 
-        datacenter = 'test'
-        auth_url = 'http://identity.api.rackspacecloud.com'
+        refreshed = threading.Event()
+        with mock.patch(mok_isexpired) as mock_isexpired,\
+                mock.patch(mok_gettoken) as mock_gettoken:
 
-        authengine = self.create_authengine(userid=username,
-                                            usertype=usertype,
-                                            credentials=apikey,
-                                            auth_method=auth_method,
-                                            datacenter=datacenter,
-                                            auth_url=auth_url)
+            mock_isexpired.side_effect = lambda fuzz=0: fuzz > 0
+            mock_gettoken.side_effect = \
+                lambda margin=None: refreshed.set()
+
+            # The current token is returned while it is renewed
+            self.assertIsNotNone(authengine.AuthToken)
+            self.assertTrue(refreshed.wait(5))
+            mock_isexpired.assert_called_with(
+                fuzz=openstackauth.DEFAULT_REFRESH_MARGIN)
+            mock_gettoken.assert_called_once_with(
+                margin=openstackauth.DEFAULT_REFRESH_MARGIN)
+
+    def test_auth_token_refresh_single_flight(self):
+        authengine = self.create_authengine_with_token()
 
         mok_isexpired = 'deuceclient.auth.openstackauth' \
             '.OpenStackAuthentication.IsExpired'
         mok_gettoken = 'deuceclient.auth.openstackauth' \
             '.OpenStackAuthentication.GetToken'
 
+        release = threading.Event()
         with mock.patch(mok_isexpired) as mock_isexpired,\
                 mock.patch(mok_gettoken) as mock_gettoken:
 
-            mock_isexpired.side_effect = [False, True]
-            token = self.create_token()
-            mock_gettoken.return_value = token
+            mock_isexpired.side_effect = lambda fuzz=0: fuzz > 0
+            mock_gettoken.side_effect = lambda margin=None: release.wait(5)
 
-            self.assertEqual(token, authengine.AuthToken)
+            # A refresh already in flight is not started again
+            self.assertIsNotNone(authengine.AuthToken)
+            self.assertIsNotNone(authengine.AuthToken)
+            release.set()
+            self.assertEqual(mock_gettoken.call_count, 1)
+
+    def test_auth_token_refresh_failure(self):
+        authengine = self.create_authengine_with_token()
+
+        mok_isexpired = 'deuceclient.auth.openstackauth' \
+            '.OpenStackAuthentication.IsExpired'
+        mok_gettoken = 'deuceclient.auth.openstackauth' \
+            '.OpenStackAuthentication.GetToken'
+
+        attempts = queue.Queue()
+
+        def failing_get_token(margin=None):
+            attempts.put(1)
+            raise deuceclient.auth.AuthenticationError('mock')
+
+        with mock.patch(mok_isexpired) as mock_isexpired,\
+                mock.patch(mok_gettoken) as mock_gettoken:
+
+            mock_isexpired.side_effect = lambda fuzz=0: fuzz > 0
+            mock_gettoken.side_effect = failing_get_token
+
+            self.assertIsNotNone(authengine.AuthToken)
+            attempts.get(timeout=5)
+
+            # The next request tries again once the failed one finished
+            for _ in range(500):
+                authengine.AuthToken
+                if mock_gettoken.call_count > 1:
+                    break
+                time.sleep(0.01)
+            self.assertGreater(mock_gettoken.call_count, 1)
+
+    def test_auth_token_refresh_failure_keeps_token(self):
+        authengine, client = self.create_failing_authengine(
+            keystoneclient.exceptions.Unauthorized('mock'))
+        current = openstackauth._CachedAccess({
+            'token': self.create_token(),
+            'expires': datetime.datetime.utcnow() +
+            datetime.timedelta(seconds=120)})
+        authengine._OpenStackAuthentication__access = current
+
+        self.assertEqual(authengine.AuthToken, current.auth_token)
+        for _ in range(5000):
+            if client.get_raw_token_from_identity_service.called and \
+                    not authengine._OpenStackAuthentication__refreshing:
+                break
+            time.sleep(0.01)
+        self.assertTrue(client.get_raw_token_from_identity_service.called)
+
+        # The token is still valid so it is still used, without blocking
+        # on retrieving a new one
+        with mock.patch('deuceclient.auth.openstackauth'
+                        '.OpenStackAuthentication.GetToken') as mock_gettoken:
+            self.assertEqual(authengine.AuthTokenAndExpiration,
+                             (current.auth_token, current.expires))
+            self.assertEqual(authengine.CurrentToken, current.auth_token)
+            self.assertFalse(authengine.IsExpired())
+            for call in mock_gettoken.call_args_list:
+                self.assertEqual(call, mock.call(
+                    margin=openstackauth.DEFAULT_REFRESH_MARGIN))
+
+    def test_auth_token_expired_single_flight(self):
+        authengine = self.create_authengine_with_token()
+
+        mok_isexpired = 'deuceclient.auth.openstackauth' \
+            '.OpenStackAuthentication.IsExpired'
+        mok_gettoken = 'deuceclient.auth.openstackauth' \
+            '.OpenStackAuthentication.GetToken'
+
+        renewed = threading.Event()
+        token = self.create_token()
+
+        def get_token():
+            time.sleep(0.1)
+            renewed.set()
+            return token
+
+        with mock.patch(mok_isexpired) as mock_isexpired,\
+                mock.patch(mok_gettoken) as mock_gettoken:
+
+            mock_isexpired.side_effect = \
+                lambda fuzz=0: not renewed.is_set()
+            mock_gettoken.side_effect = get_token
+
+            threads = [threading.Thread(target=lambda: authengine.AuthToken)
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+
+            # Only one of the waiting threads renewed the token
+            self.assertEqual(mock_gettoken.call_count, 1)
+
+    def test_auth_token_and_expiration(self):
+        authengine = self.create_authengine(userid=self.create_username(),
+                                            usertype='user_name',
+                                            credentials=self.create_apikey(),
+                                            auth_method='apikey',
+                                            datacenter='test',
+                                            auth_url='http://identity')
+        self.assertIsNone(authengine.CurrentToken)
+
+        def make_access(expires_in):
+            return openstackauth._CachedAccess({
+                'token': self.create_token(),
+                'expires': datetime.datetime.utcnow() +
+                datetime.timedelta(seconds=expires_in)})
+
+        current = make_access(3600)
+        authengine._OpenStackAuthentication__access = current
+        self.assertEqual(authengine.CurrentToken, current.auth_token)
+        self.assertEqual(authengine.AuthTokenAndExpiration,
+                         (current.auth_token, current.expires))
+
+        # The token being replaced by a refresh is paired with its own
+        # expiration time
+        current = make_access(200)
+        renewed = make_access(3600)
+        authengine._OpenStackAuthentication__access = current
+
+        def refresh(margin=None):
+            authengine._OpenStackAuthentication__access = renewed
+
+        with mock.patch('deuceclient.auth.openstackauth'
+                        '.OpenStackAuthentication.GetToken') as mock_gettoken:
+            mock_gettoken.side_effect = refresh
+
+            token, expires = authengine.AuthTokenAndExpiration
+            self.assertIn((token, expires),
+                          [(current.auth_token, current.expires),
+                           (renewed.auth_token, renewed.expires)])
+
+            for _ in range(500):
+                if authengine.CurrentToken == renewed.auth_token:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(authengine.AuthTokenAndExpiration,
+                             (renewed.auth_token, renewed.expires))
+            self.assertEqual(authengine.refresh_margin,
+                             openstackauth.DEFAULT_REFRESH_MARGIN)
+
+    def test_auth_token_refresh_token_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        token_cache = TokenCache(os.path.join(temp_dir, 'tokens.json'))
+
+        # Expiring within the refresh margin but not the cache margin
+        lifetimes = iter([200, 3600])
+
+        def get_raw_token(**kwargs):
+            return openstackauth._CachedAccess({
+                'token': self.create_token(),
+                'expires': datetime.datetime.utcnow() +
+                datetime.timedelta(seconds=next(lifetimes)),
+                'tenant_id': None,
+                'tenant_name': None,
+                'user_id': None,
+                'username': None})
+
+        client = mock.Mock()
+        client.get_raw_token_from_identity_service.side_effect = \
+            get_raw_token
+
+        with mock.patch(
+            'deuceclient.auth.openstackauth.OpenStackAuthentication.get_client'
+        ) as mok_get_client:
+            mok_get_client.return_value = client
+
+            authengine = self.create_authengine(
+                userid=self.create_username(),
+                usertype='user_name',
+                credentials=self.create_apikey(),
+                auth_method='apikey',
+                datacenter='test',
+                auth_url='http://identity',
+                token_cache=token_cache)
+            token = authengine.AuthToken
+
+            with mock.patch('threading.Thread',
+                            wraps=threading.Thread) as mock_thread:
+                for _ in range(500):
+                    new_token = authengine.AuthToken
+                    if new_token != token:
+                        break
+                    time.sleep(0.01)
+
+                # The cached token is replaced by a single refresh
+                self.assertNotEqual(new_token, token)
+                self.assertEqual(mock_thread.call_count, 1)
+                self.assertEqual(
+                    client.get_raw_token_from_identity_service.call_count, 2)
+                self.assertEqual(token_cache.get(
+                    authengine.token_cache_key)['token'], new_token)
+
+                # and is not renewed again
+                for _ in range(10):
+                    self.assertEqual(authengine.AuthToken, new_token)
+                self.assertEqual(mock_thread.call_count, 1)
 
     def test_auth_token_cached(self):
         usertype = 'user_name'
@@ -991,3 +1232,269 @@ class OpenStackAuthTest(TestCase,
             FakeAccess.user_data['tenant']['name'] = None
             FakeAccess.user_data['user']['id'] = None
             FakeAccess.user_data['user']['name'] = None
+
+    def test_token_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        token_cache = TokenCache(os.path.join(temp_dir, 'tokens.json'))
+
+        FakeAccess.raise_reset()
+        FakeAccess.expire_time = datetime.datetime.utcnow() + \
+            datetime.timedelta(hours=1)
+        FakeAccess.user_data['tenant']['id'] = 'tenant_id'
+        self.addCleanup(setattr, FakeAccess, 'expire_time', None)
+        self.addCleanup(FakeAccess.user_data['tenant'].__setitem__,
+                        'id', None)
+
+        def make_authengine(userid):
+            return self.create_authengine(userid=userid,
+                                          usertype='user_name',
+                                          credentials=self.create_apikey(),
+                                          auth_method='apikey',
+                                          datacenter='test',
+                                          auth_url='http://identity',
+                                          token_cache=token_cache)
+
+        username = self.create_username()
+        with mock.patch(
+            'deuceclient.auth.openstackauth.OpenStackAuthentication.get_client'
+        ) as mok_get_client:
+            mok_get_client.return_value = FakeClient()
+
+            first = make_authengine(username)
+            self.assertIs(first.token_cache, token_cache)
+            token = first.AuthToken
+            self.assertEqual(mok_get_client.call_count, 1)
+
+            # Another process for the same user shares the token
+            second = make_authengine(username)
+            self.assertEqual(second.AuthToken, token)
+            self.assertEqual(mok_get_client.call_count, 1)
+            self.assertEqual(second.AuthTenantId, 'tenant_id')
+            self.assertIsNone(second.AuthTenantName)
+            self.assertIsNone(second.AuthUserId)
+            self.assertIsNone(second.AuthUserName)
+            self.assertEqual(second.AuthExpirationTime,
+                             FakeAccess.expire_time)
+            self.assertFalse(second.IsExpired())
+            self.assertTrue(second.IsExpired(fuzz=7200))
+
+            # Other users do not
+            other = make_authengine(self.create_username())
+            self.assertNotEqual(other.AuthToken, token)
+            self.assertEqual(mok_get_client.call_count, 2)
+
+    def test_token_cache_key(self):
+        tenant_engine = self.create_authengine(
+            userid='same',
+            usertype='tenant_id',
+            credentials=self.create_token(),
+            auth_method='token',
+            datacenter='test',
+            auth_url='http://identity')
+        user_engine = self.create_authengine(
+            userid='same',
+            usertype='user_id',
+            credentials=self.create_apikey(),
+            auth_method='apikey',
+            datacenter='test',
+            auth_url='http://identity')
+
+        self.assertNotEqual(tenant_engine.token_cache_key,
+                            user_engine.token_cache_key)
+        self.assertIsNone(user_engine.token_cache)
+
+    def test_reset_token(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        token_cache = TokenCache(os.path.join(temp_dir, 'tokens.json'))
+
+        FakeAccess.raise_reset()
+        FakeAccess.expire_time = datetime.datetime.utcnow() + \
+            datetime.timedelta(hours=1)
+        self.addCleanup(setattr, FakeAccess, 'expire_time', None)
+
+        with mock.patch(
+            'deuceclient.auth.openstackauth.OpenStackAuthentication.get_client'
+        ) as mok_get_client:
+            mok_get_client.return_value = FakeClient()
+
+            authengine = self.create_authengine(
+                userid=self.create_username(),
+                usertype='user_name',
+                credentials=self.create_apikey(),
+                auth_method='apikey',
+                datacenter='test',
+                auth_url='http://identity',
+                token_cache=token_cache)
+
+            # Nothing to drop from the cache yet
+            token = authengine.ResetToken()
+            self.assertEqual(authengine.AuthToken, token)
+
+            # The rejected token is not handed out from the cache again
+            new_token = authengine.ResetToken()
+            self.assertNotEqual(new_token, token)
+            self.assertEqual(token_cache.get(
+                authengine.token_cache_key)['token'], new_token)
+
+            # Without a cache a new token is retrieved as well
+            uncached = self.create_authengine(
+                userid=self.create_username(),
+                usertype='user_name',
+                credentials=self.create_apikey(),
+                auth_method='apikey',
+                datacenter='test',
+                auth_url='http://identity')
+            self.assertIsNotNone(uncached.ResetToken())
+
+    def create_failing_authengine(self, errors):
+        client = mock.Mock()
+        client.get_raw_token_from_identity_service.side_effect = errors
+
+        authengine = self.create_authengine(userid=self.create_username(),
+                                            usertype='user_name',
+                                            credentials=self.create_apikey(),
+                                            auth_method='apikey',
+                                            datacenter='test',
+                                            auth_url='http://identity')
+        patcher = mock.patch(
+            'deuceclient.auth.openstackauth.OpenStackAuthentication'
+            '.get_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return (authengine, client)
+
+    def test_get_token_backoff(self):
+        transient = keystoneclient.exceptions.ServiceUnavailable('mock')
+        access = FakeAccess()
+        FakeAccess.raise_reset()
+        authengine, client = self.create_failing_authengine(
+            [transient, transient, transient, access])
+
+        with mock.patch('deuceclient.auth.openstackauth.time.sleep') \
+                as mock_sleep, \
+                mock.patch('deuceclient.auth.openstackauth.random.uniform',
+                           side_effect=lambda low, high: high):
+            self.assertIsNotNone(authengine.GetToken(retry=5))
+
+        self.assertEqual(client.get_raw_token_from_identity_service
+                         .call_count, 4)
+        delays = [args[0] for args, kwargs in mock_sleep.call_args_list]
+        self.assertEqual(delays, [openstackauth.RETRY_BASE_DELAY,
+                                  openstackauth.RETRY_BASE_DELAY * 2,
+                                  openstackauth.RETRY_BASE_DELAY * 4])
+
+    def test_get_token_backoff_capped(self):
+        transient = keystoneclient.exceptions.ServiceUnavailable('mock')
+        authengine, client = self.create_failing_authengine(
+            [transient] * 10)
+
+        with mock.patch('deuceclient.auth.openstackauth.time.sleep') \
+                as mock_sleep, \
+                mock.patch('deuceclient.auth.openstackauth.RETRY_DEADLINE',
+                           1000), \
+                mock.patch('deuceclient.auth.openstackauth.random.uniform',
+                           side_effect=lambda low, high: high):
+            with self.assertRaises(deuceclient.auth.AuthenticationError):
+                authengine.GetToken(retry=9)
+
+        delays = [args[0] for args, kwargs in mock_sleep.call_args_list]
+        self.assertEqual(len(delays), 9)
+        self.assertEqual(max(delays), openstackauth.RETRY_MAX_DELAY)
+        self.assertIsNone(authengine._OpenStackAuthentication__access)
+
+    def test_get_token_deadline(self):
+        transient = keystoneclient.exceptions.ServiceUnavailable('mock')
+        authengine, client = self.create_failing_authengine(
+            [transient] * 10)
+
+        with mock.patch('deuceclient.auth.openstackauth.time.sleep') \
+                as mock_sleep, \
+                mock.patch('deuceclient.auth.openstackauth.RETRY_DEADLINE',
+                           0.75), \
+                mock.patch('deuceclient.auth.openstackauth.random.uniform',
+                           side_effect=lambda low, high: high):
+            with self.assertRaises(deuceclient.auth.AuthenticationError):
+                authengine.GetToken(retry=9)
+
+        # a 0.5 second delay fits in the deadline, a 1 second one does not
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertEqual(client.get_raw_token_from_identity_service
+                         .call_count, 2)
+
+    def test_get_token_client_error_not_retried(self):
+        for error in (keystoneclient.exceptions.BadRequest('mock'),
+                      keystoneclient.exceptions.NotFound('mock'),
+                      keystoneclient.exceptions.AuthorizationFailure('mock')):
+            authengine, client = self.create_failing_authengine([error])
+
+            with mock.patch('deuceclient.auth.openstackauth.time.sleep') \
+                    as mock_sleep:
+                with self.assertRaises(deuceclient.auth.AuthenticationError):
+                    authengine.GetToken(retry=5)
+
+            self.assertEqual(client.get_raw_token_from_identity_service
+                             .call_count, 1)
+            self.assertFalse(mock_sleep.called)
+
+    def test_get_token_programming_error_not_retried(self):
+        authengine, client = self.create_failing_authengine(
+            [TypeError('mock')])
+
+        with mock.patch('deuceclient.auth.openstackauth.time.sleep') \
+                as mock_sleep:
+            with self.assertRaises(TypeError):
+                authengine.GetToken(retry=5)
+
+        self.assertEqual(client.get_raw_token_from_identity_service
+                         .call_count, 1)
+        self.assertFalse(mock_sleep.called)
+
+    def test_get_token_transient_errors_retried(self):
+        def wrapped(error):
+            # As the Keystone client wraps the errors of the service
+            try:
+                raise error
+            except Exception:
+                try:
+                    raise keystoneclient.exceptions.AuthorizationFailure(
+                        'mock')
+                except Exception as failure:
+                    return failure
+
+        transient = [
+            keystoneclient.exceptions.ConnectionRefused('mock'),
+            keystoneclient.exceptions.RequestTimeout('mock'),
+            keystoneclient.exceptions.InternalServerError('mock'),
+            keystoneclient.exceptions.HttpError('mock', http_status=429),
+            ConnectionResetError('mock'),
+            wrapped(keystoneclient.exceptions.ConnectionRefused('mock')),
+            wrapped(keystoneclient.exceptions.ServiceUnavailable('mock'))]
+        FakeAccess.raise_reset()
+        authengine, client = self.create_failing_authengine(
+            transient + [FakeAccess()])
+
+        with mock.patch('deuceclient.auth.openstackauth.time.sleep') \
+                as mock_sleep, \
+                mock.patch('deuceclient.auth.openstackauth.RETRY_DEADLINE',
+                           1000):
+            self.assertIsNotNone(authengine.GetToken(retry=len(transient)))
+
+        self.assertEqual(client.get_raw_token_from_identity_service
+                         .call_count, len(transient) + 1)
+        self.assertEqual(mock_sleep.call_count, len(transient))
+
+    def test_get_token_invalid_credentials(self):
+        for error in (keystoneclient.exceptions.Unauthorized('mock'),
+                      keystoneclient.exceptions.Forbidden('mock')):
+            authengine, client = self.create_failing_authengine([error])
+
+            with mock.patch('deuceclient.auth.openstackauth.time.sleep') \
+                    as mock_sleep:
+                with self.assertRaises(deuceclient.auth.AuthCredentialsErrors):
+                    authengine.GetToken(retry=5)
+
+            self.assertEqual(client.get_raw_token_from_identity_service
+                             .call_count, 1)
+            self.assertFalse(mock_sleep.called)
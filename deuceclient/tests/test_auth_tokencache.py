@@ -0,0 +1,196 @@
+"""
+Tests - Deuce Client - Auth - Token Cache
+"""
+import datetime
+import os
+import shutil
+import stat
+import tempfile
+import threading
+from unittest import TestCase
+
+import mock
+
+from deuceclient.auth import tokencache
+
+
+class TokenCacheTest(TestCase):
+
+    def setUp(self):
+        super(TokenCacheTest, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.temp_dir, 'cache', 'tokens.json')
+        self.cache = tokencache.TokenCache(self.cache_file)
+        self.key = tokencache.TokenCache.make_key('https://identity',
+                                                  'user_name:bob', None)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        super(TokenCacheTest, self).tearDown()
+
+    def make_entry(self, expires_in=3600):
+        return {
+            'token': 'token_{0}'.format(expires_in),
+            'expires': (datetime.datetime.utcnow() +
+                        datetime.timedelta(seconds=expires_in)),
+            'tenant_id': 'tenant'
+        }
+
+    def test_default_path(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.temp_dir}):
+            self.assertEqual(tokencache.TokenCache().path,
+                             os.path.join(self.temp_dir, 'deuceclient',
+                                          'tokens.json'))
+
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertTrue(tokencache.default_cache_path().endswith(
+                os.path.join('.cache', 'deuceclient', 'tokens.json')))
+
+    def test_make_key(self):
+        self.assertNotEqual(
+            tokencache.TokenCache.make_key('a', 'b', None),
+            tokencache.TokenCache.make_key('a', None, 'b'))
+
+    def test_get_missing(self):
+        self.assertEqual(self.cache.margin,
+                         tokencache.DEFAULT_EXPIRATION_MARGIN)
+        self.assertIsNone(self.cache.get(self.key))
+
+    def test_put_get(self):
+        entry = self.make_entry()
+        self.cache.put(self.key, entry)
+
+        cached = self.cache.get(self.key)
+        self.assertEqual(cached, entry)
+
+        # Shared with other instances (processes) using the same file
+        other = tokencache.TokenCache(self.cache_file)
+        self.assertEqual(other.get(self.key), entry)
+
+        mode = stat.S_IMODE(os.stat(self.cache_file).st_mode)
+        self.assertEqual(mode, 0o600)
+
+    def test_timezone_aware_expiration(self):
+        entry = self.make_entry()
+        aware = dict(entry)
+        aware['expires'] = entry['expires'].replace(
+            tzinfo=datetime.timezone.utc).astimezone(
+            datetime.timezone(datetime.timedelta(hours=-5)))
+
+        self.cache.put(self.key, aware)
+        self.assertEqual(self.cache.get(self.key), entry)
+
+    def test_expiring(self):
+        self.cache.put(self.key, self.make_entry(expires_in=30))
+        self.assertIsNone(self.cache.get(self.key))
+
+        no_margin = tokencache.TokenCache(self.cache_file, margin=0)
+        self.assertIsNotNone(no_margin.get(self.key))
+
+    def test_prune_expired(self):
+        other_key = tokencache.TokenCache.make_key('https://identity',
+                                                   'user_name:alice', None)
+        self.cache.put(other_key, self.make_entry(expires_in=-10))
+        self.cache.put(self.key, self.make_entry())
+
+        with open(self.cache_file, 'r') as cache:
+            self.assertNotIn('alice', cache.read())
+
+    def test_corrupted(self):
+        os.makedirs(os.path.dirname(self.cache_file))
+
+        with open(self.cache_file, 'w') as cache:
+            cache.write('{not json')
+        self.assertIsNone(self.cache.get(self.key))
+
+        with open(self.cache_file, 'w') as cache:
+            cache.write('[]')
+        self.assertIsNone(self.cache.get(self.key))
+
+        with open(self.cache_file, 'w') as cache:
+            cache.write('{{"{0}": {{"token": "t"}}}}'.format(
+                self.key.replace('"', '\\"')))
+        self.assertIsNone(self.cache.get(self.key))
+
+        self.cache.put(self.key, self.make_entry())
+        self.assertIsNotNone(self.cache.get(self.key))
+
+    def test_remove(self):
+        self.cache.remove(self.key)
+
+        self.cache.put(self.key, self.make_entry())
+        self.cache.remove(self.key)
+        self.assertIsNone(self.cache.get(self.key))
+
+    def test_remove_token(self):
+        entry = self.make_entry()
+        self.cache.put(self.key, entry)
+
+        # Another process already replaced the rejected token
+        self.cache.remove(self.key, token='rejected')
+        self.assertEqual(self.cache.get(self.key), entry)
+
+        self.cache.remove(self.key, token=entry['token'])
+        self.assertIsNone(self.cache.get(self.key))
+
+    def test_fetch(self):
+        entry = self.make_entry()
+        get_entry = mock.Mock(return_value=entry)
+
+        self.assertEqual(self.cache.fetch(self.key, get_entry), entry)
+        self.assertEqual(self.cache.fetch(self.key, get_entry), entry)
+        self.assertEqual(get_entry.call_count, 1)
+
+    def test_fetch_margin(self):
+        expiring = self.make_entry(expires_in=200)
+        self.cache.put(self.key, expiring)
+        renewed = self.make_entry()
+        get_entry = mock.Mock(return_value=renewed)
+
+        # Still valid for the cache margin
+        self.assertEqual(self.cache.fetch(self.key, get_entry), expiring)
+        self.assertEqual(get_entry.call_count, 0)
+
+        # Replaced when expiring within the requested margin
+        self.assertEqual(self.cache.fetch(self.key, get_entry, margin=300),
+                         renewed)
+        self.assertEqual(self.cache.fetch(self.key, get_entry, margin=300),
+                         renewed)
+        self.assertEqual(get_entry.call_count, 1)
+
+        # A smaller margin than the cache's does not lower it
+        self.cache.put(self.key, self.make_entry(expires_in=30))
+        self.assertEqual(self.cache.fetch(self.key, get_entry, margin=10),
+                         renewed)
+        self.assertEqual(get_entry.call_count, 2)
+
+    def test_fetch_single_flight(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def get_entry():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return self.make_entry()
+
+        results = []
+
+        def fetch():
+            results.append(self.cache.fetch(self.key, get_entry))
+
+        first = threading.Thread(target=fetch)
+        first.start()
+        self.assertTrue(started.wait(5))
+
+        # Waits on the lock held while the first token is requested
+        second = threading.Thread(target=fetch)
+        second.start()
+        release.set()
+
+        first.join(5)
+        second.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0], results[1])
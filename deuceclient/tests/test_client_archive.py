@@ -0,0 +1,278 @@
+"""
+Tests - Deuce Client - Client - Vault Archives
+"""
+import io
+import json
+import os
+import random
+import struct
+
+import mock
+import requests
+
+import deuceclient.api as api
+import deuceclient.client.archive as archive
+import deuceclient.client.deuce
+from deuceclient.tests import *
+from deuceclient.tests.standin import StandInDeuce
+
+
+class ClientArchiveTests(ClientTestBase):
+
+    def setUp(self):
+        super(ClientArchiveTests, self).setUp()
+        self.deuce = StandInDeuce().__enter__()
+        self.session = requests.Session()
+        self.client = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.deuce.apihost, session=self.session)
+        self.stored = self.deuce.add_vault(self.vault.vault_id)
+
+        self.target = api.Vault(project_id=self.vault.project_id,
+                                vault_id=create_vault_name())
+        self.target.status = 'valid'
+        self.target_stored = self.deuce.add_vault(self.target.vault_id)
+
+        # Files sharing some of their blocks, one of them empty
+        self.blocks = [os.urandom(random.randrange(1, 300))
+                       for _ in range(20)]
+        self.contents = {}
+        for file_blocks in (self.blocks[:8], self.blocks[4:16],
+                            self.blocks[10:] + self.blocks[:2], []):
+            file_id = self.store_file(self.stored, file_blocks)
+            self.contents[file_id] = b''.join(file_blocks)
+
+    def tearDown(self):
+        self.session.close()
+        self.deuce.__exit__(None, None, None)
+        super(ClientArchiveTests, self).tearDown()
+
+    def store_file(self, stored, blocks):
+        file_id = create_file()
+        stored['files'][file_id] = []
+        offset = 0
+        for block in blocks:
+            block_id = get_block_id(block)
+            stored['blocks'][block_id] = block
+            stored['files'][file_id].append((block_id, offset))
+            offset = offset + len(block)
+        return file_id
+
+    def export(self, **kwargs):
+        output = io.BytesIO()
+        exporter = archive.VaultExporter(self.client, self.vault, **kwargs)
+        self.assertEqual(exporter.export(output), len(self.contents))
+        output.seek(0)
+        return exporter, output
+
+    def content(self, stored, file_id):
+        return b''.join(stored['blocks'][block_id] for block_id, offset in
+                        sorted(stored['files'][file_id],
+                               key=lambda block: block[1]))
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            archive.VaultExporter(self.client, self.vault, concurrency=0)
+        with self.assertRaises(ValueError):
+            archive.VaultImporter(self.client, self.target, concurrency=0)
+        with self.assertRaises(ValueError):
+            archive.VaultImporter(self.client, self.target,
+                                  upload_batch_size=0)
+        with self.assertRaises(ValueError):
+            archive.VaultImporter(self.client, self.target,
+                                  blocks_per_assignment=0)
+
+    def test_export(self):
+        exporter, output = self.export(concurrency=4)
+        self.assertEqual(exporter.files_exported, 4)
+        self.assertEqual(exporter.blocks_exported, 20)
+        self.assertEqual(exporter.bytes_exported,
+                         len(b''.join(self.blocks)))
+
+        manifest = archive.read_manifest(output)
+        self.assertEqual(manifest['vault_id'], self.vault.vault_id)
+        self.assertEqual(manifest['blocks'], 20)
+        self.assertEqual({file_id: [tuple(block) for block in blocks]
+                          for file_id, blocks in manifest['files'].items()},
+                         self.stored['files'])
+
+        # Each block is downloaded and written once
+        blocks = dict(archive.read_blocks(output))
+        self.assertEqual(blocks, self.stored['blocks'])
+        self.assertEqual(output.read(), b'')
+        self.assertEqual(len([path for path in self.deuce.requests_made('GET')
+                              if '/blocks/' in path]), 20)
+
+    def test_import(self):
+        exporter, output = self.export()
+        importer = archive.VaultImporter(self.client, self.target,
+                                         concurrency=4, upload_batch_size=500,
+                                         blocks_per_assignment=3)
+        files = importer.import_archive(output)
+
+        self.assertEqual(sorted(files), sorted(self.contents))
+        for archived_file_id, file_id in files.items():
+            self.assertEqual(self.content(self.target_stored, file_id),
+                             self.contents[archived_file_id])
+            self.assertEqual(self.target_stored['finalized'][file_id],
+                             len(self.contents[archived_file_id]))
+        self.assertEqual(importer.files_imported, 4)
+        self.assertEqual(importer.blocks_uploaded, 20)
+        self.assertEqual(importer.blocks_skipped, 0)
+        self.assertEqual(importer.bytes_uploaded, len(b''.join(self.blocks)))
+        self.assertGreater(len(self.deuce.requests_made('POST')), 4 + 4 + 1)
+
+    def test_import_skips_stored_blocks(self):
+        for block in self.blocks[:5]:
+            self.target_stored['blocks'][get_block_id(block)] = block
+
+        exporter, output = self.export()
+        importer = archive.VaultImporter(self.client, self.target)
+        files = importer.import_archive(output)
+        for archived_file_id, file_id in files.items():
+            self.assertEqual(self.content(self.target_stored, file_id),
+                             self.contents[archived_file_id])
+        self.assertEqual(importer.blocks_uploaded, 15)
+        self.assertEqual(importer.blocks_skipped, 5)
+        self.assertEqual(set(self.deuce.uploads),
+                         {get_block_id(block) for block in self.blocks[5:]})
+
+    def test_import_into_same_vault(self):
+        exporter, output = self.export()
+        importer = archive.VaultImporter(self.client, self.vault)
+        files = importer.import_archive(output)
+        self.assertEqual(importer.blocks_uploaded, 0)
+        self.assertEqual(importer.blocks_skipped, 20)
+        for archived_file_id, file_id in files.items():
+            self.assertNotEqual(file_id, archived_file_id)
+            self.assertEqual(self.content(self.stored, file_id),
+                             self.contents[archived_file_id])
+
+    def test_empty_vault(self):
+        output = io.BytesIO()
+        exporter = archive.VaultExporter(self.client, self.target)
+        self.assertEqual(exporter.export(output), 0)
+        output.seek(0)
+
+        importer = archive.VaultImporter(self.client, self.vault)
+        self.assertEqual(importer.import_archive(output), {})
+
+    def test_invalid_archive(self):
+        exporter, output = self.export()
+        data = output.getvalue()
+        importer = archive.VaultImporter(self.client, self.target)
+
+        header_size = struct.calcsize('<8sIQ')
+        manifest_size = struct.unpack('<Q', data[12:header_size])[0]
+        for invalid in (b'',
+                        b'NOTVAULT' + data[8:],
+                        data[:8] + struct.pack('<I', 99) + data[12:],
+                        data[:header_size - 8] + struct.pack('<Q', 2) +
+                        b'[]',
+                        data[:header_size - 8] + struct.pack('<Q', 2) +
+                        b'{}',
+                        data[:header_size + manifest_size + 30],
+                        data[:-20]):
+            with self.assertRaises(ValueError):
+                importer.import_archive(io.BytesIO(invalid))
+
+    def test_corrupted_block(self):
+        exporter, output = self.export()
+        data = bytearray(output.getvalue())
+        data[-21] = data[-21] ^ 0xff
+        importer = archive.VaultImporter(self.client, self.target)
+        with self.assertRaises(ValueError) as failure:
+            importer.import_archive(io.BytesIO(bytes(data)))
+        self.assertIn('does not match', str(failure.exception))
+        self.assertEqual(self.target_stored['finalized'], {})
+        self.assertEqual(self.target_stored['files'], {})
+
+    def test_truncated_archive(self):
+        exporter, output = self.export()
+        data = output.getvalue()
+        importer = archive.VaultImporter(self.client, self.target,
+                                         concurrency=4, upload_batch_size=500)
+        with self.assertRaises(ValueError):
+            importer.import_archive(io.BytesIO(data[:len(data) // 2]))
+
+        # The files created before the archive ran out are deleted
+        self.assertEqual(self.target_stored['finalized'], {})
+        self.assertEqual(self.target_stored['files'], {})
+        self.assertEqual(len(self.deuce.requests_made('DELETE')),
+                         len(self.contents))
+
+    def test_create_failure(self):
+        exporter, output = self.export()
+        create_file = self.client.CreateFile
+        created = []
+
+        def failing_create_file(vault):
+            if len(created) == 2:
+                raise RuntimeError('mock failure')
+            created.append(create_file(vault))
+            return created[-1]
+
+        importer = archive.VaultImporter(self.client, self.target,
+                                         concurrency=1)
+        with mock.patch.object(self.client, 'CreateFile',
+                               side_effect=failing_create_file), \
+                mock.patch.object(self.client, 'DeleteFile',
+                                  wraps=self.client.DeleteFile) as delete:
+            with self.assertRaises(RuntimeError):
+                importer.import_archive(output)
+            self.assertEqual(sorted(call[0][1] for call in
+                                    delete.call_args_list),
+                             sorted(created))
+        self.assertEqual(self.target_stored['files'], {})
+
+    def test_delete_failure(self):
+        exporter, output = self.export()
+        data = output.getvalue()
+        importer = archive.VaultImporter(self.client, self.target)
+        with mock.patch.object(self.client, 'DeleteFile',
+                               side_effect=RuntimeError('mock failure')):
+            with self.assertRaises(ValueError):
+                importer.import_archive(io.BytesIO(data[:-20]))
+
+    def test_missing_blocks(self):
+        exporter, output = self.export()
+        manifest = archive.read_manifest(output)
+        blocks = list(archive.read_blocks(output))
+
+        def write_archive(blocks):
+            data = json.dumps(manifest).encode()
+            return io.BytesIO(
+                archive.ARCHIVE_MAGIC + struct.pack('<IQ', 1, len(data)) +
+                data + b''.join(bytes.fromhex(block_id) +
+                                struct.pack('<Q', len(block)) + block
+                                for block_id, block in blocks) +
+                b'\x00' * 20)
+
+        # A block the vault is missing
+        importer = archive.VaultImporter(self.client, self.target)
+        with self.assertRaises(RuntimeError):
+            importer.import_archive(write_archive(blocks[1:]))
+        self.assertEqual(self.target_stored['files'], {})
+
+        # A block the vault already has
+        importer = archive.VaultImporter(self.client, self.vault)
+        with self.assertRaises(ValueError):
+            importer.import_archive(write_archive(blocks[1:]))
+        self.assertEqual(self.stored['finalized'], {})
+        self.assertEqual(sorted(self.stored['files']),
+                         sorted(self.contents))
+
+    def test_upload_failure(self):
+        exporter, output = self.export()
+        self.deuce.failing_blocks.add(get_block_id(self.blocks[3]))
+        importer = archive.VaultImporter(self.client, self.target,
+                                         concurrency=4, upload_batch_size=1)
+        with self.assertRaises(RuntimeError):
+            importer.import_archive(output)
+        self.assertEqual(self.target_stored['finalized'], {})
+        self.assertEqual(self.target_stored['files'], {})
+
+    def test_download_failure(self):
+        del self.stored['blocks'][get_block_id(self.blocks[3])]
+        exporter = archive.VaultExporter(self.client, self.vault)
+        with self.assertRaises(RuntimeError):
+            exporter.export(io.BytesIO())
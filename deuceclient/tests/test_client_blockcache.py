@@ -0,0 +1,270 @@
+"""
+Tests - Deuce Client - Client - Block Cache
+"""
+import os
+import shutil
+import stat
+import tempfile
+import threading
+from unittest import TestCase
+
+import httpretty
+import mock
+
+import deuceclient.api as api
+import deuceclient.client.blockcache as blockcache
+import deuceclient.client.deuce
+from deuceclient.tests import *
+
+
+class BlockCacheTest(TestCase):
+
+    def setUp(self):
+        super(BlockCacheTest, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, 'blocks')
+        self.cache = blockcache.BlockCache(self.cache_dir, max_size=1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        super(BlockCacheTest, self).tearDown()
+
+    def test_default_path(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.temp_dir}):
+            self.assertEqual(blockcache.BlockCache().path,
+                             os.path.join(self.temp_dir, 'deuceclient',
+                                          'blocks'))
+
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertTrue(blockcache.default_cache_path().endswith(
+                os.path.join('.cache', 'deuceclient', 'blocks')))
+
+    def test_invalid_max_size(self):
+        with self.assertRaises(ValueError):
+            blockcache.BlockCache(self.cache_dir, max_size=0)
+
+    def test_put_get(self):
+        block_id, block_data, block_size = create_block()
+        self.assertIsNone(self.cache.get(block_id))
+        self.assertEqual(self.cache.size, 0)
+
+        self.assertTrue(self.cache.put(block_id, block_data))
+        self.assertTrue(self.cache.put(block_id, block_data))
+        self.assertEqual(self.cache.get(block_id), block_data)
+        self.assertEqual(self.cache.size, block_size)
+        self.assertEqual(self.cache.max_size, 1000)
+
+        # Sharded by the first characters of the Block ID
+        path = self.cache.block_path(block_id)
+        self.assertEqual(path, os.path.join(self.cache_dir, block_id[0:2],
+                                            block_id[2:4], block_id))
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode) & 0o077, 0)
+
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+        # Shared with other instances
+        other = blockcache.BlockCache(self.cache_dir, max_size=1000)
+        self.assertEqual(other.get(block_id), block_data)
+        self.assertEqual(other.size, block_size)
+
+    def test_rejected_blocks(self):
+        block_id, block_data, block_size = create_block()
+        self.assertFalse(self.cache.put(block_id, b'other data'))
+        self.assertFalse(self.cache.put(get_block_id(b'x' * 1001),
+                                        b'x' * 1001))
+        self.assertEqual(self.cache.size, 0)
+
+    def test_corrupted_entry(self):
+        block_id, block_data, block_size = create_block()
+        self.cache.put(block_id, block_data)
+        with open(self.cache.block_path(block_id), 'r+b') as entry:
+            entry.write(b'corrupted')
+
+        self.assertIsNone(self.cache.get(block_id))
+        self.assertFalse(os.path.exists(self.cache.block_path(block_id)))
+        self.assertEqual(self.cache.corrupted, 1)
+        self.assertEqual(self.cache.size, 0)
+
+        # Already removed by another process
+        self.cache.put(block_id, block_data)
+        with open(self.cache.block_path(block_id), 'r+b') as entry:
+            entry.write(b'corrupted')
+        with mock.patch.object(blockcache.os, 'unlink',
+                               side_effect=FileNotFoundError):
+            self.assertIsNone(self.cache.get(block_id))
+
+    def test_lru_eviction(self):
+        blocks = [create_block(300) for _ in range(3)]
+        for age, (block_id, block_data, block_size) in enumerate(blocks):
+            self.cache.put(block_id, block_data)
+            os.utime(self.cache.block_path(block_id), (age, age))
+
+        # Using the oldest block makes it the most recently used
+        self.assertEqual(self.cache.get(blocks[0][0]), blocks[0][1])
+
+        block_id, block_data, block_size = create_block(300)
+        self.cache.put(block_id, block_data)
+
+        self.assertEqual(self.cache.evicted, 1)
+        self.assertIsNone(self.cache.get(blocks[1][0]))
+        for cached_id, cached_data, cached_size in (blocks[0], blocks[2]):
+            self.assertEqual(self.cache.get(cached_id), cached_data)
+        self.assertEqual(self.cache.get(block_id), block_data)
+        self.assertEqual(self.cache.size, 900)
+
+    def test_shared_eviction(self):
+        blocks = [create_block(100) for _ in range(3)]
+        for block_id, block_data, block_size in blocks:
+            self.cache.put(block_id, block_data)
+
+        # Leftovers of an interrupted write are not entries
+        with open(os.path.join(self.cache_dir, '.partial.tmp'), 'wb') as tmp:
+            tmp.write(b'partial')
+
+        # Entries evicted by another process while scanning
+        real_stat = os.stat
+
+        def evicted_stat(path, *args, **kwargs):
+            if path.endswith(blocks[0][0]):
+                raise FileNotFoundError(path)
+            return real_stat(path, *args, **kwargs)
+
+        real_unlink = os.unlink
+
+        def evicted_unlink(path):
+            real_unlink(path)
+            if path.endswith(blocks[1][0]):
+                raise FileNotFoundError(path)
+
+        with mock.patch.object(blockcache.os, 'stat',
+                               side_effect=evicted_stat):
+            with mock.patch.object(blockcache.os, 'unlink',
+                                   side_effect=evicted_unlink):
+                self.cache.clear()
+
+        self.assertEqual(self.cache.size, 0)
+        self.assertEqual(self.cache.evicted, 1)
+        self.assertTrue(os.path.exists(self.cache.block_path(blocks[0][0])))
+
+    def test_entry_evicted_while_reading(self):
+        block_id, block_data, block_size = create_block()
+        self.cache.put(block_id, block_data)
+        with mock.patch.object(blockcache.os, 'utime',
+                               side_effect=FileNotFoundError):
+            self.assertEqual(self.cache.get(block_id), block_data)
+
+    def test_added_meanwhile(self):
+        block_id, block_data, block_size = create_block()
+        path = self.cache.block_path(block_id)
+
+        # Another thread adds the block while this one writes it
+        real_exists = os.path.exists
+        checks = []
+
+        def exists(checked_path):
+            if checked_path == path:
+                checks.append(checked_path)
+                return len(checks) > 1
+            return real_exists(checked_path)
+
+        with mock.patch.object(blockcache.os.path, 'exists',
+                               side_effect=exists):
+            self.assertTrue(self.cache.put(block_id, block_data))
+
+        self.assertEqual(os.listdir(os.path.dirname(path)), [])
+        self.assertEqual(self.cache.size, 0)
+
+    def test_concurrent_use(self):
+        blocks = [create_block(50) for _ in range(40)]
+
+        def use_blocks():
+            for block_id, block_data, block_size in blocks:
+                if self.cache.get(block_id) is None:
+                    self.cache.put(block_id, block_data)
+
+        threads = [threading.Thread(target=use_blocks) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertLessEqual(self.cache.size, self.cache.max_size)
+        self.assertEqual(self.cache.hits + self.cache.misses, 160)
+        self.assertEqual(self.cache.size,
+                         sum(os.path.getsize(self.cache.block_path(block[0]))
+                             for block in blocks
+                             if os.path.exists(
+                                 self.cache.block_path(block[0]))))
+
+
+@httpretty.activate
+class ClientBlockCacheTests(ClientTestBase):
+
+    def setUp(self):
+        super(ClientBlockCacheTests, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = blockcache.BlockCache(self.temp_dir)
+        self.client = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.apihost, sslenabled=True,
+            block_cache=self.cache)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        super(ClientBlockCacheTests, self).tearDown()
+
+    def test_block_download(self):
+        block_id, block_data, block_size = create_block()
+        httpretty.register_uri(httpretty.GET,
+                               get_block_url(self.apihost,
+                                             self.vault.vault_id,
+                                             block_id),
+                               content_type='text/plain',
+                               body=block_data,
+                               status=200)
+
+        for _ in range(3):
+            block = api.Block(project_id=self.vault.project_id,
+                              vault_id=self.vault.vault_id,
+                              block_id=block_id)
+            self.assertTrue(self.client.DownloadBlock(self.vault, block))
+            self.assertEqual(block.data, block_data)
+
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_storage_block_download(self):
+        block_id, block_data, block_size = create_block()
+        storage_id = create_storage_block(block_id)
+        httpretty.register_uri(httpretty.GET,
+                               get_storage_block_url(self.apihost,
+                                                     self.vault.vault_id,
+                                                     storage_id),
+                               content_type='application/octet-stream',
+                               body=block_data,
+                               adding_headers={
+                                   'x-block-reference-count': '1',
+                                   'x-ref-modified': '0',
+                                   'x-storage-id': storage_id,
+                                   'x-block-id': block_id,
+                               },
+                               status=200)
+
+        for _ in range(2):
+            block = api.Block(project_id=self.vault.project_id,
+                              vault_id=self.vault.vault_id,
+                              storage_id=storage_id,
+                              block_type='storage')
+            block = self.client.DownloadBlockStorageData(self.vault, block)
+            self.assertEqual(block.data, block_data)
+            self.assertEqual(block.block_id, block_id)
+
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+
+        # Both download paths share the cache
+        block = api.Block(project_id=self.vault.project_id,
+                          vault_id=self.vault.vault_id,
+                          block_id=block_id)
+        self.assertTrue(self.client.DownloadBlock(self.vault, block))
+        self.assertEqual(block.data, block_data)
+        self.assertEqual(len(httpretty.latest_requests()), 1)
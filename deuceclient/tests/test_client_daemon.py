@@ -0,0 +1,454 @@
+"""
+Tests - Deuce Client - Client - Daemon
+"""
+import functools
+import os
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import threading
+from unittest import TestCase
+
+import mock
+import requests
+
+import deuceclient.client.daemon as daemon
+import deuceclient.client.deuce
+import deuceclient.shell as shell
+from deuceclient.tests import *
+from deuceclient.tests.standin import StandInDeuce
+
+
+class ClientDaemonTests(TestCase):
+
+    def setUp(self):
+        super(ClientDaemonTests, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.temp_dir, 'run', 'daemon.sock')
+
+        self.deuce = StandInDeuce()
+        threading.Thread(target=self.deuce.serve_forever).start()
+
+        self.vault_name = create_vault_name()
+        vault = self.deuce.add_vault(self.vault_name)
+        for _ in range(3):
+            block_id, block_data, block_size = create_block()
+            vault['blocks'][block_id] = block_data
+        content_block_id = get_block_id(b'file content')
+        vault['blocks'][content_block_id] = b'file content'
+        self.block_ids = sorted(vault['blocks'])
+        self.file_id = create_file()
+        vault['files'][self.file_id] = [(content_block_id, 0)]
+
+        self.authenticator = FakeAuthenticator(userid='cheshirecat',
+                                               usertype='username',
+                                               credentials='alice',
+                                               auth_method='password',
+                                               datacenter='wonderland',
+                                               auth_url='down.the.rabbit.hole')
+        self.session = requests.Session()
+        self.client = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.deuce.apihost, session=self.session)
+
+        self.server = daemon.DaemonServer(
+            functools.partial(shell.run_batch,
+                              shell.BatchSession(self.client)),
+            path=self.socket_path)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join(5)
+        self.session.close()
+        self.deuce.shutdown()
+        self.deuce.server_close()
+        shutil.rmtree(self.temp_dir)
+        super(ClientDaemonTests, self).tearDown()
+
+    def test_default_socket_path(self):
+        with mock.patch.dict(os.environ, {'XDG_RUNTIME_DIR': self.temp_dir}):
+            self.assertEqual(daemon.default_socket_path(),
+                             os.path.join(self.temp_dir, 'deuceclient',
+                                          'daemon.sock'))
+            self.assertEqual(daemon.DaemonClient().path,
+                             daemon.default_socket_path())
+
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertTrue(daemon.default_socket_path().endswith(
+                os.path.join('.cache', 'deuceclient', 'daemon.sock')))
+
+    def test_socket_permissions(self):
+        mode = stat.S_IMODE(os.stat(self.socket_path).st_mode)
+        self.assertEqual(mode & 0o077, 0)
+
+    def test_listing(self):
+        with daemon.DaemonClient(self.socket_path) as client:
+            self.assertEqual(client.ListVaults(), [self.vault_name])
+            self.assertEqual(client.ListBlocks(self.vault_name),
+                             self.block_ids)
+            self.assertEqual(client.ListBlocks(self.vault_name,
+                                               marker=self.block_ids[0],
+                                               limit=10),
+                             self.block_ids)
+            self.assertEqual(client.ListFiles(self.vault_name),
+                             [self.file_id])
+            self.assertEqual(client.ListFiles(self.vault_name, limit=10),
+                             [self.file_id])
+
+        # The vault was only checked once for all the commands
+        self.assertEqual(len(self.deuce.requests_made('HEAD')), 1)
+
+    def test_download(self):
+        file_name = os.path.join(self.temp_dir, 'restored file')
+        with daemon.DaemonClient(self.socket_path) as client:
+            client.DownloadFile(self.vault_name, self.file_id, file_name)
+
+        with open(file_name, 'rb') as restored:
+            self.assertEqual(restored.read(), b'file content')
+
+    def test_read_range(self):
+        file_name = os.path.join(self.temp_dir, 'range')
+        with daemon.DaemonClient(self.socket_path) as client:
+            result = client.execute(['files', '--vault-name',
+                                     self.vault_name, 'read-range',
+                                     '--file-id', self.file_id,
+                                     '--start', '5', '--length', '4',
+                                     '--file-name', file_name])
+            self.assertEqual(result['length'], 4)
+
+            # The data can not be written to the daemon's output
+            with self.assertRaises(RuntimeError):
+                client.execute(['files', '--vault-name', self.vault_name,
+                                'read-range', '--file-id', self.file_id,
+                                '--length', '4'])
+
+        with open(file_name, 'rb') as data:
+            self.assertEqual(data.read(), b'cont')
+
+    def test_stream(self):
+        file_name = os.path.join(self.temp_dir, 'streamed')
+        with daemon.DaemonClient(self.socket_path) as client:
+            result = client.execute(['files', '--vault-name',
+                                     self.vault_name, 'stream',
+                                     '--file-id', self.file_id,
+                                     '--file-name', file_name])
+            self.assertEqual(result['length'], len(b'file content'))
+
+            # The data can not be written to the daemon's output
+            with self.assertRaises(RuntimeError):
+                client.execute(['files', '--vault-name', self.vault_name,
+                                'stream', '--file-id', self.file_id])
+
+        with open(file_name, 'rb') as data:
+            self.assertEqual(data.read(), b'file content')
+
+    def test_clone(self):
+        with daemon.DaemonClient(self.socket_path) as client:
+            result = client.execute(['files', '--vault-name',
+                                     self.vault_name, 'clone',
+                                     '--file-id', self.file_id])
+        vault = self.deuce.state['vaults'][self.vault_name]
+        self.assertEqual(vault['files'][result['clone_file_id']],
+                         vault['files'][self.file_id])
+        self.assertEqual(vault['finalized'],
+                         {result['clone_file_id']: len(b'file content')})
+
+    def test_replicate(self):
+        target = create_vault_name()
+        target_vault = self.deuce.add_vault(target)
+        with daemon.DaemonClient(self.socket_path) as client:
+            result = client.execute(['files', '--vault-name',
+                                     self.vault_name, 'replicate',
+                                     '--file-id', self.file_id,
+                                     '--destination-vault', target])
+            self.assertEqual(result['blocks_transferred'], 1)
+
+            # The daemon has a single endpoint
+            with self.assertRaises(RuntimeError):
+                client.execute(['files', '--vault-name', self.vault_name,
+                                'replicate', '--file-id', self.file_id,
+                                '--destination-vault', target,
+                                '--destination-url', 'elsewhere'])
+
+        self.assertEqual(target_vault['finalized'],
+                         {result['destination_file_id']:
+                          len(b'file content')})
+
+    def test_export_import(self):
+        archive = os.path.join(self.temp_dir, 'archive')
+        target = create_vault_name()
+        target_vault = self.deuce.add_vault(target)
+        with daemon.DaemonClient(self.socket_path) as client:
+            result = client.execute(['vault', 'export', '--vault-name',
+                                     self.vault_name, '--archive', archive])
+            self.assertEqual(result['files'], 1)
+            self.assertEqual(result['blocks'], 1)
+
+            result = client.execute(['vault', 'import', '--vault-name',
+                                     target, '--archive', archive])
+            file_id = result['files'][self.file_id]
+            self.assertEqual(result['blocks_uploaded'], 1)
+
+            # The archive can not be read from the daemon's input
+            with self.assertRaises(RuntimeError):
+                client.execute(['vault', 'import', '--vault-name', target])
+
+        self.assertEqual(target_vault['finalized'],
+                         {file_id: len(b'file content')})
+
+    def test_shared_between_clients(self):
+        listings = []
+
+        def list_files():
+            with daemon.DaemonClient(self.socket_path) as client:
+                for _ in range(5):
+                    listings.append(client.ListFiles(self.vault_name))
+
+        with daemon.DaemonClient(self.socket_path) as client:
+            client.ListFiles(self.vault_name)
+
+        threads = [threading.Thread(target=list_files) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertEqual(listings, [[self.file_id]] * 20)
+        self.assertEqual(len(self.deuce.requests_made('GET')), 21)
+        self.assertEqual(len(self.deuce.requests_made('HEAD')), 1)
+
+    def test_command_failure(self):
+        other_vault = create_vault_name()
+
+        with daemon.DaemonClient(self.socket_path) as client:
+            result = client.send(['files', '--vault-name', other_vault,
+                                  'list'])
+            self.assertEqual(result['status'], 'error')
+
+            with self.assertRaises(RuntimeError):
+                client.ListFiles(other_vault)
+
+            # The connection is still usable
+            client.execute(['vault', 'create', '--vault-name', other_vault])
+            self.assertEqual(client.ListFiles(other_vault), [])
+
+            with self.assertRaises(ValueError):
+                client.send([])
+
+    def test_upload_paths(self):
+        content = os.path.join(self.temp_dir, 'content')
+        with open(content, 'w') as content_file:
+            content_file.write('data')
+
+        client = daemon.DaemonClient(self.socket_path)
+        with mock.patch.object(client, 'execute',
+                               return_value={'block_id': 'b',
+                                             'file_id': 'f'}) as execute:
+            self.assertEqual(client.UploadBlock(self.vault_name, content),
+                             'b')
+            self.assertEqual(client.UploadFile(self.vault_name, content), 'f')
+            self.assertEqual(client.UploadFile(self.vault_name, content,
+                                               file_id='f'), 'f')
+
+        commands = [call[0][0] for call in execute.call_args_list]
+        self.assertEqual(commands[0][-1], content)
+        self.assertEqual(commands[1][-1], content)
+        self.assertEqual(commands[2][-2:], ['--file-id', 'f'])
+
+    def test_connection_failure(self):
+        client = daemon.DaemonClient(os.path.join(self.temp_dir, 'missing'))
+        with self.assertRaises(RuntimeError):
+            client.ListVaults()
+        client.close()
+
+    def test_daemon_stopped(self):
+        client = daemon.DaemonClient(self.socket_path)
+        client.ListVaults()
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertFalse(os.path.exists(self.socket_path))
+
+        # The established connection outlives the server
+        connection = client._DaemonClient__socket
+        client._DaemonClient__socket = mock.Mock()
+        client._DaemonClient__socket.sendall.side_effect = \
+            BrokenPipeError('mock')
+        with self.assertRaises(RuntimeError):
+            client.ListVaults()
+        connection.close()
+
+        client = daemon.DaemonClient(self.socket_path)
+        with self.assertRaises(RuntimeError):
+            client.ListVaults()
+
+    def test_connection_closed(self):
+        def close_connection(commands, output):
+            commands.readline()
+
+        self.server.run_commands = close_connection
+        client = daemon.DaemonClient(self.socket_path)
+        with self.assertRaises(RuntimeError):
+            client.ListVaults()
+
+    def test_client_disconnects(self):
+        def write_results(commands, output):
+            raise BrokenPipeError('mock')
+
+        self.server.run_commands = write_results
+        client = daemon.DaemonClient(self.socket_path)
+        with self.assertRaises(RuntimeError):
+            client.ListVaults()
+
+    def test_already_running(self):
+        with self.assertRaises(RuntimeError):
+            daemon.DaemonServer(None, path=self.socket_path)
+
+    def test_stale_socket(self):
+        path = os.path.join(self.temp_dir, 'stale.sock')
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+
+        server = daemon.DaemonServer(None, path=path)
+        server.server_close()
+        self.assertFalse(os.path.exists(path))
+        server.server_close()
+
+
+class ShellDaemonCommandTests(TestCase):
+
+    def parse(self, *command):
+        return shell.batch_parser().parse_args(command)
+
+    def test_vault_commands(self):
+        self.assertEqual(
+            shell.daemon_command('vault_list', self.parse('vault', 'list')),
+            ['vault', 'list'])
+        self.assertEqual(
+            shell.daemon_command('vault_create',
+                                 self.parse('vault', 'create',
+                                            '--vault-name', 'v')),
+            ['vault', 'create', '--vault-name', 'v'])
+
+    def test_operation_options(self):
+        self.assertEqual(
+            shell.daemon_command('block_list',
+                                 self.parse('blocks', '--vault-name', 'v',
+                                            'list', '--limit', '5')),
+            ['blocks', '--vault-name', 'v', 'list', '--limit', '5'])
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            content = os.path.join(temp_dir, 'content')
+            with open(content, 'w') as content_file:
+                content_file.write('data')
+
+            arguments = self.parse('files', '--vault-name', 'v', 'upload',
+                                   '--content', content)
+            self.assertEqual(shell.daemon_command('file_upload', arguments),
+                             ['files', '--vault-name', 'v', 'upload',
+                              '--content', content])
+            self.assertTrue(arguments.content.closed)
+        finally:
+            shutil.rmtree(temp_dir)
+
+        arguments = self.parse('files', '--vault-name', 'v', 'download',
+                               '--file-id', 'f', '--file-name', 'restored')
+        self.assertEqual(shell.daemon_command('file_download', arguments),
+                         ['files', '--vault-name', 'v', 'download',
+                          '--file-id', 'f', '--file-name',
+                          os.path.abspath('restored')])
+
+        arguments = self.parse('files', '--vault-name', 'v', 'download',
+                               '--file-id', 'f', '--file-name', 'restored',
+                               '--differential')
+        self.assertEqual(shell.daemon_command('file_download', arguments),
+                         ['files', '--vault-name', 'v', 'download',
+                          '--file-id', 'f', '--file-name',
+                          os.path.abspath('restored'), '--differential'])
+
+    def test_upload_tree(self):
+        arguments = self.parse('files', '--vault-name', 'v', 'upload-tree',
+                               '--source', 'tree', '--concurrency', '2')
+        self.assertEqual(shell.daemon_command('file_upload_tree', arguments),
+                         ['files', '--vault-name', 'v', 'upload-tree',
+                          '--concurrency', '2',
+                          '--source', os.path.abspath('tree')])
+
+    def test_restore_tree(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            manifest = os.path.join(temp_dir, 'manifest')
+            with open(manifest, 'w') as manifest_file:
+                manifest_file.write('{"path": "a", "file_id": "f"}')
+
+            arguments = self.parse('files', '--vault-name', 'v',
+                                   'restore-tree', '--manifest', manifest,
+                                   '--destination', 'restored')
+            self.assertEqual(
+                shell.daemon_command('file_restore_tree', arguments),
+                ['files', '--vault-name', 'v', 'restore-tree',
+                 '--concurrency', str(shell.DEFAULT_CONCURRENCY),
+                 '--manifest', manifest,
+                 '--destination', os.path.abspath('restored')])
+            self.assertTrue(arguments.manifest.closed)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_read_range_command(self):
+        arguments = self.parse('files', '--vault-name', 'v', 'read-range',
+                               '--file-id', 'f', '--length', '10',
+                               '--file-name', 'range')
+        self.assertEqual(shell.daemon_command('file_read_range', arguments),
+                         ['files', '--vault-name', 'v', 'read-range',
+                          '--file-id', 'f', '--start', '0',
+                          '--length', '10',
+                          '--file-name', os.path.abspath('range')])
+
+    def test_stream_command(self):
+        arguments = self.parse('files', '--vault-name', 'v', 'stream',
+                               '--file-id', 'f', '--buffer-size', '16')
+        self.assertEqual(shell.daemon_command('file_stream', arguments),
+                         ['files', '--vault-name', 'v', 'stream',
+                          '--file-id', 'f',
+                          '--concurrency', str(shell.DEFAULT_CONCURRENCY),
+                          '--buffer-size', '16'])
+
+    def test_clone_command(self):
+        arguments = self.parse('files', '--vault-name', 'v', 'clone',
+                               '--file-id', 'f', '--concurrency', '2')
+        self.assertEqual(shell.daemon_command('file_clone', arguments),
+                         ['files', '--vault-name', 'v', 'clone',
+                          '--file-id', 'f', '--concurrency', '2'])
+
+    def test_replicate_command(self):
+        arguments = self.parse('files', '--vault-name', 'v', 'replicate',
+                               '--file-id', 'f', '--destination-vault', 'w',
+                               '--destination-url', 'elsewhere')
+        self.assertEqual(shell.daemon_command('file_replicate', arguments),
+                         ['files', '--vault-name', 'v', 'replicate',
+                          '--file-id', 'f',
+                          '--concurrency', str(shell.DEFAULT_CONCURRENCY),
+                          '--destination-vault', 'w',
+                          '--destination-url', 'elsewhere'])
+
+    def test_export_command(self):
+        arguments = self.parse('vault', 'export', '--vault-name', 'v',
+                               '--archive', 'archive')
+        self.assertEqual(shell.daemon_command('vault_export', arguments),
+                         ['vault', 'export', '--vault-name', 'v',
+                          '--concurrency', str(shell.DEFAULT_CONCURRENCY),
+                          '--archive', os.path.abspath('archive')])
+
+    def test_stdin(self):
+        arguments = self.parse('blocks', '--vault-name', 'v', 'upload',
+                               '--block-content', '-')
+        self.assertIs(arguments.block_content, sys.stdin)
+
+        with self.assertRaises(shell.ProgramArgumentError):
+            shell.daemon_command('block_upload', arguments)
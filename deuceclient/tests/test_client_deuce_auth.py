@@ -0,0 +1,185 @@
+"""
+Tests - Deuce Client - Client - Deuce - Authentication Headers
+"""
+import datetime
+import threading
+
+import httpretty
+import mock
+
+import deuceclient.client.deuce
+from deuceclient.tests import *
+
+
+@httpretty.activate
+class ClientDeuceAuthTests(ClientTestBase):
+
+    def setUp(self):
+        super(ClientDeuceAuthTests, self).setUp()
+
+        self.client = deuceclient.client.deuce.DeuceClient(self.authenticator,
+                                                           self.apihost,
+                                                           sslenabled=True)
+        self.tokens_seen = []
+
+    def tearDown(self):
+        super(ClientDeuceAuthTests, self).tearDown()
+
+    def register_vault(self, rejected_tokens=()):
+        def callback(request, uri, response_headers):
+            token = request.headers.get('X-Auth-Token')
+            self.tokens_seen.append(token)
+            if token in rejected_tokens or '*' in rejected_tokens:
+                return (401, response_headers, 'mock rejection')
+            return (201, response_headers, '')
+
+        httpretty.register_uri(httpretty.PUT,
+                               get_vault_url(self.apihost,
+                                             self.vault.vault_id),
+                               body=callback)
+
+    def test_headers_cached(self):
+        self.register_vault()
+
+        with mock.patch.object(self.authenticator, '_AuthToken',
+                               wraps=self.authenticator._AuthToken) as token:
+            for _ in range(5):
+                self.client.CreateVault(self.vault.vault_id)
+            self.assertEqual(self.client.project_id,
+                             self.authenticator.AuthTenantId)
+
+            self.assertEqual(token.call_count, 1)
+
+        self.assertEqual(len(set(self.tokens_seen)), 1)
+
+    def test_headers_expired(self):
+        self.register_vault()
+
+        # Every cached token is considered about to expire
+        with mock.patch('deuceclient.client.deuce'
+                        '.AUTH_HEADERS_EXPIRATION_MARGIN', 7200):
+            for _ in range(3):
+                self.client.CreateVault(self.vault.vault_id)
+
+        self.assertEqual(len(set(self.tokens_seen)), 3)
+
+    def test_headers_refresh_margin(self):
+        self.register_vault()
+
+        # Resolved again once the authenticator renews the token
+        with mock.patch.object(FakeAuthenticator, 'refresh_margin', 7200):
+            for _ in range(3):
+                self.client.CreateVault(self.vault.vault_id)
+
+        self.assertEqual(len(set(self.tokens_seen)), 3)
+
+    def test_headers_token_changed(self):
+        self.register_vault()
+
+        with mock.patch.object(self.authenticator, '_AuthToken',
+                               wraps=self.authenticator._AuthToken) as token:
+            self.client.CreateVault(self.vault.vault_id)
+
+            # e.g. renewed in the background or for another client
+            self.authenticator.GetToken()
+            self.client.CreateVault(self.vault.vault_id)
+            self.client.CreateVault(self.vault.vault_id)
+
+            self.assertEqual(token.call_count, 2)
+
+        self.assertNotEqual(self.tokens_seen[0], self.tokens_seen[1])
+        self.assertEqual(self.tokens_seen[1], self.tokens_seen[2])
+
+    def test_headers_token_and_expiration(self):
+        self.register_vault()
+
+        expires = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        with mock.patch.object(self.authenticator, '_AuthTokenAndExpiration',
+                               return_value=('token_paired', expires)), \
+                mock.patch.object(self.authenticator, '_CurrentToken',
+                                  return_value='token_paired'), \
+                mock.patch.object(self.authenticator, '_AuthExpirationTime',
+                                  side_effect=AssertionError('unpaired')):
+            self.client.CreateVault(self.vault.vault_id)
+            self.client.CreateVault(self.vault.vault_id)
+
+        self.assertEqual(self.tokens_seen, ['token_paired'] * 2)
+        self.assertEqual(self.client._DeuceClient__auth[2],
+                         expires - datetime.timedelta(
+                             seconds=deuceclient.client.deuce
+                             .AUTH_HEADERS_EXPIRATION_MARGIN))
+
+    def test_rejected_token_replayed(self):
+        first_token = self.authenticator.AuthToken
+        with mock.patch.object(self.authenticator, 'GetToken',
+                               return_value=first_token):
+            self.client.project_id
+
+        self.register_vault(rejected_tokens=(first_token,))
+
+        with mock.patch.object(self.authenticator, 'ResetToken',
+                               wraps=self.authenticator.ResetToken) as reset:
+            self.client.CreateVault(self.vault.vault_id)
+            self.assertEqual(reset.call_count, 1)
+
+        self.assertEqual(len(self.tokens_seen), 2)
+        self.assertEqual(self.tokens_seen[0], first_token)
+        self.assertNotEqual(self.tokens_seen[1], first_token)
+
+        # the new token is used from then on
+        self.client.CreateVault(self.vault.vault_id)
+        self.assertEqual(self.tokens_seen[2], self.tokens_seen[1])
+
+    def test_rejected_token_replayed_once(self):
+        self.register_vault(rejected_tokens=('*',))
+
+        with self.assertRaises(RuntimeError):
+            self.client.CreateVault(self.vault.vault_id)
+
+        self.assertEqual(len(self.tokens_seen), 2)
+
+    def test_rejected_token_single_reauthentication(self):
+        self.client.project_id
+        rejected_token = self.client._DeuceClient__auth[0]
+
+        # hold the rejections until all the requests used the rejected token
+        rejected = threading.Barrier(4, timeout=5)
+
+        def callback(request, uri, response_headers):
+            token = request.headers.get('X-Auth-Token')
+            self.tokens_seen.append(token)
+            if token == rejected_token:
+                rejected.wait()
+                return (401, response_headers, 'mock rejection')
+            return (201, response_headers, '')
+
+        httpretty.register_uri(httpretty.PUT,
+                               get_vault_url(self.apihost,
+                                             self.vault.vault_id),
+                               body=callback)
+
+        errors = []
+
+        def create_vault():
+            try:
+                self.client.CreateVault(self.vault.vault_id)
+            except Exception as ex:
+                errors.append(ex)
+
+        with mock.patch.object(self.authenticator, 'ResetToken',
+                               wraps=self.authenticator.ResetToken) as reset:
+            threads = [threading.Thread(target=create_vault)
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+            self.assertEqual(reset.call_count, 1)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.tokens_seen[:4], [rejected_token] * 4)
+        replayed = self.tokens_seen[4:]
+        self.assertEqual(len(replayed), 4)
+        self.assertEqual(len(set(replayed)), 1)
+        self.assertNotIn(rejected_token, replayed)
@@ -558,3 +558,174 @@ class ClientDeuceBlockTests(ClientTestBase):
         self.assertEqual(block.block_id, block_id)
         self.assertEqual(len(block), block_size)
         self.assertFalse(block.block_orphaned)
+
+    def register_block_heads(self, block_ids, status=204):
+        for block_id in block_ids:
+            httpretty.register_uri(httpretty.HEAD,
+                                   get_block_url(self.apihost,
+                                                 self.vault.vault_id,
+                                                 block_id),
+                                   adding_headers={
+                                       'x-block-reference-count': '3',
+                                       'x-ref-modified': '12345',
+                                       'x-storage-id':
+                                       create_storage_block(block_id),
+                                       'x-block-id': block_id,
+                                       'x-block-size': '100',
+                                   },
+                                   status=status)
+
+    def test_block_head_bulk(self):
+        block_ids = [block[0] for block in create_blocks(12)]
+        missing_ids = block_ids[:3]
+        self.register_block_heads(block_ids[3:])
+        self.register_block_heads(missing_ids, status=410)
+
+        blocks = (api.Block(project_id=self.vault.project_id,
+                            vault_id=self.vault.vault_id,
+                            block_id=block_id)
+                  for block_id in block_ids)
+        missing = []
+        heads = list(self.client.HeadBlocks(self.vault, blocks,
+                                            concurrency=4,
+                                            missing=missing))
+
+        self.assertEqual(sorted(block.block_id for block in heads),
+                         sorted(block_ids[3:]))
+        for block in heads:
+            self.assertEqual(block.ref_count, 3)
+            self.assertEqual(block.ref_modified, 12345)
+            self.assertEqual(len(block), 100)
+            self.assertFalse(block.block_orphaned)
+
+        self.assertEqual(sorted(block.block_id for block in missing),
+                         sorted(missing_ids))
+
+    def test_block_head_bulk_missing(self):
+        block_id = create_block()[0]
+        self.register_block_heads([block_id], status=410)
+        blocks = [api.Block(project_id=self.vault.project_id,
+                            vault_id=self.vault.vault_id,
+                            block_id=block_id)]
+
+        with self.assertRaises(errors.MissingBlockError):
+            list(self.client.HeadBlocks(self.vault, blocks))
+
+    def test_block_head_bulk_failure(self):
+        block_id = create_block()[0]
+        self.register_block_heads([block_id], status=404)
+        blocks = [api.Block(project_id=self.vault.project_id,
+                            vault_id=self.vault.vault_id,
+                            block_id=block_id)]
+
+        with self.assertRaises(RuntimeError):
+            list(self.client.HeadBlocks(self.vault, blocks, missing=[]))
+
+    def test_block_head_bulk_invalid_concurrency(self):
+        # Raised by the call rather than once the blocks are iterated
+        with self.assertRaises(ValueError):
+            self.client.HeadBlocks(self.vault, [], concurrency=0)
+
+    @httpretty.activate
+    def test_block_iter(self):
+        block_ids = sorted(block[0] for block in create_blocks(25))
+        httpretty.register_uri(httpretty.GET,
+                               get_blocks_url(self.apihost,
+                                              self.vault.vault_id),
+                               body=make_paged_listing(block_ids, 10))
+
+        self.assertEqual(list(self.client.IterBlockList(self.vault)),
+                         block_ids)
+        self.assertEqual(len(self.vault.blocks), 0)
+        self.assertEqual(len(httpretty.latest_requests()), 3)
+
+    @httpretty.activate
+    def test_block_iter_store_with_marker_and_limit(self):
+        block_ids = sorted(block[0] for block in create_blocks(25))
+        httpretty.register_uri(httpretty.GET,
+                               get_blocks_url(self.apihost,
+                                              self.vault.vault_id),
+                               body=make_paged_listing(block_ids, 10))
+
+        self.assertEqual(list(self.client.IterBlockList(self.vault,
+                                                        marker=block_ids[3],
+                                                        limit=4,
+                                                        store=True)),
+                         block_ids[3:])
+        self.assertEqual(sorted(self.vault.blocks.keys()), block_ids[3:])
+
+    @httpretty.activate
+    def test_block_iter_failure(self):
+        httpretty.register_uri(httpretty.GET,
+                               get_blocks_url(self.apihost,
+                                              self.vault.vault_id),
+                               status=404)
+
+        with self.assertRaises(RuntimeError):
+            list(self.client.IterBlockList(self.vault))
+
+    def test_block_iter_bad_vault(self):
+        with self.assertRaises(TypeError):
+            self.client.IterBlockList(self.vault.vault_id)
+
+    @httpretty.activate
+    def test_block_iter_prefetch(self):
+        block_ids = sorted(block[0] for block in create_blocks(25))
+        httpretty.register_uri(httpretty.GET,
+                               get_blocks_url(self.apihost,
+                                              self.vault.vault_id),
+                               body=make_paged_listing(block_ids, 4))
+
+        self.assertEqual(list(self.client.IterBlockList(self.vault,
+                                                        store=True,
+                                                        prefetch=2)),
+                         block_ids)
+        self.assertEqual(sorted(self.vault.blocks.keys()), block_ids)
+
+    @httpretty.activate
+    def test_block_iter_partitioned(self):
+        block_ids = sorted(block[0] for block in create_blocks(100))
+        httpretty.register_uri(httpretty.GET,
+                               get_blocks_url(self.apihost,
+                                              self.vault.vault_id),
+                               body=make_paged_listing(block_ids, 10))
+
+        for partitions in (1, 3, 4, 16):
+            listed = list(self.client.IterBlockListPartitioned(
+                self.vault, partitions=partitions, limit=7))
+            self.assertEqual(sorted(listed), block_ids)
+
+        self.assertEqual(len(self.vault.blocks), 0)
+
+    @httpretty.activate
+    def test_block_iter_partitioned_store(self):
+        block_ids = sorted(block[0] for block in create_blocks(20))
+        httpretty.register_uri(httpretty.GET,
+                               get_blocks_url(self.apihost,
+                                              self.vault.vault_id),
+                               body=make_paged_listing(block_ids, 10))
+
+        listed = list(self.client.IterBlockListPartitioned(
+            self.vault, partitions=2, store=True))
+        self.assertEqual(sorted(listed), block_ids)
+        self.assertEqual(sorted(self.vault.blocks.keys()), block_ids)
+
+        markers = [request.querystring.get('marker', [None])[0]
+                   for request in httpretty.latest_requests()]
+        self.assertIn(None, markers)
+        self.assertIn('8' + '0' * 39, markers)
+
+    @httpretty.activate
+    def test_block_iter_partitioned_failure(self):
+        httpretty.register_uri(httpretty.GET,
+                               get_blocks_url(self.apihost,
+                                              self.vault.vault_id),
+                               status=500)
+
+        with self.assertRaises(RuntimeError):
+            list(self.client.IterBlockListPartitioned(self.vault))
+
+    def test_block_iter_partitioned_invalid(self):
+        with self.assertRaises(ValueError):
+            list(self.client.IterBlockListPartitioned(self.vault,
+                                                      partitions=0))
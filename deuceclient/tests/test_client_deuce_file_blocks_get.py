@@ -221,3 +221,51 @@ class ClientDeuceFileGetBlocksTests(ClientTestBase):
 
         with self.assertRaises(RuntimeError) as stats_error:
             self.client.GetFileBlockList(self.vault, file_id)
+
+    @httpretty.activate
+    def test_file_blocks_iter(self):
+        file_id = create_file()
+        self.vault.add_file(file_id)
+
+        data = []
+        running_offset = 0
+        for block_id, block_data, block_size in create_blocks(25):
+            data.append([block_id, running_offset])
+            running_offset = running_offset + block_size
+
+        httpretty.register_uri(httpretty.GET,
+                               get_file_blocks_url(self.apihost,
+                                                   self.vault.vault_id,
+                                                   file_id),
+                               body=make_paged_listing(
+                                   data, 10, key=lambda entry: entry[1]))
+
+        self.assertEqual(
+            list(self.client.IterFileBlockList(self.vault, file_id)),
+            [tuple(entry) for entry in data])
+        self.assertEqual(self.vault.files[file_id].offsets, {})
+
+        self.assertEqual(
+            list(self.client.IterFileBlockList(self.vault, file_id,
+                                               limit=7, store=True)),
+            [tuple(entry) for entry in data])
+        self.assertEqual(self.vault.files[file_id].offsets,
+                         {offset: block_id for block_id, offset in data})
+
+    @httpretty.activate
+    def test_file_blocks_iter_failure(self):
+        file_id = create_file()
+        self.vault.add_file(file_id)
+
+        httpretty.register_uri(httpretty.GET,
+                               get_file_blocks_url(self.apihost,
+                                                   self.vault.vault_id,
+                                                   file_id),
+                               status=404)
+
+        with self.assertRaises(RuntimeError):
+            list(self.client.IterFileBlockList(self.vault, file_id))
+
+    def test_file_blocks_iter_bad_fileid(self):
+        with self.assertRaises(KeyError):
+            list(self.client.IterFileBlockList(self.vault, create_file()))
@@ -0,0 +1,157 @@
+"""
+Tests - Deuce Client - Client - Deuce - File - Clone
+"""
+import os
+import random
+
+import requests
+
+import deuceclient.client.deuce
+from deuceclient.tests import *
+from deuceclient.tests.standin import StandInDeuce
+
+
+class ClientDeuceFileCloneTests(ClientTestBase):
+
+    def setUp(self):
+        super(ClientDeuceFileCloneTests, self).setUp()
+        self.deuce = StandInDeuce().__enter__()
+        self.session = requests.Session()
+        self.client = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.deuce.apihost, session=self.session)
+        self.stored = self.deuce.add_vault(self.vault.vault_id)
+
+        self.blocks = [os.urandom(random.randrange(1, 200))
+                       for _ in range(25)]
+        self.content = b''.join(self.blocks)
+        self.file_id = create_file()
+        self.stored['files'][self.file_id] = []
+        offset = 0
+        for block in self.blocks:
+            block_id = get_block_id(block)
+            self.stored['blocks'][block_id] = block
+            self.stored['files'][self.file_id].append((block_id, offset))
+            offset = offset + len(block)
+
+    def tearDown(self):
+        self.session.close()
+        self.deuce.__exit__(None, None, None)
+        super(ClientDeuceFileCloneTests, self).tearDown()
+
+    def content_of(self, file_id):
+        return b''.join(self.stored['blocks'][block_id]
+                        for block_id, offset in
+                        sorted(self.stored['files'][file_id],
+                               key=lambda block: block[1]))
+
+    def test_clone(self):
+        clone_file_id = self.client.CloneFile(self.vault, self.file_id,
+                                              blocks_per_assignment=4,
+                                              concurrency=4)
+        self.assertNotEqual(clone_file_id, self.file_id)
+        self.assertIn(clone_file_id, self.vault.files)
+        self.assertEqual(self.content_of(clone_file_id), self.content)
+        self.assertEqual(self.stored['finalized'],
+                         {clone_file_id: len(self.content)})
+
+        # Only the block list was read and no data moved
+        assignments = [path for path in self.deuce.requests_made('POST')
+                       if path.endswith('/blocks')]
+        self.assertEqual(len(assignments), 7)
+        self.assertEqual(self.deuce.uploads, {})
+        self.assertEqual([path for path in self.deuce.requests_made('GET')
+                          if '/blocks/' in path], [])
+        self.assertEqual(len(self.deuce.requests_made('HEAD')), 1)
+
+    def test_clone_empty_file(self):
+        file_id = create_file()
+        self.stored['files'][file_id] = []
+        clone_file_id = self.client.CloneFile(self.vault, file_id)
+        self.assertEqual(self.stored['files'][clone_file_id], [])
+        self.assertEqual(self.stored['finalized'], {clone_file_id: 0})
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            self.client.CloneFile(self.vault, self.file_id,
+                                  blocks_per_assignment=0)
+        self.assertEqual(list(self.stored['files']), [self.file_id])
+
+    def test_missing_blocks(self):
+        del self.stored['blocks'][get_block_id(self.blocks[7])]
+        with self.assertRaises(RuntimeError) as failure:
+            self.client.CloneFile(self.vault, self.file_id,
+                                  blocks_per_assignment=4)
+        self.assertIn('1 of its blocks are missing', str(failure.exception))
+
+        # The partial clone is deleted
+        self.assertEqual(list(self.stored['files']), [self.file_id])
+        self.assertEqual(list(self.vault.files), [])
+        self.assertEqual(self.stored['finalized'], {})
+
+    def test_missing_file(self):
+        with self.assertRaises(RuntimeError):
+            self.client.CloneFile(self.vault, create_file())
+        self.assertEqual(list(self.stored['files']), [self.file_id])
+
+    def test_delete_failure(self):
+        del self.stored['blocks'][get_block_id(self.blocks[7])]
+
+        # The listing succeeds but the vault is gone by the time the
+        # partial clone is deleted
+        assign = self.client._DeuceClient__assign_blocks
+
+        def assign_then_lose_vault(vault, file_id, chunk):
+            try:
+                return assign(vault, file_id, chunk)
+            finally:
+                self.deuce.state['vaults'].pop(self.vault.vault_id, None)
+
+        self.client._DeuceClient__assign_blocks = assign_then_lose_vault
+        with self.assertRaises(RuntimeError) as failure:
+            self.client.CloneFile(self.vault, self.file_id, concurrency=1)
+        self.assertIn('missing', str(failure.exception))
+
+    def test_file_block_chunks(self):
+        last_block = []
+        chunks = list(self.client.IterFileBlockChunks(self.vault,
+                                                      self.file_id, 4,
+                                                      last_block))
+        self.assertEqual([len(chunk) for chunk in chunks],
+                         [4, 4, 4, 4, 4, 4, 1])
+        self.assertEqual([(block_id, int(offset)) for chunk in chunks
+                          for block_id, offset in chunk],
+                         self.stored['files'][self.file_id])
+        self.assertEqual(last_block,
+                         [len(self.content) - len(self.blocks[-1]),
+                          get_block_id(self.blocks[-1])])
+
+        # The listing is kept out of the vault
+        self.assertEqual(list(self.vault.files), [])
+
+    def test_file_block_chunks_invalid_size(self):
+        with self.assertRaises(ValueError):
+            self.client.IterFileBlockChunks(self.vault, self.file_id, 0, [])
+
+    def test_finalize_after_last_block(self):
+        file_id = self.client.CreateFile(self.vault)
+        last_block = []
+        for chunk in self.client.IterFileBlockChunks(self.vault,
+                                                     self.file_id, 10,
+                                                     last_block):
+            for block_id, offset in chunk:
+                self.vault.files[file_id].assign_block(block_id, offset)
+            self.client.AssignBlocksToFile(self.vault, file_id, chunk)
+
+        self.assertTrue(self.client.FinalizeFileAfterLastBlock(
+            self.vault, file_id, last_block))
+        self.assertEqual(self.content_of(file_id), self.content)
+        self.assertEqual(self.stored['finalized'],
+                         {file_id: len(self.content)})
+        self.assertEqual(len(self.deuce.requests_made('HEAD')), 1)
+
+    def test_finalize_after_last_block_empty_file(self):
+        file_id = self.client.CreateFile(self.vault)
+        self.assertTrue(self.client.FinalizeFileAfterLastBlock(
+            self.vault, file_id, []))
+        self.assertEqual(self.stored['finalized'], {file_id: 0})
+        self.assertEqual(self.deuce.requests_made('HEAD'), [])
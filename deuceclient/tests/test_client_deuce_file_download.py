@@ -1,6 +1,7 @@
 """
 Tests - Deuce Client - Client - Deuce - File - Download
 """
+import gzip
 import json
 import os
 import tempfile
@@ -49,17 +50,16 @@ class ClientDeuceFileDownloadTests(ClientTestBase):
                                body=os.urandom(1024),
                                status=200)
 
-        output_file = tempfile.NamedTemporaryFile()
-
-        open_value = mock.mock_open()
-        open_value.side_effect = Exception('mock failure')
+        # The directory of the local file does not exist
+        output_dir = tempfile.mkdtemp()
+        os.rmdir(output_dir)
 
-        with mock.patch('builtins.open', open_value, create=True):
-            with self.assertRaises(RuntimeError):
-                self.client.DownloadFile(self.vault, file_id, output_file.name)
+        with self.assertRaises(RuntimeError):
+            self.client.DownloadFile(self.vault, file_id,
+                                     os.path.join(output_dir, 'file'))
 
     @httpretty.activate
-    def test_file_download_fail_iter_content(self):
+    def test_file_download_fail_readinto(self):
         file_id = create_file()
 
         httpretty.register_uri(httpretty.GET,
@@ -71,8 +71,8 @@ class ClientDeuceFileDownloadTests(ClientTestBase):
 
         output_file = tempfile.NamedTemporaryFile()
 
-        with mock.patch('requests.Response.iter_content') as mok_request:
-            mok_request.side_effect = Exception('mock failure')
+        with mock.patch('urllib3.response.HTTPResponse.readinto',
+                        side_effect=Exception('mock failure')):
 
             with self.assertRaises(RuntimeError):
                 self.client.DownloadFile(self.vault, file_id, output_file.name)
@@ -80,12 +80,13 @@ class ClientDeuceFileDownloadTests(ClientTestBase):
     @httpretty.activate
     def test_file_download_success(self):
         file_id = create_file()
+        data = os.urandom(2 * 1024 * 1024)
 
         httpretty.register_uri(httpretty.GET,
                                get_file_url(self.apihost,
                                             self.vault.vault_id,
                                             file_id),
-                               body=os.urandom(2 * 1024 * 1024),
+                               body=data,
                                status=200)
 
         output_file = tempfile.NamedTemporaryFile()
@@ -93,3 +94,41 @@ class ClientDeuceFileDownloadTests(ClientTestBase):
                          self.client.DownloadFile(self.vault,
                                                   file_id,
                                                   output_file.name))
+        self.assertEqual(output_file.read(), data)
+
+    @httpretty.activate
+    def test_file_download_encoded(self):
+        file_id = create_file()
+        data = os.urandom(100 * 1024) * 10
+
+        httpretty.register_uri(httpretty.GET,
+                               get_file_url(self.apihost,
+                                            self.vault.vault_id,
+                                            file_id),
+                               body=gzip.compress(data),
+                               adding_headers={'Content-Encoding': 'gzip'},
+                               status=200)
+
+        # The length of the encoded body is not the length of the file
+        output_file = tempfile.NamedTemporaryFile()
+        self.assertTrue(self.client.DownloadFile(self.vault, file_id,
+                                                 output_file.name))
+        self.assertEqual(output_file.read(), data)
+
+    @httpretty.activate
+    def test_file_download_unknown_length(self):
+        file_id = create_file()
+        chunks = [os.urandom(100 * 1024) for _ in range(5)]
+
+        httpretty.register_uri(httpretty.GET,
+                               get_file_url(self.apihost,
+                                            self.vault.vault_id,
+                                            file_id),
+                               body=(chunk for chunk in chunks),
+                               streaming=True,
+                               status=200)
+
+        output_file = tempfile.NamedTemporaryFile()
+        self.assertTrue(self.client.DownloadFile(self.vault, file_id,
+                                                 output_file.name))
+        self.assertEqual(output_file.read(), b''.join(chunks))
@@ -112,3 +112,49 @@ class ClientDeuceFileGetFilesTests(ClientTestBase):
 
         with self.assertRaises(RuntimeError):
             self.client.ListFiles(self.vault)
+
+    def test_file_iter(self):
+        file_ids = sorted(create_file() for _ in range(25))
+        httpretty.register_uri(httpretty.GET,
+                               get_files_url(self.apihost,
+                                             self.vault.vault_id),
+                               body=make_paged_listing(file_ids, 10))
+
+        self.assertEqual(list(self.client.IterFiles(self.vault)), file_ids)
+        self.assertEqual(len(self.vault.files), 0)
+
+    def test_file_iter_store_with_marker_and_limit(self):
+        file_ids = sorted(create_file() for _ in range(25))
+        httpretty.register_uri(httpretty.GET,
+                               get_files_url(self.apihost,
+                                             self.vault.vault_id),
+                               body=make_paged_listing(file_ids, 10))
+
+        self.assertEqual(list(self.client.IterFiles(self.vault,
+                                                    marker=file_ids[1],
+                                                    limit=3,
+                                                    store=True)),
+                         file_ids[1:])
+        self.assertEqual(sorted(self.vault.files.keys()), file_ids[1:])
+
+    def test_file_iter_failure(self):
+        httpretty.register_uri(httpretty.GET,
+                               get_files_url(self.apihost,
+                                             self.vault.vault_id),
+                               status=500)
+
+        with self.assertRaises(RuntimeError):
+            list(self.client.IterFiles(self.vault))
+
+    def test_file_iter_prefetch(self):
+        file_ids = sorted(create_file() for _ in range(25))
+        httpretty.register_uri(httpretty.GET,
+                               get_files_url(self.apihost,
+                                             self.vault.vault_id),
+                               body=make_paged_listing(file_ids, 3))
+
+        self.assertEqual(list(self.client.IterFiles(self.vault,
+                                                    store=True,
+                                                    prefetch=3)),
+                         file_ids)
+        self.assertEqual(sorted(self.vault.files.keys()), file_ids)
@@ -8,6 +8,7 @@ import httpretty
 
 import deuceclient.client.deuce
 import deuceclient.api as api
+from deuceclient.common import errors
 from deuceclient.tests import *
 
 
@@ -193,6 +194,22 @@ class ClientDeuceStorageBlockTests(ClientTestBase):
         with self.assertRaises(RuntimeError):
             self.client.HeadBlockStorage(self.vault, block)
 
+    @httpretty.activate
+    def test_head_storage_block_failure(self):
+        storage_blockid = create_storage_block()
+        httpretty.register_uri(httpretty.HEAD,
+                               get_storage_block_url(self.apihost,
+                                                     self.vault.vault_id,
+                                                     storage_blockid),
+                               status=500)
+        block = api.Block(project_id=create_project_name(),
+                          vault_id=create_vault_name(),
+                          storage_id=storage_blockid,
+                          block_type='storage')
+        with self.assertRaises(RuntimeError) as failure:
+            self.client.HeadBlockStorage(self.vault, block)
+        self.assertNotIsInstance(failure.exception, errors.MissingBlockError)
+
     @httpretty.activate
     def test_head_storage_block(self):
         storage_blockid = create_storage_block()
@@ -232,6 +249,105 @@ class ClientDeuceStorageBlockTests(ClientTestBase):
         self.assertEqual(len(block), check_data['block-size'])
         self.assertTrue(block.block_orphaned)
 
+    @httpretty.activate
+    def test_head_storage_block_bulk(self):
+        storage_ids = [create_storage_block() for _ in range(10)]
+        for storage_id in storage_ids:
+            httpretty.register_uri(httpretty.HEAD,
+                                   get_storage_block_url(self.apihost,
+                                                         self.vault.vault_id,
+                                                         storage_id),
+                                   adding_headers={
+                                       'x-block-reference-count': '0',
+                                       'x-ref-modified': '12345',
+                                       'x-storage-id': storage_id,
+                                       'x-block-id': 'None',
+                                       'x-block-size': '200',
+                                       'x-block-orphaned': 'True'
+                                   },
+                                   status=204)
+
+        blocks = [api.Block(project_id=self.vault.project_id,
+                            vault_id=self.vault.vault_id,
+                            storage_id=storage_id,
+                            block_type='storage')
+                  for storage_id in storage_ids]
+        missing = []
+        heads = list(self.client.HeadBlocksStorage(self.vault, blocks,
+                                                   concurrency=3,
+                                                   missing=missing))
+
+        self.assertEqual(sorted(block.storage_id for block in heads),
+                         sorted(storage_ids))
+        for block in heads:
+            self.assertIsNone(block.block_id)
+            self.assertTrue(block.block_orphaned)
+        self.assertEqual(missing, [])
+
+    @httpretty.activate
+    def test_head_storage_block_bulk_missing(self):
+        storage_ids = [create_storage_block() for _ in range(9)]
+        present_ids = storage_ids[:5]
+        for storage_id, status in zip(storage_ids,
+                                      [204] * 5 + [404, 410] * 2):
+            httpretty.register_uri(httpretty.HEAD,
+                                   get_storage_block_url(self.apihost,
+                                                         self.vault.vault_id,
+                                                         storage_id),
+                                   adding_headers={
+                                       'x-block-reference-count': '0',
+                                       'x-ref-modified': '12345',
+                                       'x-storage-id': storage_id,
+                                       'x-block-id': 'None',
+                                       'x-block-size': '200',
+                                       'x-block-orphaned': 'True'
+                                   },
+                                   status=status)
+
+        def blocks():
+            return [api.Block(project_id=self.vault.project_id,
+                              vault_id=self.vault.vault_id,
+                              storage_id=storage_id,
+                              block_type='storage')
+                    for storage_id in storage_ids]
+
+        # The missing blocks are collected
+        missing = []
+        heads = list(self.client.HeadBlocksStorage(self.vault, blocks(),
+                                                   concurrency=3,
+                                                   missing=missing))
+        self.assertEqual(sorted(block.storage_id for block in heads),
+                         sorted(present_ids))
+        self.assertEqual(sorted(block.storage_id for block in missing),
+                         sorted(storage_ids[5:]))
+
+        # or fail the whole head
+        with self.assertRaises(errors.MissingBlockError):
+            list(self.client.HeadBlocksStorage(self.vault, blocks(),
+                                               concurrency=3))
+
+    @httpretty.activate
+    def test_head_storage_block_bulk_failure(self):
+        storage_id = create_storage_block()
+        httpretty.register_uri(httpretty.HEAD,
+                               get_storage_block_url(self.apihost,
+                                                     self.vault.vault_id,
+                                                     storage_id),
+                               status=500)
+        blocks = [api.Block(project_id=self.vault.project_id,
+                            vault_id=self.vault.vault_id,
+                            storage_id=storage_id,
+                            block_type='storage')]
+
+        with self.assertRaises(RuntimeError):
+            list(self.client.HeadBlocksStorage(self.vault, blocks,
+                                               missing=[]))
+
+    def test_head_storage_block_bulk_invalid_concurrency(self):
+        # Raised by the call rather than once the blocks are iterated
+        with self.assertRaises(ValueError):
+            self.client.HeadBlocksStorage(self.vault, [], concurrency=0)
+
     @httpretty.activate
     def test_delete_storage_block(self):
         storage_blockid = create_storage_block()
@@ -262,3 +378,56 @@ class ClientDeuceStorageBlockTests(ClientTestBase):
                           block_type='storage')
         with self.assertRaises(RuntimeError):
             self.client.DeleteBlockStorage(self.vault, block)
+
+    @httpretty.activate
+    def test_storage_block_iter(self):
+        data = sorted(create_storage_block() for _ in range(25))
+        httpretty.register_uri(httpretty.GET,
+                               get_storage_blocks_url(self.apihost,
+                                                      self.vault.vault_id),
+                               body=make_paged_listing(data, 10))
+
+        self.assertEqual(list(self.client.IterBlockStorageList(self.vault)),
+                         data)
+        self.assertEqual(len(self.vault.storageblocks), 0)
+
+        self.assertEqual(list(self.client.IterBlockStorageList(
+            self.vault, marker=data[10], limit=5, store=True)), data[10:])
+        self.assertEqual(sorted(self.vault.storageblocks.keys()), data[10:])
+        for storage_id in data[10:]:
+            self.assertEqual(
+                self.vault.storageblocks[storage_id].block_type, 'storage')
+
+    @httpretty.activate
+    def test_storage_block_iter_error(self):
+        httpretty.register_uri(httpretty.GET,
+                               get_storage_blocks_url(self.apihost,
+                                                      self.vault.vault_id),
+                               status=500)
+
+        with self.assertRaises(RuntimeError):
+            list(self.client.IterBlockStorageList(self.vault))
+
+    @httpretty.activate
+    def test_storage_block_iter_prefetch_error(self):
+        httpretty.register_uri(httpretty.GET,
+                               get_storage_blocks_url(self.apihost,
+                                                      self.vault.vault_id),
+                               status=500)
+
+        with self.assertRaises(RuntimeError):
+            list(self.client.IterBlockStorageList(self.vault, prefetch=1))
+
+    @httpretty.activate
+    def test_storage_block_iter_partitioned(self):
+        data = sorted(create_storage_block(create_block()[0])
+                      for _ in range(60))
+        httpretty.register_uri(httpretty.GET,
+                               get_storage_blocks_url(self.apihost,
+                                                      self.vault.vault_id),
+                               body=make_paged_listing(data, 10))
+
+        listed = list(self.client.IterBlockStorageListPartitioned(
+            self.vault, partitions=5, limit=4, store=True))
+        self.assertEqual(sorted(listed), data)
+        self.assertEqual(sorted(self.vault.storageblocks.keys()), data)
@@ -330,3 +330,42 @@ class ClientDeuceVaultTests(ClientTestBase):
 
         with self.assertRaises(RuntimeError) as stats_error:
             self.client.GetVaultStatistics(self.vault)
+
+    @httpretty.activate
+    def test_iter_vaults(self):
+        vault_names = sorted(['vault_{0:02}'.format(x) for x in range(25)])
+        httpretty.register_uri(httpretty.GET,
+                               get_vaults_url(self.apihost),
+                               body=make_paged_listing(vault_names, 10,
+                                                       as_dict=True))
+
+        self.assertEqual(sorted(self.client.IterVaults(self.project)),
+                         vault_names)
+        self.assertEqual(len(self.project), 0)
+
+    @httpretty.activate
+    def test_iter_vaults_store_with_marker_and_limit(self):
+        vault_names = sorted(['vault_{0:02}'.format(x) for x in range(25)])
+        httpretty.register_uri(httpretty.GET,
+                               get_vaults_url(self.apihost),
+                               body=make_paged_listing(vault_names, 10,
+                                                       as_dict=True))
+
+        listed = list(self.client.IterVaults(self.project,
+                                             marker=vault_names[5],
+                                             limit=7,
+                                             store=True))
+        self.assertEqual(sorted(listed), vault_names[5:])
+        self.assertEqual(sorted(self.project.keys()), vault_names[5:])
+        for vault_name in listed:
+            self.assertEqual(self.project[vault_name].status, 'valid')
+
+    @httpretty.activate
+    def test_iter_vaults_failed(self):
+        httpretty.register_uri(httpretty.GET,
+                               get_vaults_url(self.apihost),
+                               status=500)
+
+        vaults = self.client.IterVaults(self.project)
+        with self.assertRaises(RuntimeError):
+            next(vaults)
@@ -0,0 +1,160 @@
+"""
+Tests - Deuce Client - Client - Differential Restore
+"""
+import os
+import shutil
+import tempfile
+
+import mock
+import requests
+
+import deuceclient.client.deuce
+import deuceclient.client.differential
+from deuceclient.client.differential import DifferentialRestore
+from deuceclient.tests import *
+from deuceclient.tests.standin import StandInDeuce
+
+
+class ClientDifferentialRestoreTests(ClientTestBase):
+
+    def setUp(self):
+        super(ClientDifferentialRestoreTests, self).setUp()
+        self.deuce = StandInDeuce().__enter__()
+        self.session = requests.Session()
+        self.client = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.deuce.apihost, session=self.session)
+        self.stored = self.deuce.add_vault(self.vault.vault_id)
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'restored')
+
+        # The last block is shorter than the others
+        self.blocks = [os.urandom(100) for _ in range(4)] + [os.urandom(40)]
+        self.layout = [0, 1, 2, 1, 3, 4]
+        self.file_id = self.store_file(self.layout)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        self.session.close()
+        self.deuce.__exit__(None, None, None)
+        super(ClientDifferentialRestoreTests, self).tearDown()
+
+    def store_file(self, layout):
+        file_id = create_file()
+        self.stored['files'][file_id] = []
+        offset = 0
+        for index in layout:
+            block_id = get_block_id(self.blocks[index])
+            self.stored['blocks'][block_id] = self.blocks[index]
+            self.stored['files'][file_id].append((block_id, offset))
+            offset = offset + len(self.blocks[index])
+        return file_id
+
+    def content(self, layout=None):
+        return b''.join(self.blocks[index]
+                        for index in (layout or self.layout))
+
+    def write_local(self, data):
+        with open(self.path, 'wb') as local_file:
+            local_file.write(data)
+
+    def restore(self, concurrency=4):
+        restore = DifferentialRestore(self.client, self.vault,
+                                      concurrency=concurrency)
+        self.assertTrue(restore.restore(self.file_id, self.path))
+        with open(self.path, 'rb') as local_file:
+            self.assertEqual(local_file.read(), self.content())
+        return restore
+
+    def block_downloads(self):
+        return [path for path in self.deuce.requests_made('GET')
+                if '/blocks/' in path]
+
+    def test_invalid_concurrency(self):
+        with self.assertRaises(ValueError):
+            DifferentialRestore(self.client, self.vault, concurrency=0)
+
+    def test_up_to_date(self):
+        self.write_local(self.content())
+        restore = self.restore()
+
+        self.assertEqual(self.block_downloads(), [])
+        self.assertEqual(restore.blocks_matched, len(self.layout))
+        self.assertEqual(restore.bytes_matched, len(self.content()))
+        self.assertEqual(restore.blocks_downloaded, 0)
+
+    def test_changed_blocks(self):
+        local = bytearray(self.content())
+        local[150:160] = b'x' * 10
+        local.extend(b'appended locally')
+        self.write_local(bytes(local))
+
+        restore = self.restore()
+
+        # The changed block and the last one, now followed by more data
+        self.assertEqual(restore.blocks_downloaded, 2)
+        self.assertEqual(restore.blocks_matched, len(self.layout) - 2)
+        self.assertEqual(restore.bytes_downloaded, 140)
+
+    def test_shorter_local_file(self):
+        self.write_local(self.content()[:250])
+        restore = self.restore()
+
+        # The second block matches but is also needed further in the file
+        self.assertEqual(restore.blocks_matched, 2)
+        self.assertEqual(restore.blocks_downloaded, 4)
+
+    def test_missing_local_file(self):
+        restore = self.restore(concurrency=1)
+
+        # The repeated block is only downloaded once
+        self.assertEqual(restore.blocks_matched, 0)
+        self.assertEqual(restore.blocks_downloaded, len(self.blocks))
+        self.assertEqual(len(self.block_downloads()), len(self.blocks))
+
+    def test_last_block_changed(self):
+        self.write_local(self.content())
+        layout = [0, 1, 2, 1, 3, 0]
+        file_id = self.store_file(layout)
+
+        restore = DifferentialRestore(self.client, self.vault)
+        restore.restore(file_id, self.path)
+        with open(self.path, 'rb') as local_file:
+            self.assertEqual(local_file.read(), self.content(layout))
+        self.assertEqual(restore.blocks_downloaded, 1)
+
+    def test_much_longer_local_file(self):
+        self.write_local(self.content() + os.urandom(64 * 1024))
+
+        # The tail of the local file is hashed a piece at a time rather
+        # than read whole
+        reads = []
+        pread = os.pread
+
+        def recorded_pread(fd, size, offset):
+            reads.append(size)
+            return pread(fd, size, offset)
+
+        with mock.patch.object(deuceclient.client.differential,
+                               'HASH_READ_SIZE', 1024), \
+                mock.patch('os.pread', side_effect=recorded_pread):
+            restore = self.restore()
+        self.assertLessEqual(max(reads), 1024)
+        self.assertEqual(restore.blocks_matched, len(self.layout) - 1)
+        self.assertEqual(restore.blocks_downloaded, 1)
+
+    def test_empty_file(self):
+        self.write_local(self.content())
+        file_id = create_file()
+        self.stored['files'][file_id] = []
+
+        DifferentialRestore(self.client, self.vault).restore(file_id,
+                                                             self.path)
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_download_failure(self):
+        self.write_local(self.content()[:100])
+        del self.stored['blocks'][get_block_id(self.blocks[2])]
+
+        with self.assertRaises(RuntimeError):
+            DifferentialRestore(self.client, self.vault).restore(
+                self.file_id, self.path)
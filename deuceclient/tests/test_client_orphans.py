@@ -0,0 +1,259 @@
+"""
+Tests - Deuce Client - Client - Orphaned Storage Block Collection
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import httpretty
+
+import deuceclient.client.deuce
+from deuceclient.client.orphans import OrphanCollector
+from deuceclient.tests import *
+
+
+class ClientOrphanCollectorTests(ClientTestBase):
+
+    def setUp(self):
+        super(ClientOrphanCollectorTests, self).setUp()
+
+        self.client = deuceclient.client.deuce.DeuceClient(self.authenticator,
+                                                           self.apihost,
+                                                           sslenabled=True)
+        self.temp_dir = tempfile.mkdtemp()
+        self.checkpoint_file = os.path.join(self.temp_dir, 'gc.checkpoint')
+
+        self.storage_ids = sorted(create_storage_block(create_block()[0])
+                                  for _ in range(20))
+        now = int(time.time())
+        self.old_orphans = self.storage_ids[0:16:2]
+        self.recent_orphans = self.storage_ids[1:9:2]
+        self.states = {}
+        for storage_id in self.storage_ids:
+            self.states[storage_id] = (False, now - 7 * 24 * 60 * 60)
+        for storage_id in self.old_orphans:
+            self.states[storage_id] = (True, now - 7 * 24 * 60 * 60)
+        for storage_id in self.recent_orphans:
+            self.states[storage_id] = (True, now - 60)
+
+        self.headed = []
+        self.deleted = []
+        self.delete_failures = set()
+        self.vanished = set()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        super(ClientOrphanCollectorTests, self).tearDown()
+
+    def register_storage(self):
+        httpretty.register_uri(httpretty.GET,
+                               get_storage_blocks_url(self.apihost,
+                                                      self.vault.vault_id),
+                               body=make_paged_listing(self.storage_ids, 3))
+
+        def head(request, uri, response_headers):
+            storage_id = uri.split('/')[-1]
+            self.headed.append(storage_id)
+            if storage_id in self.vanished:
+                return (404, response_headers, '')
+            orphaned, ref_modified = self.states[storage_id]
+            response_headers.update({
+                'x-block-reference-count': '0' if orphaned else '1',
+                'x-ref-modified': '' if ref_modified is None else
+                                  str(ref_modified),
+                'x-storage-id': storage_id,
+                'x-block-id': 'None' if orphaned else storage_id[:40],
+                'x-block-size': '100',
+                'x-block-orphaned': str(orphaned)
+            })
+            return (204, response_headers, '')
+
+        def delete(request, uri, response_headers):
+            storage_id = uri.split('/')[-1]
+            if storage_id in self.delete_failures:
+                return (500, response_headers, 'mock failure')
+            self.deleted.append(storage_id)
+            return (204, response_headers, '')
+
+        for storage_id in self.storage_ids:
+            url = get_storage_block_url(self.apihost, self.vault.vault_id,
+                                        storage_id)
+            httpretty.register_uri(httpretty.HEAD, url, body=head)
+            httpretty.register_uri(httpretty.DELETE, url, body=delete)
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            OrphanCollector(self.client, self.vault, min_age=-1)
+
+        with self.assertRaises(ValueError):
+            OrphanCollector(self.client, self.vault, batch_size=0)
+
+    @httpretty.activate
+    def test_sweep(self):
+        self.register_storage()
+        collector = OrphanCollector(self.client, self.vault,
+                                    concurrency=4, batch_size=5,
+                                    checkpoint_file=self.checkpoint_file)
+        self.assertEqual(collector.checkpoint_file, self.checkpoint_file)
+
+        results = list(collector.sweep())
+
+        self.assertEqual(sorted(results),
+                         [(storage_id, True)
+                          for storage_id in self.old_orphans])
+        self.assertEqual(sorted(self.deleted), self.old_orphans)
+        self.assertEqual(sorted(self.headed), self.storage_ids)
+        self.assertEqual(collector.scanned, len(self.storage_ids))
+        self.assertEqual(collector.orphaned,
+                         len(self.old_orphans) + len(self.recent_orphans))
+        self.assertEqual(collector.recent, len(self.recent_orphans))
+        self.assertEqual(collector.deleted, len(self.old_orphans))
+        self.assertEqual(collector.failed, 0)
+
+        # A complete sweep leaves no checkpoint behind
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    @httpretty.activate
+    def test_sweep_min_age(self):
+        self.register_storage()
+        collector = OrphanCollector(self.client, self.vault, min_age=0)
+
+        results = list(collector.sweep())
+
+        self.assertEqual(
+            sorted(storage_id for storage_id, deleted in results),
+            sorted(self.old_orphans + self.recent_orphans))
+        self.assertEqual(collector.recent, 0)
+
+    @httpretty.activate
+    def test_sweep_unknown_age(self):
+        unknown = self.old_orphans[:3]
+        for storage_id in unknown:
+            self.states[storage_id] = (True, None)
+        self.register_storage()
+
+        # Even without a minimum age, an orphan of unknown age is kept
+        for min_age in (0, 60):
+            self.deleted = []
+            collector = OrphanCollector(self.client, self.vault,
+                                        min_age=min_age)
+            results = list(collector.sweep())
+
+            self.assertFalse(set(unknown).intersection(
+                storage_id for storage_id, deleted in results))
+            self.assertFalse(set(unknown).intersection(self.deleted))
+            self.assertEqual(collector.unknown_age, len(unknown))
+            self.assertEqual(collector.orphaned,
+                             len(self.old_orphans) + len(self.recent_orphans))
+
+    @httpretty.activate
+    def test_sweep_vanished(self):
+        self.register_storage()
+        self.vanished.update(self.old_orphans[:2])
+        collector = OrphanCollector(self.client, self.vault, batch_size=5)
+
+        results = list(collector.sweep())
+
+        self.assertEqual(sorted(results),
+                         [(storage_id, True)
+                          for storage_id in self.old_orphans[2:]])
+        self.assertEqual(collector.vanished, 2)
+        self.assertEqual(collector.scanned, len(self.storage_ids))
+
+    @httpretty.activate
+    def test_sweep_dry_run(self):
+        self.register_storage()
+        collector = OrphanCollector(self.client, self.vault, dry_run=True)
+
+        results = list(collector.sweep())
+
+        self.assertEqual(sorted(results),
+                         [(storage_id, False)
+                          for storage_id in self.old_orphans])
+        self.assertEqual(self.deleted, [])
+        self.assertEqual(collector.deleted, 0)
+        self.assertEqual(collector.failed, 0)
+
+    @httpretty.activate
+    def test_sweep_delete_failure(self):
+        self.register_storage()
+        self.delete_failures.add(self.old_orphans[0])
+        collector = OrphanCollector(self.client, self.vault)
+
+        results = dict(collector.sweep())
+
+        self.assertFalse(results[self.old_orphans[0]])
+        self.assertEqual(collector.failed, 1)
+        self.assertEqual(collector.deleted, len(self.old_orphans) - 1)
+
+    @httpretty.activate
+    def test_sweep_interrupted(self):
+        self.register_storage()
+        collector = OrphanCollector(self.client, self.vault, batch_size=5,
+                                    checkpoint_file=self.checkpoint_file)
+
+        # Stop after the first batch has been fully processed
+        sweep = collector.sweep()
+        first_batch_orphans = [storage_id
+                               for storage_id in self.old_orphans
+                               if storage_id <= self.storage_ids[4]]
+        for _ in first_batch_orphans:
+            next(sweep)
+        sweep.close()
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+        sweep = collector.sweep()
+        for _ in first_batch_orphans:
+            next(sweep)
+        # the first orphan of the second batch completes the first batch
+        next(sweep)
+        sweep.close()
+
+        with open(self.checkpoint_file, 'r') as checkpoint:
+            data = json.load(checkpoint)
+        self.assertEqual(data['marker'], self.storage_ids[4])
+        self.assertEqual(data['vault_id'], self.vault.vault_id)
+
+        self.headed = []
+        resumed = OrphanCollector(self.client, self.vault, batch_size=5,
+                                  checkpoint_file=self.checkpoint_file)
+        results = list(resumed.sweep())
+
+        self.assertEqual(sorted(self.headed), self.storage_ids[5:])
+        self.assertEqual(resumed.scanned, len(self.storage_ids) - 5)
+        self.assertEqual(sorted(storage_id for storage_id, _ in results),
+                         [storage_id for storage_id in self.old_orphans
+                          if storage_id > self.storage_ids[4]])
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_checkpoint_other_vault(self):
+        with open(self.checkpoint_file, 'w') as checkpoint:
+            json.dump({'project_id': self.vault.project_id,
+                       'vault_id': create_vault_name(),
+                       'marker': self.storage_ids[0]}, checkpoint)
+
+        collector = OrphanCollector(self.client, self.vault,
+                                    checkpoint_file=self.checkpoint_file)
+        with self.assertRaises(ValueError):
+            list(collector.sweep())
+
+    @httpretty.activate
+    def test_sweep_head_failure(self):
+        httpretty.register_uri(httpretty.GET,
+                               get_storage_blocks_url(self.apihost,
+                                                      self.vault.vault_id),
+                               body=make_paged_listing(self.storage_ids, 3))
+        for storage_id in self.storage_ids:
+            httpretty.register_uri(httpretty.HEAD,
+                                   get_storage_block_url(self.apihost,
+                                                         self.vault.vault_id,
+                                                         storage_id),
+                                   status=500)
+
+        collector = OrphanCollector(self.client, self.vault,
+                                    checkpoint_file=self.checkpoint_file)
+        with self.assertRaises(RuntimeError):
+            list(collector.sweep())
+        self.assertFalse(os.path.exists(self.checkpoint_file))
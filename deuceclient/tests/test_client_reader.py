@@ -0,0 +1,341 @@
+"""
+Tests - Deuce Client - Client - File Reader
+"""
+import io
+import os
+import random
+import tarfile
+import threading
+import time
+import zipfile
+
+import requests
+
+import deuceclient
+import deuceclient.client.deuce
+from deuceclient.client.reader import DeuceFile, FileReader
+from deuceclient.tests import *
+from deuceclient.tests.standin import StandInDeuce
+
+
+class StandInReaderTestBase(ClientTestBase):
+
+    def setUp(self):
+        super(StandInReaderTestBase, self).setUp()
+        self.deuce = StandInDeuce().__enter__()
+        self.session = requests.Session()
+        self.client = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.deuce.apihost, session=self.session)
+        self.stored = self.deuce.add_vault(self.vault.vault_id)
+
+        self.blocks = [os.urandom(size) for size in (100, 50, 100, 30)]
+        self.content = b''.join(self.blocks)
+        self.file_id = create_file()
+        self.stored['files'][self.file_id] = []
+        offset = 0
+        for block in self.blocks:
+            block_id = get_block_id(block)
+            self.stored['blocks'][block_id] = block
+            self.stored['files'][self.file_id].append((block_id, offset))
+            offset = offset + len(block)
+
+    def tearDown(self):
+        self.session.close()
+        self.deuce.__exit__(None, None, None)
+        super(StandInReaderTestBase, self).tearDown()
+
+    def requests_for(self, resource):
+        return [path for path in self.deuce.requests_made('GET')
+                if resource in path]
+
+
+class ClientFileReaderTests(StandInReaderTestBase):
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            FileReader(self.client, self.vault, self.file_id, concurrency=0)
+
+        reader = FileReader(self.client, self.vault, self.file_id)
+        with self.assertRaises(ValueError):
+            reader.read_range(-1, 10)
+        with self.assertRaises(ValueError):
+            reader.read_range(0, -1)
+
+    def test_header(self):
+        reader = FileReader(self.client, self.vault, self.file_id)
+        self.assertEqual(reader.file_id, self.file_id)
+        self.assertEqual(reader.read_range(0, 10), self.content[0:10])
+
+        # Only the first block was downloaded
+        self.assertEqual(len(self.requests_for('/blocks/')), 1)
+
+    def test_ranges(self):
+        reader = FileReader(self.client, self.vault, self.file_id,
+                            concurrency=2)
+        for start, length, blocks in ((90, 70, 3), (100, 50, 1),
+                                      (0, 280, 4), (149, 2, 2)):
+            before = len(self.requests_for('/blocks/'))
+            self.assertEqual(reader.read_range(start, length),
+                             self.content[start:start + length])
+            self.assertEqual(len(self.requests_for('/blocks/')) - before,
+                             blocks)
+
+        for _ in range(20):
+            start = random.randrange(len(self.content))
+            length = random.randrange(len(self.content))
+            self.assertEqual(reader.read_range(start, length),
+                             self.content[start:start + length])
+
+        # The block map was only retrieved once
+        self.assertEqual(len(self.requests_for(
+            '/files/{0}/blocks'.format(self.file_id))), 1)
+
+    def test_end_of_file(self):
+        reader = FileReader(self.client, self.vault, self.file_id)
+        self.assertEqual(reader.read_range(250, 1000), self.content[250:])
+        self.assertEqual(reader.read_range(280, 10), b'')
+        self.assertEqual(reader.read_range(1000, 10), b'')
+        self.assertEqual(reader.read_range(10, 0), b'')
+
+    def test_empty_file(self):
+        file_id = create_file()
+        self.stored['files'][file_id] = []
+        reader = FileReader(self.client, self.vault, file_id)
+        self.assertEqual(reader.read_range(0, 10), b'')
+        self.assertEqual(reader.block_map, [])
+
+    def test_partial_offsets(self):
+        # e.g. a single page of the block list
+        self.vault.add_file(self.file_id)
+        for block_id, offset in self.stored['files'][self.file_id][:2]:
+            self.vault.files[self.file_id].assign_block(block_id, offset)
+
+        reader = FileReader(self.client, self.vault, self.file_id)
+        self.assertEqual(reader.read_range(120, 1000),
+                         self.content[120:])
+        self.assertEqual(len(self.requests_for(
+            '/files/{0}/blocks'.format(self.file_id))), 1)
+        self.assertEqual([offset for offset, block_id in reader.block_map],
+                         [0, 100, 150, 250])
+
+    def test_stream(self):
+        reader = FileReader(self.client, self.vault, self.file_id,
+                            concurrency=1)
+        chunks = list(reader.iter_range(50, 210))
+        self.assertEqual([len(chunk) for chunk in chunks], [50, 50, 100, 10])
+        self.assertEqual(b''.join(chunks), self.content[50:260])
+
+
+class DeuceFileTests(StandInReaderTestBase):
+
+    def store_file(self, content, block_size):
+        file_id = create_file()
+        self.stored['files'][file_id] = []
+        for offset in range(0, len(content), block_size):
+            block = content[offset:offset + block_size]
+            block_id = get_block_id(block)
+            self.stored['blocks'][block_id] = block
+            self.stored['files'][file_id].append((block_id, offset))
+        return file_id
+
+    def block_downloads(self):
+        return len(self.requests_for('/blocks/'))
+
+    def wait_for_downloads(self, count):
+        for _ in range(100):
+            if self.block_downloads() >= count:
+                break
+            time.sleep(0.05)
+        return self.block_downloads()
+
+    def read_ahead_threads(self):
+        return len([thread for thread in threading.enumerate()
+                    if thread.name == 'deuceclient-read-ahead'])
+
+    def test_invalid_parameters(self):
+        reader = FileReader(self.client, self.vault, self.file_id)
+        with self.assertRaises(ValueError):
+            DeuceFile(reader, read_ahead=-1)
+        with self.assertRaises(ValueError):
+            DeuceFile(reader, cached_blocks=0)
+
+    def test_read(self):
+        with deuceclient.open(self.client, self.vault,
+                              self.file_id) as deuce_file:
+            self.assertIsInstance(deuce_file, io.RawIOBase)
+            self.assertTrue(deuce_file.readable())
+            self.assertTrue(deuce_file.seekable())
+            self.assertFalse(deuce_file.writable())
+            self.assertEqual(deuce_file.name, self.file_id)
+            self.assertEqual(deuce_file.mode, 'rb')
+            self.assertEqual(deuce_file.size, len(self.content))
+
+            self.assertEqual(deuce_file.read(10), self.content[0:10])
+            self.assertEqual(deuce_file.read(), self.content[10:])
+            self.assertEqual(deuce_file.read(), b'')
+
+            buffer = bytearray(60)
+            deuce_file.seek(240)
+            self.assertEqual(deuce_file.readinto(buffer), 40)
+            self.assertEqual(bytes(buffer[0:40]), self.content[240:])
+
+        self.assertTrue(deuce_file.closed)
+        with self.assertRaises(ValueError):
+            deuce_file.read(10)
+
+    def test_seek(self):
+        deuce_file = deuceclient.open(self.client, self.vault, self.file_id)
+        self.assertEqual(deuce_file.seek(120), 120)
+        self.assertEqual(deuce_file.read(10), self.content[120:130])
+        self.assertEqual(deuce_file.seek(-30, io.SEEK_CUR), 100)
+        self.assertEqual(deuce_file.tell(), 100)
+        self.assertEqual(deuce_file.seek(-5, io.SEEK_END), 275)
+        self.assertEqual(deuce_file.read(), self.content[275:])
+        self.assertEqual(deuce_file.seek(1000), 1000)
+        self.assertEqual(deuce_file.read(10), b'')
+
+        with self.assertRaises(ValueError):
+            deuce_file.seek(-1)
+        with self.assertRaises(ValueError):
+            deuce_file.seek(0, 3)
+        self.assertEqual(deuce_file.tell(), 1000)
+
+        for _ in range(20):
+            start = random.randrange(len(self.content))
+            length = random.randrange(len(self.content))
+            deuce_file.seek(start)
+            self.assertEqual(deuce_file.read(length),
+                             self.content[start:start + length])
+
+    def test_read_ahead(self):
+        deuce_file = deuceclient.open(self.client, self.vault, self.file_id,
+                                      read_ahead=2)
+        self.assertEqual(deuce_file.read(10), self.content[0:10])
+
+        # The next two blocks are fetched in the background
+        self.assertEqual(self.wait_for_downloads(3), 3)
+        self.assertEqual(deuce_file.read(200), self.content[10:210])
+        self.assertEqual(self.wait_for_downloads(4), 4)
+        self.assertEqual(deuce_file.read(), self.content[210:])
+        self.assertEqual(self.block_downloads(), 4)
+
+    def test_no_read_ahead_on_random_access(self):
+        deuce_file = deuceclient.open(self.client, self.vault, self.file_id)
+        deuce_file.seek(120)
+        self.assertEqual(deuce_file.read(10), self.content[120:130])
+        self.assertEqual(self.block_downloads(), 1)
+
+        deuce_file = deuceclient.open(self.client, self.vault, self.file_id,
+                                      read_ahead=0)
+        self.assertEqual(deuce_file.read(10), self.content[0:10])
+        self.assertEqual(self.block_downloads(), 2)
+
+    def test_cached_blocks(self):
+        for cached_blocks, downloads in ((1, 3), (2, 2)):
+            before = self.block_downloads()
+            deuce_file = deuceclient.open(self.client, self.vault,
+                                          self.file_id, read_ahead=0,
+                                          cached_blocks=cached_blocks)
+            for start in (0, 100, 10):
+                deuce_file.seek(start)
+                self.assertEqual(deuce_file.read(20),
+                                 self.content[start:start + 20])
+            self.assertEqual(self.block_downloads() - before, downloads)
+
+    def test_seek_drops_read_ahead(self):
+        threads = self.read_ahead_threads()
+        content = os.urandom(400)
+        file_id = self.store_file(content, 10)
+        deuce_file = deuceclient.open(self.client, self.vault, file_id,
+                                      read_ahead=4, cached_blocks=8)
+        blocks = deuce_file._DeuceFile__blocks
+        fetches = deuce_file._DeuceFile__fetches
+
+        # Seeking around with a few sequential reads at each position,
+        # as zipfile and tarfile do
+        for start in range(0, 400, 15):
+            deuce_file.seek(start)
+            self.assertEqual(deuce_file.read(5), content[start:start + 5])
+            self.assertEqual(deuce_file.read(5),
+                             content[start + 5:start + 10])
+            self.assertLessEqual(len(blocks) + len(fetches), 8)
+            self.assertTrue(all(start // 10 <= index <= start // 10 + 5
+                                for index in fetches))
+
+        deuce_file.seek(0)
+        self.assertEqual(len(fetches), 0)
+
+        # The fetches run on at most read_ahead threads
+        self.assertLessEqual(self.read_ahead_threads() - threads, 4)
+
+        deuce_file.close()
+        self.assertEqual(len(fetches), 0)
+
+    def test_read_ahead_failure(self):
+        del self.stored['blocks'][get_block_id(self.blocks[2])]
+        deuce_file = deuceclient.open(self.client, self.vault, self.file_id)
+        self.assertEqual(deuce_file.read(10), self.content[0:10])
+        self.assertEqual(deuce_file.read(140), self.content[10:150])
+        with self.assertRaises(RuntimeError):
+            deuce_file.read(10)
+
+    def test_read_ahead_failure_retried(self):
+        block_id = get_block_id(self.blocks[2])
+        data = self.stored['blocks'].pop(block_id)
+        deuce_file = deuceclient.open(self.client, self.vault, self.file_id,
+                                      read_ahead=2)
+        self.assertEqual(deuce_file.read(10), self.content[0:10])
+        deuce_file._DeuceFile__fetches[2].done.wait()
+
+        # The failed fetch ahead is not kept once the block is back
+        self.stored['blocks'][block_id] = data
+        self.assertEqual(deuce_file.read(140), self.content[10:150])
+        self.assertEqual(deuce_file.read(10), self.content[150:160])
+        self.assertEqual(len(self.requests_for(
+            '/blocks/{0}'.format(block_id))), 2)
+
+    def test_partial_offsets(self):
+        self.vault.add_file(self.file_id)
+        for block_id, offset in self.stored['files'][self.file_id][:2]:
+            self.vault.files[self.file_id].assign_block(block_id, offset)
+
+        deuce_file = deuceclient.open(self.client, self.vault, self.file_id)
+        self.assertEqual(deuce_file.size, len(self.content))
+        self.assertEqual(deuce_file.read(), self.content)
+
+    def test_empty_file(self):
+        file_id = create_file()
+        self.stored['files'][file_id] = []
+        deuce_file = deuceclient.open(self.client, self.vault, file_id)
+        self.assertEqual(deuce_file.size, 0)
+        self.assertEqual(deuce_file.read(), b'')
+
+    def test_tarfile(self):
+        members = {'first': os.urandom(3000), 'second': os.urandom(700)}
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode='w') as tar:
+            for name, data in sorted(members.items()):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        file_id = self.store_file(archive.getvalue(), 1000)
+
+        deuce_file = io.BufferedReader(
+            deuceclient.open(self.client, self.vault, file_id))
+        with tarfile.open(fileobj=deuce_file) as tar:
+            self.assertEqual(sorted(tar.getnames()), sorted(members))
+            for name, data in members.items():
+                self.assertEqual(tar.extractfile(name).read(), data)
+
+    def test_zipfile(self):
+        members = {'first': os.urandom(3000), 'second': os.urandom(700)}
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, mode='w') as zip_file:
+            for name, data in members.items():
+                zip_file.writestr(name, data)
+        file_id = self.store_file(archive.getvalue(), 1000)
+
+        deuce_file = deuceclient.open(self.client, self.vault, file_id)
+        with zipfile.ZipFile(deuce_file) as zip_file:
+            self.assertEqual(sorted(zip_file.namelist()), sorted(members))
+            self.assertEqual(zip_file.read('second'), members['second'])
@@ -0,0 +1,185 @@
+"""
+Tests - Deuce Client - Client - File Replication
+"""
+import os
+import random
+
+import mock
+import requests
+
+import deuceclient.api as api
+import deuceclient.client.deuce
+from deuceclient.client.replicate import FileReplicator
+from deuceclient.tests import *
+from deuceclient.tests.standin import StandInDeuce
+
+
+class ClientReplicateTests(ClientTestBase):
+
+    def setUp(self):
+        super(ClientReplicateTests, self).setUp()
+        self.source_deuce = StandInDeuce().__enter__()
+        self.destination_deuce = StandInDeuce().__enter__()
+        self.session = requests.Session()
+        self.source = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.source_deuce.apihost,
+            session=self.session)
+        self.destination = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.destination_deuce.apihost,
+            session=self.session)
+        self.stored = self.source_deuce.add_vault(self.vault.vault_id)
+
+        self.destination_vault = api.Vault(project_id=self.vault.project_id,
+                                           vault_id=create_vault_name())
+        self.destination_vault.status = 'valid'
+        self.replicated = self.destination_deuce.add_vault(
+            self.destination_vault.vault_id)
+
+        self.blocks = [os.urandom(random.randrange(1, 200))
+                       for _ in range(30)]
+        self.file_id = self.store_file(self.blocks)
+
+    def tearDown(self):
+        self.session.close()
+        self.source_deuce.__exit__(None, None, None)
+        self.destination_deuce.__exit__(None, None, None)
+        super(ClientReplicateTests, self).tearDown()
+
+    def store_file(self, blocks):
+        file_id = create_file()
+        self.stored['files'][file_id] = []
+        offset = 0
+        for block in blocks:
+            block_id = get_block_id(block)
+            self.stored['blocks'][block_id] = block
+            self.stored['files'][file_id].append((block_id, offset))
+            offset = offset + len(block)
+        return file_id
+
+    def content(self, stored, file_id):
+        return b''.join(stored['blocks'][block_id] for block_id, offset in
+                        sorted(stored['files'][file_id],
+                               key=lambda block: block[1]))
+
+    def replicator(self, **kwargs):
+        return FileReplicator(self.source, self.vault, self.destination,
+                              self.destination_vault, **kwargs)
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            self.replicator(concurrency=0)
+        with self.assertRaises(ValueError):
+            self.replicator(blocks_per_assignment=0)
+        with self.assertRaises(ValueError):
+            self.replicator(upload_batch_size=0)
+
+    def test_replicate(self):
+        replicator = self.replicator(concurrency=4, blocks_per_assignment=4,
+                                     upload_batch_size=300)
+        file_id = replicator.replicate(self.file_id)
+
+        self.assertEqual(self.content(self.replicated, file_id),
+                         b''.join(self.blocks))
+        self.assertEqual(self.replicated['finalized'],
+                         {file_id: len(b''.join(self.blocks))})
+        self.assertIn(file_id, self.destination_vault.files)
+        self.assertEqual(replicator.files_replicated, 1)
+        self.assertEqual(replicator.blocks_assigned, 30)
+        self.assertEqual(replicator.blocks_transferred, 30)
+        self.assertEqual(replicator.bytes_transferred,
+                         len(b''.join(self.blocks)))
+        self.assertEqual(set(self.destination_deuce.uploads.values()), {1})
+
+    def test_only_missing_blocks(self):
+        for block in self.blocks[:20]:
+            self.replicated['blocks'][get_block_id(block)] = block
+
+        replicator = self.replicator(concurrency=4)
+        file_id = replicator.replicate(self.file_id)
+        self.assertEqual(self.content(self.replicated, file_id),
+                         b''.join(self.blocks))
+        self.assertEqual(replicator.blocks_transferred, 10)
+        self.assertEqual(set(self.destination_deuce.uploads),
+                         {get_block_id(block) for block in self.blocks[20:]})
+        self.assertEqual(len([path for path in
+                              self.source_deuce.requests_made('GET')
+                              if '/blocks/' in path]), 10)
+
+    def test_similar_files(self):
+        replicator = self.replicator()
+        replicator.replicate(self.file_id)
+
+        # A new version of the file with a block changed and one appended
+        blocks = list(self.blocks)
+        blocks[10] = os.urandom(100)
+        blocks.append(os.urandom(100))
+        file_id = replicator.replicate(self.store_file(blocks))
+
+        self.assertEqual(self.content(self.replicated, file_id),
+                         b''.join(blocks))
+        self.assertEqual(replicator.files_replicated, 2)
+        self.assertEqual(replicator.blocks_transferred, 32)
+        self.assertEqual(replicator.bytes_transferred,
+                         len(b''.join(self.blocks)) + 200)
+
+    def test_repeated_blocks(self):
+        blocks = [self.blocks[0], self.blocks[1]] * 10
+        replicator = self.replicator(concurrency=4, blocks_per_assignment=3)
+        file_id = replicator.replicate(self.store_file(blocks))
+        self.assertEqual(self.content(self.replicated, file_id),
+                         b''.join(blocks))
+        self.assertEqual(replicator.blocks_assigned, 20)
+        self.assertEqual(replicator.blocks_transferred, 2)
+
+    def test_same_endpoint(self):
+        destination_vault = api.Vault(project_id=self.vault.project_id,
+                                      vault_id=create_vault_name())
+        destination_vault.status = 'valid'
+        replicated = self.source_deuce.add_vault(destination_vault.vault_id)
+
+        replicator = FileReplicator(self.source, self.vault, self.source,
+                                    destination_vault)
+        file_id = replicator.replicate(self.file_id)
+        self.assertEqual(self.content(replicated, file_id),
+                         b''.join(self.blocks))
+
+    def test_empty_file(self):
+        replicator = self.replicator()
+        file_id = replicator.replicate(self.store_file([]))
+        self.assertEqual(self.replicated['files'][file_id], [])
+        self.assertEqual(self.replicated['finalized'], {file_id: 0})
+        self.assertEqual(replicator.blocks_transferred, 0)
+
+    def test_download_failure(self):
+        del self.stored['blocks'][get_block_id(self.blocks[12])]
+        replicator = self.replicator(concurrency=4, blocks_per_assignment=4)
+        with self.assertRaises(RuntimeError):
+            replicator.replicate(self.file_id)
+
+        # The partial file is deleted
+        self.assertEqual(self.replicated['files'], {})
+        self.assertEqual(self.replicated['finalized'], {})
+        self.assertEqual(self.destination_vault.files, {})
+
+    def test_upload_failure(self):
+        self.destination_deuce.failing_blocks.add(
+            get_block_id(self.blocks[5]))
+        replicator = self.replicator(concurrency=4, upload_batch_size=1)
+        with self.assertRaises(RuntimeError):
+            replicator.replicate(self.file_id)
+        self.assertEqual(self.replicated['files'], {})
+
+    def test_missing_file(self):
+        replicator = self.replicator()
+        with self.assertRaises(RuntimeError):
+            replicator.replicate(create_file())
+        self.assertEqual(self.replicated['files'], {})
+
+    def test_delete_failure(self):
+        del self.stored['blocks'][get_block_id(self.blocks[12])]
+        replicator = self.replicator()
+        with mock.patch.object(self.destination, 'DeleteFile',
+                               side_effect=RuntimeError('mock failure')):
+            with self.assertRaises(RuntimeError) as failure:
+                replicator.replicate(self.file_id)
+        self.assertNotIn('mock failure', str(failure.exception))
@@ -0,0 +1,148 @@
+"""
+Tests - Deuce Client - Client - Ordered Streaming Restore
+"""
+import os
+import random
+import threading
+import time
+
+import requests
+
+import deuceclient.client.deuce
+from deuceclient.client.stream import StreamRestore
+from deuceclient.tests import *
+from deuceclient.tests.standin import StandInDeuce
+
+
+class Output(object):
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    @property
+    def data(self):
+        return b''.join(self.chunks)
+
+
+class ClientStreamRestoreTests(ClientTestBase):
+
+    def setUp(self):
+        super(ClientStreamRestoreTests, self).setUp()
+        self.deuce = StandInDeuce().__enter__()
+        self.session = requests.Session()
+        self.client = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.deuce.apihost, session=self.session)
+        self.stored = self.deuce.add_vault(self.vault.vault_id)
+
+        self.blocks = [os.urandom(100) for _ in range(12)]
+        self.content = b''.join(self.blocks)
+        self.file_id = self.store_file(self.blocks)
+
+    def tearDown(self):
+        self.session.close()
+        self.deuce.__exit__(None, None, None)
+        super(ClientStreamRestoreTests, self).tearDown()
+
+    def store_file(self, blocks):
+        file_id = create_file()
+        self.stored['files'][file_id] = []
+        offset = 0
+        for block in blocks:
+            block_id = get_block_id(block)
+            self.stored['blocks'][block_id] = block
+            self.stored['files'][file_id].append((block_id, offset))
+            offset = offset + len(block)
+        return file_id
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            StreamRestore(self.client, self.vault, concurrency=0)
+        with self.assertRaises(ValueError):
+            StreamRestore(self.client, self.vault, buffer_size=0)
+
+    def test_in_order(self):
+        blocks = [os.urandom(random.randrange(1, 200)) for _ in range(30)]
+        file_id = self.store_file(blocks)
+
+        output = Output()
+        restore = StreamRestore(self.client, self.vault, concurrency=8)
+        self.assertEqual(restore.restore(file_id, output),
+                         len(b''.join(blocks)))
+        self.assertEqual(output.data, b''.join(blocks))
+        self.assertEqual(restore.blocks_downloaded, 30)
+        self.assertEqual(restore.bytes_written, len(b''.join(blocks)))
+
+    def test_buffer_bounds_downloads(self):
+        restore = StreamRestore(self.client, self.vault, concurrency=8,
+                                buffer_size=300)
+        download = restore._download
+        first_block = get_block_id(self.blocks[0])
+        started = []
+
+        # The first block arrives last of those that fit in the buffer
+        def slow_download(block_id):
+            started.append(block_id)
+            if block_id == first_block:
+                time.sleep(0.5)
+                self.assertEqual(len(started), 3)
+            return download(block_id)
+
+        restore._download = slow_download
+        output = Output()
+        restore.restore(self.file_id, output)
+        self.assertEqual(output.data, self.content)
+        self.assertEqual(restore.peak_buffered, 300)
+
+    def test_block_larger_than_buffer(self):
+        output = Output()
+        restore = StreamRestore(self.client, self.vault, buffer_size=10)
+        restore.restore(self.file_id, output)
+        self.assertEqual(output.data, self.content)
+        self.assertEqual(restore.peak_buffered, 100)
+
+    def test_last_block_larger(self):
+        blocks = self.blocks[:3] + [os.urandom(250)]
+        output = Output()
+        restore = StreamRestore(self.client, self.vault, buffer_size=200)
+        restore.restore(self.store_file(blocks), output)
+        self.assertEqual(output.data, b''.join(blocks))
+
+    def test_empty_file(self):
+        output = Output()
+        restore = StreamRestore(self.client, self.vault)
+        self.assertEqual(restore.restore(self.store_file([]), output), 0)
+        self.assertEqual(output.chunks, [])
+
+    def test_download_failure(self):
+        del self.stored['blocks'][get_block_id(self.blocks[1])]
+        output = Output()
+        restore = StreamRestore(self.client, self.vault, concurrency=4,
+                                buffer_size=200)
+        with self.assertRaises(RuntimeError) as failure:
+            restore.restore(self.file_id, output)
+        self.assertIn('Block Content', str(failure.exception))
+        self.assertIn(output.data, (b'', self.blocks[0]))
+
+    def test_output_failure(self):
+
+        class BrokenOutput(object):
+
+            def write(self, data):
+                raise BrokenPipeError('mock failure')
+
+        restore = StreamRestore(self.client, self.vault, concurrency=4,
+                                buffer_size=200)
+        with self.assertRaises(BrokenPipeError):
+            restore.restore(self.file_id, BrokenOutput())
+
+        # No download is left waiting for room
+        for _ in range(50):
+            if not [thread for thread in threading.enumerate()
+                    if thread.name == 'deuceclient-merge']:
+                break
+            time.sleep(0.1)
+        self.assertEqual([thread for thread in threading.enumerate()
+                          if thread.name == 'deuceclient-merge'], [])
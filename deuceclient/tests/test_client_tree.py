@@ -0,0 +1,378 @@
+"""
+Tests - Deuce Client - Client - Directory Tree Transfers
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+import mock
+import requests
+
+import deuceclient.client.deuce
+import deuceclient.client.tree as tree
+from deuceclient.client.tree import TreeRestorer, TreeUploader, \
+    UploadedBlocks
+from deuceclient.tests import *
+from deuceclient.tests.standin import StandInDeuce
+
+
+class UploadedBlocksTest(TestCase):
+
+    def test_claim(self):
+        uploaded_blocks = UploadedBlocks()
+
+        claimed, others = uploaded_blocks.claim(['a', 'b', 'a'])
+        self.assertEqual(claimed, {'a', 'b'})
+        self.assertEqual(others, [])
+
+        claimed, others = uploaded_blocks.claim(['b', 'c'])
+        self.assertEqual(claimed, {'c'})
+        self.assertEqual(len(others), 1)
+        self.assertEqual(uploaded_blocks.deduplicated, 1)
+
+        uploaded_blocks.complete({'a', 'b'})
+        self.assertTrue(uploaded_blocks.wait(others))
+        self.assertIn('a', uploaded_blocks)
+        self.assertNotIn('c', uploaded_blocks)
+        self.assertEqual(len(uploaded_blocks), 2)
+        self.assertEqual(uploaded_blocks.uploaded, 2)
+
+    def test_failed_upload(self):
+        uploaded_blocks = UploadedBlocks()
+        uploaded_blocks.claim(['a'])
+        claimed, others = uploaded_blocks.claim(['a'])
+
+        waiter = threading.Thread(
+            target=lambda: self.assertFalse(uploaded_blocks.wait(others)))
+        waiter.start()
+        uploaded_blocks.complete(['a'], uploaded=False)
+        waiter.join(5)
+
+        # It is up to the next file needing the block to upload it
+        claimed, others = uploaded_blocks.claim(['a'])
+        self.assertEqual(claimed, {'a'})
+        self.assertEqual(uploaded_blocks.uploaded, 0)
+
+
+class ManifestTest(TestCase):
+
+    def test_read_manifest(self):
+        lines = ['{"path": "a", "file_id": "f1"}\n',
+                 '\n',
+                 '{"path": "b", "file_id": null, "error": "failed"}\n',
+                 '{"path": "c/d", "file_id": "f2"}']
+        self.assertEqual(list(tree.read_manifest(lines)),
+                         [('a', 'f1'), ('c/d', 'f2')])
+
+    def test_invalid_manifest(self):
+        for line in ('not json', '["a", "f1"]', '{"path": "a"}'):
+            with self.assertRaises(ValueError):
+                list(tree.read_manifest([line]))
+
+
+class SpoolTest(TestCase):
+
+    def test_reserve(self):
+        spool = tree._Spool(10)
+        spool.reserve(6)
+        spool.reserve(4)
+
+        reserved = threading.Event()
+
+        def reserve():
+            spool.reserve(20)
+            reserved.set()
+
+        waiter = threading.Thread(target=reserve)
+        waiter.start()
+        self.assertFalse(reserved.wait(0.2))
+
+        # A block larger than the spool gets it when empty
+        spool.release(6)
+        self.assertFalse(reserved.wait(0.2))
+        spool.release(4)
+        self.assertTrue(reserved.wait(5))
+        waiter.join(5)
+
+    def test_close(self):
+        spool = tree._Spool(10)
+        spool.reserve(10)
+        errors = []
+
+        def reserve():
+            try:
+                spool.reserve(1)
+            except RuntimeError as ex:
+                errors.append(ex)
+
+        waiter = threading.Thread(target=reserve)
+        waiter.start()
+        spool.close()
+        waiter.join(5)
+        self.assertEqual(len(errors), 1)
+
+
+class ClientTreeUploadTests(ClientTestBase):
+
+    def setUp(self):
+        super(ClientTreeUploadTests, self).setUp()
+        self.deuce = StandInDeuce().__enter__()
+        self.session = requests.Session()
+        self.client = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.deuce.apihost, session=self.session)
+        self.vault.status = 'valid'
+        self.deuce.add_vault(self.vault.vault_id)
+        self.root = tempfile.mkdtemp()
+
+        self.block_size = 100
+        self.blocks = [os.urandom(self.block_size) for _ in range(4)]
+        self.contents = {
+            'a.bin': b''.join(self.blocks[0:3]),
+            'empty': b'',
+            os.path.join('sub', 'b.bin'): (self.blocks[0] + self.blocks[1] +
+                                           self.blocks[3]),
+            os.path.join('sub', 'deeper', 'c.bin'): b''.join(self.blocks[0:3])
+        }
+        for path, content in self.contents.items():
+            path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as content_file:
+                content_file.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        self.session.close()
+        self.deuce.__exit__(None, None, None)
+        super(ClientTreeUploadTests, self).tearDown()
+
+    @property
+    def stored_files(self):
+        return self.deuce.state['vaults'][self.vault.vault_id]['files']
+
+    def expected_assignments(self, path):
+        content = self.contents[path]
+        return [(get_block_id(content[offset:offset + self.block_size]),
+                 offset)
+                for offset in range(0, len(content), self.block_size)]
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            TreeUploader(self.client, self.vault, concurrency=0)
+
+        with self.assertRaises(ValueError):
+            TreeUploader(self.client, self.vault, blocks_per_assignment=0)
+
+    def test_iter_paths(self):
+        os.symlink(os.path.join(self.root, 'missing'),
+                   os.path.join(self.root, 'dangling'))
+        self.assertEqual(list(TreeUploader.iter_paths(self.root)),
+                         sorted(self.contents))
+
+    def test_upload(self):
+        uploader = TreeUploader(self.client, self.vault, concurrency=4,
+                                block_size=self.block_size,
+                                blocks_per_assignment=2)
+
+        with mock.patch.object(self.client, 'FinalizeFile') as finalize:
+            mapping = dict(uploader.upload(self.root))
+
+        self.assertEqual(sorted(mapping), sorted(self.contents))
+        self.assertEqual(len(set(mapping.values())), len(mapping))
+        self.assertEqual(uploader.uploaded, len(self.contents))
+        self.assertEqual(uploader.failed, 0)
+
+        # Each unique block is uploaded once for all the files
+        self.assertEqual(self.deuce.uploads,
+                         {get_block_id(block): 1 for block in self.blocks})
+        self.assertEqual(len(uploader.uploaded_blocks), len(self.blocks))
+
+        for path, file_id in mapping.items():
+            self.assertEqual(self.stored_files[file_id],
+                             self.expected_assignments(path))
+
+        self.assertEqual(sorted(call[0][1] for call in
+                                finalize.call_args_list),
+                         sorted(mapping.values()))
+
+    def test_upload_failure(self):
+        self.deuce.failing_blocks.add(get_block_id(self.blocks[3]))
+        uploader = TreeUploader(self.client, self.vault, concurrency=1,
+                                block_size=self.block_size)
+
+        with mock.patch.object(self.client, 'FinalizeFile'):
+            mapping = dict(uploader.upload(self.root))
+
+        failed_path = os.path.join('sub', 'b.bin')
+        self.assertIsNone(mapping[failed_path])
+        self.assertEqual(uploader.failed, 1)
+        self.assertEqual(uploader.uploaded, len(self.contents) - 1)
+        self.assertIn('Failed to upload blocks', uploader.errors[failed_path])
+
+        # The failed blocks can be uploaded by another file
+        self.assertNotIn(get_block_id(self.blocks[3]),
+                         uploader.uploaded_blocks)
+
+    def test_upload_shared_block_failure(self):
+        uploader = TreeUploader(self.client, self.vault,
+                                block_size=self.block_size)
+
+        # Another file claimed the blocks but failed to upload them
+        block_ids = [get_block_id(self.blocks[0])]
+        uploader.uploaded_blocks.claim(block_ids)
+        claimed, others = uploader.uploaded_blocks.claim(block_ids)
+        uploader.uploaded_blocks.complete(block_ids, uploaded=False)
+        with mock.patch.object(uploader.uploaded_blocks, 'claim',
+                               return_value=(set(), others)):
+            with self.assertRaises(RuntimeError):
+                uploader.upload_file(os.path.join(self.root, 'a.bin'))
+
+
+class ClientTreeRestoreTests(ClientTestBase):
+
+    def setUp(self):
+        super(ClientTreeRestoreTests, self).setUp()
+        self.deuce = StandInDeuce().__enter__()
+        self.session = requests.Session()
+        self.client = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.deuce.apihost, session=self.session)
+        self.vault.status = 'valid'
+        self.stored = self.deuce.add_vault(self.vault.vault_id)
+        self.root = tempfile.mkdtemp()
+
+        self.blocks = [os.urandom(100) for _ in range(4)]
+        self.block_ids = [get_block_id(block) for block in self.blocks]
+        for block_id, block in zip(self.block_ids, self.blocks):
+            self.stored['blocks'][block_id] = block
+
+        # Near identical images sharing most of their blocks
+        self.layouts = {
+            'image-1': [0, 1, 2, 1],
+            os.path.join('images', 'image-2'): [0, 1, 3, 1],
+            os.path.join('images', 'old', 'image-3'): [0, 1, 2, 1],
+            'empty': []
+        }
+        self.files = {}
+        for path, layout in sorted(self.layouts.items()):
+            file_id = create_file()
+            self.stored['files'][file_id] = [
+                (self.block_ids[index], position * 100)
+                for position, index in reversed(list(enumerate(layout)))]
+            self.files[path] = file_id
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+        self.session.close()
+        self.deuce.__exit__(None, None, None)
+        super(ClientTreeRestoreTests, self).tearDown()
+
+    def content(self, path):
+        return b''.join(self.blocks[index] for index in self.layouts[path])
+
+    def restored(self, path):
+        with open(os.path.join(self.root, path), 'rb') as restored_file:
+            return restored_file.read()
+
+    def block_downloads(self):
+        return [path for path in self.deuce.requests_made('GET')
+                if '/blocks/' in path]
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            TreeRestorer(self.client, self.vault, concurrency=0)
+
+        with self.assertRaises(ValueError):
+            TreeRestorer(self.client, self.vault, spool_size=0)
+
+    def test_restore(self):
+        restorer = TreeRestorer(self.client, self.vault, concurrency=4,
+                                spool_size=150)
+        restored = dict(restorer.restore(self.files.items(), self.root))
+
+        self.assertEqual(restored, self.files)
+        self.assertEqual(restorer.restored, len(self.files))
+        self.assertEqual(restorer.failed, 0)
+        for path in self.files:
+            self.assertEqual(self.restored(path), self.content(path))
+
+        # Each unique block is downloaded once for all the files
+        self.assertEqual(len(self.block_downloads()), len(self.blocks))
+        self.assertEqual(restorer.blocks_downloaded, len(self.blocks))
+        self.assertEqual(restorer.bytes_downloaded,
+                         sum(len(block) for block in self.blocks))
+        self.assertEqual(restorer.bytes_written,
+                         sum(len(self.content(path)) for path in self.files))
+
+    def test_restore_uploaded_tree(self):
+        source = tempfile.mkdtemp()
+        try:
+            for path in self.files:
+                target = os.path.join(source, path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, 'wb') as source_file:
+                    source_file.write(self.content(path))
+
+            uploader = TreeUploader(self.client, self.vault,
+                                    block_size=100)
+            with mock.patch.object(self.client, 'FinalizeFile'):
+                manifest = [json.dumps({'path': path, 'file_id': file_id})
+                            for path, file_id in uploader.upload(source)]
+        finally:
+            shutil.rmtree(source)
+
+        restorer = TreeRestorer(self.client, self.vault)
+        list(restorer.restore(tree.read_manifest(manifest), self.root))
+        for path in self.files:
+            self.assertEqual(self.restored(path), self.content(path))
+
+    def test_restore_failures(self):
+        # A block of the second image is missing
+        del self.stored['blocks'][self.block_ids[3]]
+        files = list(self.files.items()) + [
+            ('missing', create_file()),
+            (os.path.join('..', 'outside'), create_file()),
+            ('twice', create_file()),
+            ('twice', create_file())]
+        os.makedirs(os.path.join(self.root, 'directory'))
+        files.append(('directory', self.files['image-1']))
+
+        restorer = TreeRestorer(self.client, self.vault, concurrency=2)
+        restored = dict(restorer.restore(files, self.root))
+
+        failed = {os.path.join('images', 'image-2'), 'missing',
+                  os.path.join('..', 'outside'), 'twice', 'directory'}
+        self.assertEqual(set(restored), set(self.files) | failed)
+        self.assertEqual(set(restorer.errors), failed)
+        self.assertEqual(restorer.failed, len(failed))
+        self.assertEqual(restorer.restored, len(self.files) - 1)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'twice')))
+        self.assertEqual(self.restored('image-1'), self.content('image-1'))
+
+    def test_write_failure(self):
+        def failing_open(path, mode='r', *args, **kwargs):
+            if mode == 'r+b' and path.endswith('image-3'):
+                raise OSError('mock failure')
+            return open(path, mode, *args, **kwargs)
+
+        restorer = TreeRestorer(self.client, self.vault, concurrency=1)
+        with mock.patch.object(tree, 'open', create=True,
+                               side_effect=failing_open):
+            restored = dict(restorer.restore(self.files.items(), self.root))
+
+        failed_path = os.path.join('images', 'old', 'image-3')
+        self.assertEqual(restored, self.files)
+        self.assertEqual(list(restorer.errors), [failed_path])
+        self.assertEqual(self.restored('image-1'), self.content('image-1'))
+
+    def test_abandoned_restore(self):
+        restorer = TreeRestorer(self.client, self.vault, concurrency=4,
+                                spool_size=1)
+        restoring = restorer.restore(self.files.items(), self.root)
+
+        # Only the empty file is restored before the blocks are downloaded
+        self.assertEqual(next(restoring), ('empty', self.files['empty']))
+        next(restoring)
+        restoring.close()
+        self.assertLess(restorer.restored, len(self.files))
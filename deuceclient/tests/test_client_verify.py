@@ -0,0 +1,244 @@
+"""
+Tests - Deuce Client - Client - Download Verification
+"""
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import httpretty
+import requests
+
+import deuceclient.api as api
+import deuceclient.client.deuce
+from deuceclient.client.verify import StreamVerifier, VerificationStats
+from deuceclient.common import errors
+from deuceclient.tests import *
+from deuceclient.tests.standin import StandInDeuce
+
+
+class FlakyBlocks(dict):
+    """Blocks of the stand-in service, some served corrupted at first
+    """
+
+    def __init__(self, blocks, corrupted, times=1):
+        super(FlakyBlocks, self).__init__(blocks)
+        self.corrupted = corrupted
+        self.times = {block_id: times for block_id in corrupted}
+
+    def __getitem__(self, block_id):
+        if self.times.get(block_id, 0) > 0:
+            self.times[block_id] = self.times[block_id] - 1
+            return self.corrupted[block_id]
+        return super(FlakyBlocks, self).__getitem__(block_id)
+
+
+class StreamVerifierTests(TestCase):
+
+    def setUp(self):
+        super(StreamVerifierTests, self).setUp()
+        self.stats = VerificationStats()
+        self.blocks = [os.urandom(size) for size in (100, 50, 100, 30)]
+        self.content = b''.join(self.blocks)
+        self.block_list = []
+        offset = 0
+        for block in self.blocks:
+            self.block_list.append((offset, get_block_id(block)))
+            offset = offset + len(block)
+
+    def verify(self, data, chunk_size=37, block_list=None):
+        verifier = StreamVerifier(
+            self.block_list if block_list is None else block_list,
+            self.stats)
+        for offset in range(0, len(data), chunk_size):
+            verifier.feed(data[offset:offset + chunk_size])
+        return verifier.finish()
+
+    def test_matching(self):
+        for chunk_size in (1, 37, 100, 1000):
+            self.assertEqual(self.verify(self.content, chunk_size), [])
+        self.assertEqual(self.stats.blocks_verified, 16)
+        self.assertEqual(self.stats.bytes_verified, 4 * len(self.content))
+        self.assertEqual(self.stats.mismatches, 0)
+        self.assertGreater(self.stats.throughput, 0)
+        self.assertGreaterEqual(self.stats.overhead, 0)
+
+    def test_mismatch(self):
+        data = bytearray(self.content)
+        data[160] = data[160] ^ 0xff
+        self.assertEqual(self.verify(bytes(data)), [self.block_list[2]])
+        self.assertEqual(self.stats.mismatches, 1)
+
+    def test_short_data(self):
+        self.assertEqual(self.verify(self.content[:120]),
+                         self.block_list[1:])
+
+    def test_long_data(self):
+        self.assertEqual(self.verify(self.content + b'more'),
+                         [self.block_list[3]])
+
+    def test_no_blocks(self):
+        self.assertEqual(self.verify(b'', block_list=[]), [])
+        self.assertEqual(self.verify(b'data', block_list=[]), [(0, None)])
+
+    def test_finish_twice(self):
+        verifier = StreamVerifier(self.block_list, self.stats)
+        verifier.feed(self.content)
+        self.assertEqual(verifier.finish(), [])
+        self.assertEqual(verifier.finish(), [])
+        self.assertEqual(self.stats.blocks_verified, 4)
+
+    def test_report(self):
+        self.assertEqual(self.stats.throughput, 0.0)
+        self.assertEqual(self.stats.overhead, 0.0)
+        self.stats.add(blocks_verified=2, bytes_verified=1024 * 1024,
+                       hash_seconds=0.5, transfer_seconds=2.0,
+                       wait_seconds=0.1)
+        self.assertEqual(self.stats.report(),
+                         'Verified 2 blocks, 1048576 bytes, at 2.0 MB/s; '
+                         '0 mismatches, 0 retries; '
+                         'added 0.100 seconds (5.0%) to the downloads')
+
+
+class ClientVerifyTests(ClientTestBase):
+
+    def setUp(self):
+        super(ClientVerifyTests, self).setUp()
+        self.deuce = StandInDeuce().__enter__()
+        self.session = requests.Session()
+        self.stored = self.deuce.add_vault(self.vault.vault_id)
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'downloaded')
+
+        self.blocks = [os.urandom(size) for size in (100, 50, 100, 30)]
+        self.block_ids = [get_block_id(block) for block in self.blocks]
+        self.content = b''.join(self.blocks)
+        self.file_id = create_file()
+        self.stored['files'][self.file_id] = []
+        offset = 0
+        for block_id, block in zip(self.block_ids, self.blocks):
+            self.stored['blocks'][block_id] = block
+            self.stored['files'][self.file_id].append((block_id, offset))
+            offset = offset + len(block)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        self.session.close()
+        self.deuce.__exit__(None, None, None)
+        super(ClientVerifyTests, self).tearDown()
+
+    def make_client(self, **kwargs):
+        return deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.deuce.apihost, session=self.session,
+            **kwargs)
+
+    def corrupt(self, corrupted, times=1):
+        self.stored['blocks'] = FlakyBlocks(self.stored['blocks'],
+                                            corrupted, times)
+
+    def download_block(self, client, index):
+        block = api.Block(project_id=self.vault.project_id,
+                          vault_id=self.vault.vault_id,
+                          block_id=self.block_ids[index])
+        client.DownloadBlock(self.vault, block)
+        return block.data
+
+    def block_downloads(self):
+        return [path for path in self.deuce.requests_made('GET')
+                if '/blocks/' in path]
+
+    def test_not_verified_by_default(self):
+        client = self.make_client()
+        self.corrupt({self.block_ids[0]: b'corrupted'})
+        self.assertEqual(self.download_block(client, 0), b'corrupted')
+        self.assertEqual(client.verification.blocks_verified, 0)
+
+    def test_block_verified(self):
+        client = self.make_client(verify_downloads=True)
+        self.assertEqual(self.download_block(client, 0), self.blocks[0])
+        self.assertEqual(client.verification.blocks_verified, 1)
+        self.assertEqual(client.verification.bytes_verified, 100)
+
+    def test_block_retried(self):
+        client = self.make_client(verify_downloads=True)
+        self.corrupt({self.block_ids[1]: b'corrupted'})
+        self.assertEqual(self.download_block(client, 1), self.blocks[1])
+        self.assertEqual(client.verification.mismatches, 1)
+        self.assertEqual(client.verification.retries, 1)
+        self.assertEqual(len(self.block_downloads()), 2)
+
+    def test_block_corrupted(self):
+        client = self.make_client(verify_downloads=True, verify_retries=1)
+        self.corrupt({self.block_ids[1]: b'corrupted'}, times=2)
+        with self.assertRaises(errors.BlockIntegrityError):
+            self.download_block(client, 1)
+        self.assertEqual(len(self.block_downloads()), 2)
+
+    def test_block_download_failure(self):
+        client = self.make_client(verify_downloads=True)
+        del self.stored['blocks'][self.block_ids[1]]
+        with self.assertRaises(RuntimeError):
+            self.download_block(client, 1)
+
+    def test_file_verified(self):
+        client = self.make_client(verify_downloads=True)
+        self.assertTrue(client.DownloadFile(self.vault, self.file_id,
+                                            self.path))
+        with open(self.path, 'rb') as downloaded:
+            self.assertEqual(downloaded.read(), self.content)
+        self.assertEqual(client.verification.blocks_verified, 4)
+        self.assertEqual(self.block_downloads(), [])
+
+    def test_file_repaired(self):
+        client = self.make_client(verify_downloads=True)
+
+        # The last block is served longer than it is
+        self.corrupt({self.block_ids[1]: b'x' * 50,
+                      self.block_ids[3]: self.blocks[3] + b'more'})
+        self.assertTrue(client.DownloadFile(self.vault, self.file_id,
+                                            self.path))
+        with open(self.path, 'rb') as downloaded:
+            self.assertEqual(downloaded.read(), self.content)
+        self.assertEqual(client.verification.mismatches, 2)
+        self.assertEqual(client.verification.retries, 2)
+        self.assertEqual(len(self.block_downloads()), 2)
+
+    def test_file_corrupted(self):
+        client = self.make_client(verify_downloads=True, verify_retries=0)
+        self.corrupt({self.block_ids[1]: b'x' * 50})
+        with self.assertRaises(errors.BlockIntegrityError):
+            client.DownloadFile(self.vault, self.file_id, self.path)
+        self.assertEqual(self.block_downloads(), [])
+
+    def test_file_download_failure(self):
+        client = self.make_client(verify_downloads=True)
+        with self.assertRaises(RuntimeError):
+            client.DownloadFile(self.vault, create_file(), self.path)
+
+
+class ClientVerifyFailureTests(ClientTestBase):
+
+    @httpretty.activate
+    def test_file_download_failure(self):
+        client = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.apihost, sslenabled=True,
+            verify_downloads=True)
+        file_id = create_file()
+        httpretty.register_uri(httpretty.GET,
+                               get_file_blocks_url(self.apihost,
+                                                   self.vault.vault_id,
+                                                   file_id),
+                               content_type='application/json',
+                               body='[]',
+                               status=200)
+        httpretty.register_uri(httpretty.GET,
+                               get_file_url(self.apihost,
+                                            self.vault.vault_id,
+                                            file_id),
+                               body='mock failure',
+                               status=404)
+
+        with self.assertRaises(RuntimeError):
+            client.DownloadFile(self.vault, file_id,
+                                os.path.join(tempfile.gettempdir(),
+                                             'never-written'))
@@ -2,6 +2,7 @@
 Tests - Deuce Client - Common - Command
 """
 import mock
+import threading
 from unittest import TestCase
 
 import deuceclient
@@ -141,3 +142,32 @@ class CommandTest(TestCase):
             self.assertIsNone(command.body)
             self.assertIsNone(command.Body)
             self.assertEqual(command.body, command.Body)
+
+    def test_request_state_per_thread(self):
+        apihost = 'myapi'
+        command = deuceclient.common.command.Command(apihost,
+                                                     '/someuri',
+                                                     True)
+        command.body = 'main'
+
+        thread_state = {}
+
+        def worker():
+            thread_state['initial_uri'] = command.uri
+            thread_state['initial_body'] = command.body
+            command.ReInit(False, '/otheruri')
+            command.body = 'worker'
+            thread_state['uri'] = command.uri
+            thread_state['body'] = command.body
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(thread_state['initial_uri'], '')
+        self.assertIsNone(thread_state['initial_body'])
+        self.assertEqual(thread_state['uri'], 'http://myapi/otheruri')
+        self.assertEqual(thread_state['body'], 'worker')
+
+        self.assertEqual(command.uri, 'https://myapi/someuri')
+        self.assertEqual(command.body, 'main')
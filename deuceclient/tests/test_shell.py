@@ -0,0 +1,267 @@
+"""
+Tests - Deuce Client - Shell
+"""
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+import httpretty
+import mock
+import requests
+
+import deuceclient.client.deuce
+import deuceclient.shell as shell
+from deuceclient.tests import *
+
+
+class ShellImportTest(TestCase):
+
+    def test_lazy_imports(self):
+        # The heavy modules are only imported once a command needs them
+        lazy_modules = ['keystoneclient', 'msgpack', 'requests',
+                        'deuceclient.client.deuce']
+        script = ('import sys\n'
+                  'import deuceclient.shell\n'
+                  'print(" ".join(name for name in {0!r}\n'
+                  '               if name in sys.modules))\n'
+                  ).format(lazy_modules)
+
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         universal_newlines=True)
+        self.assertEqual(output.strip(), '')
+
+    def test_pooled_session(self):
+        pooled_session = getattr(shell, '__pooled_session')
+        for concurrency, pool_size in ((
+                1, requests.adapters.DEFAULT_POOLSIZE), (50, 50)):
+            with pooled_session(concurrency) as session:
+                for prefix in ('http://', 'https://'):
+                    self.assertEqual(
+                        session.get_adapter(prefix)._pool_maxsize, pool_size)
+
+    def test_print_error(self):
+        with mock.patch('sys.stdout', new=io.StringIO()) as stdout, \
+                mock.patch('sys.stderr', new=io.StringIO()) as stderr:
+            getattr(shell, '__print_error')(RuntimeError('mock'))
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertEqual(stderr.getvalue(), 'Error: mock\n')
+
+
+@httpretty.activate
+class ShellBatchTest(ClientTestBase):
+
+    def setUp(self):
+        super(ShellBatchTest, self).setUp()
+        self.session = requests.Session()
+        self.client = deuceclient.client.deuce.DeuceClient(
+            self.authenticator, self.apihost, sslenabled=True,
+            session=self.session)
+        self.batch = shell.BatchSession(self.client)
+        self.temp_dir = tempfile.mkdtemp()
+        self.heads = []
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        self.session.close()
+        super(ShellBatchTest, self).tearDown()
+
+    def run_batch(self, commands, **kwargs):
+        output = io.StringIO()
+        failures = shell.run_batch(self.batch, io.StringIO(commands),
+                                   output, **kwargs)
+        results = [json.loads(line)
+                   for line in output.getvalue().splitlines()]
+        return failures, results
+
+    def register_vault(self, exists=True):
+        def head(request, uri, response_headers):
+            self.heads.append(uri)
+            return (204 if exists else 404, response_headers, '')
+
+        url = get_vault_url(self.apihost, self.vault_name)
+        httpretty.register_uri(httpretty.HEAD, url, body=head)
+        httpretty.register_uri(httpretty.PUT, url, status=201)
+        httpretty.register_uri(httpretty.DELETE, url, status=204)
+
+    def test_vault_commands(self):
+        self.register_vault()
+        statistics = {'files': {'count': 0}}
+        httpretty.register_uri(httpretty.GET,
+                               get_vault_url(self.apihost, self.vault_name),
+                               body=json.dumps(statistics))
+        httpretty.register_uri(httpretty.GET,
+                               get_vaults_url(self.apihost),
+                               body=make_paged_listing(['vault_a', 'vault_b'],
+                                                       5, as_dict=True))
+
+        failures, results = self.run_batch(
+            '# set up\n'
+            '\n'
+            'vault create --vault-name {0}\n'
+            'vault exists --vault-name {0}\n'
+            'vault stats --vault-name {0}\n'
+            'vault list\n'
+            'vault delete --vault-name {0}\n'.format(self.vault_name))
+
+        self.assertEqual(failures, 0)
+        self.assertEqual([result['line'] for result in results],
+                         [3, 4, 5, 6, 7])
+        self.assertEqual([result['status'] for result in results],
+                         ['ok'] * 5)
+        self.assertEqual(results[0]['result'], {'vault': self.vault_name})
+        self.assertTrue(results[1]['result']['exists'])
+        self.assertEqual(results[2]['result']['statistics'], statistics)
+        self.assertEqual(sorted(results[3]['result']['vaults']),
+                         ['vault_a', 'vault_b'])
+        self.assertTrue(results[4]['result']['deleted'])
+        self.assertNotIn(self.vault_name, self.batch.vaults)
+
+        # The created vault is known to exist
+        self.assertEqual(len(self.heads), 1)
+
+    def test_vault_cache(self):
+        self.register_vault()
+        block_ids = sorted(create_block()[0] for _ in range(3))
+        httpretty.register_uri(httpretty.GET,
+                               get_blocks_url(self.apihost, self.vault_name),
+                               body=make_paged_listing(block_ids, 5))
+
+        failures, results = self.run_batch(
+            'blocks --vault-name {0} list\n'
+            'blocks --vault-name {0} list --limit 5\n'.format(
+                self.vault_name))
+
+        self.assertEqual(failures, 0)
+        for result in results:
+            self.assertEqual(result['result']['blocks'], block_ids)
+        self.assertEqual(len(self.heads), 1)
+
+    def test_vault_does_not_exist(self):
+        self.register_vault(exists=False)
+        self.batch.vaults.add(self.vault_name)
+
+        failures, results = self.run_batch(
+            'vault exists --vault-name {0}\n'
+            'files --vault-name {0} create\n'.format(self.vault_name))
+
+        self.assertEqual(failures, 1)
+        self.assertFalse(results[0]['result']['exists'])
+        self.assertEqual(results[1]['status'], 'error')
+        self.assertIn('Failed to find a Vault', results[1]['error'])
+
+    def test_block_commands(self):
+        self.register_vault()
+        block_id = create_block()[0]
+        httpretty.register_uri(httpretty.DELETE,
+                               get_block_url(self.apihost, self.vault_name,
+                                             block_id),
+                               status=204)
+
+        failures, results = self.run_batch(
+            'blocks --vault-name {0} delete --block-id {1}\n'.format(
+                self.vault_name, block_id))
+
+        self.assertEqual(failures, 0)
+        self.assertEqual(results[0]['result'],
+                         {'vault': self.vault_name, 'block_id': block_id,
+                          'deleted': True})
+
+    def test_known_blocks(self):
+        self.register_vault()
+        block_ids = sorted(create_block()[0] for _ in range(3))
+        httpretty.register_uri(httpretty.GET,
+                               get_blocks_url(self.apihost, self.vault_name),
+                               body=make_paged_listing(block_ids, 5))
+        content = os.path.join(self.temp_dir, 'block')
+        with open(content, 'w') as block_file:
+            block_file.write('block data')
+        block_id = get_block_id(b'block data')
+        self.batch.known_blocks(self.vault_name).add(block_id)
+
+        failures, results = self.run_batch(
+            'blocks --vault-name {0} list\n'
+            'blocks --vault-name {0} upload --block-content {1}\n'
+            'vault exists --vault-name {0}\n'.format(self.vault_name,
+                                                     content))
+
+        self.assertEqual(failures, 0)
+        self.assertEqual(self.batch.known_blocks(self.vault_name),
+                         set(block_ids + [block_id]))
+
+        # Blocks known to be stored are not uploaded again
+        self.assertEqual(results[1]['result'],
+                         {'vault': self.vault_name, 'block_id': block_id,
+                          'uploaded': False})
+        self.assertNotIn(httpretty.PUT, [request.method for request in
+                                         httpretty.latest_requests()])
+
+        self.register_vault(exists=False)
+        self.run_batch('vault exists --vault-name {0}\n'.format(
+            self.vault_name))
+        self.assertNotIn(self.vault_name, self.batch.blocks)
+
+    def test_file_commands(self):
+        self.register_vault()
+        file_id = create_file()
+        file_url = get_file_url(self.apihost, self.vault_name, file_id)
+        httpretty.register_uri(httpretty.POST,
+                               get_files_url(self.apihost, self.vault_name),
+                               adding_headers={
+                                   'location': file_url,
+                                   'x-file-id': file_id
+                               },
+                               status=201)
+        httpretty.register_uri(httpretty.GET,
+                               get_files_url(self.apihost, self.vault_name),
+                               body=make_paged_listing([file_id], 5))
+        httpretty.register_uri(httpretty.GET, file_url, body='file data')
+        httpretty.register_uri(httpretty.DELETE, file_url, status=204)
+
+        file_name = os.path.join(self.temp_dir, 'restored file')
+        failures, results = self.run_batch(
+            'files --vault-name {0} create\n'
+            'files --vault-name {0} list\n'
+            'files --vault-name {0} download --file-id {1} '
+            '--file-name "{2}"\n'
+            'files --vault-name {0} delete --file-id {1}\n'.format(
+                self.vault_name, file_id, file_name))
+
+        self.assertEqual(failures, 0)
+        self.assertEqual(results[0]['result']['file_id'], file_id)
+        self.assertEqual(results[0]['result']['url'], file_url)
+        self.assertEqual(results[1]['result']['files'], [file_id])
+        self.assertEqual(results[2]['result']['file_name'], file_name)
+        with open(file_name, 'r') as restored:
+            self.assertEqual(restored.read(), 'file data')
+        self.assertTrue(results[3]['result']['deleted'])
+
+    def test_invalid_commands(self):
+        self.register_vault()
+        failures, results = self.run_batch(
+            'vault create\n'
+            'snapshots list\n'
+            'vault\n'
+            'vault list --help\n'
+            'vault create --vault-name "unterminated\n'
+            'files --vault-name {0} delete --file-id invalid\n'.format(
+                self.vault_name))
+
+        self.assertEqual(failures, 6)
+        for result in results:
+            self.assertEqual(result['status'], 'error')
+        self.assertIn('--vault-name', results[0]['error'])
+        self.assertIn('no operation', results[2]['error'])
+        self.assertIn('usage', results[3]['error'])
+        self.assertEqual(results[5]['error'], 'InvalidFiles')
+
+    def test_stop_on_error(self):
+        failures, results = self.run_batch('vault create\nvault list\n',
+                                           stop_on_error=True)
+
+        self.assertEqual(failures, 1)
+        self.assertEqual(len(results), 1)
@@ -0,0 +1,139 @@
+"""
+Tests - Deuce Client - Utils - Download Helpers
+"""
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import mock
+
+import deuceclient.utils.download as download
+
+
+class RecordingResponse(io.BytesIO):
+    """Response body recording the size of the reads
+    """
+
+    def __init__(self, data):
+        super(RecordingResponse, self).__init__(data)
+        self.reads = []
+
+    def readinto(self, buffer):
+        self.reads.append(len(buffer))
+        return super(RecordingResponse, self).readinto(buffer)
+
+
+class AdaptiveChunkSizeTest(TestCase):
+
+    def test_bounds(self):
+        self.assertEqual(download.AdaptiveChunkSize(1).size,
+                         download.MIN_CHUNK_SIZE)
+        self.assertEqual(download.AdaptiveChunkSize(1 << 40).size,
+                         download.MAX_CHUNK_SIZE)
+
+    def test_adapts(self):
+        chunk = download.AdaptiveChunkSize(1024, minimum=1024, maximum=4096,
+                                           target_seconds=1.0)
+        for size in (2048, 4096, 4096):
+            chunk.update(chunk.size, 0.1)
+            self.assertEqual(chunk.size, size)
+
+        # Reads within the target keep the size
+        chunk.update(chunk.size, 1.0)
+        self.assertEqual(chunk.size, 4096)
+
+        for size in (2048, 1024, 1024):
+            chunk.update(chunk.size, 3.0)
+            self.assertEqual(chunk.size, size)
+
+        # The end of the data says nothing of the throughput
+        chunk.update(10, 0.0)
+        self.assertEqual(chunk.size, 1024)
+
+
+class DownloadHelpersTest(TestCase):
+
+    def setUp(self):
+        super(DownloadHelpersTest, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'output')
+        self.data = os.urandom(1024 * 1024 + 123)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        super(DownloadHelpersTest, self).tearDown()
+
+    def read_output(self):
+        with open(self.path, 'rb') as output:
+            return output.read()
+
+    def test_preallocate(self):
+        with open(self.path, 'wb') as output:
+            download.preallocate(output.fileno(), 1000)
+            with mock.patch.object(download.os, 'posix_fallocate',
+                                   side_effect=OSError(95, 'unsupported')):
+                download.preallocate(output.fileno(), 2000)
+            with mock.patch.object(download, 'hasattr', create=True,
+                                   return_value=False):
+                download.preallocate(output.fileno(), 3000)
+        self.assertEqual(os.path.getsize(self.path), 3000)
+
+    def test_known_size(self):
+        # Replaces the existing file
+        with open(self.path, 'wb') as output:
+            output.write(b'x' * (2 * len(self.data)))
+
+        chunks = []
+        response = RecordingResponse(self.data)
+        self.assertEqual(download.receive_into_file(
+            response, self.path, expected_size=len(self.data),
+            on_chunk=lambda chunk: chunks.append(bytes(chunk))),
+            len(self.data))
+
+        self.assertEqual(self.read_output(), self.data)
+        self.assertEqual(b''.join(chunks), self.data)
+
+        # The reads grew with the throughput
+        self.assertEqual(response.reads[0], download.MIN_CHUNK_SIZE)
+        self.assertGreater(max(response.reads), download.MIN_CHUNK_SIZE)
+        self.assertLess(len(response.reads),
+                        len(self.data) // download.MIN_CHUNK_SIZE)
+
+    def test_unknown_size(self):
+        chunks = []
+        self.assertEqual(download.receive_into_file(
+            io.BytesIO(self.data), self.path,
+            on_chunk=lambda chunk: chunks.append(bytes(chunk))),
+            len(self.data))
+        self.assertEqual(self.read_output(), self.data)
+        self.assertEqual(b''.join(chunks), self.data)
+
+        self.assertEqual(download.receive_into_file(io.BytesIO(b''),
+                                                    self.path), 0)
+        self.assertEqual(self.read_output(), b'')
+
+    def test_partial_writes(self):
+        real_write = os.write
+
+        def short_write(fd, data):
+            return real_write(fd, data[:1000])
+
+        with mock.patch.object(download.os, 'write',
+                               side_effect=short_write):
+            download.receive_into_file(io.BytesIO(self.data), self.path)
+        self.assertEqual(self.read_output(), self.data)
+
+    def test_short_body(self):
+        with self.assertRaises(IOError):
+            download.receive_into_file(io.BytesIO(self.data), self.path,
+                                       expected_size=len(self.data) + 1)
+
+    def test_read_failure(self):
+        response = mock.Mock()
+        response.readinto.side_effect = ValueError('mock failure')
+        for expected_size in (None, len(self.data)):
+            with self.assertRaises(ValueError):
+                download.receive_into_file(response, self.path,
+                                           expected_size=expected_size)
@@ -0,0 +1,95 @@
+"""
+Tests - Deuce Client - Utils - Paginator
+"""
+import threading
+from unittest import TestCase
+
+from deuceclient.utils.paginator import Paginator
+
+
+class TestPaginator(TestCase):
+
+    def setUp(self):
+        super(TestPaginator, self).setUp()
+
+        self.entries = list(range(95))
+        self.page_size = 10
+        self.requested_markers = []
+
+    def get_page(self, marker):
+        self.requested_markers.append(marker)
+        start = 0 if marker is None else marker
+        end = start + self.page_size
+        next_marker = end if end < len(self.entries) else None
+        return (self.entries[start:end], next_marker)
+
+    def test_invalid_prefetch(self):
+        with self.assertRaises(ValueError):
+            Paginator(self.get_page, prefetch=-1)
+
+    def test_serial(self):
+        pages = Paginator(self.get_page)
+        self.assertEqual(pages.prefetch, 0)
+
+        result = [entry for page in pages for entry in page]
+        self.assertEqual(result, self.entries)
+        self.assertEqual(self.requested_markers,
+                         [None, 10, 20, 30, 40, 50, 60, 70, 80, 90])
+
+    def test_serial_with_marker(self):
+        pages = Paginator(self.get_page, marker=50)
+
+        result = [entry for page in pages for entry in page]
+        self.assertEqual(result, self.entries[50:])
+
+    def test_prefetch(self):
+        for prefetch in (1, 2, 5, 20):
+            self.requested_markers = []
+            pages = Paginator(self.get_page, prefetch=prefetch)
+            self.assertEqual(pages.prefetch, prefetch)
+
+            result = [entry for page in pages for entry in page]
+            self.assertEqual(result, self.entries)
+            self.assertEqual(self.requested_markers,
+                             [None, 10, 20, 30, 40, 50, 60, 70, 80, 90])
+
+    def test_prefetch_single_page(self):
+        self.entries = list(range(5))
+        pages = Paginator(self.get_page, prefetch=2)
+        self.assertEqual(list(pages), [self.entries])
+
+    def test_prefetch_overlaps_processing(self):
+        # The second page must be requested while the caller
+        # is still holding on to the first one
+        second_page_requested = threading.Event()
+
+        def get_page(marker):
+            if marker is not None:
+                second_page_requested.set()
+            return self.get_page(marker)
+
+        pages = iter(Paginator(get_page, prefetch=1))
+        first_page = next(pages)
+        self.assertTrue(second_page_requested.wait(5))
+        self.assertEqual(first_page, self.entries[:10])
+        pages.close()
+
+    def test_prefetch_error(self):
+        def get_page(marker):
+            if marker is not None:
+                raise RuntimeError('failed')
+            return self.get_page(marker)
+
+        pages = iter(Paginator(get_page, prefetch=3))
+        self.assertEqual(next(pages), self.entries[:10])
+        with self.assertRaises(RuntimeError):
+            next(pages)
+
+    def test_prefetch_abandoned(self):
+        pages = iter(Paginator(self.get_page, prefetch=1))
+        self.assertEqual(next(pages), self.entries[:10])
+        pages.close()
+
+        # The background fetcher stops instead of reading
+        # the whole listing
+        self.assertLess(len(self.requested_markers), 10)
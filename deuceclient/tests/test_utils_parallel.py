@@ -0,0 +1,116 @@
+"""
+Tests - Deuce Client - Utils - Parallel Execution Helpers
+"""
+import threading
+from unittest import TestCase
+
+from deuceclient.utils import parallel
+
+
+class TestMerge(TestCase):
+
+    def test_merge(self):
+        iterables = [range(0, 100), range(100, 150), [], range(150, 160)]
+
+        result = list(parallel.merge(iterables))
+        self.assertEqual(sorted(result), list(range(160)))
+
+        # order is preserved within each iterable
+        self.assertEqual([x for x in result if x < 100], list(range(100)))
+
+    def test_merge_nothing(self):
+        self.assertEqual(list(parallel.merge([])), [])
+
+    def test_merge_buffer_size(self):
+        result = list(parallel.merge([range(10), range(10, 20)],
+                                     buffer_size=1))
+        self.assertEqual(sorted(result), list(range(20)))
+
+    def test_merge_concurrent(self):
+        # Both iterables must be running at the same time for
+        # either of them to finish
+        barrier = threading.Barrier(2, timeout=5)
+
+        def waiting(value):
+            barrier.wait()
+            yield value
+
+        self.assertEqual(sorted(parallel.merge([waiting(1), waiting(2)])),
+                         [1, 2])
+
+    def test_merge_error(self):
+        def failing():
+            yield 1
+            raise RuntimeError('failed')
+
+        with self.assertRaises(RuntimeError):
+            list(parallel.merge([failing(), range(5)]))
+
+    def test_merge_abandoned(self):
+        consumed = []
+
+        def endless():
+            value = 0
+            while True:
+                consumed.append(value)
+                yield value
+                value = value + 1
+
+        results = parallel.merge([endless()])
+        self.assertEqual(next(results), 0)
+        results.close()
+
+        self.assertLess(len(consumed), 10)
+
+
+class TestImapUnordered(TestCase):
+
+    def test_imap_unordered(self):
+        result = parallel.imap_unordered(lambda x: x * 2, range(100), 4)
+        self.assertEqual(sorted(result), [x * 2 for x in range(100)])
+
+    def test_imap_unordered_nothing(self):
+        self.assertEqual(
+            list(parallel.imap_unordered(lambda x: x, [], 4)), [])
+
+    def test_imap_unordered_concurrency(self):
+        # All the items must be in progress at the same time for
+        # any of them to finish
+        barrier = threading.Barrier(3, timeout=5)
+
+        def waiting(value):
+            barrier.wait()
+            return value
+
+        self.assertEqual(
+            sorted(parallel.imap_unordered(waiting, [1, 2, 3], 3)),
+            [1, 2, 3])
+
+    def test_imap_unordered_invalid_concurrency(self):
+        with self.assertRaises(ValueError):
+            parallel.imap_unordered(lambda x: x, [1], 0)
+
+    def test_imap_unordered_lazy(self):
+        consumed = []
+
+        def endless():
+            value = 0
+            while True:
+                consumed.append(value)
+                yield value
+                value = value + 1
+
+        results = parallel.imap_unordered(lambda x: x, endless(), 2)
+        self.assertIn(next(results), (0, 1))
+        results.close()
+
+        self.assertLess(len(consumed), 20)
+
+    def test_imap_unordered_error(self):
+        def failing(value):
+            if value == 5:
+                raise RuntimeError('failed')
+            return value
+
+        with self.assertRaises(RuntimeError):
+            list(parallel.imap_unordered(failing, range(10), 2))
@@ -0,0 +1,144 @@
+"""
+Deuce Client - Utils - Download Helpers
+"""
+import mmap
+import os
+import time
+
+# Bounds of the size of the reads of a download
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Time each read of a download is aimed to take
+TARGET_CHUNK_SECONDS = 0.25
+
+
+class AdaptiveChunkSize(object):
+    """Size of the reads of a download, adapted to the throughput
+
+    The size doubles while reads complete well within the target time and
+    halves when they take much longer. Fast transfers are then read in few
+    large reads, and slow ones still make regular progress.
+    """
+
+    def __init__(self, initial, minimum=MIN_CHUNK_SIZE,
+                 maximum=MAX_CHUNK_SIZE, target_seconds=TARGET_CHUNK_SECONDS):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.size = min(max(initial, minimum), maximum)
+
+    def update(self, count, seconds):
+        """Adapt the size to a read
+
+        :param count: number of bytes read
+        :param seconds: time the read took
+        """
+        # A short read is the end of the data, not a measure of throughput
+        if count < self.size:
+            return
+
+        if seconds < self.target_seconds / 2:
+            self.size = min(self.size * 2, self.maximum)
+        elif seconds > self.target_seconds * 2:
+            self.size = max(self.size // 2, self.minimum)
+
+
+def preallocate(fd, size):
+    """Reserve the space of a file of known size
+
+    Falls back to extending the file when the platform or the file system
+    does not support allocating the space.
+    """
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass
+    os.ftruncate(fd, size)
+
+
+def receive_into_file(response, path, expected_size=None,
+                      chunk_size=MIN_CHUNK_SIZE, on_chunk=None):
+    """Read the body of a response into a file
+
+    The response is read straight into the file, mapped in memory once
+    preallocated to the expected size. When the size is not known, it is
+    read into a single reused buffer. No buffer is allocated for each
+    chunk either way.
+
+    :param response: file-like body of the response with a readinto method
+    :param path: path of the file to write, replaced if it exists
+    :param expected_size: number of bytes of the body, if known
+    :param chunk_size: size of the first read
+    :param on_chunk: function called with a memoryview of each chunk
+                     received; the view is only valid during the call
+    :returns: number of bytes received
+    :raises: IOError if the body is shorter than the expected size
+    """
+    chunk = AdaptiveChunkSize(chunk_size)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        if expected_size:
+            preallocate(fd, expected_size)
+            with mmap.mmap(fd, expected_size) as mapped:
+                with memoryview(mapped) as view:
+                    received = _receive(response, chunk, on_chunk,
+                                        lambda received, size:
+                                        view[received:received + size],
+                                        limit=expected_size)
+            if received < expected_size:
+                raise IOError('Received {0:} of {1:} bytes'.format(
+                    received, expected_size))
+            return received
+
+        buffers = []
+
+        def into_buffer(received, size):
+            if not buffers or len(buffers[0]) < size:
+                buffers[:] = [memoryview(bytearray(size))]
+            return buffers[0][:size]
+
+        def write(data):
+            written = 0
+            while written < len(data):
+                written = written + os.write(fd, data[written:])
+            if on_chunk is not None:
+                on_chunk(data)
+
+        return _receive(response, chunk, write, into_buffer)
+
+    finally:
+        os.close(fd)
+
+
+def _receive(response, chunk, on_chunk, target, limit=None):
+    """Read a response chunk by chunk
+
+    :param target: function returning the memoryview to read the chunk
+                   into from the number of bytes received and the size
+    :param limit: number of bytes to read at most
+    """
+    received = 0
+    into = None
+    try:
+        while limit is None or received < limit:
+            size = chunk.size if limit is None else \
+                min(chunk.size, limit - received)
+            into = target(received, size)
+
+            start = time.perf_counter()
+            count = response.readinto(into)
+            chunk.update(count, time.perf_counter() - start)
+            if not count:
+                break
+
+            if on_chunk is not None:
+                on_chunk(into[:count])
+            received = received + count
+    finally:
+        # The mapped output can only be closed once no view is left
+        if into is not None:
+            into.release()
+    return received
@@ -0,0 +1,97 @@
+"""
+Deuce Client - Utils - Paginator
+"""
+import queue
+import threading
+
+
+class Paginator(object):
+    """Iterates over the pages of a marker based listing
+
+    Deuce returns the marker for page N+1 along with page N; so when
+    prefetching is enabled a background thread requests the following pages
+    while the caller is still processing the current one. At most
+    `prefetch` pages are held ahead of the caller.
+    """
+
+    def __init__(self, get_page, marker=None, prefetch=0):
+        """
+        :param get_page: function taking a marker and returning a tuple of
+                         (entries, next_marker) where next_marker is None
+                         on the last page
+        :param marker: marker to start the listing at
+        :param prefetch: number of pages to request ahead of the caller,
+                         0 to request each page only when it is needed
+        """
+        if prefetch < 0:
+            raise ValueError('prefetch must not be negative')
+
+        self._get_page = get_page
+        self._marker = marker
+        self._prefetch = prefetch
+
+    @property
+    def prefetch(self):
+        return self._prefetch
+
+    def __iter__(self):
+        if self._prefetch:
+            return self._prefetched_pages()
+        else:
+            return self._serial_pages()
+
+    def _serial_pages(self):
+        marker = self._marker
+        while True:
+            entries, marker = self._get_page(marker)
+            yield entries
+
+            if marker is None:
+                break
+
+    def _prefetched_pages(self):
+        pages = queue.Queue(maxsize=self._prefetch)
+        stop = threading.Event()
+
+        def put(item):
+            # Do not block forever if the caller abandons the listing
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def fetch_pages():
+            marker = self._marker
+            try:
+                while not stop.is_set():
+                    entries, marker = self._get_page(marker)
+                    if not put((entries, marker is None, None)):
+                        break
+
+                    if marker is None:
+                        break
+
+            except Exception as ex:
+                put((None, True, ex))
+
+        fetcher = threading.Thread(target=fetch_pages,
+                                   name='deuceclient-paginator')
+        fetcher.daemon = True
+        fetcher.start()
+
+        try:
+            while True:
+                entries, last_page, error = pages.get()
+                if error is not None:
+                    raise error
+
+                yield entries
+
+                if last_page:
+                    break
+        finally:
+            stop.set()
+            fetcher.join()
@@ -0,0 +1,115 @@
+"""
+Deuce Client - Utils - Parallel Execution Helpers
+"""
+import queue
+import threading
+
+# Default number of requests in flight for the bulk operations
+DEFAULT_CONCURRENCY = 8
+
+
+class _Done(object):
+    """Marks that a producer thread finished
+    """
+    pass
+
+
+def _put(items, item, stop):
+    # Do not block forever if the caller abandons the results
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def merge(iterables, buffer_size=None):
+    """Consume several iterables concurrently
+
+    Each iterable is consumed by its own thread and the items are yielded
+    in the order they become available, so the result order is not
+    deterministic across iterables (it is preserved within each one).
+
+    :param iterables: list of iterables to consume
+    :param buffer_size: maximum number of items held for the caller,
+                        defaults to one per iterable
+    :returns: generator of the items
+    :raises: the first exception raised by any of the iterables
+    """
+    iterables = list(iterables)
+    if buffer_size is None:
+        buffer_size = max(len(iterables), 1)
+
+    items = queue.Queue(maxsize=buffer_size)
+    stop = threading.Event()
+
+    def consume(iterable):
+        try:
+            for item in iterable:
+                if not _put(items, (item, None), stop):
+                    return
+            _put(items, (_Done, None), stop)
+
+        except Exception as ex:
+            _put(items, (_Done, ex), stop)
+
+    workers = [threading.Thread(target=consume, args=(iterable,),
+                                name='deuceclient-merge')
+               for iterable in iterables]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    try:
+        remaining = len(workers)
+        while remaining:
+            item, error = items.get()
+            if error is not None:
+                raise error
+
+            if item is _Done:
+                remaining = remaining - 1
+            else:
+                yield item
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+
+def imap_unordered(function, iterable, concurrency, buffer_size=None):
+    """Apply a function to each item of an iterable concurrently
+
+    The iterable is consumed lazily by a fixed number of worker threads so
+    that arbitrarily long (or endless) inputs can be processed without
+    holding them in memory.
+
+    :param function: function to call with each item
+    :param iterable: iterable of the items to process
+    :param concurrency: number of items to process at the same time
+    :param buffer_size: maximum number of results held for the caller,
+                        defaults to one per worker
+    :returns: generator of the function results in completion order
+    :raises: ValueError if concurrency is less than 1
+    :raises: the first exception raised by the function or the iterable
+    """
+    if concurrency < 1:
+        raise ValueError('concurrency must be at least 1')
+
+    items = iter(iterable)
+    items_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with items_lock:
+                item = next(items, _Done)
+
+            if item is _Done:
+                return
+
+            yield function(item)
+
+    return merge([worker() for _ in range(concurrency)],
+                 buffer_size=buffer_size)
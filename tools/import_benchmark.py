@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+"""
+Deuce Client Import Time Benchmark
+
+Measures the time taken to import a module (deuceclient.shell by default)
+in a fresh interpreter using `python -X importtime` (Python 3.7+) and
+reports the slowest imports. It exits with a non-zero status if the
+median import time exceeds a budget or if modules that are meant to be
+imported lazily were imported, e.g.:
+
+    python tools/import_benchmark.py --runs 10 --budget 250
+"""
+from __future__ import print_function
+import argparse
+import statistics
+import subprocess
+import sys
+
+
+# Heavy modules that must only be imported once actually needed
+DEFAULT_LAZY_MODULES = ['keystoneclient', 'msgpack', 'requests']
+
+
+def measure(module):
+    """Import a module in a new interpreter
+
+    :param module: name of the module to import
+    :returns: dict of the imported module names to a tuple of their own
+              and cumulative import times in microseconds
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime',
+                             '-c', 'import {0}'.format(module)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            own, cumulative = int(fields[0]), int(fields[1])
+        except ValueError:
+            # the header line
+            continue
+        timings[fields[2].strip()] = (own, cumulative)
+    return timings
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description='Deuce Client Import Time Benchmark')
+    arg_parser.add_argument('--module', default='deuceclient.shell',
+                            help='Module to import')
+    arg_parser.add_argument('--runs', default=5, type=int,
+                            help='Number of fresh interpreters to measure')
+    arg_parser.add_argument('--top', default=15, type=int,
+                            help='Number of slowest imports to report')
+    arg_parser.add_argument('--budget', default=None, type=float,
+                            help='Maximum median import time in milliseconds')
+    arg_parser.add_argument('--lazy', default=DEFAULT_LAZY_MODULES,
+                            nargs='*',
+                            help='Modules that must not be imported')
+    arguments = arg_parser.parse_args()
+
+    runs = [measure(arguments.module) for _ in range(arguments.runs)]
+    totals = [timings[arguments.module][1] / 1000.0 for timings in runs]
+    median = statistics.median(totals)
+
+    print('{0}: median {1:.1f} ms, min {2:.1f} ms, max {3:.1f} ms '
+          '({4} runs)'.format(arguments.module, median, min(totals),
+                              max(totals), len(totals)))
+
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1][1],
+                     reverse=True)
+    print('{0:>12} {1:>12}  {2}'.format('self (us)', 'cumul. (us)',
+                                        'module'))
+    for name, (own, cumulative) in slowest[:arguments.top]:
+        print('{0:12} {1:12}  {2}'.format(own, cumulative, name))
+
+    failed = False
+    for lazy_module in arguments.lazy:
+        imported = [name for name in runs[-1]
+                    if name == lazy_module or
+                    name.startswith(lazy_module + '.')]
+        if imported:
+            print('FAIL: {0} was imported'.format(lazy_module))
+            failed = True
+
+    if arguments.budget is not None and median > arguments.budget:
+        print('FAIL: median import time {0:.1f} ms exceeds the budget of '
+              '{1:.1f} ms'.format(median, arguments.budget))
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())